@@ -27,6 +27,13 @@ LOG = logging.getLogger(__name__)
 ROOT_HELPER_OPTS = [
     cfg.StrOpt('root_helper', default='sudo',
                help=_('Root helper application.')),
+    cfg.StrOpt('root_helper_daemon',
+               help=_('Root helper daemon application to use instead of '
+                      'root_helper when possible, e.g. "sudo '
+                      'neutron-rootwrap-daemon /etc/neutron/rootwrap.conf". '
+                      'It is started once and runs the privileged commands '
+                      'of the agent without forking a root helper for each '
+                      'of them.')),
 ]
 
 AGENT_STATE_OPTS = [
@@ -41,6 +48,15 @@ INTERFACE_DRIVER_OPTS = [
                help=_("The driver used to manage the virtual interface.")),
 ]
 
+MINIMIZE_POLLING_OPTS = [
+    cfg.BoolOpt('minimize_polling',
+                default=True,
+                help=_("Minimize polling by monitoring for interface "
+                       "changes: ovsdb for the Open vSwitch agents, netlink "
+                       "link notifications for the Linux Bridge and SR-IOV "
+                       "agents, for which it defaults to False.")),
+]
+
 USE_NAMESPACES_OPTS = [
     cfg.BoolOpt('use_namespaces', default=True,
                 help=_("Allow overlapping IP.")),
@@ -88,6 +104,11 @@ def register_interface_driver_opts_helper(conf):
     conf.register_opts(INTERFACE_DRIVER_OPTS)
 
 
+def register_minimize_polling_opts_helper(conf, default=True):
+    conf.register_opts(MINIMIZE_POLLING_OPTS, 'AGENT')
+    conf.set_default('minimize_polling', default, 'AGENT')
+
+
 def register_use_namespaces_opts_helper(conf):
     conf.register_opts(USE_NAMESPACES_OPTS)
 
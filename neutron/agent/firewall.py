@@ -83,6 +83,15 @@ class FirewallDriver(object):
         """Stop filtering port."""
         raise NotImplementedError()
 
+    def update_security_group_members(self, sg_id, sg_members):
+        """Update the addresses of the members of a remote group.
+
+        Only called when enable_ipset is set, in which case remote_group_id
+        rules are not converted to ip prefixes. sg_members maps each
+        ethertype to the list of member addresses.
+        """
+        pass
+
     def filter_defer_apply_on(self):
         """Defer application of filtering rule."""
         pass
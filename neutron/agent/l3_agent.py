@@ -13,7 +13,10 @@
 #    under the License.
 #
 
+import collections
+import copy
 import sys
+import time
 
 import datetime
 import eventlet
@@ -28,6 +31,7 @@ from neutron.agent.linux import external_process
 from neutron.agent.linux import interface
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import iptables_manager
+from neutron.agent.linux import namespace_cleanup
 from neutron.agent.linux import ra
 from neutron.agent import rpc as agent_rpc
 from neutron.common import config as common_config
@@ -67,6 +71,14 @@ FIP_PR_END = FIP_PR_START + 40000
 RPC_LOOP_INTERVAL = 1
 FLOATING_IP_CIDR_SUFFIX = '/32'
 # Lower value is higher priority
+# The keys of the router payload handled by each part of process_router
+ROUTER_INTERFACE_KEYS = frozenset([l3_constants.INTERFACE_KEY,
+                                   l3_constants.SNAT_ROUTER_INTF_KEY])
+ROUTER_GATEWAY_KEYS = frozenset(['gw_port', 'enable_snat', 'distributed',
+                                 'gw_port_host'])
+ROUTER_FLOATINGIP_KEYS = frozenset([l3_constants.FLOATINGIP_KEY])
+ROUTER_ROUTE_KEYS = frozenset(['routes'])
+
 PRIORITY_RPC = 0
 PRIORITY_SYNC_ROUTERS_TASK = 1
 DELETE_ROUTER = 1
@@ -82,6 +94,7 @@ class L3PluginApi(n_rpc.RpcProxy):
               - get_ports_by_subnet
               - get_agent_gateway_port
               Needed by the agent when operating in DVR/DVR_SNAT mode
+        1.3 - get_router_revisions
 
     """
 
@@ -99,6 +112,14 @@ class L3PluginApi(n_rpc.RpcProxy):
                                        router_ids=router_ids),
                          topic=self.topic)
 
+    def get_router_revisions(self, context, router_ids=None):
+        """Make a remote process call to retrieve the router revisions."""
+        return self.call(context,
+                         self.make_msg('get_router_revisions', host=self.host,
+                                       router_ids=router_ids),
+                         topic=self.topic,
+                         version='1.3')
+
     def get_external_network_id(self, context):
         """Make a remote process call to retrieve the external network id.
 
@@ -148,6 +169,8 @@ class RouterInfo(object):
         self.snat_ports = []
         self.floating_ips = set()
         self.floating_ips_dict = {}
+        # floating ip id -> NAT rules of the floating ip
+        self.floating_ip_nat_rules = {}
         self.root_helper = root_helper
         self.use_namespaces = use_namespaces
         # Invoke the setter for establishing initial SNAT action
@@ -164,6 +187,8 @@ class RouterInfo(object):
         # Linklocal floating to router IP addr
         self.fip_2_rtr = None
         self.dist_fip_count = 0
+        # Snapshot of the router payload last processed successfully
+        self._processed_router = None
 
     @property
     def router(self):
@@ -184,6 +209,33 @@ class RouterInfo(object):
             # Gateway port was removed, remove rules
             self._snat_action = 'remove_rules'
 
+    def snapshot(self):
+        """Returns a copy of the router payload to diff with later ones.
+
+        The status of the floating IPs is left out, since it is reported by
+        the agent itself.
+        """
+        router = copy.deepcopy(self._router)
+        for fip in router.get(l3_constants.FLOATINGIP_KEY, []):
+            fip.pop('status', None)
+        return router
+
+    def get_changes(self, snapshot):
+        """Returns the keys whose value changed since the router was last
+        processed, or None if it was never processed successfully.
+        """
+        processed = self._processed_router
+        if processed is None:
+            return None
+        return set(key for key in set(snapshot) | set(processed)
+                   if snapshot.get(key) != processed.get(key))
+
+    def set_processed(self, snapshot):
+        """Records the payload processed, or None to process the next one
+        in full.
+        """
+        self._processed_router = snapshot
+
     def perform_snat_action(self, snat_callback, *args):
         # Process SNAT rules for attached subnets
         if self._snat_action:
@@ -199,7 +251,7 @@ class RouterUpdate(object):
     and process a request to update a router.
     """
     def __init__(self, router_id, priority,
-                 action=None, router=None, timestamp=None):
+                 action=None, router=None, timestamp=None, revision=None):
         self.priority = priority
         self.timestamp = timestamp
         if not timestamp:
@@ -207,6 +259,7 @@ class RouterUpdate(object):
         self.id = router_id
         self.action = action
         self.router = router
+        self.revision = revision
 
     def __lt__(self, other):
         """Implements priority among updates
@@ -262,6 +315,11 @@ class ExclusiveRouterProcessor(object):
     def _i_am_master(self):
         return self == self._master
 
+    @property
+    def is_master(self):
+        """Whether this instance was granted exclusive access to the router"""
+        return self._i_am_master()
+
     def __enter__(self):
         return self
 
@@ -304,20 +362,36 @@ class ExclusiveRouterProcessor(object):
 
 
 class RouterProcessingQueue(object):
-    """Manager of the queue of routers to process."""
+    """Manager of the queues of routers to process.
+
+    The updates of each priority are queued apart and taken by their own
+    workers, so that a full resync does not hold up the updates notified
+    by the server.
+    """
     def __init__(self):
-        self._queue = Queue.PriorityQueue()
+        self._queues = {}
+
+    def _get_queue(self, priority):
+        if priority not in self._queues:
+            self._queues[priority] = Queue.PriorityQueue()
+        return self._queues[priority]
 
     def add(self, update):
-        self._queue.put(update)
+        self._get_queue(update.priority).put(update)
+
+    def depth(self, priority):
+        """Returns the number of updates of a priority waiting"""
+        return self._get_queue(priority).qsize()
 
-    def each_update_to_next_router(self):
-        """Grabs the next router from the queue and processes
+    def each_update_to_next_router(self, priority=PRIORITY_RPC):
+        """Grabs the next router of a priority from the queue and processes
 
         This method uses a for loop to process the router repeatedly until
-        updates stop bubbling to the front of the queue.
+        updates stop bubbling to the front of the queue.  The updates of the
+        other priorities for a router being processed are processed by the
+        same worker.
         """
-        next_update = self._queue.get()
+        next_update = self._get_queue(priority).get()
 
         with ExclusiveRouterProcessor(next_update.id) as rp:
             # Queue the update whether this worker is the master or not.
@@ -330,6 +404,49 @@ class RouterProcessingQueue(object):
                 yield (rp, update)
 
 
+class GratuitousArpSender(object):
+    """Sends gratuitous ARPs in the background.
+
+    The addresses queued are sent for by a pool of workers, which send for
+    several addresses concurrently, and no more than rate_limit sends are
+    started per second. An address queued again before its send started is
+    only sent for once.
+    """
+    def __init__(self, send, workers, rate_limit=0):
+        self._send = send
+        self._pool = eventlet.GreenPool(max(workers, 1))
+        self._interval = 1.0 / rate_limit if rate_limit > 0 else 0
+        self._queue = collections.deque()
+        self._queued = set()
+        self._dispatcher = None
+
+    def queue(self, *args):
+        if args in self._queued:
+            return
+        self._queued.add(args)
+        self._queue.append(args)
+        if self._dispatcher is None:
+            self._dispatcher = eventlet.spawn(self._dispatch)
+
+    def _dispatch(self):
+        try:
+            while self._queue:
+                args = self._queue.popleft()
+                self._queued.discard(args)
+                # Waits for a free worker
+                self._pool.spawn_n(self._send, *args)
+                if self._interval:
+                    eventlet.sleep(self._interval)
+        finally:
+            self._dispatcher = None
+
+    def waitall(self):
+        """Waits until the addresses queued are all sent for."""
+        if self._dispatcher is not None:
+            self._dispatcher.wait()
+        self._pool.waitall()
+
+
 class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     """Manager for L3NatAgent
 
@@ -372,6 +489,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default=3,
                    help=_("Send this many gratuitous ARPs for HA setup, if "
                           "less than or equal to 0, the feature is disabled")),
+        cfg.IntOpt('send_arp_workers',
+                   default=16,
+                   help=_("Number of addresses the gratuitous ARPs are sent "
+                          "for concurrently.")),
+        cfg.IntOpt('send_arp_rate_limit',
+                   default=100,
+                   help=_("Maximum number of addresses per second the "
+                          "sending of gratuitous ARPs is started for, if "
+                          "less than or equal to 0, it is not limited.")),
         cfg.StrOpt('router_id', default='',
                    help=_("If namespaces is disabled, the l3 agent can only"
                           " configure a router that has the matching router "
@@ -390,6 +516,18 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                    default='$state_path/metadata_proxy',
                    help=_('Location of Metadata Proxy UNIX domain '
                           'socket')),
+        cfg.IntOpt('rpc_router_workers', default=8,
+                   help=_("Number of routers processed concurrently for the "
+                          "updates notified by the server.")),
+        cfg.IntOpt('sync_router_workers', default=8,
+                   help=_("Number of routers processed concurrently for a "
+                          "full resync with the server, in addition to the "
+                          "routers of the notified updates.")),
+        cfg.IntOpt('sync_routers_chunk_size', default=256,
+                   help=_("Number of routers fetched from the server in one "
+                          "call by a full resync. The routers whose "
+                          "revision did not change since they were last "
+                          "processed are not fetched.")),
     ]
 
     def __init__(self, host, conf=None):
@@ -416,11 +554,18 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.context = context.get_admin_context_without_session()
         self.plugin_rpc = L3PluginApi(topics.L3PLUGIN, host)
         self.fullsync = True
+        # router id -> revision of the router data last processed by a
+        # full resync
+        self._router_revisions = {}
         self.updated_routers = set()
         self.removed_routers = set()
         self.sync_progress = False
 
         self._clean_stale_namespaces = self.conf.use_namespaces
+        self._namespace_cleaner = namespace_cleanup.NamespaceCleaner(
+            self.root_helper)
+        # green thread destroying the stale namespaces
+        self._namespace_cleanup = None
 
         # dvr data
         self.agent_gateway_port = None
@@ -429,6 +574,12 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         self.fip_priorities = set(range(FIP_PR_START, FIP_PR_END))
 
         self._queue = RouterProcessingQueue()
+        # count, total and longest seconds of the router updates processed
+        # since the last report
+        self._processing_stats = [0, 0.0, 0.0]
+        self._garp_sender = GratuitousArpSender(
+            self._arping, self.conf.send_arp_workers,
+            self.conf.send_arp_rate_limit)
         super(L3NATAgent, self).__init__(conf=self.conf)
 
         self.target_ex_net_id = None
@@ -449,6 +600,14 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             LOG.error(msg)
             raise SystemExit(1)
 
+        for opt in ('rpc_router_workers', 'sync_router_workers',
+                    'sync_routers_chunk_size'):
+            if self.conf[opt] < 1:
+                msg = _('%(opt)s must be at least 1, got %(value)d.') % {
+                    'opt': opt, 'value': self.conf[opt]}
+                LOG.error(msg)
+                raise SystemExit(1)
+
     def _list_namespaces(self):
         """Get a set of all router namespaces on host
 
@@ -484,26 +643,54 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         The argumenet router_namespaces is a list of stale router namespaces
 
         As some stale router namespaces may not be able to be deleted, only
-        one attempt will be made to delete them.
+        one attempt will be made to delete them. They are destroyed
+        concurrently in the background, so that the processing of the
+        routers is not held up, and the namespace of a router processed
+        or added meanwhile is left alone.
         """
-        for ns in router_namespaces:
-            ra.disable_ipv6_ra(ns[len(NS_PREFIX):], ns, self.root_helper)
-            try:
-                self._destroy_namespace(ns)
-            except RuntimeError:
-                LOG.exception(_('Failed to destroy stale router namespace '
-                                '%s'), ns)
         self._clean_stale_namespaces = False
+        if router_namespaces:
+            self._namespace_cleanup = (
+                self._namespace_cleaner.cleanup_in_background(
+                    router_namespaces, self._destroy_stale_router_namespace))
 
-    def _destroy_namespace(self, ns):
+    def _destroy_stale_router_namespace(self, ns, devices):
+        """Destroys a stale router namespace unless the router is in use
+
+        The router is processed exclusively while its namespace is
+        destroyed. The updates of the router which come in meanwhile are
+        queued again for the workers.
+        """
+        router_id = ns[len(NS_PREFIX):]
+        with ExclusiveRouterProcessor(router_id) as rp:
+            if not rp.is_master or router_id in self.router_info:
+                LOG.debug("Router %s is in use, not destroying its "
+                          "namespace", router_id)
+                return
+            ra.disable_ipv6_ra(router_id, ns, self.root_helper)
+            self._destroy_namespace(ns, devices)
+            updates = list(rp.updates())
+        for update in updates:
+            self._queue.add(update)
+
+    def _destroy_namespace(self, ns, devices=None):
         if ns.startswith(NS_PREFIX):
             if self.conf.enable_metadata_proxy:
                 self._destroy_metadata_proxy(ns[len(NS_PREFIX):], ns)
-            self._destroy_router_namespace(ns)
+            self._destroy_router_namespace(ns, devices)
         elif ns.startswith(FIP_NS_PREFIX):
-            self._destroy_fip_namespace(ns)
+            self._destroy_fip_namespace(ns, devices)
         elif ns.startswith(SNAT_NS_PREFIX):
-            self._destroy_snat_namespace(ns)
+            self._destroy_snat_namespace(ns, devices)
+
+    def _get_namespace_devices(self, ns_ip, devices=None):
+        """Returns the names of the devices of a namespace, unless they
+        were already listed.
+        """
+        if devices is None:
+            devices = [d.name
+                       for d in ns_ip.get_devices(exclude_loopback=True)]
+        return devices
 
     def _delete_namespace(self, ns_ip, ns):
         try:
@@ -512,13 +699,13 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             msg = _('Failed trying to delete namespace: %s') % ns
             LOG.exception(msg)
 
-    def _destroy_snat_namespace(self, ns):
+    def _destroy_snat_namespace(self, ns, devices=None):
         ns_ip = ip_lib.IPWrapper(self.root_helper, namespace=ns)
         # delete internal interfaces
-        for d in ns_ip.get_devices(exclude_loopback=True):
-            if d.name.startswith(SNAT_INT_DEV_PREFIX):
-                LOG.debug('Unplugging DVR device %s', d.name)
-                self.driver.unplug(d.name, namespace=ns,
+        for name in self._get_namespace_devices(ns_ip, devices):
+            if name.startswith(SNAT_INT_DEV_PREFIX):
+                LOG.debug('Unplugging DVR device %s', name)
+                self.driver.unplug(name, namespace=ns,
                                    prefix=SNAT_INT_DEV_PREFIX)
 
         # TODO(mrsmith): delete ext-gw-port
@@ -526,18 +713,18 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         if self.conf.router_delete_namespaces:
             self._delete_namespace(ns_ip, ns)
 
-    def _destroy_fip_namespace(self, ns):
+    def _destroy_fip_namespace(self, ns, devices=None):
         ns_ip = ip_lib.IPWrapper(self.root_helper, namespace=ns)
-        for d in ns_ip.get_devices(exclude_loopback=True):
-            if d.name.startswith(FIP_2_ROUTER_DEV_PREFIX):
+        for name in self._get_namespace_devices(ns_ip, devices):
+            if name.startswith(FIP_2_ROUTER_DEV_PREFIX):
                 # internal link between IRs and FIP NS
                 # TODO(mrsmith): remove IR interfaces (IP pool?)
                 pass
-            elif d.name.startswith(FIP_EXT_DEV_PREFIX):
+            elif name.startswith(FIP_EXT_DEV_PREFIX):
                 # single port from FIP NS to br-ext
                 # TODO(mrsmith): remove br-ext interface
-                LOG.debug('DVR: unplug: %s', d.name)
-                self.driver.unplug(d.name,
+                LOG.debug('DVR: unplug: %s', name)
+                self.driver.unplug(name,
                                    bridge=self.conf.external_network_bridge,
                                    namespace=ns,
                                    prefix=FIP_EXT_DEV_PREFIX)
@@ -547,15 +734,15 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self._delete_namespace(ns_ip, ns)
         self.agent_gateway_port = None
 
-    def _destroy_router_namespace(self, ns):
+    def _destroy_router_namespace(self, ns, devices=None):
         ns_ip = ip_lib.IPWrapper(self.root_helper, namespace=ns)
-        for d in ns_ip.get_devices(exclude_loopback=True):
-            if d.name.startswith(INTERNAL_DEV_PREFIX):
+        for name in self._get_namespace_devices(ns_ip, devices):
+            if name.startswith(INTERNAL_DEV_PREFIX):
                 # device is on default bridge
-                self.driver.unplug(d.name, namespace=ns,
+                self.driver.unplug(name, namespace=ns,
                                    prefix=INTERNAL_DEV_PREFIX)
-            elif d.name.startswith(EXTERNAL_DEV_PREFIX):
-                self.driver.unplug(d.name,
+            elif name.startswith(EXTERNAL_DEV_PREFIX):
+                self.driver.unplug(name,
                                    bridge=self.conf.external_network_bridge,
                                    namespace=ns,
                                    prefix=EXTERNAL_DEV_PREFIX)
@@ -615,6 +802,7 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self._spawn_metadata_proxy(ri.router_id, ri.ns_name)
 
     def _router_removed(self, router_id):
+        self._router_revisions.pop(router_id, None)
         ri = self.router_info.get(router_id)
         if ri is None:
             LOG.warn(_("Info for router %s were not found. "
@@ -691,23 +879,129 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
         prefixlen = netaddr.IPNetwork(port['subnet']['cidr']).prefixlen
         port['ip_cidr'] = "%s/%s" % (ips[0]['ip_address'], prefixlen)
 
-    def _get_existing_devices(self, ri):
+    def _get_existing_addresses(self, ri):
+        """Return the addresses of the devices of a router by device name.
+
+        They are listed at once, the addresses with the devices.
+        """
         ip_wrapper = ip_lib.IPWrapper(root_helper=self.root_helper,
                                       namespace=ri.ns_name)
-        ip_devs = ip_wrapper.get_devices(exclude_loopback=True)
-        return [ip_dev.name for ip_dev in ip_devs]
+        return ip_wrapper.get_addresses(exclude_loopback=True)
 
     def process_router(self, ri):
         # TODO(mrsmith) - we shouldn't need to check here
         if 'distributed' not in ri.router:
             ri.router['distributed'] = False
+        # Only the parts of the router whose payload changed since it was
+        # last processed are configured, and an unchanged router is left
+        # as it is.
+        snapshot = ri.snapshot()
+        changes = ri.get_changes(snapshot)
+        if changes is not None:
+            if not changes & (ROUTER_INTERFACE_KEYS | ROUTER_GATEWAY_KEYS |
+                              ROUTER_FLOATINGIP_KEYS | ROUTER_ROUTE_KEYS):
+                LOG.debug(_("Router %s is unchanged"), ri.router_id)
+                ri.set_processed(snapshot)
+                return
+            LOG.debug(_("Processing the changes of router %(router_id)s: "
+                        "%(changes)s"),
+                      {'router_id': ri.router_id, 'changes': sorted(changes)})
+            interfaces_changed = bool(changes & ROUTER_INTERFACE_KEYS)
+            gateway_changed = bool(changes & ROUTER_GATEWAY_KEYS)
+            fips_changed = bool(changes & ROUTER_FLOATINGIP_KEYS)
+            routes_changed = bool(changes & ROUTER_ROUTE_KEYS)
+        else:
+            interfaces_changed = gateway_changed = True
+            fips_changed = routes_changed = True
+        # A failure leaves the router to be processed in full
+        ri.set_processed(None)
+
         ri.iptables_manager.defer_apply_on()
         ex_gw_port = self._get_ex_gw_port(ri)
         internal_ports = ri.router.get(l3_constants.INTERFACE_KEY, [])
         snat_ports = ri.router.get(l3_constants.SNAT_ROUTER_INTF_KEY, [])
-        existing_port_ids = set([p['id'] for p in ri.internal_ports])
         current_port_ids = set([p['id'] for p in internal_ports
                                 if p['admin_state_up']])
+        if interfaces_changed:
+            self._process_internal_ports(ri, internal_ports,
+                                         current_port_ids)
+
+        existing_addresses = existing_devices = None
+        if interfaces_changed or gateway_changed:
+            existing_addresses = self._get_existing_addresses(ri)
+            existing_devices = list(existing_addresses)
+        # The addresses of the gateway device only change when it is
+        # plugged or unplugged
+        if ex_gw_port != ri.ex_gw_port:
+            existing_addresses = None
+        if interfaces_changed:
+            self._remove_stale_internal_devices(ri, existing_devices,
+                                                current_port_ids)
+
+        # Get IPv4 only internal CIDRs
+        internal_cidrs = [p['ip_cidr'] for p in ri.internal_ports
+                          if netaddr.IPNetwork(p['ip_cidr']).version == 4]
+        # TODO(salv-orlando): RouterInfo would be a better place for
+        # this logic too
+        ex_gw_port_id = (ex_gw_port and ex_gw_port['id'] or
+                         ri.ex_gw_port and ri.ex_gw_port['id'])
+
+        interface_name = None
+        if ex_gw_port_id:
+            interface_name = self.get_external_device_name(ex_gw_port_id)
+        if gateway_changed:
+            self._process_external_gateway(ri, ex_gw_port, interface_name,
+                                           internal_cidrs, existing_devices)
+
+        # Process static routes for router
+        if routes_changed:
+            self.routes_updated(ri)
+        # Process SNAT rules for external gateway
+        if ((interfaces_changed or gateway_changed) and
+            (not ri.router['distributed'] or
+             ex_gw_port and ri.router['gw_port_host'] == self.host)):
+            ri.perform_snat_action(self._handle_router_snat_rules,
+                                   internal_cidrs, interface_name)
+
+        # Process SNAT/DNAT rules for floating IPs
+        fip_statuses = {}
+        process_fips = ex_gw_port and (fips_changed or gateway_changed)
+        if ex_gw_port and not process_fips:
+            ri.iptables_manager.defer_apply_off()
+        try:
+            if process_fips:
+                existing_floating_ips = ri.floating_ips
+                self.process_router_floating_ip_nat_rules(ri)
+                ri.iptables_manager.defer_apply_off()
+                # Once NAT rules for floating IPs are safely in place
+                # configure their addresses on the external gateway port
+                fip_statuses = self.process_router_floating_ip_addresses(
+                    ri, ex_gw_port, existing_addresses)
+        except Exception:
+            # TODO(salv-orlando): Less broad catching
+            # All floating IPs must be put in error state
+            for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
+                fip_statuses[fip['id']] = l3_constants.FLOATINGIP_STATUS_ERROR
+
+        if process_fips:
+            # Identify floating IPs which were disabled
+            ri.floating_ips = set(fip_statuses.keys())
+            for fip_id in existing_floating_ips - ri.floating_ips:
+                fip_statuses[fip_id] = l3_constants.FLOATINGIP_STATUS_DOWN
+            # Update floating IP status on the neutron server
+            self.plugin_rpc.update_floatingip_statuses(
+                self.context, ri.router_id, fip_statuses)
+
+        # Update ex_gw_port and enable_snat on the router info cache
+        ri.ex_gw_port = ex_gw_port
+        ri.snat_ports = snat_ports
+        ri.enable_snat = ri.router.get('enable_snat')
+        # The floating IPs which failed are retried with the next payload
+        if l3_constants.FLOATINGIP_STATUS_ERROR not in fip_statuses.values():
+            ri.set_processed(snapshot)
+
+    def _process_internal_ports(self, ri, internal_ports, current_port_ids):
+        existing_port_ids = set([p['id'] for p in ri.internal_ports])
         new_ports = [p for p in internal_ports if
                      p['id'] in current_port_ids and
                      p['id'] not in existing_port_ids]
@@ -739,7 +1033,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                               self.get_internal_device_name,
                               self.root_helper)
 
-        existing_devices = self._get_existing_devices(ri)
+    def _remove_stale_internal_devices(self, ri, existing_devices,
+                                       current_port_ids):
         current_internal_devs = set([n for n in existing_devices
                                      if n.startswith(INTERNAL_DEV_PREFIX)])
         current_port_devs = set([self.get_internal_device_name(id) for
@@ -752,17 +1047,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                                namespace=ri.ns_name,
                                prefix=INTERNAL_DEV_PREFIX)
 
-        # Get IPv4 only internal CIDRs
-        internal_cidrs = [p['ip_cidr'] for p in ri.internal_ports
-                          if netaddr.IPNetwork(p['ip_cidr']).version == 4]
-        # TODO(salv-orlando): RouterInfo would be a better place for
-        # this logic too
-        ex_gw_port_id = (ex_gw_port and ex_gw_port['id'] or
-                         ri.ex_gw_port and ri.ex_gw_port['id'])
-
-        interface_name = None
-        if ex_gw_port_id:
-            interface_name = self.get_external_device_name(ex_gw_port_id)
+    def _process_external_gateway(self, ri, ex_gw_port, interface_name,
+                                  internal_cidrs, existing_devices):
         if ex_gw_port and ex_gw_port != ri.ex_gw_port:
             self._set_subnet_info(ex_gw_port)
             self.external_gateway_added(ri, ex_gw_port,
@@ -782,45 +1068,6 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                                namespace=ri.ns_name,
                                prefix=EXTERNAL_DEV_PREFIX)
 
-        # Process static routes for router
-        self.routes_updated(ri)
-        # Process SNAT rules for external gateway
-        if (not ri.router['distributed'] or
-            ex_gw_port and ri.router['gw_port_host'] == self.host):
-            ri.perform_snat_action(self._handle_router_snat_rules,
-                                   internal_cidrs, interface_name)
-
-        # Process SNAT/DNAT rules for floating IPs
-        fip_statuses = {}
-        try:
-            if ex_gw_port:
-                existing_floating_ips = ri.floating_ips
-                self.process_router_floating_ip_nat_rules(ri)
-                ri.iptables_manager.defer_apply_off()
-                # Once NAT rules for floating IPs are safely in place
-                # configure their addresses on the external gateway port
-                fip_statuses = self.process_router_floating_ip_addresses(
-                    ri, ex_gw_port)
-        except Exception:
-            # TODO(salv-orlando): Less broad catching
-            # All floating IPs must be put in error state
-            for fip in ri.router.get(l3_constants.FLOATINGIP_KEY, []):
-                fip_statuses[fip['id']] = l3_constants.FLOATINGIP_STATUS_ERROR
-
-        if ex_gw_port:
-            # Identify floating IPs which were disabled
-            ri.floating_ips = set(fip_statuses.keys())
-            for fip_id in existing_floating_ips - ri.floating_ips:
-                fip_statuses[fip_id] = l3_constants.FLOATINGIP_STATUS_DOWN
-            # Update floating IP status on the neutron server
-            self.plugin_rpc.update_floatingip_statuses(
-                self.context, ri.router_id, fip_statuses)
-
-        # Update ex_gw_port and enable_snat on the router info cache
-        ri.ex_gw_port = ex_gw_port
-        ri.snat_ports = snat_ports
-        ri.enable_snat = ri.router.get('enable_snat')
-
     def _handle_router_snat_rules(self, ri, ex_gw_port, internal_cidrs,
                                   interface_name, action):
         # Remove all the rules
@@ -882,26 +1129,34 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
         Configures iptables rules for the floating ips of the given router
         """
-        # Clear out all iptables rules for floating ips
-        ri.iptables_manager.ipv4['nat'].clear_rules_by_tag('floating_ip')
-
-        floating_ips = self.get_floating_ips(ri)
-        # Loop once to ensure that floating ips are configured.
-        for fip in floating_ips:
-            # Rebuild iptables rules for the floating ip.
-            fixed = fip['fixed_ip_address']
-            fip_ip = fip['floating_ip_address']
-            for chain, rule in self.floating_forward_rules(fip_ip, fixed):
-                ri.iptables_manager.ipv4['nat'].add_rule(chain, rule,
-                                                         tag='floating_ip')
+        nat = ri.iptables_manager.ipv4['nat']
+        # Only the rules of the floating ips which were added, removed or
+        # remapped are changed
+        fip_rules = {}
+        for fip in self.get_floating_ips(ri):
+            fip_rules[fip['id']] = self.floating_forward_rules(
+                fip['floating_ip_address'], fip['fixed_ip_address'])
+
+        for fip_id, rules in ri.floating_ip_nat_rules.items():
+            if fip_rules.get(fip_id) != rules:
+                for chain, rule in rules:
+                    nat.remove_rule(chain, rule)
+        for fip_id, rules in fip_rules.items():
+            if ri.floating_ip_nat_rules.get(fip_id) != rules:
+                for chain, rule in rules:
+                    nat.add_rule(chain, rule, tag='floating_ip')
+        ri.floating_ip_nat_rules = fip_rules
 
         ri.iptables_manager.apply()
 
-    def process_router_floating_ip_addresses(self, ri, ex_gw_port):
+    def process_router_floating_ip_addresses(self, ri, ex_gw_port,
+                                             existing_addresses=None):
         """Configure IP addresses on router's external gateway interface.
 
         Ensures addresses for existing floating IPs and cleans up
-        those that should not longer be configured.
+        those that should not longer be configured. existing_addresses
+        are the addresses of the devices of the router by device name,
+        if they were already listed.
         """
         fip_statuses = {}
 
@@ -926,50 +1181,86 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
 
         device = ip_lib.IPDevice(interface_name, self.root_helper,
                                  namespace=ri.ns_name)
-        existing_cidrs = set([addr['cidr'] for addr in device.addr.list()])
+        if existing_addresses and interface_name in existing_addresses:
+            addresses = existing_addresses[interface_name]
+        else:
+            addresses = device.addr.list()
+        existing_cidrs = set([addr['cidr'] for addr in addresses])
         new_cidrs = set()
+        added_fips = []
 
         # Loop once to ensure that floating ips are configured.
         for fip in floating_ips:
-            fip_ip = fip['floating_ip_address']
-            ip_cidr = str(fip_ip) + FLOATING_IP_CIDR_SUFFIX
-
+            ip_cidr = str(fip['floating_ip_address']) + FLOATING_IP_CIDR_SUFFIX
             new_cidrs.add(ip_cidr)
-
             if ip_cidr not in existing_cidrs:
-                net = netaddr.IPNetwork(ip_cidr)
-                try:
-                    device.addr.add(net.version, ip_cidr, str(net.broadcast))
-                except (processutils.UnknownArgumentError,
-                        processutils.ProcessExecutionError):
-                    # any exception occurred here should cause the floating IP
-                    # to be set in error state
-                    fip_statuses[fip['id']] = (
-                        l3_constants.FLOATINGIP_STATUS_ERROR)
-                    LOG.warn(_("Unable to configure IP address for "
-                               "floating IP: %s"), fip['id'])
-                    continue
-                if ri.router['distributed']:
-                    # Special Handling for DVR - update FIP namespace
-                    # and ri.namespace to handle DVR based FIP
-                    self.floating_ip_added_dist(ri, fip)
-                else:
-                    # As GARP is processed in a distinct thread the call below
-                    # won't raise an exception to be handled.
-                    self._send_gratuitous_arp_packet(
-                        ri.ns_name, interface_name, fip_ip)
+                added_fips.append((fip, ip_cidr))
             fip_statuses[fip['id']] = (
                 l3_constants.FLOATINGIP_STATUS_ACTIVE)
 
+        failed_cidrs = self._add_floating_ip_addresses(
+            device, [cidr for fip, cidr in added_fips])
+        for fip, ip_cidr in added_fips:
+            if ip_cidr in failed_cidrs:
+                # any exception occurred here should cause the floating IP
+                # to be set in error state
+                fip_statuses[fip['id']] = (
+                    l3_constants.FLOATINGIP_STATUS_ERROR)
+                LOG.warn(_("Unable to configure IP address for "
+                           "floating IP: %s"), fip['id'])
+            elif ri.router['distributed']:
+                # Special Handling for DVR - update FIP namespace
+                # and ri.namespace to handle DVR based FIP
+                self.floating_ip_added_dist(ri, fip)
+            else:
+                # As GARP is processed in a distinct thread the call below
+                # won't raise an exception to be handled.
+                self._send_gratuitous_arp_packet(
+                    ri.ns_name, interface_name, fip['floating_ip_address'])
+
         # Clean up addresses that no longer belong on the gateway interface.
-        for ip_cidr in existing_cidrs - new_cidrs:
-            if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX):
-                net = netaddr.IPNetwork(ip_cidr)
-                device.addr.delete(net.version, ip_cidr)
-                if ri.router['distributed']:
-                    self.floating_ip_removed_dist(ri, ip_cidr)
+        stale_cidrs = [ip_cidr for ip_cidr in existing_cidrs - new_cidrs
+                       if ip_cidr.endswith(FLOATING_IP_CIDR_SUFFIX)]
+        self._delete_floating_ip_addresses(device, stale_cidrs)
+        if ri.router['distributed']:
+            for ip_cidr in stale_cidrs:
+                self.floating_ip_removed_dist(ri, ip_cidr)
         return fip_statuses
 
+    def _add_floating_ip_addresses(self, device, ip_cidrs):
+        """Adds addresses to a device, in a single ip -batch call if there
+        are several, and returns the ones which could not be added.
+        """
+        if len(ip_cidrs) > 1:
+            try:
+                device.addr.batch(
+                    add=[(ip_cidr, str(netaddr.IPNetwork(ip_cidr).broadcast))
+                         for ip_cidr in ip_cidrs])
+                return set()
+            except RuntimeError:
+                # The other addresses of the batch were added
+                existing_cidrs = set([addr['cidr']
+                                      for addr in device.addr.list()])
+                return set(ip_cidrs) - existing_cidrs
+
+        failed_cidrs = set()
+        for ip_cidr in ip_cidrs:
+            net = netaddr.IPNetwork(ip_cidr)
+            try:
+                device.addr.add(net.version, ip_cidr, str(net.broadcast))
+            except (processutils.UnknownArgumentError,
+                    processutils.ProcessExecutionError):
+                failed_cidrs.add(ip_cidr)
+        return failed_cidrs
+
+    def _delete_floating_ip_addresses(self, device, ip_cidrs):
+        if len(ip_cidrs) > 1:
+            device.addr.batch(delete=ip_cidrs)
+            return
+        for ip_cidr in ip_cidrs:
+            net = netaddr.IPNetwork(ip_cidr)
+            device.addr.delete(net.version, ip_cidr)
+
     def _get_ex_gw_port(self, ri):
         return ri.router.get('gw_port')
 
@@ -997,8 +1288,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
     def _send_gratuitous_arp_packet(self, ns_name, interface_name, ip_address,
                                     distributed=False):
         if self.conf.send_arp_for_ha > 0:
-            eventlet.spawn_n(self._arping, ns_name, interface_name, ip_address,
-                             distributed)
+            self._garp_sender.queue(ns_name, interface_name, ip_address,
+                                    distributed)
 
     def get_internal_port(self, ri, subnet_id):
         """Return internal router port based on subnet_id."""
@@ -1552,15 +1843,24 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 self._router_added(r['id'], r)
             ri = self.router_info[r['id']]
             ri.router = r
-            pool.spawn_n(self.process_router, ri)
+            pool.spawn_n(self._process_router, ri)
         # identify and remove routers that no longer exist
         for router_id in prev_router_ids - cur_router_ids:
             pool.spawn_n(self._router_removed, router_id)
         pool.waitall()
 
-    def _process_router_update(self):
-        for rp, update in self._queue.each_update_to_next_router():
+    def _process_router(self, ri):
+        try:
+            self.process_router(ri)
+        except Exception:
+            # The next full resync fetches the router again
+            self._router_revisions.pop(ri.router_id, None)
+            raise
+
+    def _process_router_update(self, priority=PRIORITY_RPC):
+        for rp, update in self._queue.each_update_to_next_router(priority):
             LOG.debug("Starting router update for %s", update.id)
+            start = time.time()
             router = update.router
             if update.action != DELETE_ROUTER and not router:
                 try:
@@ -1580,15 +1880,39 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 self._router_removed(update.id)
                 continue
 
+            if update.revision:
+                self._router_revisions[update.id] = update.revision
             self._process_routers([router])
-            LOG.debug("Finished a router update for %s", update.id)
+            elapsed = time.time() - start
+            LOG.debug("Finished a router update for %(router_id)s in "
+                      "%(elapsed).3f seconds",
+                      {'router_id': update.id, 'elapsed': elapsed})
+            self._record_processing_time(elapsed)
             rp.fetched_and_processed(update.timestamp)
 
-    def _process_routers_loop(self):
-        LOG.debug("Starting _process_routers_loop")
-        pool = eventlet.GreenPool(size=8)
+    def _record_processing_time(self, elapsed):
+        stats = self._processing_stats
+        stats[0] += 1
+        stats[1] += elapsed
+        stats[2] = max(stats[2], elapsed)
+
+    def get_processing_stats(self):
+        """Returns the processing statistics and resets the times"""
+        count, total, longest = self._processing_stats
+        self._processing_stats = [0, 0.0, 0.0]
+        average = total / count if count else 0.0
+        return {'rpc_updates_queued': self._queue.depth(PRIORITY_RPC),
+                'sync_updates_queued': self._queue.depth(
+                    PRIORITY_SYNC_ROUTERS_TASK),
+                'routers_processed': count,
+                'average_processing_time': round(average, 3),
+                'max_processing_time': round(longest, 3)}
+
+    def _process_routers_loop(self, priority=PRIORITY_RPC, workers=8):
+        LOG.debug("Starting _process_routers_loop for priority %s", priority)
+        pool = eventlet.GreenPool(size=workers)
         while True:
-            pool.spawn_n(self._process_router_update)
+            pool.spawn_n(self._process_router_update, priority)
 
     def _process_router_delete(self):
         current_removed_routers = list(self.removed_routers)
@@ -1624,16 +1948,8 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.updated_routers.clear()
             self.removed_routers.clear()
             timestamp = timeutils.utcnow()
-            routers = self.plugin_rpc.get_routers(
-                context, router_ids)
-
-            LOG.debug(_('Processing :%r'), routers)
-            for r in routers:
-                update = RouterUpdate(r['id'],
-                                      PRIORITY_SYNC_ROUTERS_TASK,
-                                      router=r,
-                                      timestamp=timestamp)
-                self._queue.add(update)
+            curr_router_ids = self._fetch_sync_routers(context, router_ids,
+                                                       timestamp)
             self.fullsync = False
             LOG.debug(_("_sync_routers_task successfully completed"))
         except n_rpc.RPCException:
@@ -1644,8 +1960,6 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
             self.fullsync = True
         else:
             # Resync is not necessary for the cleanup of stale namespaces
-            curr_router_ids = set([r['id'] for r in routers])
-
             # Two kinds of stale routers:  Routers for which info is cached in
             # self.router_info and the others.  First, handle the former.
             for router_id in prev_router_ids - curr_router_ids:
@@ -1661,8 +1975,55 @@ class L3NATAgent(firewall_l3_agent.FWaaSL3AgentRpcCallback, manager.Manager):
                 ids_to_keep = curr_router_ids | prev_router_ids
                 self._cleanup_namespaces(namespaces, ids_to_keep)
 
+    def _queue_sync_routers(self, routers, timestamp, revisions=None):
+        LOG.debug(_('Processing :%r'), routers)
+        for r in routers:
+            update = RouterUpdate(r['id'],
+                                  PRIORITY_SYNC_ROUTERS_TASK,
+                                  router=r,
+                                  timestamp=timestamp,
+                                  revision=(revisions or {}).get(r['id']))
+            self._queue.add(update)
+
+    def _fetch_sync_routers(self, context, router_ids, timestamp):
+        """Queue the routers of a full resync and return their ids.
+
+        The revisions of the routers are fetched first, then the routers
+        whose revision changed since they were last processed are fetched
+        by chunks of sync_routers_chunk_size routers.
+        """
+        try:
+            revisions = self.plugin_rpc.get_router_revisions(context,
+                                                             router_ids)
+        except n_rpc.RemoteError:
+            LOG.warn(_("Failed fetching the router revisions, fetching "
+                       "all the routers at once"), exc_info=True)
+            routers = self.plugin_rpc.get_routers(context, router_ids)
+            self._queue_sync_routers(routers, timestamp)
+            return set([r['id'] for r in routers])
+
+        changed = sorted(
+            router_id for router_id, revision in revisions.iteritems()
+            if (router_id not in self.router_info or
+                self._router_revisions.get(router_id) != revision))
+        LOG.debug(_("Fetching %(changed)d of %(total)d routers"),
+                  {'changed': len(changed), 'total': len(revisions)})
+        router_ids = set(revisions)
+        chunk_size = max(self.conf.sync_routers_chunk_size, 1)
+        for i in range(0, len(changed), chunk_size):
+            chunk = changed[i:i + chunk_size]
+            routers = self.plugin_rpc.get_routers(context, chunk)
+            self._queue_sync_routers(routers, timestamp, revisions)
+            # the routers deleted since their revision was fetched
+            router_ids -= set(chunk) - set([r['id'] for r in routers])
+        return router_ids
+
     def after_start(self):
-        eventlet.spawn_n(self._process_routers_loop)
+        eventlet.spawn_n(self._process_routers_loop, PRIORITY_RPC,
+                         self.conf.rpc_router_workers)
+        eventlet.spawn_n(self._process_routers_loop,
+                         PRIORITY_SYNC_ROUTERS_TASK,
+                         self.conf.sync_router_workers)
         LOG.info(_("L3 agent started"))
 
     def _update_routing_table(self, ri, operation, route):
@@ -1739,6 +2100,7 @@ class L3NATAgentWithStateReport(L3NATAgent):
         configurations['ex_gw_ports'] = num_ex_gw_ports
         configurations['interfaces'] = num_interfaces
         configurations['floating_ips'] = num_floating_ips
+        configurations.update(self.get_processing_stats())
         try:
             self.state_rpc.report_state(self.context, self.agent_state,
                                         self.use_call)
@@ -1769,6 +2131,7 @@ def main(manager='neutron.agent.l3_agent.L3NATAgentWithStateReport'):
     config.register_root_helper(conf)
     conf.register_opts(interface.OPTS)
     conf.register_opts(external_process.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     common_config.init(sys.argv[1:])
     config.setup_logging(conf)
     server = neutron_service.Service.create(
@@ -40,6 +40,11 @@ class AsyncProcess(object):
     being cleaned up and the process restarted after the specified
     interval.
 
+    If max_queue_size is provided, the queues hold at most that many
+    lines and the lines read while a queue is full are dropped, after
+    calling _handle_overflow(). The depth of the queues and the number
+    of dropped lines are returned by get_stats().
+
     Example usage:
 
     >>> import time
@@ -51,7 +56,8 @@ class AsyncProcess(object):
     ...     print line
     """
 
-    def __init__(self, cmd, root_helper=None, respawn_interval=None):
+    def __init__(self, cmd, root_helper=None, respawn_interval=None,
+                 max_queue_size=None):
         """Constructor.
 
         :param cmd: The list of command arguments to invoke.
@@ -59,20 +65,26 @@ class AsyncProcess(object):
         :param respawn_interval: Optional, the interval in seconds to wait
                to respawn after unexpected process death. Respawn will
                only be attempted if a value of 0 or greater is provided.
+        :param max_queue_size: Optional, the maximum number of lines kept
+               in each of the stdout and stderr queues.
         """
         self.cmd = cmd
         self.root_helper = root_helper
         if respawn_interval is not None and respawn_interval < 0:
             raise ValueError(_('respawn_interval must be >= 0 if provided.'))
         self.respawn_interval = respawn_interval
+        if max_queue_size is not None and max_queue_size < 1:
+            raise ValueError(_('max_queue_size must be >= 1 if provided.'))
+        self.max_queue_size = max_queue_size
+        self.dropped_lines = 0
         self._process = None
         self._kill_event = None
         self._reset_queues()
         self._watchers = []
 
     def _reset_queues(self):
-        self._stdout_lines = eventlet.queue.LightQueue()
-        self._stderr_lines = eventlet.queue.LightQueue()
+        self._stdout_lines = eventlet.queue.LightQueue(self.max_queue_size)
+        self._stderr_lines = eventlet.queue.LightQueue(self.max_queue_size)
 
     def start(self):
         """Launch a process and monitor it asynchronously."""
@@ -194,11 +206,28 @@ class AsyncProcess(object):
         if not kill_event.ready():
             self._handle_process_error()
 
+    def _queue_line(self, queue, data):
+        try:
+            queue.put_nowait(data)
+        except eventlet.queue.Full:
+            self.dropped_lines += 1
+            self._handle_overflow()
+
+    def _handle_overflow(self):
+        """Called when a line is dropped because its queue is full."""
+        LOG.warning(_('Output of async process [%s] dropped, the queue is '
+                      'full.'), self.cmd)
+
+    def get_stats(self):
+        return {'stdout_queue_depth': self._stdout_lines.qsize(),
+                'stderr_queue_depth': self._stderr_lines.qsize(),
+                'dropped_lines': self.dropped_lines}
+
     def _read(self, stream, queue):
         data = stream.readline()
         if data:
             data = data.strip()
-            queue.put(data)
+            self._queue_line(queue, data)
             return data
 
     def _read_stdout(self):
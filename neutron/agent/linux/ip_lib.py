@@ -16,6 +16,7 @@
 import netaddr
 from oslo.config import cfg
 
+from neutron.agent.linux import netlink_lib
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 
@@ -24,8 +25,16 @@ OPTS = [
     cfg.BoolOpt('ip_lib_force_root',
                 default=False,
                 help=_('Force ip_lib calls to use the root helper')),
+    cfg.StrOpt('ip_lib_backend',
+               default='iproute2',
+               help=_("Backend used by ip_lib to query links, addresses and "
+                      "routes: 'iproute2' runs the ip command, 'netlink' "
+                      "sends rtnetlink requests from the agent process.")),
 ]
 
+IPROUTE2_BACKEND = 'iproute2'
+NETLINK_BACKEND = 'netlink'
+
 
 LOOPBACK_DEVNAME = 'lo'
 # NOTE(ethuleau): depend of the version of iproute2, the vlan
@@ -45,6 +54,24 @@ class SubProcessBase(object):
             # Only callers that need to force use of the root helper
             # need to register the option.
             self.force_root = False
+        try:
+            self.use_netlink = cfg.CONF.ip_lib_backend == NETLINK_BACKEND
+        except cfg.NoSuchOptError:
+            self.use_netlink = False
+
+    def _netlink_dump(self, *tables):
+        return netlink_lib.dump(tables, namespace=self.namespace,
+                                root_helper=self.root_helper)
+
+    def _netlink_link(self, name, *tables):
+        """Return the entry of a link and a dump of the links and tables."""
+        tables = self._netlink_dump(netlink_lib.LINKS, *tables)
+        for link in tables[netlink_lib.LINKS]:
+            if link['name'] == name:
+                return link, tables
+        raise RuntimeError(_('Device "%(name)s" does not exist in namespace '
+                             '%(namespace)s') % {'name': name,
+                                                 'namespace': self.namespace})
 
     def _run(self, options, command, args):
         if self.namespace:
@@ -68,15 +95,34 @@ class SubProcessBase(object):
                              self.root_helper,
                              namespace)
 
+    def _as_root_batch(self, commands):
+        """Run ip commands in a single ip -batch call.
+
+        The commands, lists of arguments, are all run even if some of them
+        fail, in which case RuntimeError is raised once they are done.
+        """
+        if not self.root_helper:
+            raise exceptions.SudoRequired()
+
+        process_input = ''.join(' '.join(str(arg) for arg in args) + '\n'
+                                for args in commands)
+        return utils.execute(self._ip_cmd(self.namespace) +
+                             ['-force', '-batch', '-'],
+                             root_helper=self.root_helper,
+                             process_input=process_input)
+
+    @staticmethod
+    def _ip_cmd(namespace):
+        if namespace:
+            return ['ip', 'netns', 'exec', namespace, 'ip']
+        return ['ip']
+
     @classmethod
     def _execute(cls, options, command, args, root_helper=None,
                  namespace=None):
         opt_list = ['-%s' % o for o in options]
-        if namespace:
-            ip_cmd = ['ip', 'netns', 'exec', namespace, 'ip']
-        else:
-            ip_cmd = ['ip']
-        return utils.execute(ip_cmd + opt_list + [command] + list(args),
+        return utils.execute(cls._ip_cmd(namespace) + opt_list + [command] +
+                             list(args),
                              root_helper=root_helper)
 
 
@@ -91,6 +137,12 @@ class IPWrapper(SubProcessBase):
 
     def get_devices(self, exclude_loopback=False):
         retval = []
+        if self.use_netlink:
+            links = self._netlink_dump(netlink_lib.LINKS)[netlink_lib.LINKS]
+            return [IPDevice(link['name'], self.root_helper, self.namespace)
+                    for link in links
+                    if not (exclude_loopback and
+                            link['name'] == LOOPBACK_DEVNAME)]
         output = self._execute(['o', 'd'], 'link', ('list',),
                                self.root_helper, self.namespace)
         for line in output.split('\n'):
@@ -112,6 +164,41 @@ class IPWrapper(SubProcessBase):
                                        self.namespace))
         return retval
 
+    def get_addresses(self, exclude_loopback=False):
+        """Return the addresses of all the devices of the namespace.
+
+        The result maps device names to lists of addresses in the format
+        of IpAddrCommand.list. They are all listed by a single ip command,
+        or a single dump with the netlink backend.
+        """
+        if not self.use_netlink:
+            retval = {}
+            addresses = None
+            output = self._execute([], 'addr', ('show',),
+                                   self.root_helper, self.namespace)
+            for line in output.split('\n'):
+                if line[:1].isdigit():
+                    # e.g. "2: qr-1@if4: <BROADCAST,UP> mtu 1500 ..."
+                    name = line.split(' ', 2)[1].rstrip(':').partition('@')[0]
+                    addresses = None
+                    if not (exclude_loopback and name == LOOPBACK_DEVNAME):
+                        addresses = retval[name] = []
+                elif addresses is not None and (
+                        line.strip().startswith('inet')):
+                    addresses.append(_parse_address(line.strip()))
+            return retval
+        tables = self._netlink_dump(netlink_lib.LINKS, netlink_lib.ADDRESSES)
+        names = dict((link['index'], link['name'])
+                     for link in tables[netlink_lib.LINKS]
+                     if not (exclude_loopback and
+                             link['name'] == LOOPBACK_DEVNAME))
+        retval = dict((name, []) for name in names.values())
+        for address in tables[netlink_lib.ADDRESSES]:
+            if address['index'] in names:
+                retval[names[address['index']]].append(
+                    _netlink_address(address))
+        return retval
+
     def add_tuntap(self, name, mode='tap'):
         self._as_root('', 'tuntap', ('add', name, 'mode', mode))
         return IPDevice(name, self.root_helper, self.namespace)
@@ -228,6 +315,10 @@ class IpCommandBase(object):
                                      args,
                                      kwargs.get('use_root_namespace', False))
 
+    def _as_root_batch(self, commands):
+        return self._parent._as_root_batch([[self.COMMAND] + list(args)
+                                            for args in commands])
+
 
 class IpDeviceCommandBase(IpCommandBase):
     @property
@@ -290,8 +381,20 @@ class IpLinkCommand(IpDeviceCommandBase):
 
     @property
     def attributes(self):
+        if self._parent.use_netlink:
+            link = self._parent._netlink_link(self.name)[0]
+            return self._netlink_attributes(link)
         return self._parse_line(self._run('show', self.name, options='o'))
 
+    def _netlink_attributes(self, link):
+        # Use the keys of the output of 'ip -o link show'.
+        retval = {'link/%s' % link['link_type']: link['address'],
+                  'brd': link['broadcast']}
+        for key in ('mtu', 'qdisc', 'qlen', 'state', 'alias'):
+            if link[key] is not None:
+                retval[key] = link[key]
+        return retval
+
     def _parse_line(self, value):
         if not value:
             return {}
@@ -326,6 +429,18 @@ class IpAddrCommand(IpDeviceCommandBase):
                       self.name,
                       options=[ip_version])
 
+    def batch(self, add=(), delete=(), scope='global'):
+        """Add and delete addresses in a single ip -batch call.
+
+        :param add: the (cidr, broadcast) of the addresses to add.
+        :param delete: the cidrs of the addresses to delete.
+        """
+        commands = [('add', cidr, 'brd', broadcast, 'scope', scope,
+                     'dev', self.name) for cidr, broadcast in add]
+        commands += [('del', cidr, 'dev', self.name) for cidr in delete]
+        if commands:
+            self._as_root_batch(commands)
+
     def flush(self):
         self._as_root('flush', self.name)
 
@@ -335,6 +450,9 @@ class IpAddrCommand(IpDeviceCommandBase):
 
         retval = []
 
+        if self._parent.use_netlink and not filters:
+            return self._netlink_list(scope, to)
+
         if scope:
             filters += ['scope', scope]
         if to:
@@ -342,30 +460,23 @@ class IpAddrCommand(IpDeviceCommandBase):
 
         for line in self._run('show', self.name, *filters).split('\n'):
             line = line.strip()
-            if not line.startswith('inet'):
+            if line.startswith('inet'):
+                retval.append(_parse_address(line))
+        return retval
+
+    def _netlink_list(self, scope=None, to=None):
+        link, tables = self._parent._netlink_link(self.name,
+                                                  netlink_lib.ADDRESSES)
+        retval = []
+        for address in tables[netlink_lib.ADDRESSES]:
+            if address['index'] != link['index']:
                 continue
-            parts = line.split()
-            if parts[0] == 'inet6':
-                version = 6
-                scope = parts[3]
-                broadcast = '::'
-            else:
-                version = 4
-                if parts[2] == 'brd':
-                    broadcast = parts[3]
-                    scope = parts[5]
-                else:
-                    # sometimes output of 'ip a' might look like:
-                    # inet 192.168.100.100/24 scope global eth0
-                    # and broadcast needs to be calculated from CIDR
-                    broadcast = str(netaddr.IPNetwork(parts[1]).broadcast)
-                    scope = parts[3]
-
-            retval.append(dict(cidr=parts[1],
-                               broadcast=broadcast,
-                               scope=scope,
-                               ip_version=version,
-                               dynamic=('dynamic' == parts[-1])))
+            if scope and address['scope'] != scope:
+                continue
+            if to and (netaddr.IPNetwork(address['cidr']).ip not in
+                       netaddr.IPNetwork(to)):
+                continue
+            retval.append(_netlink_address(address))
         return retval
 
 
@@ -412,6 +523,9 @@ class IpRouteCommand(IpDeviceCommandBase):
 
         retval = None
 
+        if self._parent.use_netlink and not filters:
+            return self._netlink_get_gateway(scope)
+
         if scope:
             filters += ['scope', scope]
 
@@ -430,6 +544,22 @@ class IpRouteCommand(IpDeviceCommandBase):
 
         return retval
 
+    def _netlink_get_gateway(self, scope=None):
+        # Like 'ip route list dev DEV', only look at the IPv4 routes of the
+        # main table.
+        link, tables = self._parent._netlink_link(self.name,
+                                                  netlink_lib.ROUTES)
+        for route in tables[netlink_lib.ROUTES]:
+            if (route['ip_version'] == 4 and
+                    route['table'] == netlink_lib.RT_TABLE_MAIN and
+                    route['oif'] == link['index'] and
+                    route['dst'] == 'default' and
+                    (not scope or route['scope'] == scope)):
+                retval = dict(gateway=route['gateway'])
+                if route['metric'] is not None:
+                    retval.update(metric=route['metric'])
+                return retval
+
     def pullup_route(self, interface_name):
         """Ensures that the route entry for the interface is before all
         others on the same subnet.
@@ -544,6 +674,37 @@ class IpNetnsCommand(IpCommandBase):
         return False
 
 
+def _parse_address(line):
+    """Parse an address line of the output of 'ip addr show'."""
+    parts = line.split()
+    if parts[0] == 'inet6':
+        version = 6
+        scope = parts[3]
+        broadcast = '::'
+    else:
+        version = 4
+        if parts[2] == 'brd':
+            broadcast = parts[3]
+            scope = parts[5]
+        else:
+            # sometimes output of 'ip a' might look like:
+            # inet 192.168.100.100/24 scope global eth0
+            # and broadcast needs to be calculated from CIDR
+            broadcast = str(netaddr.IPNetwork(parts[1]).broadcast)
+            scope = parts[3]
+
+    return dict(cidr=parts[1],
+                broadcast=broadcast,
+                scope=scope,
+                ip_version=version,
+                dynamic=('dynamic' == parts[-1]))
+
+
+def _netlink_address(address):
+    return dict((key, address[key]) for key in
+                ('cidr', 'broadcast', 'scope', 'ip_version', 'dynamic'))
+
+
 def device_exists(device_name, root_helper=None, namespace=None):
     try:
         address = IPDevice(device_name, root_helper, namespace).link.address
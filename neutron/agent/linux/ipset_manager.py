@@ -0,0 +1,107 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Implements kernel ipsets of security group members using ipset."""
+
+from neutron.agent.linux import utils as linux_utils
+from neutron.common import constants
+from neutron.common import utils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+# Set names are limited to 31 characters by the kernel.
+MAX_SET_NAME_LENGTH = 31
+
+SET_FAMILY = {constants.IPv4: 'inet',
+              constants.IPv6: 'inet6'}
+
+
+def get_set_name(id, ethertype):
+    """Return the name of the set of the members of a group."""
+    return (ethertype + id)[:MAX_SET_NAME_LENGTH]
+
+
+class IpsetManager(object):
+    """Wrapper for ipset.
+
+    Keeps one hash:net set per (security group, ethertype) and remembers
+    its members, so that a membership change only adds or deletes the
+    addresses that changed instead of rebuilding the set.
+
+    """
+
+    def __init__(self, execute=None, root_helper=None, namespace=None):
+        self.execute = execute or linux_utils.execute
+        self.root_helper = root_helper
+        self.namespace = namespace
+        # set name -> members currently in the kernel set
+        self.sets = {}
+
+    def set_exists(self, id, ethertype):
+        return get_set_name(id, ethertype) in self.sets
+
+    def set_names(self):
+        return set(self.sets)
+
+    @utils.synchronized('ipset', external=True)
+    def set_members(self, id, ethertype, member_ips):
+        """Make the members of a set exactly member_ips.
+
+        The first time a set is seen by this manager it is built aside and
+        swapped in, so members left over by a previous run are dropped
+        without the set ever being empty.
+        """
+        set_name = get_set_name(id, ethertype)
+        new_members = set(member_ips)
+        old_members = self.sets.get(set_name)
+
+        if old_members is None:
+            tmp_name = (set_name[:MAX_SET_NAME_LENGTH - 4] + '-new')
+            lines = [self._create_line(set_name, ethertype),
+                     self._create_line(tmp_name, ethertype),
+                     'flush %s' % tmp_name]
+            lines += ['add %s %s' % (tmp_name, ip)
+                      for ip in sorted(new_members)]
+            lines += ['swap %s %s' % (tmp_name, set_name),
+                      'destroy %s' % tmp_name]
+        else:
+            lines = ['add %s %s' % (set_name, ip)
+                     for ip in sorted(new_members - old_members)]
+            lines += ['del %s %s' % (set_name, ip)
+                      for ip in sorted(old_members - new_members)]
+
+        if lines:
+            self._restore(lines)
+        self.sets[set_name] = new_members
+
+    @utils.synchronized('ipset', external=True)
+    def destroy_set(self, set_name):
+        """Destroy a set no iptables rule refers to anymore."""
+        if self.sets.pop(set_name, None) is None:
+            return
+        self._run(['ipset', 'destroy', set_name])
+
+    def _create_line(self, set_name, ethertype):
+        return 'create %s hash:net family %s' % (set_name,
+                                                 SET_FAMILY[ethertype])
+
+    def _restore(self, lines):
+        LOG.debug(_("Applying ipset changes:\n%s"), '\n'.join(lines))
+        self._run(['ipset', 'restore', '-exist'],
+                  process_input='\n'.join(lines) + '\n')
+
+    def _run(self, args, process_input=None):
+        if self.namespace:
+            args = ['ip', 'netns', 'exec', self.namespace] + args
+        return self.execute(args, process_input=process_input,
+                            root_helper=self.root_helper)
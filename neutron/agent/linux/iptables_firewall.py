@@ -17,15 +17,20 @@ import netaddr
 from oslo.config import cfg
 
 from neutron.agent import firewall
+from neutron.agent.linux import ipset_manager
 from neutron.agent.linux import iptables_manager
 from neutron.common import constants
 from neutron.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
+cfg.CONF.import_opt('enable_ipset', 'neutron.agent.securitygroups_rpc',
+                    group='SECURITYGROUP')
 SG_CHAIN = 'sg-chain'
 INGRESS_DIRECTION = 'ingress'
 EGRESS_DIRECTION = 'egress'
+IPSET_DIRECTION = {INGRESS_DIRECTION: 'src',
+                   EGRESS_DIRECTION: 'dst'}
 SPOOF_FILTER = 'spoof-filter'
 CHAIN_NAME_PREFIX = {INGRESS_DIRECTION: 'i',
                      EGRESS_DIRECTION: 'o',
@@ -42,6 +47,10 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.iptables = iptables_manager.IptablesManager(
             root_helper=cfg.CONF.AGENT.root_helper,
             use_ipv6=True)
+        self.enable_ipset = cfg.CONF.SECURITYGROUP.enable_ipset
+        if self.enable_ipset:
+            self.ipset = ipset_manager.IpsetManager(
+                root_helper=cfg.CONF.AGENT.root_helper)
         # list of port which has security group
         self.filtered_ports = {}
         self._add_fallback_chain_v4v6()
@@ -81,6 +90,28 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self.filtered_ports.pop(port['device'], None)
         self._setup_chains()
         self.iptables.apply()
+        if not self._defer_apply:
+            self._remove_unused_member_sets()
+
+    def update_security_group_members(self, sg_id, sg_members):
+        if not self.enable_ipset:
+            return
+        for ethertype in (constants.IPv4, constants.IPv6):
+            self.ipset.set_members(sg_id, ethertype,
+                                   sg_members.get(ethertype, []))
+
+    def _remove_unused_member_sets(self):
+        # Sets can only be destroyed once no applied rule refers to them.
+        if not self.enable_ipset:
+            return
+        used_sets = set()
+        for port in self.filtered_ports.values():
+            for rule in port.get('security_group_rules', []):
+                if rule.get('remote_group_id'):
+                    used_sets.add(ipset_manager.get_set_name(
+                        rule['remote_group_id'], rule['ethertype']))
+        for set_name in self.ipset.set_names() - used_sets:
+            self.ipset.destroy_set(set_name)
 
     def _setup_chains(self):
         """Setup ingress and egress chain for a port."""
@@ -280,6 +311,9 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
         self._drop_invalid_packets(iptables_rules)
         self._allow_established(iptables_rules)
         for rule in security_group_rules:
+            set_args = self._remote_group_set_arg(rule)
+            if set_args is None:
+                continue
             # These arguments MUST be in the format iptables-save will
             # display them: source/dest, protocol, sport, dport, target
             # Otherwise the iptables_manager code won't be able to find
@@ -297,6 +331,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
                                    rule.get('protocol'),
                                    rule.get('port_range_min'),
                                    rule.get('port_range_max'))
+            args += set_args
             args += ['-j RETURN']
             iptables_rules += [' '.join(args)]
 
@@ -304,6 +339,21 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
 
         return iptables_rules
 
+    def _remote_group_set_arg(self, rule):
+        # NOTE: without ipset, the server has already expanded remote
+        # groups into one rule per member, so remote_group_id is never set.
+        # With ipset, the rule matches on the set of the group members,
+        # and is skipped until the members of that group are known.
+        remote_group_id = rule.get('remote_group_id')
+        if not remote_group_id or not self.enable_ipset:
+            return []
+        if not self.ipset.set_exists(remote_group_id, rule['ethertype']):
+            return None
+        return ['-m', 'set', '--match-set',
+                ipset_manager.get_set_name(remote_group_id,
+                                           rule['ethertype']),
+                IPSET_DIRECTION[rule['direction']]]
+
     def _drop_invalid_packets(self, iptables_rules):
         # Always drop invalid packets
         iptables_rules += ['-m state --state ' 'INVALID -j DROP']
@@ -368,6 +418,7 @@ class IptablesFirewallDriver(firewall.FirewallDriver):
             self._pre_defer_filtered_ports = None
             self._setup_chains_apply(self.filtered_ports)
             self.iptables.defer_apply_off()
+            self._remove_unused_member_sets()
 
 
 class OVSHybridIptablesFirewallDriver(IptablesFirewallDriver):
@@ -22,6 +22,9 @@
 import inspect
 import os
 import re
+import time
+
+from oslo.config import cfg
 
 from neutron.agent.linux import utils as linux_utils
 from neutron.common import utils
@@ -31,6 +34,19 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+OPTS = [
+    cfg.BoolOpt('iptables_incremental_apply', default=False,
+                help=_('Only send the chains that changed since the last '
+                       'apply to iptables-restore --noflush, instead of '
+                       'saving and restoring every table.')),
+    cfg.IntOpt('iptables_full_resync_interval', default=300,
+               help=_('Seconds between full iptables-save/iptables-restore '
+                      'runs when iptables_incremental_apply is enabled, '
+                      'which repairs rules changed outside of the agent. '
+                      '0 disables the periodic full resync.')),
+]
+cfg.CONF.register_opts(OPTS)
+
 
 # NOTE(vish): Iptables supports chain names of up to 28 characters,  and we
 #             add up to 12 characters to binary_name which is used as a prefix,
@@ -289,6 +305,17 @@ class IptablesManager(object):
         self.iptables_apply_deferred = False
         self.wrap_name = binary_name[:16]
 
+        self.incremental_apply = cfg.CONF.iptables_incremental_apply
+        self.full_resync_interval = cfg.CONF.iptables_full_resync_interval
+        # Rules last written to the kernel, see _get_state(). None means
+        # unknown, which forces the next apply to be a full one.
+        self._applied_state = None
+        self._last_full_apply = 0
+        self.apply_stats = {'full_applies': 0,
+                            'incremental_applies': 0,
+                            'lines_written': 0,
+                            'last_lines_written': 0}
+
         self.ipv4 = {'filter': IptablesTable(binary_name=self.wrap_name)}
         self.ipv6 = {'filter': IptablesTable(binary_name=self.wrap_name)}
 
@@ -374,6 +401,12 @@ class IptablesManager(object):
         finally:
             LOG.debug(_('Semaphore / lock released "%s"'), lock_name)
 
+    def _get_cmd_tables(self):
+        s = [('iptables', self.ipv4)]
+        if self.use_ipv6:
+            s += [('ip6tables', self.ipv6)]
+        return s
+
     def _apply_synchronized(self):
         """Apply the current in-memory set of iptables rules.
 
@@ -381,12 +414,37 @@ class IptablesManager(object):
         same component of Nova, and replace them with our current set of
         rules. This happens atomically, thanks to iptables-restore.
 
+        With iptables_incremental_apply, only the wrapped chains that changed
+        since the previous apply are rewritten, through iptables-restore
+        --noflush. Changes to the unwrapped chains, which are shared with
+        other components, and the periodic full resync still go through the
+        save/modify/restore path.
+
         """
-        s = [('iptables', self.ipv4)]
-        if self.use_ipv6:
-            s += [('ip6tables', self.ipv6)]
+        state = self._get_state() if self.incremental_apply else None
+        if state and self._can_apply_incrementally(state):
+            try:
+                lines_written = self._apply_incremental(state)
+                self.apply_stats['incremental_applies'] += 1
+            except RuntimeError:
+                LOG.warn(_("IPTablesManager incremental apply failed, "
+                           "falling back to a full apply"))
+                lines_written = self._apply_full()
+        else:
+            lines_written = self._apply_full()
+        self._applied_state = state
 
-        for cmd, tables in s:
+        self.apply_stats['last_lines_written'] = lines_written
+        self.apply_stats['lines_written'] += lines_written
+        LOG.debug(_("IPTablesManager.apply completed with success, "
+                    "%d lines written"), lines_written)
+
+    def _apply_full(self):
+        # If a restore fails halfway, the kernel state is unknown.
+        self._applied_state = None
+        lines_written = 0
+
+        for cmd, tables in self._get_cmd_tables():
             args = ['%s-save' % (cmd,), '-c']
             if self.namespace:
                 args = ['ip', 'netns', 'exec', self.namespace] + args
@@ -424,7 +482,99 @@ class IptablesManager(object):
                     LOG.error(_("IPTablesManager.apply failed to apply the "
                                 "following set of iptables rules:\n%s"),
                               '\n'.join(log_lines))
-        LOG.debug(_("IPTablesManager.apply completed with success"))
+            lines_written += len(all_lines)
+
+        self._last_full_apply = time.time()
+        self.apply_stats['full_applies'] += 1
+        return lines_written
+
+    def _get_table_state(self, table):
+        # Rules of every wrapped chain, keyed by the full chain name, in the
+        # order _modify_rules() writes them: top rules first and only the
+        # last occurrence of a duplicated rule.
+        top_rules = dict((chain, []) for chain in table.chains)
+        bot_rules = dict((chain, []) for chain in table.chains)
+        unwrapped_rules = []
+        for rule in table.rules:
+            if not rule.wrap:
+                unwrapped_rules.append((rule.chain, rule.rule, rule.top))
+            elif rule.chain in top_rules:
+                (top_rules if rule.top else bot_rules)[rule.chain].append(
+                    str(rule))
+
+        wrapped = {}
+        for chain in table.chains:
+            seen = set()
+            rules = []
+            for rule_str in reversed(top_rules[chain] + bot_rules[chain]):
+                if rule_str not in seen:
+                    seen.add(rule_str)
+                    rules.append(rule_str)
+            rules.reverse()
+            wrapped['%s-%s' % (self.wrap_name, chain)] = tuple(rules)
+
+        return {'wrapped': wrapped,
+                'unwrapped': (frozenset(table.unwrapped_chains),
+                              tuple(unwrapped_rules))}
+
+    def _get_state(self):
+        return dict((cmd, dict((table_name, self._get_table_state(table))
+                               for table_name, table in tables.iteritems()))
+                    for cmd, tables in self._get_cmd_tables())
+
+    def _can_apply_incrementally(self, state):
+        if self._applied_state is None:
+            return False
+        if (self.full_resync_interval and
+                time.time() - self._last_full_apply >=
+                self.full_resync_interval):
+            return False
+        for cmd, tables in self._get_cmd_tables():
+            for table_name, table in tables.iteritems():
+                if table.remove_rules or table.remove_chains:
+                    return False
+                old = self._applied_state.get(cmd, {}).get(table_name)
+                if (old is None or old['unwrapped'] !=
+                        state[cmd][table_name]['unwrapped']):
+                    return False
+        return True
+
+    def _apply_incremental(self, state):
+        lines_written = 0
+
+        for cmd, tables in self._get_cmd_tables():
+            lines = []
+            for table_name in sorted(tables):
+                new = state[cmd][table_name]['wrapped']
+                old = self._applied_state[cmd][table_name]['wrapped']
+                changed = [chain for chain in sorted(new)
+                           if old.get(chain) != new[chain]]
+                removed = sorted(set(old) - set(new))
+                if not changed and not removed:
+                    continue
+
+                # With --noflush, declaring an existing user-defined chain
+                # flushes it, so the rules of a changed chain are simply
+                # written again and removed chains can be deleted once
+                # empty. Chains jumping to a removed chain have changed too.
+                lines.append('*%s' % table_name)
+                lines += [':%s - [0:0]' % chain for chain in changed + removed]
+                for chain in changed:
+                    lines += new[chain]
+                lines += ['-X %s' % chain for chain in removed]
+                lines.append('COMMIT')
+
+            if not lines:
+                continue
+
+            args = ['%s-restore' % (cmd,), '--noflush']
+            if self.namespace:
+                args = ['ip', 'netns', 'exec', self.namespace] + args
+            self.execute(args, process_input='\n'.join(lines) + '\n',
+                         root_helper=self.root_helper)
+            lines_written += len(lines)
+
+        return lines_written
 
     def _find_table(self, lines, table_name):
         if len(lines) < 3:
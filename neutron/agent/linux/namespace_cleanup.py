@@ -0,0 +1,127 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Destroys many namespaces concurrently, e.g. the ones left by agents.
+
+The devices of the namespaces are listed up front: with the netlink
+backend of ip_lib, by a single dump of the links of every namespace, and
+otherwise by listing the devices of the namespaces concurrently. Each
+namespace is then destroyed with its devices by a NamespacePool.
+"""
+
+import eventlet
+from oslo.config import cfg
+
+from neutron.agent.linux import ip_lib
+from neutron.agent.linux import namespace_pool
+from neutron.agent.linux import netlink_lib
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+def _use_netlink():
+    try:
+        return cfg.CONF.ip_lib_backend == ip_lib.NETLINK_BACKEND
+    except cfg.NoSuchOptError:
+        return False
+
+
+class NamespaceCleaner(object):
+    """Destroys namespaces concurrently.
+
+    The namespaces are destroyed by a function called with the name of a
+    namespace and the names of its devices, but the loopback.
+    """
+
+    def __init__(self, root_helper=None, pool_size=None):
+        self.root_helper = root_helper
+        self._pool = namespace_pool.NamespacePool(pool_size)
+
+    def list_devices(self, namespaces):
+        """Return the names of the devices of namespaces by namespace.
+
+        The namespaces missing from a netlink dump no longer exist and are
+        left out. The namespaces whose devices could not be listed are
+        mapped to None, their devices are listed again when destroyed.
+        """
+        namespaces = set(namespaces)
+        if not namespaces:
+            return {}
+        if _use_netlink():
+            tables = netlink_lib.dump_all((netlink_lib.LINKS,),
+                                          self.root_helper)
+            return dict((ns, [link['name']
+                              for link in ns_tables[netlink_lib.LINKS]
+                              if link['name'] != ip_lib.LOOPBACK_DEVNAME])
+                        for ns, ns_tables in tables.iteritems()
+                        if ns in namespaces)
+
+        events = dict((ns, self._pool.submit(ns, self._get_devices, ns))
+                      for ns in namespaces)
+        devices = {}
+        for ns, done in events.iteritems():
+            try:
+                devices[ns] = done.wait()
+            except RuntimeError:
+                LOG.debug(_("Unable to list the devices of namespace %s"), ns)
+                devices[ns] = None
+        return devices
+
+    def _get_devices(self, namespace):
+        ip_wrapper = ip_lib.IPWrapper(self.root_helper, namespace)
+        return [device.name
+                for device in ip_wrapper.get_devices(exclude_loopback=True)]
+
+    def cleanup(self, namespaces, destroy, skip=None, devices=None):
+        """Destroy namespaces concurrently and wait until they are done.
+
+        destroy(namespace, devices) is called for each namespace, unless
+        skip(namespace) returns True by then. devices are the names of the
+        devices of the namespaces by namespace, if they were already
+        listed with list_devices. destroy is passed None as the devices of
+        the namespaces whose devices could not be listed.
+
+        Returns the namespaces which failed to be destroyed.
+        """
+        if devices is None:
+            devices = self.list_devices(namespaces)
+        else:
+            devices = dict((ns, devices[ns])
+                           for ns in namespaces if ns in devices)
+        if not devices:
+            return []
+        LOG.info(_("Destroying %d namespaces"), len(devices))
+        events = dict((ns, self._pool.submit(ns, self._destroy, ns, ns_devices,
+                                             destroy, skip))
+                      for ns, ns_devices in devices.iteritems())
+        failed = []
+        for ns, done in events.iteritems():
+            try:
+                done.wait()
+            except Exception:
+                LOG.exception(_("Failed to destroy namespace %s"), ns)
+                failed.append(ns)
+        LOG.info(_("Destroyed %(count)d namespaces, %(failed)d failed"),
+                 {'count': len(devices) - len(failed), 'failed': len(failed)})
+        return failed
+
+    def _destroy(self, namespace, devices, destroy, skip):
+        if skip and skip(namespace):
+            LOG.debug(_("Namespace %s is in use, not destroying it"),
+                      namespace)
+            return
+        destroy(namespace, devices)
+
+    def cleanup_in_background(self, namespaces, destroy, skip=None):
+        """Run cleanup in a green thread, which is returned."""
+        return eventlet.spawn(self.cleanup, namespaces, destroy, skip)
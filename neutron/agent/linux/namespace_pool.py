@@ -0,0 +1,118 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Runs operations of different namespaces concurrently.
+
+Commands are run by the agents with eventlet's green subprocess module,
+so waiting for a command only blocks the green thread which started it
+and the commands of independent namespaces can be run side by side.
+"""
+
+import collections
+import sys
+
+import eventlet
+from eventlet import event
+from oslo.config import cfg
+import six
+
+from neutron.agent.linux import ip_lib
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+OPTS = [
+    cfg.IntOpt('namespace_workers',
+               default=16,
+               help=_("Maximum number of namespaces whose operations are "
+                      "run concurrently by the agents.")),
+]
+cfg.CONF.register_opts(OPTS)
+
+
+def _run_commands(ip_wrapper, commands, check_exit_code):
+    return [ip_wrapper.netns.execute(cmd, check_exit_code=check_exit_code)
+            for cmd in commands]
+
+
+class NamespacePool(object):
+    """A bounded pool of green threads running operations in namespaces.
+
+    The operations submitted for a namespace are run one at a time in the
+    order they were submitted, while operations of different namespaces
+    are run concurrently by at most size green threads.
+    """
+
+    def __init__(self, size=None):
+        self.size = size or cfg.CONF.namespace_workers
+        self._pool = eventlet.GreenPool(self.size)
+        self._queues = {}
+
+    def submit(self, namespace, func, *args, **kwargs):
+        """Run func(*args, **kwargs) after the operations of a namespace.
+
+        Returns an event whose wait() returns the result of func or raises
+        its exception.
+        """
+        done = event.Event()
+        queue = self._queues.get(namespace)
+        if queue is None:
+            queue = self._queues[namespace] = collections.deque()
+            queue.append((done, func, args, kwargs))
+            self._pool.spawn_n(self._run_queue, namespace, queue)
+        else:
+            queue.append((done, func, args, kwargs))
+        return done
+
+    def execute(self, namespace, commands, root_helper=None,
+                check_exit_code=True):
+        """Run a batch of commands in order in a namespace.
+
+        Returns an event whose wait() returns the list of their outputs.
+        """
+        ip_wrapper = ip_lib.IPWrapper(root_helper, namespace)
+        return self.submit(namespace, _run_commands, ip_wrapper,
+                           list(commands), check_exit_code)
+
+    def waitall(self):
+        """Wait until all the submitted operations are done."""
+        self._pool.waitall()
+
+    def _run_queue(self, namespace, queue):
+        while queue:
+            done, func, args, kwargs = queue.popleft()
+            try:
+                done.send(func(*args, **kwargs))
+            except Exception:
+                LOG.debug(_("Operation in namespace %s failed"), namespace,
+                          exc_info=True)
+                done.send_exception(*sys.exc_info())
+        del self._queues[namespace]
+
+
+def wait_all(events):
+    """Wait for events returned by a pool and return their results.
+
+    All the events are waited for before the first error is raised.
+    """
+    results = []
+    error = None
+    for done in events:
+        try:
+            results.append(done.wait())
+        except Exception:
+            results.append(None)
+            if error is None:
+                error = sys.exc_info()
+    if error:
+        six.reraise(*error)
+    return results
@@ -0,0 +1,419 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Dumps links, addresses and routes with rtnetlink requests.
+
+Reading the kernel tables over a netlink socket does not require any
+privilege, so dumps of the namespace of the agent are done in process.
+Dumps of another namespace are done in process too when running as root,
+by creating the netlink socket inside the namespace with setns(2), and
+otherwise by running this module as a helper through the root helper,
+which prints all the requested tables as JSON in a single command. The
+helper also dumps the tables of every namespace at once, to enumerate the
+devices of many namespaces without running a command for each of them.
+"""
+
+import contextlib
+import ctypes
+import ctypes.util
+import os
+import socket
+import struct
+import sys
+
+import netaddr
+
+from neutron.agent.linux import utils
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+LOG = logging.getLogger(__name__)
+
+HELPER = 'neutron-netlink-dump'
+ALL_NAMESPACES = '--all'
+
+NETNS_RUN_DIR = '/var/run/netns'
+CLONE_NEWNET = 0x40000000
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+RTM_NEWLINK = 16
+RTM_DELLINK = 17
+RTM_GETLINK = 18
+RTM_NEWADDR = 20
+RTM_GETADDR = 22
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+
+RTMGRP_LINK = 0x1
+
+IFLA_ADDRESS = 1
+IFLA_BROADCAST = 2
+IFLA_IFNAME = 3
+IFLA_MTU = 4
+IFLA_QDISC = 6
+IFLA_TXQLEN = 13
+IFLA_OPERSTATE = 16
+IFLA_IFALIAS = 20
+
+IFA_ADDRESS = 1
+IFA_LOCAL = 2
+IFA_LABEL = 3
+IFA_BROADCAST = 4
+IFA_FLAGS = 8
+IFA_F_PERMANENT = 0x80
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_PRIORITY = 6
+RTA_TABLE = 15
+RT_TABLE_MAIN = 254
+
+NLMSGHDR = struct.Struct('=LHHLL')
+RTATTR = struct.Struct('=HH')
+IFINFOMSG = struct.Struct('=BxHiII')
+IFADDRMSG = struct.Struct('=BBBBi')
+RTMSG = struct.Struct('=BBBBBBBBI')
+
+FAMILY_VERSION = {socket.AF_INET: 4, socket.AF_INET6: 6}
+
+# Names used by iproute2 for the link types, scopes and operational states.
+LINK_TYPES = {1: 'ether', 772: 'loopback'}
+SCOPES = {0: 'global', 200: 'site', 253: 'link', 254: 'host', 255: 'nowhere'}
+OPER_STATES = ['UNKNOWN', 'NOTPRESENT', 'DOWN', 'LOWERLAYERDOWN',
+               'TESTING', 'DORMANT', 'UP']
+
+LINKS = 'links'
+ADDRESSES = 'addresses'
+ROUTES = 'routes'
+TABLES = (LINKS, ADDRESSES, ROUTES)
+
+RECV_SIZE = 65536
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def _parse_attrs(data, offset):
+    """Return a dict of the rtattrs of a message starting at offset."""
+    attrs = {}
+    while offset + RTATTR.size <= len(data):
+        length, attr_type = RTATTR.unpack_from(data, offset)
+        if length < RTATTR.size:
+            break
+        attrs[attr_type] = data[offset + RTATTR.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def _string(value):
+    return value.split('\0', 1)[0]
+
+
+def _uint32(value):
+    return struct.unpack('=I', value[:4])[0]
+
+
+def _ip(family, value):
+    return socket.inet_ntop(family, value)
+
+
+def _lladdr(value):
+    return ':'.join('%02x' % ord(c) for c in value)
+
+
+def _parse_link(data):
+    family, link_type, index, flags, change = IFINFOMSG.unpack_from(data)
+    attrs = _parse_attrs(data, IFINFOMSG.size)
+    link = {'index': index,
+            'name': _string(attrs.get(IFLA_IFNAME, '')),
+            'link_type': LINK_TYPES.get(link_type, str(link_type)),
+            'address': None,
+            'broadcast': None,
+            'mtu': None,
+            'qdisc': None,
+            'qlen': None,
+            'state': None,
+            'alias': None}
+    if IFLA_ADDRESS in attrs:
+        link['address'] = _lladdr(attrs[IFLA_ADDRESS])
+    if IFLA_BROADCAST in attrs:
+        link['broadcast'] = _lladdr(attrs[IFLA_BROADCAST])
+    if IFLA_MTU in attrs:
+        link['mtu'] = _uint32(attrs[IFLA_MTU])
+    if IFLA_TXQLEN in attrs:
+        link['qlen'] = _uint32(attrs[IFLA_TXQLEN])
+    if IFLA_QDISC in attrs:
+        link['qdisc'] = _string(attrs[IFLA_QDISC])
+    if IFLA_OPERSTATE in attrs:
+        state = ord(attrs[IFLA_OPERSTATE][0])
+        if state < len(OPER_STATES):
+            link['state'] = OPER_STATES[state]
+    if IFLA_IFALIAS in attrs:
+        link['alias'] = _string(attrs[IFLA_IFALIAS]) or None
+    return link
+
+
+def _parse_address(data):
+    family, prefixlen, flags, scope, index = IFADDRMSG.unpack_from(data)
+    if family not in FAMILY_VERSION:
+        return None
+    attrs = _parse_attrs(data, IFADDRMSG.size)
+    if IFA_FLAGS in attrs:
+        flags = _uint32(attrs[IFA_FLAGS])
+    # IFA_LOCAL is the address of the interface, IFA_ADDRESS is the peer
+    # address for point to point interfaces.
+    ip = _ip(family, attrs.get(IFA_LOCAL) or attrs[IFA_ADDRESS])
+    cidr = '%s/%s' % (ip, prefixlen)
+    if family == socket.AF_INET6:
+        broadcast = '::'
+    elif IFA_BROADCAST in attrs:
+        broadcast = _ip(family, attrs[IFA_BROADCAST])
+    else:
+        broadcast = str(netaddr.IPNetwork(cidr).broadcast)
+    return {'index': index,
+            'cidr': cidr,
+            'broadcast': broadcast,
+            'scope': SCOPES.get(scope, str(scope)),
+            'ip_version': FAMILY_VERSION[family],
+            'dynamic': not flags & IFA_F_PERMANENT,
+            'label': _string(attrs.get(IFA_LABEL, ''))}
+
+
+def _parse_route(data):
+    (family, dst_len, src_len, tos, table, protocol, scope, route_type,
+     flags) = RTMSG.unpack_from(data)
+    if family not in FAMILY_VERSION:
+        return None
+    attrs = _parse_attrs(data, RTMSG.size)
+    if RTA_TABLE in attrs:
+        table = _uint32(attrs[RTA_TABLE])
+    if RTA_DST in attrs:
+        dst = '%s/%s' % (_ip(family, attrs[RTA_DST]), dst_len)
+    else:
+        dst = 'default'
+    route = {'ip_version': FAMILY_VERSION[family],
+             'dst': dst,
+             'table': table,
+             'scope': SCOPES.get(scope, str(scope)),
+             'oif': None,
+             'gateway': None,
+             'metric': None}
+    if RTA_OIF in attrs:
+        route['oif'] = _uint32(attrs[RTA_OIF])
+    if RTA_GATEWAY in attrs:
+        route['gateway'] = _ip(family, attrs[RTA_GATEWAY])
+    if RTA_PRIORITY in attrs:
+        route['metric'] = _uint32(attrs[RTA_PRIORITY])
+    return route
+
+
+# table -> (request type, reply type, request header, parser)
+_DUMPS = {
+    LINKS: (RTM_GETLINK, RTM_NEWLINK,
+            IFINFOMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0), _parse_link),
+    ADDRESSES: (RTM_GETADDR, RTM_NEWADDR,
+                IFADDRMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0),
+                _parse_address),
+    ROUTES: (RTM_GETROUTE, RTM_NEWROUTE,
+             RTMSG.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0),
+             _parse_route),
+}
+
+
+def _iter_messages(data):
+    """Yield the type and payload of the netlink messages in data."""
+    offset = 0
+    while offset + NLMSGHDR.size <= len(data):
+        length, msg_type, flags, seq, pid = NLMSGHDR.unpack_from(data, offset)
+        if length < NLMSGHDR.size:
+            break
+        yield msg_type, data[offset + NLMSGHDR.size:offset + length]
+        offset += _align(length)
+
+
+def parse_messages(data, reply_type, parser):
+    """Parse the replies to a dump request.
+
+    Returns the parsed entries and whether the end of the dump was reached.
+    """
+    entries = []
+    for msg_type, payload in _iter_messages(data):
+        if msg_type == NLMSG_DONE:
+            return entries, True
+        if msg_type == NLMSG_ERROR:
+            error = -struct.unpack_from('=i', payload)[0]
+            raise RuntimeError(_("Netlink dump failed: %s") %
+                               os.strerror(error))
+        if msg_type == reply_type:
+            entry = parser(payload)
+            if entry is not None:
+                entries.append(entry)
+    return entries, False
+
+
+def parse_link_events(data):
+    """Parse link notifications.
+
+    Returns a list of (created, link) tuples, where created is False when
+    the link was deleted.
+    """
+    return [(msg_type == RTM_NEWLINK, _parse_link(payload))
+            for msg_type, payload in _iter_messages(data)
+            if msg_type in (RTM_NEWLINK, RTM_DELLINK)]
+
+
+class NetlinkSocket(object):
+    """A rtnetlink socket dumping the tables of the namespace it lives in.
+
+    The socket also receives the notifications of the given multicast
+    groups, e.g. RTMGRP_LINK.
+    """
+
+    def __init__(self, groups=0):
+        self._sock = socket.socket(socket.AF_NETLINK, socket.SOCK_RAW,
+                                   NETLINK_ROUTE)
+        self._sock.bind((0, groups))
+        self._seq = 0
+
+    def close(self):
+        self._sock.close()
+
+    def dump(self, table):
+        request_type, reply_type, header, parser = _DUMPS[table]
+        self._seq += 1
+        self._sock.sendall(NLMSGHDR.pack(NLMSGHDR.size + len(header),
+                                         request_type,
+                                         NLM_F_REQUEST | NLM_F_DUMP,
+                                         self._seq, 0) + header)
+        result = []
+        done = False
+        while not done:
+            entries, done = parse_messages(self._sock.recv(RECV_SIZE),
+                                           reply_type, parser)
+            result.extend(entries)
+        return result
+
+    def receive_link_events(self):
+        """Wait for link notifications and return them parsed."""
+        return parse_link_events(self._sock.recv(RECV_SIZE))
+
+
+def _setns(fd):
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    if libc.setns(fd, CLONE_NEWNET) != 0:
+        error = ctypes.get_errno()
+        raise OSError(error, os.strerror(error))
+
+
+@contextlib.contextmanager
+def _in_namespace(namespace):
+    """Switch the network namespace of the calling thread."""
+    with open('/proc/self/ns/net') as own_ns:
+        with open(os.path.join(NETNS_RUN_DIR, namespace)) as target_ns:
+            _setns(target_ns.fileno())
+        try:
+            yield
+        finally:
+            _setns(own_ns.fileno())
+
+
+def _open_socket(namespace=None):
+    if not namespace:
+        return NetlinkSocket()
+    # A netlink socket stays bound to the namespace it was created in, so
+    # the thread only leaves its own namespace for the time needed to
+    # create it and nothing can yield to another green thread meanwhile.
+    with _in_namespace(namespace):
+        return NetlinkSocket()
+
+
+def dump_tables(tables=TABLES, namespace=None):
+    """Dump the given tables of a namespace in process."""
+    sock = _open_socket(namespace)
+    try:
+        return dict((table, sock.dump(table)) for table in tables)
+    finally:
+        sock.close()
+
+
+def dump(tables=TABLES, namespace=None, root_helper=None):
+    """Return a dict of the entries of the given tables of a namespace.
+
+    Entering another namespace requires privileges, so unless running as
+    root the tables of a namespace are dumped by the privileged helper.
+    """
+    if not namespace or os.geteuid() == 0:
+        return dump_tables(tables, namespace)
+    output = utils.execute([HELPER, namespace] + list(tables),
+                           root_helper=root_helper)
+    return jsonutils.loads(output)
+
+
+def dump_all_tables(tables=TABLES):
+    """Dump the given tables of every namespace created by ip netns."""
+    try:
+        namespaces = os.listdir(NETNS_RUN_DIR)
+    except OSError:
+        return {}
+    result = {}
+    for namespace in namespaces:
+        try:
+            result[namespace] = dump_tables(tables, namespace)
+        except (IOError, OSError):
+            # The namespace was deleted meanwhile
+            LOG.debug(_("Unable to dump the tables of namespace %s"),
+                      namespace, exc_info=True)
+    return result
+
+
+def dump_all(tables=TABLES, root_helper=None):
+    """Return the entries of the given tables of every namespace.
+
+    The result maps the namespaces created by ip netns to their tables.
+    Unless running as root, they are all dumped by a single run of the
+    privileged helper.
+    """
+    if os.geteuid() == 0:
+        return dump_all_tables(tables)
+    output = utils.execute([HELPER, ALL_NAMESPACES] + list(tables),
+                           root_helper=root_helper)
+    return jsonutils.loads(output)
+
+
+def main():
+    """Print the requested tables of a namespace as JSON.
+
+    Usage: neutron-netlink-dump NAMESPACE|--all [links] [addresses] [routes]
+
+    With --all, the tables of every namespace are printed by namespace.
+    """
+    if len(sys.argv) < 2:
+        sys.exit(main.__doc__)
+    namespace = sys.argv[1]
+    tables = sys.argv[2:] or TABLES
+    if set(tables) - set(TABLES):
+        sys.exit(main.__doc__)
+    if namespace == ALL_NAMESPACES:
+        sys.stdout.write(jsonutils.dumps(dump_all_tables(tables)))
+        return
+    # Only the namespaces created by ip netns may be entered.
+    if os.path.basename(namespace) != namespace or namespace.startswith('.'):
+        sys.exit(main.__doc__)
+    sys.stdout.write(jsonutils.dumps(dump_tables(tables, namespace)))
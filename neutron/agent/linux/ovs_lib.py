@@ -13,9 +13,13 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import re
+
 from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import ovsdb_client
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.common import utils as common_utils
@@ -53,11 +57,122 @@ class VifPort:
                 self.switch.br_name)
 
 
+class VsctlCommand(object):
+    """A command of a vsctl transaction.
+
+    Its result is only available once the transaction is committed.
+    """
+
+    def __init__(self, args, parse=None):
+        self.args = args
+        self.parse = parse
+        self.result = None
+
+    def set_output(self, output):
+        self.result = self.parse(output) if self.parse else output
+
+
+class VsctlTransaction(object):
+    """Runs many vsctl commands in a single ovs-vsctl invocation."""
+
+    def __init__(self, ovs, check_error=False):
+        self.ovs = ovs
+        self.check_error = check_error
+        self.commands = []
+        # Calls run once the commands are committed
+        self.after_commit = []
+
+    def add(self, args, parse=None):
+        command = VsctlCommand(args, parse)
+        self.commands.append(command)
+        return command
+
+    def commit(self):
+        if not self.commands:
+            return
+        # With --oneline the output of each command is printed on its own
+        # line, newlines and backslashes in it being escaped.
+        args = ['--oneline']
+        for command in self.commands:
+            if command.args[0] != '--':
+                args.append('--')
+            args += command.args
+        output = self.ovs.run_vsctl(args, self.check_error)
+        if output is None:
+            for command in self.commands:
+                command.set_output(None)
+            return
+        lines = iter(output.split('\n'))
+        for command in self.commands:
+            # A queued command can hold several vsctl commands, like the
+            # add-port and set of add_patch_port. Keep the output of the
+            # last one.
+            for i in range(command.args[1:].count('--') + 1):
+                line = next(lines, '')
+            command.set_output(_unescape_oneline(line) + '\n')
+
+
+def _unescape_oneline(line):
+    return re.sub(r'\\(.)',
+                  lambda m: '\n' if m.group(1) == 'n' else m.group(1),
+                  line)
+
+
 class BaseOVS(object):
 
     def __init__(self, root_helper):
         self.root_helper = root_helper
         self.vsctl_timeout = cfg.CONF.ovs_vsctl_timeout
+        self._txn = None
+        self.ovsdb = (ovsdb_client.get_client()
+                      if ovsdb_client.is_native() else None)
+
+    @property
+    def _ovsdb_synced(self):
+        """Whether queries can be answered by the native OVSDB replica."""
+        return self.ovsdb is not None and self.ovsdb.synced
+
+    @contextlib.contextmanager
+    def ovsdb_transaction(self, check_error=False):
+        """Run the vsctl commands issued in the block as a single command.
+
+        The methods of the bridge that change the database are queued and
+        committed together when the block exits, and so are the ofport
+        lookups, which return a VsctlCommand whose result is set on commit.
+        Ports added in the transaction get their ofport once it is
+        committed, so add_port and similar methods return None inside a
+        transaction. db_get_val and db_get_map are run at once, since their
+        callers need the value, and do not see the queued changes. Nested
+        transactions are part of the outermost one.
+        """
+        if self._txn is not None:
+            yield self._txn
+            return
+        self._txn = VsctlTransaction(self, check_error)
+        try:
+            yield self._txn
+            txn = self._txn
+        finally:
+            self._txn = None
+        txn.commit()
+        for func, args, kwargs in txn.after_commit:
+            func(*args, **kwargs)
+
+    def after_commit(self, func, *args, **kwargs):
+        """Call func(*args, **kwargs) once the transaction is committed.
+
+        Outside of a transaction, func is called at once.
+        """
+        if self._txn is not None:
+            self._txn.after_commit.append((func, args, kwargs))
+        else:
+            func(*args, **kwargs)
+
+    def _vsctl(self, args, check_error=False, parse=None, query=False):
+        if self._txn is not None and not query:
+            return self._txn.add(args, parse)
+        output = self.run_vsctl(args, check_error)
+        return parse(output) if parse else output
 
     def run_vsctl(self, args, check_error=False):
         full_args = ["ovs-vsctl", "--timeout=%d" % self.vsctl_timeout] + args
@@ -106,6 +221,10 @@ class OVSBridge(BaseOVS):
         self.br_name = br_name
         self.defer_apply_flows = False
         self.deferred_flows = {'add': '', 'mod': '', 'del': ''}
+        # Cookie stamped on the flows added to the bridge.
+        self.agent_cookie = None
+        # While flows are synchronized, the flow calls only build this table.
+        self.desired_flows = None
 
     def set_controller(self, controller_names):
         vsctl_command = ['--', 'set-controller', self.br_name]
@@ -143,21 +262,22 @@ class OVSBridge(BaseOVS):
         self.create()
 
     def add_port(self, port_name):
-        self.run_vsctl(["--", "--may-exist", "add-port", self.br_name,
-                        port_name])
-        return self.get_port_ofport(port_name)
+        self._vsctl(["--", "--may-exist", "add-port", self.br_name,
+                     port_name])
+        if self._txn is None:
+            return self.get_port_ofport(port_name)
 
     def delete_port(self, port_name):
-        self.run_vsctl(["--", "--if-exists", "del-port", self.br_name,
-                        port_name])
+        self._vsctl(["--", "--if-exists", "del-port", self.br_name,
+                     port_name])
 
     def set_db_attribute(self, table_name, record, column, value):
         args = ["set", table_name, record, "%s=%s" % (column, value)]
-        self.run_vsctl(args)
+        self._vsctl(args)
 
     def clear_db_attribute(self, table_name, record, column):
         args = ["clear", table_name, record, column]
-        self.run_vsctl(args)
+        self._vsctl(args)
 
     def run_ofctl(self, cmd, args, process_input=None):
         full_args = ["ovs-ofctl", cmd, self.br_name] + args
@@ -173,39 +293,47 @@ class OVSBridge(BaseOVS):
         return len(flow_list) - 1
 
     def remove_all_flows(self):
-        self.run_ofctl("del-flows", [])
+        if self.desired_flows is not None:
+            self.desired_flows.clear()
+        else:
+            self.run_ofctl("del-flows", [])
 
     def get_port_ofport(self, port_name):
-        ofport = self.db_get_val("Interface", port_name, "ofport")
-        # This can return a non-integer string, like '[]' so ensure a
-        # common failure case
-        try:
-            int(ofport)
-            return ofport
-        except (ValueError, TypeError):
-            return constants.INVALID_OFPORT
+        return self._vsctl(["get", "Interface", port_name, "ofport"],
+                           parse=_parse_ofport, query=True)
 
     def get_datapath_id(self):
         return self.db_get_val('Bridge',
                                self.br_name, 'datapath_id').strip('"')
 
     def add_flow(self, **kwargs):
+        if self.agent_cookie is not None:
+            kwargs.setdefault('cookie', '%#x' % self.agent_cookie)
         flow_str = _build_flow_expr_str(kwargs, 'add')
-        if self.defer_apply_flows:
+        if self.desired_flows is not None:
+            self.desired_flows.add(Flow(flow_str))
+        elif self.defer_apply_flows:
             self.deferred_flows['add'] += flow_str + '\n'
         else:
             self.run_ofctl("add-flow", [flow_str])
 
     def mod_flow(self, **kwargs):
+        # Without a mask, the cookie of a mod-flows is set on the flows.
+        if self.agent_cookie is not None:
+            kwargs.setdefault('cookie', '%#x' % self.agent_cookie)
         flow_str = _build_flow_expr_str(kwargs, 'mod')
-        if self.defer_apply_flows:
+        if self.desired_flows is not None:
+            self.desired_flows.modify(Flow(flow_str))
+        elif self.defer_apply_flows:
             self.deferred_flows['mod'] += flow_str + '\n'
         else:
             self.run_ofctl("mod-flows", [flow_str])
 
     def delete_flows(self, **kwargs):
         flow_expr_str = _build_flow_expr_str(kwargs, 'del')
-        if self.defer_apply_flows:
+        if self.desired_flows is not None:
+            self.desired_flows.delete(Flow(flow_expr_str))
+        elif self.defer_apply_flows:
             self.deferred_flows['del'] += flow_expr_str + '\n'
         else:
             self.run_ofctl("del-flows", [flow_expr_str])
@@ -253,6 +381,88 @@ class OVSBridge(BaseOVS):
                               {'action': action, 'flow': line})
                 self.run_ofctl('%s-flows' % action, ['-'], flows)
 
+    def dump_all_flows(self):
+        """Return the flows of all the tables of the bridge, or None."""
+        flows = self.run_ofctl("dump-flows", [])
+        if flows is None:
+            return None
+        return [Flow(line) for line in flows.splitlines()
+                if 'actions=' in line]
+
+    def delete_stale_flows(self):
+        """Delete the flows which do not carry the agent cookie.
+
+        Once an agent restarted without removing the flows has installed
+        its own ones, the others are the stale flows of its previous run.
+        Each one is deleted with a strict match on its cookie, so that a
+        flow replaced by the agent in the meantime is kept. The flows of
+        learn actions have timeouts and are left to expire.
+        """
+        if self.agent_cookie is None:
+            return
+        flows = self.dump_all_flows()
+        if not flows:
+            return
+        stale = [flow for flow in flows
+                 if not flow.expires and flow.cookie != self.agent_cookie]
+        LOG.debug(_('Deleting %(count)d stale flows of bridge %(bridge)s'),
+                  {'count': len(stale), 'bridge': self.br_name})
+        if stale:
+            self.run_ofctl('del-flows', ['--strict', '-'],
+                           ''.join('cookie=%#x/-1,%s\n' %
+                                   (flow.cookie, flow.match_str())
+                                   for flow in stale))
+
+    def sync_flows_on(self):
+        """Start recording the desired flows of the bridge.
+
+        Until sync_flows_off is called, the flows added, modified and
+        deleted are only recorded, starting from an empty table, and are
+        not applied to the bridge.
+        """
+        LOG.debug(_('sync_flows_on'))
+        self.desired_flows = FlowTable()
+
+    def sync_flows_off(self, replace=False):
+        """Make the flows of the bridge the recorded desired flows.
+
+        The installed flows are dumped and only the differences are sent
+        to the bridge, so the flows which do not change keep carrying
+        traffic. With replace, or when the flows cannot be dumped, the
+        flows are replaced at once by ovs-ofctl replace-flows, which
+        applies the differences itself.
+        """
+        desired, self.desired_flows = self.desired_flows, None
+        if desired is None:
+            return
+        installed = None if replace else self.dump_all_flows()
+        if installed is None:
+            LOG.debug(_('Replacing the flows of bridge %(bridge)s with '
+                        '%(count)d flows'),
+                      {'bridge': self.br_name, 'count': len(desired)})
+            self.run_ofctl('replace-flows', ['-'],
+                           ''.join('%s\n' % flow for flow in desired))
+            return
+        deleted, modified, added = diff_flows(desired, installed,
+                                              self.agent_cookie or 0)
+        LOG.debug(_('Synchronizing the flows of bridge %(bridge)s: '
+                    '%(deleted)d deleted, %(modified)d modified, '
+                    '%(added)d added'),
+                  {'bridge': self.br_name, 'deleted': len(deleted),
+                   'modified': len(modified), 'added': len(added)})
+        # Stale flows are deleted first so that a flow which is added back
+        # because it was not recognized is not deleted.
+        if deleted:
+            self.run_ofctl('del-flows', ['--strict', '-'],
+                           ''.join('%s\n' % flow.match_str()
+                                   for flow in deleted))
+        if modified:
+            self.run_ofctl('mod-flows', ['--strict', '-'],
+                           ''.join('%s\n' % flow for flow in modified))
+        if added:
+            self.run_ofctl('add-flows', ['-'],
+                           ''.join('%s\n' % flow for flow in added))
+
     def add_tunnel_port(self, port_name, remote_ip, local_ip,
                         tunnel_type=p_const.TYPE_GRE,
                         vxlan_udp_port=constants.VXLAN_UDP_PORT,
@@ -271,7 +481,9 @@ class OVSBridge(BaseOVS):
                               "options:local_ip=%s" % local_ip,
                               "options:in_key=flow",
                               "options:out_key=flow"])
-        self.run_vsctl(vsctl_command)
+        self._vsctl(vsctl_command)
+        if self._txn is not None:
+            return
         ofport = self.get_port_ofport(port_name)
         if (tunnel_type == p_const.TYPE_VXLAN and
                 ofport == constants.INVALID_OFPORT):
@@ -281,22 +493,25 @@ class OVSBridge(BaseOVS):
         return ofport
 
     def add_patch_port(self, local_name, remote_name):
-        self.run_vsctl(["add-port", self.br_name, local_name,
-                        "--", "set", "Interface", local_name,
-                        "type=patch", "options:peer=%s" % remote_name])
-        return self.get_port_ofport(local_name)
+        self._vsctl(["add-port", self.br_name, local_name,
+                     "--", "set", "Interface", local_name,
+                     "type=patch", "options:peer=%s" % remote_name])
+        if self._txn is None:
+            return self.get_port_ofport(local_name)
 
     def db_get_map(self, table, record, column, check_error=False):
-        output = self.run_vsctl(["get", table, record, column], check_error)
+        return self._vsctl(["get", table, record, column], check_error,
+                           parse=self._parse_map, query=True)
+
+    def _parse_map(self, output):
         if output:
             output_str = output.rstrip("\n\r")
             return self.db_str_to_map(output_str)
         return {}
 
     def db_get_val(self, table, record, column, check_error=False):
-        output = self.run_vsctl(["get", table, record, column], check_error)
-        if output:
-            return output.rstrip("\n\r")
+        return self._vsctl(["get", table, record, column], check_error,
+                           parse=_parse_val, query=True)
 
     def db_str_to_map(self, full_str):
         list = full_str.strip("{}").split(", ")
@@ -309,6 +524,9 @@ class OVSBridge(BaseOVS):
         return ret
 
     def get_port_name_list(self):
+        if self._ovsdb_synced:
+            return [port['name']
+                    for port in self.ovsdb.get_bridge_ports(self.br_name)]
         res = self.run_vsctl(["list-ports", self.br_name], check_error=True)
         if res:
             return res.strip().split("\n")
@@ -317,6 +535,40 @@ class OVSBridge(BaseOVS):
     def get_port_stats(self, port_name):
         return self.db_get_map("Interface", port_name, "statistics")
 
+    def dump_port_stats(self):
+        """Return the counters of all the ports of the bridge by ofport.
+
+        The counters are read by a single dump-ports, e.g.::
+
+            {1: {'rx_packets': 8, 'rx_bytes': 648, 'rx_dropped': 0,
+                 'rx_errors': 0, 'tx_packets': 0, ...}}
+
+        The local port of the bridge is left out, as well as the counters
+        the datapath does not support. None is returned if the ports could
+        not be dumped.
+        """
+        output = self.run_ofctl("dump-ports", [])
+        if output is None:
+            return None
+        stats = {}
+        counters = None
+        for line in output.splitlines():
+            match = _PORT_STATS_RE.match(line)
+            if match:
+                ofport, direction, fields = match.groups()
+                if ofport:
+                    counters = (stats.setdefault(int(ofport), {})
+                                if ofport.isdigit() else None)
+                if counters is None:
+                    continue
+                for field in fields.split(','):
+                    name, _sep, value = field.strip().partition('=')
+                    if name in PORT_STATS_FIELDS and value.isdigit():
+                        counters['%s_%s' % (direction,
+                                            PORT_STATS_FIELDS[name])] = (
+                            int(value))
+        return stats
+
     def get_xapi_iface_id(self, xs_vif_uuid):
         args = ["xe", "vif-param-get", "param-name=other-config",
                 "param-key=nicira-iface-id", "uuid=%s" % xs_vif_uuid]
@@ -331,12 +583,22 @@ class OVSBridge(BaseOVS):
     # returns a VIF object for each VIF port
     def get_vif_ports(self):
         edge_ports = []
-        port_names = self.get_port_name_list()
-        for name in port_names:
-            external_ids = self.db_get_map("Interface", name, "external_ids",
-                                           check_error=True)
-            ofport = self.db_get_val("Interface", name, "ofport",
-                                     check_error=True)
+        if self._ovsdb_synced:
+            interfaces = [
+                (interface['name'], interface['ofport'],
+                 interface['external_ids'])
+                for interface in self.ovsdb.get_bridge_interfaces(
+                    self.br_name)]
+        else:
+            interfaces = []
+            for name in self.get_port_name_list():
+                external_ids = self.db_get_map("Interface", name,
+                                               "external_ids",
+                                               check_error=True)
+                ofport = self.db_get_val("Interface", name, "ofport",
+                                         check_error=True)
+                interfaces.append((name, ofport, external_ids))
+        for name, ofport, external_ids in interfaces:
             if "iface-id" in external_ids and "attached-mac" in external_ids:
                 p = VifPort(name, ofport, external_ids["iface-id"],
                             external_ids["attached-mac"], self)
@@ -353,18 +615,24 @@ class OVSBridge(BaseOVS):
         return edge_ports
 
     def get_vif_port_set(self):
-        port_names = self.get_port_name_list()
         edge_ports = set()
-        args = ['--format=json', '--', '--columns=name,external_ids,ofport',
-                'list', 'Interface']
-        result = self.run_vsctl(args, check_error=True)
-        if not result:
-            return edge_ports
-        for row in jsonutils.loads(result)['data']:
-            name = row[0]
-            if name not in port_names:
-                continue
-            external_ids = dict(row[1][1])
+        if self._ovsdb_synced:
+            rows = [[interface['name'], interface['external_ids'],
+                     interface['ofport']]
+                    for interface in self.ovsdb.get_bridge_interfaces(
+                        self.br_name)]
+        else:
+            port_names = set(self.get_port_name_list())
+            args = ['--format=json', '--',
+                    '--columns=name,external_ids,ofport', 'list', 'Interface']
+            result = self.run_vsctl(args, check_error=True)
+            if not result:
+                return edge_ports
+            rows = [[row[0], dict(row[1][1]), row[2]]
+                    for row in jsonutils.loads(result)['data']
+                    if row[0] in port_names]
+        for row in rows:
+            external_ids = row[1]
             # Do not consider VIFs which aren't yet ready
             # This can happen when ofport values are either [] or ["set", []]
             # We will therefore consider only integer values for ofport
@@ -405,7 +673,10 @@ class OVSBridge(BaseOVS):
         in the "Interface" table queried by the get_vif_port_set() method.
 
         """
-        port_names = self.get_port_name_list()
+        if self._ovsdb_synced:
+            return dict((port['name'], port['tag'])
+                        for port in self.ovsdb.get_bridge_ports(self.br_name))
+        port_names = set(self.get_port_name_list())
         args = ['--format=json', '--', '--columns=name,tag', 'list', 'Port']
         result = self.run_vsctl(args, check_error=True)
         port_tag_dict = {}
@@ -421,6 +692,8 @@ class OVSBridge(BaseOVS):
         return port_tag_dict
 
     def get_vif_port_by_id(self, port_id):
+        if self._ovsdb_synced:
+            return self._get_vif_port_by_id_native(port_id)
         args = ['--format=json', '--', '--columns=external_ids,name,ofport',
                 'find', 'Interface',
                 'external_ids:iface-id="%s"' % port_id]
@@ -463,6 +736,34 @@ class OVSBridge(BaseOVS):
             LOG.warn(_("Unable to parse interface details. Exception: %s"), e)
             return
 
+    def _get_vif_port_by_id_native(self, port_id):
+        for interface in self.ovsdb.tables['Interface'].values():
+            if interface['external_ids'].get('iface-id') == port_id:
+                break
+        else:
+            return
+        port_name = interface['name']
+        switch = self.ovsdb.get_bridge_name_for_interface(interface['_uuid'])
+        if switch != self.br_name:
+            LOG.info(_("Port: %(port_name)s is on %(switch)s,"
+                       " not on %(br_name)s"), {'port_name': port_name,
+                                                'switch': switch,
+                                                'br_name': self.br_name})
+            return
+        ofport = interface['ofport']
+        # ofport must be integer otherwise return None
+        if not isinstance(ofport, int) or ofport == -1:
+            LOG.warn(_("ofport: %(ofport)s for VIF: %(vif)s is not a "
+                       "positive integer"), {'ofport': ofport,
+                                             'vif': port_id})
+            return
+        vif_mac = interface['external_ids'].get('attached-mac')
+        if not vif_mac:
+            LOG.warn(_("Unable to parse interface details. No attached-mac "
+                       "for VIF: %s"), port_id)
+            return
+        return VifPort(port_name, ofport, port_id, vif_mac, self)
+
     def delete_ports(self, all_ports=False):
         if all_ports:
             port_names = self.get_port_name_list()
@@ -489,6 +790,22 @@ class OVSBridge(BaseOVS):
         self.destroy()
 
 
+def _parse_val(output):
+    if output:
+        return output.rstrip("\n\r")
+
+
+def _parse_ofport(output):
+    ofport = _parse_val(output)
+    # This can return a non-integer string, like '[]' so ensure a
+    # common failure case
+    try:
+        int(ofport)
+        return ofport
+    except (ValueError, TypeError):
+        return constants.INVALID_OFPORT
+
+
 def get_bridge_for_iface(root_helper, iface):
     args = ["ovs-vsctl", "--timeout=%d" % cfg.CONF.ovs_vsctl_timeout,
             "iface-to-br", iface]
@@ -553,6 +870,205 @@ def _build_flow_expr_str(flow_dict, cmd):
     return ','.join(flow_expr_arr)
 
 
+# Fields printed by dump-flows which are statistics and not part of the flow.
+FLOW_STATS_FIELDS = frozenset(['duration', 'n_packets', 'n_bytes',
+                               'idle_age', 'hard_age'])
+DEFAULT_FLOW_PRIORITY = 32768
+# Counters printed by dump-ports, by the name they are exported with.
+PORT_STATS_FIELDS = {'pkts': 'packets', 'bytes': 'bytes',
+                     'drop': 'dropped', 'errs': 'errors'}
+_PORT_STATS_RE = re.compile(r'\s*(?:port\s+(\S+):\s*)?(rx|tx)\s+(.*)$')
+_ACTIONS_RE = re.compile(r'(?:^|[\s,])actions=')
+_HEX_RE = re.compile(r'0x[0-9a-f]+')
+
+
+# The protocol shorthands of ovs-ofctl, by the dl_type and nw_proto they
+# stand for. ovs-ofctl prints them instead of the fields they expand to.
+_FLOW_PROTOCOLS = {
+    'ip': ('0x0800', None), 'ipv6': ('0x86dd', None),
+    'icmp': ('0x0800', '1'), 'icmp6': ('0x86dd', '58'),
+    'tcp': ('0x0800', '6'), 'tcp6': ('0x86dd', '6'),
+    'udp': ('0x0800', '17'), 'udp6': ('0x86dd', '17'),
+    'sctp': ('0x0800', '132'), 'sctp6': ('0x86dd', '132'),
+    'arp': ('0x0806', None), 'rarp': ('0x8035', None),
+    'mpls': ('0x8847', None), 'mplsm': ('0x8848', None)}
+# Synonyms of the match fields, by the name used in the normalized match.
+_FLOW_FIELD_SYNONYMS = {'eth_type': 'dl_type', 'eth_src': 'dl_src',
+                        'eth_dst': 'dl_dst', 'ip_proto': 'nw_proto',
+                        'ip_src': 'nw_src', 'ip_dst': 'nw_dst',
+                        'tunnel_id': 'tun_id'}
+# The fields of ARP packets matched by the network layer fields.
+_ARP_FIELDS = {'nw_src': 'arp_spa', 'nw_dst': 'arp_tpa',
+               'nw_proto': 'arp_op'}
+_ARP_DL_TYPES = frozenset(['2054', '32821'])
+
+
+def _normalize_flow_value(value):
+    # ovs-ofctl prints numbers in hexadecimal and keywords in upper case.
+    return _HEX_RE.sub(lambda m: str(int(m.group(0), 16)), value.lower())
+
+
+def _normalize_flow_match(match):
+    """Return the fields of a match in a form comparable across spellings.
+
+    ovs-ofctl accepts and prints equivalent matches in different ways:
+    protocol shorthands such as arp instead of dl_type=0x0806, synonyms of
+    the fields and numbers in hexadecimal. The fields are returned as a
+    frozenset of name=value strings, the shorthands being expanded.
+    """
+    fields = {}
+    for field in match:
+        name, sep, value = _normalize_flow_value(field).partition('=')
+        name = name.strip()
+        if not sep and name in _FLOW_PROTOCOLS:
+            dl_type, nw_proto = _FLOW_PROTOCOLS[name]
+            fields['dl_type'] = _normalize_flow_value(dl_type)
+            if nw_proto is not None:
+                fields['nw_proto'] = nw_proto
+            continue
+        fields[_FLOW_FIELD_SYNONYMS.get(name, name)] = value.strip()
+    if fields.get('dl_type') in _ARP_DL_TYPES:
+        fields = dict((_ARP_FIELDS.get(name, name), value)
+                      for name, value in fields.items())
+    return frozenset('%s=%s' % (name, value) if value else name
+                     for name, value in fields.items())
+
+
+class Flow(object):
+    """A flow in ovs-ofctl syntax, as built by the agents or dumped.
+
+    Flows are identified by their table, priority and match, which is
+    compared once normalized so that the flows dumped by ovs-ofctl can be
+    compared with the ones built by the agents, e.g. arp is the same match
+    as dl_type=0x0806.
+    """
+
+    def __init__(self, flow_str):
+        parts = _ACTIONS_RE.split(flow_str.strip(), 1)
+        self.actions = parts[1].strip() if len(parts) > 1 else None
+        self.table = None
+        self.priority = None
+        self.cookie = 0
+        self.idle_timeout = 0
+        self.hard_timeout = 0
+        # Statistics of the flows dumped by ovs-ofctl
+        self.n_packets = 0
+        self.n_bytes = 0
+        self.match = []
+        for field in parts[0].replace(' ', ',').split(','):
+            name, sep, value = field.partition('=')
+            name = name.strip().lower()
+            if name in ('n_packets', 'n_bytes'):
+                setattr(self, name, int(value))
+                continue
+            if not name or name in FLOW_STATS_FIELDS:
+                continue
+            if name == 'table':
+                self.table = int(value)
+            elif name == 'priority':
+                self.priority = int(value)
+            elif name == 'cookie':
+                self.cookie = int(value.split('/')[0], 0)
+            elif name == 'idle_timeout':
+                self.idle_timeout = int(value)
+            elif name == 'hard_timeout':
+                self.hard_timeout = int(value)
+            else:
+                self.match.append(field.strip())
+        self.normalized_match = _normalize_flow_match(self.match)
+
+    @property
+    def key(self):
+        return (self.table or 0,
+                DEFAULT_FLOW_PRIORITY if self.priority is None
+                else self.priority,
+                self.normalized_match)
+
+    @property
+    def normalized_actions(self):
+        return _normalize_flow_value(self.actions or '')
+
+    @property
+    def expires(self):
+        return bool(self.idle_timeout or self.hard_timeout)
+
+    def covers(self, flow):
+        """Return whether flow matches this flow as a non strict match."""
+        return ((self.table is None or self.table == (flow.table or 0)) and
+                self.normalized_match <= flow.normalized_match)
+
+    def match_str(self):
+        table, priority, match = self.key
+        return ','.join(['table=%s' % table, 'priority=%s' % priority] +
+                        self.match)
+
+    def __str__(self):
+        fields = ['cookie=%#x' % self.cookie, self.match_str()]
+        if self.idle_timeout:
+            fields.append('idle_timeout=%s' % self.idle_timeout)
+        if self.hard_timeout:
+            fields.append('hard_timeout=%s' % self.hard_timeout)
+        fields.append('actions=%s' % self.actions)
+        return ','.join(fields)
+
+
+class FlowTable(object):
+    """The flows a bridge should have.
+
+    Flows are recorded with the semantics of add-flow, mod-flows and
+    del-flows, so the table can be built by the usual flow calls of the
+    agents and then compared with the flows installed on the bridge.
+    """
+
+    def __init__(self):
+        self.flows = {}
+
+    def __len__(self):
+        return len(self.flows)
+
+    def __iter__(self):
+        return iter(self.flows.values())
+
+    def add(self, flow):
+        self.flows[flow.key] = flow
+
+    def modify(self, pattern):
+        for flow in self:
+            if pattern.covers(flow):
+                flow.actions = pattern.actions
+
+    def delete(self, pattern):
+        for key, flow in self.flows.items():
+            if pattern.covers(flow):
+                del self.flows[key]
+
+    def clear(self):
+        self.flows.clear()
+
+
+def diff_flows(desired, installed, cookie=0):
+    """Compute the flow mods turning the installed flows into desired ones.
+
+    Returns the lists of flows to delete, modify and add. Installed flows
+    which are not desired are only deleted when they belong to the agent,
+    i.e. they carry its cookie or the default one, and do not expire: the
+    flows of learn actions have timeouts and are left to expire.
+    """
+    installed = dict((flow.key, flow) for flow in installed)
+    deleted, modified, added = [], [], []
+    for flow in desired:
+        current = installed.pop(flow.key, None)
+        if current is None:
+            added.append(flow)
+        elif (current.normalized_actions != flow.normalized_actions or
+              current.cookie != flow.cookie):
+            modified.append(flow)
+    for flow in installed.values():
+        if not flow.expires and flow.cookie in (0, cookie):
+            deleted.append(flow)
+    return deleted, modified, added
+
+
 def ofctl_arg_supported(root_helper, cmd, args):
     '''Verify if ovs-ofctl binary supports command with specific args.
 
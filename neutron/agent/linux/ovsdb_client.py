@@ -0,0 +1,275 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Native OVSDB JSON-RPC client (RFC 7047).
+
+The client connects to ovsdb-server and monitors the Bridge, Port and
+Interface tables, keeping an in-memory replica of the columns the agents
+query so that they can be answered without running ovs-vsctl.
+"""
+
+import socket
+
+import eventlet
+from oslo.config import cfg
+
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+from neutron.plugins.openvswitch.common import constants
+
+LOG = logging.getLogger(__name__)
+
+VSCTL = 'vsctl'
+NATIVE = 'native'
+
+OPTS = [
+    cfg.StrOpt('ovsdb_interface',
+               default=VSCTL,
+               help=_("The interface used to query the OVSDB: 'vsctl' runs "
+                      "ovs-vsctl for each query, 'native' keeps a replica of "
+                      "the Bridge, Port and Interface tables over a "
+                      "connection to ovsdb-server.")),
+    cfg.StrOpt('ovsdb_connection',
+               default='unix:/var/run/openvswitch/db.sock',
+               help=_("The connection to ovsdb-server used by the native "
+                      "interface, either unix:PATH or tcp:IP:PORT.")),
+]
+cfg.CONF.register_opts(OPTS)
+
+DB_NAME = 'Open_vSwitch'
+MONITOR_ID = 'neutron'
+MONITOR_REQUEST_ID = 'monitor'
+MONITORED_COLUMNS = {
+    'Bridge': ['name', 'ports'],
+    'Port': ['name', 'tag', 'interfaces'],
+    'Interface': ['name', 'ofport', 'external_ids'],
+}
+
+RECV_SIZE = 65536
+
+
+def decode_value(value):
+    """Convert an OVSDB value from its JSON notation.
+
+    Sets become lists, maps become dicts and uuids become strings.
+    """
+    if isinstance(value, list):
+        kind, data = value
+        if kind == 'set':
+            return [decode_value(v) for v in data]
+        if kind == 'map':
+            return dict((decode_value(k), decode_value(v)) for k, v in data)
+        return data
+    return value
+
+
+def _as_list(value):
+    # A set of a single element is represented by the element itself.
+    return value if isinstance(value, list) else [value]
+
+
+class JsonStream(object):
+    """Splits the stream of JSON texts sent by ovsdb-server."""
+
+    def __init__(self):
+        self._buffer = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+
+    def feed(self, data):
+        """Return the messages completed by data."""
+        messages = []
+        start = 0
+        for i, c in enumerate(data):
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == '\\':
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+            elif c == '"':
+                self._in_string = True
+            elif c in '{[':
+                self._depth += 1
+            elif c in '}]':
+                self._depth -= 1
+                if not self._depth:
+                    self._buffer.append(data[start:i + 1])
+                    messages.append(jsonutils.loads(''.join(self._buffer)))
+                    self._buffer = []
+                    start = i + 1
+        if self._depth:
+            self._buffer.append(data[start:])
+        return messages
+
+
+class OvsdbClient(object):
+    """Keeps a replica of the tables of ovsdb-server used by the agents.
+
+    The replica is only usable while synced is True. The connection is
+    retried every respawn_interval seconds after it is lost, and the
+    listeners are called with the names of the updated tables whenever
+    the replica changes.
+    """
+
+    def __init__(self, connection,
+                 respawn_interval=constants.DEFAULT_OVSDBMON_RESPAWN):
+        self.connection = connection
+        self.respawn_interval = respawn_interval
+        self.tables = dict((table, {}) for table in MONITORED_COLUMNS)
+        self.synced = False
+        self._listeners = []
+        self._sock = None
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = eventlet.spawn(self._run)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        self._close()
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def _connect(self):
+        kind, _sep, address = self.connection.partition(':')
+        if kind == 'unix':
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.connect(address)
+        elif kind == 'tcp':
+            host, _sep, port = address.rpartition(':')
+            sock = socket.create_connection((host, int(port)))
+        else:
+            raise ValueError(_("Unsupported OVSDB connection: %s") %
+                             self.connection)
+        return sock
+
+    def _close(self):
+        self.synced = False
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _send(self, message):
+        self._sock.sendall(jsonutils.dumps(message))
+
+    def _run(self):
+        while True:
+            try:
+                self._sock = self._connect()
+                self._send({'method': 'monitor',
+                            'id': MONITOR_REQUEST_ID,
+                            'params': [DB_NAME, MONITOR_ID,
+                                       dict((table, {'columns': columns})
+                                            for table, columns in
+                                            MONITORED_COLUMNS.items())]})
+                stream = JsonStream()
+                while True:
+                    data = self._sock.recv(RECV_SIZE)
+                    if not data:
+                        break
+                    for message in stream.feed(data):
+                        self._handle_message(message)
+                LOG.warn(_("Connection to ovsdb-server %s closed"),
+                         self.connection)
+            except Exception:
+                LOG.exception(_("Error communicating with ovsdb-server %s"),
+                              self.connection)
+            self._close()
+            eventlet.sleep(self.respawn_interval)
+
+    def _handle_message(self, message):
+        method = message.get('method')
+        if method == 'echo':
+            self._send({'result': message['params'], 'error': None,
+                        'id': message['id']})
+        elif method == 'update':
+            self._update(message['params'][1])
+        elif message.get('id') == MONITOR_REQUEST_ID:
+            if message.get('error'):
+                raise RuntimeError(_("OVSDB monitor request failed: %s") %
+                                   message['error'])
+            self.tables = dict((table, {}) for table in MONITORED_COLUMNS)
+            self.synced = True
+            self._update(message['result'], tables=set(MONITORED_COLUMNS))
+
+    def _update(self, table_updates, tables=None):
+        for table, row_updates in table_updates.items():
+            replica = self.tables.setdefault(table, {})
+            for uuid, row_update in row_updates.items():
+                new = row_update.get('new')
+                if new is None:
+                    replica.pop(uuid, None)
+                else:
+                    row = replica.setdefault(uuid, {'_uuid': uuid})
+                    row.update((column, decode_value(value))
+                               for column, value in new.items())
+        tables = tables or set(table_updates)
+        for listener in self._listeners:
+            listener(tables)
+
+    def get_bridge(self, name):
+        for bridge in self.tables['Bridge'].values():
+            if bridge.get('name') == name:
+                return bridge
+
+    def get_bridge_ports(self, bridge_name):
+        """Return the Port rows of a bridge."""
+        bridge = self.get_bridge(bridge_name)
+        if not bridge:
+            return []
+        ports = self.tables['Port']
+        return [ports[uuid] for uuid in _as_list(bridge.get('ports', []))
+                if uuid in ports]
+
+    def get_port_interfaces(self, port):
+        interfaces = self.tables['Interface']
+        return [interfaces[uuid]
+                for uuid in _as_list(port.get('interfaces', []))
+                if uuid in interfaces]
+
+    def get_bridge_interfaces(self, bridge_name):
+        """Return the Interface rows of the ports of a bridge."""
+        return [interface for port in self.get_bridge_ports(bridge_name)
+                for interface in self.get_port_interfaces(port)]
+
+    def get_bridge_name_for_interface(self, interface_uuid):
+        for bridge in self.tables['Bridge'].values():
+            for port in self.get_bridge_ports(bridge.get('name')):
+                if interface_uuid in _as_list(port.get('interfaces', [])):
+                    return bridge.get('name')
+
+
+_client = None
+
+
+def get_client():
+    """Return the client shared by the process, started on first use."""
+    global _client
+    if _client is None:
+        _client = OvsdbClient(cfg.CONF.ovsdb_connection)
+        _client.start()
+    return _client
+
+
+def is_native():
+    return cfg.CONF.ovsdb_interface == NATIVE
@@ -15,17 +15,24 @@
 import eventlet
 
 from neutron.agent.linux import async_process
+from neutron.openstack.common import jsonutils
 from neutron.openstack.common import log as logging
 
 
 LOG = logging.getLogger(__name__)
 
+# The maximum number of lines of output queued by OvsdbMonitor.
+DEFAULT_MAX_QUEUE_SIZE = 10000
+# The maximum number of coalesced row events kept by SimpleInterfaceMonitor.
+DEFAULT_MAX_EVENTS = 1000
+
 
 class OvsdbMonitor(async_process.AsyncProcess):
     """Manages an invocation of 'ovsdb-client monitor'."""
 
     def __init__(self, table_name, columns=None, format=None,
-                 root_helper=None, respawn_interval=None):
+                 root_helper=None, respawn_interval=None,
+                 max_queue_size=DEFAULT_MAX_QUEUE_SIZE):
 
         cmd = ['ovsdb-client', 'monitor', table_name]
         if columns:
@@ -34,16 +41,20 @@ class OvsdbMonitor(async_process.AsyncProcess):
             cmd.append('--format=%s' % format)
         super(OvsdbMonitor, self).__init__(cmd,
                                            root_helper=root_helper,
-                                           respawn_interval=respawn_interval)
+                                           respawn_interval=respawn_interval,
+                                           max_queue_size=max_queue_size)
 
     def _read_stdout(self):
         data = self._process.stdout.readline()
         if not data:
             return
-        self._stdout_lines.put(data)
         LOG.debug(_('Output received from ovsdb monitor: %s') % data)
+        self._process_output(data)
         return data
 
+    def _process_output(self, data):
+        self._queue_line(self._stdout_lines, data)
+
     def _read_stderr(self):
         data = super(OvsdbMonitor, self)._read_stderr()
         if data:
@@ -58,9 +69,17 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
     The has_updates() method indicates whether changes to the ovsdb
     Interface table have been detected since the monitor started or
     since the previous access.
+
+    Each line of output is parsed as it is read and the row events it
+    carries are coalesced per row, so the pending events are bounded by
+    the number of changed interfaces rather than by the amount of output.
+    When more than max_events rows are pending, they are discarded and
+    the monitor reports an overflow, requiring a full resync of the
+    interfaces instead.
     """
 
-    def __init__(self, root_helper=None, respawn_interval=None):
+    def __init__(self, root_helper=None, respawn_interval=None,
+                 max_events=DEFAULT_MAX_EVENTS):
         super(SimpleInterfaceMonitor, self).__init__(
             'Interface',
             columns=['name', 'ofport'],
@@ -69,6 +88,78 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
             respawn_interval=respawn_interval,
         )
         self.data_received = False
+        self.max_events = max_events
+        # row uuid -> [action, name, ofport]
+        self._events = {}
+        self._overflowed = False
+        self.events_received = 0
+        self.overflows = 0
+
+    def _process_output(self, data):
+        try:
+            output = jsonutils.loads(data)
+            headings = output['headings']
+            rows = [dict(zip(headings, row)) for row in output['data']]
+        except (ValueError, KeyError, TypeError):
+            LOG.warning(_('Unable to parse ovsdb monitor output: %s'), data)
+            self._handle_overflow()
+            return
+        for row in rows:
+            self._add_event(row)
+        if len(self._events) > self.max_events:
+            self._handle_overflow()
+
+    def _add_event(self, row):
+        action = row.get('action')
+        if action == 'old':
+            # Updates are reported as an old and a new row, the new row
+            # carries all the columns.
+            return
+        if action == 'initial':
+            action = 'insert'
+        self.events_received += 1
+        uuid = row.get('row')
+        pending = self._events.get(uuid)
+        if pending is None:
+            self._events[uuid] = [action, row.get('name'), row.get('ofport')]
+        elif action == 'delete' and pending[0] == 'insert':
+            # The interface came and went since the last poll.
+            del self._events[uuid]
+        else:
+            if action == 'delete' or pending[0] != 'insert':
+                pending[0] = action
+            pending[1:] = [row.get('name'), row.get('ofport')]
+
+    def _handle_overflow(self):
+        if not self._overflowed:
+            LOG.warning(_('Too many pending ovsdb monitor events, a full '
+                          'resync of the interfaces is required.'))
+        self.overflows += 1
+        self._overflowed = True
+        self._events.clear()
+
+    def get_events(self):
+        """Return and clear the pending interface events.
+
+        The events are a dict of lists of (name, ofport) tuples keyed by
+        'added', 'removed' and 'modified', or None after an overflow.
+        """
+        events, self._events = self._events, {}
+        overflowed, self._overflowed = self._overflowed, False
+        if overflowed:
+            return None
+        result = {'added': [], 'removed': [], 'modified': []}
+        kinds = {'insert': 'added', 'delete': 'removed', 'new': 'modified'}
+        for action, name, ofport in events.values():
+            result[kinds[action]].append((name, ofport))
+        return result
+
+    def get_stats(self):
+        stats = super(SimpleInterfaceMonitor, self).get_stats()
+        stats.update({'pending_events': len(self._events),
+                      'events_received': self.events_received,
+                      'overflows': self.overflows})
+        return stats
 
     @property
     def is_active(self):
@@ -85,7 +176,8 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         the absence of updates at the expense of potential false
         positives.
         """
-        return bool(list(self.iter_stdout())) or not self.is_active
+        events = self.get_events()
+        return events is None or any(events.values()) or not self.is_active
 
     def start(self, block=False, timeout=5):
         super(SimpleInterfaceMonitor, self).start()
@@ -103,3 +195,50 @@ class SimpleInterfaceMonitor(OvsdbMonitor):
         if data and not self.data_received:
             self.data_received = True
         return data
+
+
+class NativeInterfaceMonitor(object):
+    """Detects changes of the Interface table with the native OVSDB client.
+
+    It offers the interface of SimpleInterfaceMonitor, but the updates come
+    from the connection the native client uses to maintain its replica of
+    the OVSDB instead of from an ovsdb-client child process.
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self._updated = False
+
+    @property
+    def is_active(self):
+        return self._client.synced
+
+    @property
+    def has_updates(self):
+        """Indicate whether the ovsdb Interface table has been updated.
+
+        As with SimpleInterfaceMonitor, True is returned while the client
+        is not synchronized with ovsdb-server.
+        """
+        updated, self._updated = self._updated, False
+        return updated or not self.is_active
+
+    def get_stats(self):
+        # The updates are not queued, there is nothing to measure.
+        return {}
+
+    def _tables_updated(self, tables):
+        if 'Interface' in tables:
+            self._updated = True
+
+    def start(self, block=False, timeout=5):
+        self._client.add_listener(self._tables_updated)
+        self._client.start()
+        if block:
+            with eventlet.timeout.Timeout(timeout):
+                while not self.is_active:
+                    eventlet.sleep()
+
+    def stop(self):
+        # The connection is shared with ovs_lib and stays open.
+        self._client.remove_listener(self._tables_updated)
@@ -13,12 +13,20 @@
 #    under the License.
 
 import contextlib
+import errno
+import socket
 
 import eventlet
+from eventlet import event
 
+from neutron.agent.linux import netlink_lib
+from neutron.agent.linux import ovsdb_client
 from neutron.agent.linux import ovsdb_monitor
+from neutron.openstack.common import log as logging
 from neutron.plugins.openvswitch.common import constants
 
+LOG = logging.getLogger(__name__)
+
 
 @contextlib.contextmanager
 def get_polling_manager(minimize_polling=False,
@@ -39,6 +47,20 @@ def get_polling_manager(minimize_polling=False,
             pm.stop()
 
 
+@contextlib.contextmanager
+def get_link_polling_manager(minimize_polling=False):
+    if minimize_polling:
+        pm = LinkPollingMinimizer()
+        pm.start()
+    else:
+        pm = AlwaysPoll()
+    try:
+        yield pm
+    finally:
+        if minimize_polling:
+            pm.stop()
+
+
 class BasePollingManager(object):
 
     def __init__(self):
@@ -79,6 +101,22 @@ class BasePollingManager(object):
 
         return polling_required
 
+    def get_link_changes(self):
+        """Return the names of the links added and removed since last call.
+
+        None is returned when the changes are not known, in which case all
+        the devices have to be scanned.
+        """
+        return None
+
+    def wait_for_updates(self, timeout):
+        """Sleep for timeout seconds, or less if updates are detected."""
+        eventlet.sleep(timeout)
+
+    def get_stats(self):
+        """Return the statistics of the update detection, if any."""
+        return {}
+
 
 class AlwaysPoll(BasePollingManager):
 
@@ -95,9 +133,13 @@ class InterfacePollingMinimizer(BasePollingManager):
                      constants.DEFAULT_OVSDBMON_RESPAWN)):
 
         super(InterfacePollingMinimizer, self).__init__()
-        self._monitor = ovsdb_monitor.SimpleInterfaceMonitor(
-            root_helper=root_helper,
-            respawn_interval=ovsdb_monitor_respawn_interval)
+        if ovsdb_client.is_native():
+            self._monitor = ovsdb_monitor.NativeInterfaceMonitor(
+                ovsdb_client.get_client())
+        else:
+            self._monitor = ovsdb_monitor.SimpleInterfaceMonitor(
+                root_helper=root_helper,
+                respawn_interval=ovsdb_monitor_respawn_interval)
 
     def start(self):
         self._monitor.start()
@@ -110,3 +152,127 @@ class InterfacePollingMinimizer(BasePollingManager):
         # collect output.
         eventlet.sleep()
         return self._monitor.has_updates
+
+    def get_stats(self):
+        return self._monitor.get_stats()
+
+
+class LinkPollingMinimizer(BasePollingManager):
+    """Monitors netlink link notifications to determine when polling is
+    required.
+
+    The names of the links added and removed are tracked as well, so that
+    the agents do not have to scan all their devices to find them. When
+    notifications are lost, e.g. because the socket buffer overflowed, the
+    changes are unknown until the next call of get_link_changes(). The
+    socket is reopened after any other error.
+    """
+
+    REOPEN_INTERVAL = 1
+
+    def __init__(self):
+        super(LinkPollingMinimizer, self).__init__()
+        self._sock = None
+        self._thread = None
+        self._links = set()
+        self._added = set()
+        self._removed = set()
+        self._changes_lost = True
+        self._has_updates = True
+        self._updates_event = event.Event()
+
+    def start(self):
+        self._open()
+        self._thread = eventlet.spawn(self._run)
+
+    def _open(self):
+        # Subscribe before dumping the links, to not miss a change between
+        # the dump and the subscription.
+        self._sock = netlink_lib.NetlinkSocket(groups=netlink_lib.RTMGRP_LINK)
+        self._links = set(link['name'] for link in
+                          netlink_lib.dump_tables([netlink_lib.LINKS])[
+                              netlink_lib.LINKS])
+
+    def _reopen(self):
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+        while True:
+            try:
+                self._open()
+                return
+            except (socket.error, RuntimeError):
+                LOG.exception(_("Unable to reopen the netlink socket, "
+                                "retrying in %d seconds"),
+                              self.REOPEN_INTERVAL)
+                if self._sock is not None:
+                    self._sock.close()
+                    self._sock = None
+                eventlet.sleep(self.REOPEN_INTERVAL)
+
+    def stop(self):
+        if self._thread is not None:
+            self._thread.kill()
+            self._thread = None
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def _run(self):
+        while True:
+            try:
+                events = self._sock.receive_link_events()
+            except socket.error as e:
+                if e.errno == errno.ENOBUFS:
+                    LOG.warning(_("Link notifications were lost, all the "
+                                  "devices will be scanned"))
+                else:
+                    LOG.error(_("Error receiving link notifications, "
+                                "reopening the netlink socket: %s"), e)
+                self._changes_lost = True
+                self._notify()
+                if e.errno != errno.ENOBUFS:
+                    self._reopen()
+                continue
+            self._process_events(events)
+
+    def _process_events(self, events):
+        for created, link in events:
+            name = link['name']
+            if created:
+                # Notifications of existing links report attribute changes.
+                # A link deleted and created again since the last call of
+                # get_link_changes() is reported as added and not removed.
+                if name not in self._links:
+                    self._links.add(name)
+                    self._removed.discard(name)
+                    self._added.add(name)
+            else:
+                self._links.discard(name)
+                self._added.discard(name)
+                self._removed.add(name)
+        if events:
+            self._notify()
+
+    def _notify(self):
+        self._has_updates = True
+        if not self._updates_event.ready():
+            self._updates_event.send()
+
+    def _is_polling_required(self):
+        has_updates, self._has_updates = self._has_updates, False
+        return has_updates
+
+    def get_link_changes(self):
+        added, removed = self._added, self._removed
+        self._added, self._removed = set(), set()
+        if self._changes_lost:
+            self._changes_lost = False
+            return None
+        return added, removed
+
+    def wait_for_updates(self, timeout):
+        if not self._has_updates:
+            with eventlet.Timeout(timeout, False):
+                self._updates_event.wait()
+        self._updates_event = event.Event()
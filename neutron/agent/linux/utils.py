@@ -22,9 +22,12 @@ import shutil
 import socket
 import struct
 import tempfile
+import threading
 
 from eventlet.green import subprocess
 from eventlet import greenthread
+from oslo.config import cfg
+from oslo.rootwrap import client
 
 from neutron.common import constants
 from neutron.common import utils
@@ -59,19 +62,69 @@ def create_process(cmd, root_helper=None, addl_env=None):
     return obj, cmd
 
 
+class RootwrapDaemonHelper(object):
+    """Shares one root helper daemon client across the process."""
+
+    _client = None
+    _lock = threading.Lock()
+
+    @classmethod
+    def get_client(cls):
+        with cls._lock:
+            if cls._client is None:
+                cls._client = client.Client(
+                    shlex.split(cfg.CONF.AGENT.root_helper_daemon))
+            return cls._client
+
+
+def _use_root_helper_daemon(root_helper, addl_env):
+    # The daemon runs commands with the filters of its own configuration
+    # and no inherited environment, so it only replaces root_helper for
+    # commands which do not need additional environment variables.
+    if not root_helper or addl_env:
+        return False
+    try:
+        return bool(cfg.CONF.AGENT.root_helper_daemon)
+    except (cfg.NoSuchOptError, cfg.NoSuchGroupError):
+        # Only agents that want to use the daemon need to register the
+        # option.
+        return False
+
+
+def execute_rootwrap_daemon(cmd, process_input=None):
+    """Run cmd through the root helper daemon.
+
+    The return value is a tuple of the return code, stdout and stderr.
+    """
+    cmd = map(str, cmd)
+    LOG.debug(_("Running command (rootwrap daemon): %s"), cmd)
+    try:
+        return RootwrapDaemonHelper.get_client().execute(
+            cmd, stdin=process_input)
+    except Exception as e:
+        # Errors raised in the daemon, e.g. when no filter matched the
+        # command, fail the command like a forked root helper would.
+        return 1, '', str(e)
+
+
 def execute(cmd, root_helper=None, process_input=None, addl_env=None,
             check_exit_code=True, return_stderr=False):
     try:
-        obj, cmd = create_process(cmd, root_helper=root_helper,
-                                  addl_env=addl_env)
-        _stdout, _stderr = (process_input and
-                            obj.communicate(process_input) or
-                            obj.communicate())
-        obj.stdin.close()
+        if _use_root_helper_daemon(root_helper, addl_env):
+            returncode, _stdout, _stderr = execute_rootwrap_daemon(
+                cmd, process_input)
+        else:
+            obj, cmd = create_process(cmd, root_helper=root_helper,
+                                      addl_env=addl_env)
+            _stdout, _stderr = (process_input and
+                                obj.communicate(process_input) or
+                                obj.communicate())
+            obj.stdin.close()
+            returncode = obj.returncode
         m = _("\nCommand: %(cmd)s\nExit code: %(code)s\nStdout: %(stdout)r\n"
-              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': obj.returncode,
+              "Stderr: %(stderr)r") % {'cmd': cmd, 'code': returncode,
                                        'stdout': _stdout, 'stderr': _stderr}
-        if obj.returncode:
+        if returncode:
             LOG.error(m)
             if check_exit_code:
                 raise RuntimeError(m)
@@ -0,0 +1,209 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+
+from neutron.agent.linux import utils
+from neutron.common import constants
+from neutron.openstack.common import jsonutils
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+class LocalVlanAllocator(object):
+    """Allocates the local VLANs of the networks of an L2 agent.
+
+    The VLANs in use are tracked in a bitmap, and a network is given the
+    lowest free one. The mappings of the networks are saved to a state
+    file, from which they are restored when the agent starts: a network
+    gets back the VLAN it had before the restart, so that its ports are
+    not retagged.
+
+    The VLANs restored for networks and the ones reserved for the tags
+    found on the ports are held until release_unclaimed is called, once
+    the agent has synchronized its ports. A network is mapped to the
+    reserved VLAN of one of its ports if it has none restored.
+    """
+
+    def __init__(self, state_file=None, min_vlan=constants.MIN_VLAN_TAG,
+                 max_vlan=constants.MAX_VLAN_TAG - 1):
+        self.state_file = state_file
+        self.min_vlan = min_vlan
+        self.max_vlan = max_vlan
+        self._bitmap = bytearray((max_vlan >> 3) + 1)
+        self._free = max_vlan - min_vlan + 1
+        # no VLAN below the hint is free
+        self._hint = min_vlan
+        # net_uuid -> VLAN of the networks provisioned by the agent
+        self._networks = {}
+        # net_uuid -> VLAN restored from the state file, not yet claimed
+        self._restored = {}
+        # VLANs reserved for the tags of the ports, not yet claimed
+        self._reserved = set()
+        self._dirty = False
+        if state_file:
+            self._load()
+
+    def _valid(self, lvid):
+        return (isinstance(lvid, int) and
+                self.min_vlan <= lvid <= self.max_vlan)
+
+    def _in_use(self, lvid):
+        return self._bitmap[lvid >> 3] & (1 << (lvid & 7))
+
+    def _set(self, lvid):
+        self._bitmap[lvid >> 3] |= 1 << (lvid & 7)
+        self._free -= 1
+
+    def _clear(self, lvid):
+        self._bitmap[lvid >> 3] &= ~(1 << (lvid & 7)) & 0xff
+        self._free += 1
+        self._hint = min(self._hint, lvid)
+
+    def _find_free(self):
+        if not self._free:
+            return None
+        lvid = self._hint
+        while lvid <= self.max_vlan:
+            if not lvid & 7 and self._bitmap[lvid >> 3] == 0xff:
+                lvid += 8
+            elif self._in_use(lvid):
+                lvid += 1
+            else:
+                self._hint = lvid + 1
+                return lvid
+
+    def _take_unclaimed(self):
+        if self._reserved:
+            return self._reserved.pop()
+        if self._restored:
+            return self._restored.popitem()[1]
+
+    def get(self, net_uuid):
+        return self._networks.get(net_uuid)
+
+    def is_free(self, lvid):
+        return self._valid(lvid) and not self._in_use(lvid)
+
+    def allocate(self, net_uuid, preferred=None):
+        """Return the VLAN of a network, allocating it if needed.
+
+        :param net_uuid: the uuid of the network.
+        :param preferred: the tag of a port of the network, used if it is
+                          reserved or free and the network has no VLAN
+                          restored.
+        :returns: the VLAN, or None if they are all in use.
+        """
+        lvid = self._networks.get(net_uuid)
+        if lvid is not None:
+            return lvid
+        lvid = self._restored.pop(net_uuid, None)
+        if lvid is None:
+            try:
+                preferred = int(preferred)
+            except (TypeError, ValueError):
+                preferred = None
+            if preferred in self._reserved:
+                self._reserved.remove(preferred)
+                lvid = preferred
+            elif self.is_free(preferred):
+                lvid = preferred
+                self._set(lvid)
+            else:
+                lvid = self._find_free()
+                if lvid is not None:
+                    self._set(lvid)
+                else:
+                    # Before the first sync, the VLANs left unclaimed may
+                    # belong to networks which are gone
+                    lvid = self._take_unclaimed()
+                    if lvid is None:
+                        return None
+        self._networks[net_uuid] = lvid
+        self._dirty = True
+        return lvid
+
+    def release(self, net_uuid):
+        """Release the VLAN of a network."""
+        lvid = self._networks.pop(net_uuid, None)
+        if lvid is not None:
+            self._clear(lvid)
+            self._dirty = True
+
+    def reserve(self, lvid):
+        """Hold the VLAN a port is tagged with for the network of the port.
+
+        :returns: whether the VLAN was free.
+        """
+        if not self.is_free(lvid):
+            return False
+        self._set(lvid)
+        self._reserved.add(lvid)
+        return True
+
+    def reserved(self):
+        return self._reserved | set(self._restored.values())
+
+    def release_unclaimed(self):
+        """Release the restored and reserved VLANs no network claimed."""
+        unclaimed = self.reserved()
+        if not unclaimed:
+            return
+        LOG.info(_("Releasing unclaimed local vlans %s"), sorted(unclaimed))
+        for lvid in unclaimed:
+            self._clear(lvid)
+        if self._restored:
+            self._dirty = True
+        self._restored = {}
+        self._reserved = set()
+
+    def _load(self):
+        try:
+            with open(self.state_file) as f:
+                networks = jsonutils.loads(f.read())
+            if not isinstance(networks, dict):
+                raise ValueError()
+        except IOError as e:
+            if e.errno != errno.ENOENT:
+                LOG.warning(_("Unable to read the local vlans from %(file)s: "
+                              "%(error)s"),
+                            {'file': self.state_file, 'error': e})
+            return
+        except ValueError:
+            LOG.warning(_("Ignoring the invalid local vlans file %s"),
+                        self.state_file)
+            return
+        for net_uuid, lvid in networks.items():
+            if not self.is_free(lvid):
+                LOG.warning(_("Ignoring local vlan %(lvid)s of net-id="
+                              "%(net_uuid)s"),
+                            {'lvid': lvid, 'net_uuid': net_uuid})
+                continue
+            self._set(lvid)
+            self._restored[net_uuid] = lvid
+        LOG.info(_("Restored the local vlans of %d networks"),
+                 len(self._restored))
+
+    def save(self):
+        """Write the mappings to the state file if they changed."""
+        if not self.state_file or not self._dirty:
+            return
+        networks = dict(self._restored)
+        networks.update(self._networks)
+        try:
+            utils.replace_file(self.state_file, jsonutils.dumps(networks))
+            self._dirty = False
+        except (IOError, OSError):
+            LOG.exception(_("Unable to save the local vlans to %s"),
+                          self.state_file)
@@ -26,6 +26,7 @@ from neutron.agent import l3_agent
 from neutron.agent.linux import dhcp
 from neutron.agent.linux import interface
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import namespace_cleanup
 from neutron.agent.linux import ovs_lib
 from neutron.api.v2 import attributes
 from neutron.common import config
@@ -67,6 +68,7 @@ def setup_conf():
     conf.register_opts(dhcp.OPTS)
     conf.register_opts(dhcp_agent.DhcpAgent.OPTS)
     conf.register_opts(interface.OPTS)
+    conf.register_opts(ip_lib.OPTS)
     return conf
 
 
@@ -86,17 +88,21 @@ def kill_dhcp(conf, namespace):
         dhcp_driver.disable()
 
 
-def eligible_for_deletion(conf, namespace, force=False):
+def eligible_for_deletion(conf, namespace, force=False, devices=None):
     """Determine whether a namespace is eligible for deletion.
 
     Eligibility is determined by having only the lo device or if force
-    is passed as a parameter.
+    is passed as a parameter. devices are the names of the devices of the
+    namespace but the loopback, if they were already listed.
     """
 
     # filter out namespaces without UUID as the name
     if not re.match(NS_MANGLING_PATTERN, namespace):
         return False
 
+    if devices is not None:
+        return force or not devices
+
     root_helper = agent_config.get_root_helper(conf)
     ip = ip_lib.IPWrapper(root_helper, namespace)
     return force or ip.namespace_is_empty()
@@ -116,28 +122,34 @@ def unplug_device(conf, device):
             LOG.debug(_('Unable to find bridge for device: %s'), device.name)
 
 
-def destroy_namespace(conf, namespace, force=False):
+def destroy_namespace(conf, namespace, force=False, devices=None):
     """Destroy a given namespace.
 
     If force is True, then dhcp (if it exists) will be disabled and all
-    devices will be forcibly removed.
+    devices will be forcibly removed. devices are the names of the devices
+    of the namespace but the loopback, if they were already listed.
+
+    The errors are raised, so that the NamespaceCleaner destroying the
+    namespaces logs and counts them.
     """
 
-    try:
-        root_helper = agent_config.get_root_helper(conf)
-        ip = ip_lib.IPWrapper(root_helper, namespace)
+    root_helper = agent_config.get_root_helper(conf)
+    ip = ip_lib.IPWrapper(root_helper, namespace)
 
-        if force:
-            kill_dhcp(conf, namespace)
-            # NOTE: The dhcp driver will remove the namespace if is it empty,
-            # so a second check is required here.
-            if ip.netns.exists(namespace):
-                for device in ip.get_devices(exclude_loopback=True):
-                    unplug_device(conf, device)
+    if force:
+        kill_dhcp(conf, namespace)
+        # NOTE: The dhcp driver will remove the namespace if is it empty,
+        # so a second check is required here.
+        if ip.netns.exists(namespace):
+            if devices is None:
+                ns_devices = ip.get_devices(exclude_loopback=True)
+            else:
+                ns_devices = [ip_lib.IPDevice(name, root_helper, namespace)
+                              for name in devices]
+            for device in ns_devices:
+                unplug_device(conf, device)
 
-        ip.garbage_collect_namespace()
-    except Exception:
-        LOG.exception(_('Error unable to destroy namespace: %s'), namespace)
+    ip.garbage_collect_namespace()
 
 
 def main():
@@ -156,19 +168,29 @@ def main():
     The --force flag should only be used as part of the cleanup of a devstack
     installation as it will blindly purge namespaces and their devices. This
     option also kills any lingering DHCP instances.
+
+    The devices of the namespaces are listed in bulk and the candidates are
+    destroyed concurrently.
     """
     conf = setup_conf()
     conf()
     config.setup_logging(conf)
 
     root_helper = agent_config.get_root_helper(conf)
+    cleaner = namespace_cleanup.NamespaceCleaner(root_helper)
+    namespaces = [ns for ns in ip_lib.IPWrapper.get_namespaces(root_helper)
+                  if re.match(NS_MANGLING_PATTERN, ns)]
+    devices = cleaner.list_devices(namespaces)
     # Identify namespaces that are candidates for deletion.
-    candidates = [ns for ns in
-                  ip_lib.IPWrapper.get_namespaces(root_helper)
-                  if eligible_for_deletion(conf, ns, conf.force)]
+    candidates = [ns for ns in namespaces
+                  if ns in devices and
+                  eligible_for_deletion(conf, ns, conf.force, devices[ns])]
 
     if candidates:
         eventlet.sleep(2)
 
-        for namespace in candidates:
-            destroy_namespace(conf, namespace, conf.force)
+        cleaner.cleanup(
+            candidates,
+            lambda ns, ns_devices: destroy_namespace(conf, ns, conf.force,
+                                                     ns_devices),
+            devices=devices)
@@ -80,6 +80,7 @@ class PluginApi(n_rpc.RpcProxy):
         1.3 - get_device_details rpc signature upgrade to obtain 'host' and
               return value to include fixed_ips and device_owner for
               the device port
+        1.4 - update_devices_up and update_devices_down
     '''
 
     BASE_RPC_API_VERSION = '1.1'
@@ -87,6 +88,8 @@ class PluginApi(n_rpc.RpcProxy):
     def __init__(self, topic):
         super(PluginApi, self).__init__(
             topic=topic, default_version=self.BASE_RPC_API_VERSION)
+        # Cleared once the server turns out not to support the 1.4 calls
+        self.bulk_update_supported = True
 
     def get_device_details(self, context, device, agent_id, host=None):
         return self.call(context,
@@ -130,6 +133,88 @@ class PluginApi(n_rpc.RpcProxy):
                                        agent_id=agent_id, host=host),
                          topic=self.topic)
 
+    def _update_devices(self, context, status, devices, agent_id, host):
+        if self.bulk_update_supported:
+            try:
+                return self.call(context,
+                                 self.make_msg('update_devices_%s' % status,
+                                               devices=list(devices),
+                                               agent_id=agent_id,
+                                               host=host),
+                                 topic=self.topic, version='1.4')
+            except (messaging.UnsupportedVersion,
+                    messaging.RemoteError) as e:
+                # The server raises UnsupportedVersion as a RemoteError
+                if (isinstance(e, messaging.RemoteError) and
+                        e.exc_type not in ('UnsupportedVersion',
+                                           'NoSuchMethod')):
+                    raise
+                LOG.warn(_('Updating the status of devices in bulk requires '
+                           'a server upgrade.'))
+                self.bulk_update_supported = False
+        method = 'update_device_%s' % status
+        res = []
+        for device in devices:
+            try:
+                details = self.call(context,
+                                    self.make_msg(method, device=device,
+                                                  agent_id=agent_id,
+                                                  host=host),
+                                    topic=self.topic)
+            except Exception as e:
+                LOG.debug("%(method)s failed for %(device)s: %(e)s",
+                          {'method': method, 'device': device, 'e': e})
+                res.append({'device': device, 'failed': True})
+                continue
+            res.append(details or {'device': device, 'exists': True})
+        return res
+
+    def update_devices_down(self, context, devices, agent_id, host=None):
+        """Report that devices no longer exist on the agent.
+
+        Returns a dict for each device with the keys 'device' and 'exists',
+        or 'device' and 'failed' for the devices which were not updated.
+        """
+        return self._update_devices(context, 'down', devices, agent_id,
+                                    host)
+
+    def update_devices_up(self, context, devices, agent_id, host=None):
+        """Report that devices are up on the agent.
+
+        Returns a dict for each device with the keys 'device' and 'exists',
+        or 'device' and 'failed' for the devices which were not updated.
+        """
+        return self._update_devices(context, 'up', devices, agent_id,
+                                    host)
+
+    def update_devices_status(self, context, status, devices, agent_id,
+                              host=None):
+        """Update the status of devices in bulk without raising.
+
+        :param status: 'up' or 'down'.
+        :returns: the details of the devices which were updated and the
+                  list of the devices which were not, e.g. because the
+                  call failed.
+        """
+        if not devices:
+            return [], []
+        try:
+            update = getattr(self, 'update_devices_%s' % status)
+            devices_details_list = update(context, devices, agent_id, host)
+        except Exception as e:
+            LOG.debug("Updating the status of devices %(devices)s to "
+                      "%(status)s failed: %(e)s",
+                      {'devices': devices, 'status': status, 'e': e})
+            return [], list(devices)
+        updated = []
+        failed = []
+        for details in devices_details_list:
+            if details.get('failed'):
+                failed.append(details['device'])
+            else:
+                updated.append(details)
+        return updated, failed
+
     def tunnel_sync(self, context, tunnel_ip, tunnel_type=None):
         return self.call(context,
                          self.make_msg('tunnel_sync', tunnel_ip=tunnel_ip,
@@ -15,6 +15,7 @@
 #
 
 from oslo.config import cfg
+from oslo import messaging
 
 from neutron.common import topics
 from neutron.openstack.common import importutils
@@ -22,6 +23,9 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 SG_RPC_VERSION = "1.1"
+# security_group_info_for_devices was added in the version 1.5 of the ML2
+# plugin RPC API
+SG_INFO_RPC_VERSION = "1.5"
 
 security_group_opts = [
     cfg.StrOpt(
@@ -33,7 +37,14 @@ security_group_opts = [
         help=_(
             'Controls whether the neutron security group API is enabled '
             'in the server. It should be false when using no security '
-            'groups or using the nova security group API.'))
+            'groups or using the nova security group API.')),
+    cfg.BoolOpt(
+        'enable_ipset',
+        default=False,
+        help=_('Use ipset to match the members of remote security groups '
+               'instead of one iptables rule per member. Requires a '
+               'server that supports security_group_info_for_devices, '
+               'otherwise there is a rule per member.'))
 ]
 cfg.CONF.register_opts(security_group_opts, 'SECURITYGROUP')
 
@@ -83,6 +94,15 @@ class SecurityGroupServerRpcApiMixin(object):
                          version=SG_RPC_VERSION,
                          topic=self.topic)
 
+    def security_group_info_for_devices(self, context, devices):
+        LOG.debug(_("Get security group information "
+                    "for devices via rpc %r"), devices)
+        return self.call(context,
+                         self.make_msg('security_group_info_for_devices',
+                                       devices=devices),
+                         version=SG_INFO_RPC_VERSION,
+                         topic=self.topic)
+
 
 class SecurityGroupAgentRpcCallbackMixin(object):
     """A mix-in that enable SecurityGroup agent
@@ -150,17 +170,40 @@ class SecurityGroupAgentRpcMixin(object):
         self.devices_to_refilter = set()
         # Flag raised when a global refresh is needed
         self.global_refresh_firewall = False
+        # Cleared when the server does not support
+        # security_group_info_for_devices
+        self.sg_info_supported = True
 
     def prepare_devices_filter(self, device_ids):
         if not device_ids:
             return
         LOG.info(_("Preparing filters for devices %s"), device_ids)
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, list(device_ids))
+        devices = self._get_devices_for_filter(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
                 self.firewall.prepare_port_filter(device)
 
+    def _get_devices_for_filter(self, device_ids):
+        if cfg.CONF.SECURITYGROUP.enable_ipset and self.sg_info_supported:
+            try:
+                info = self.plugin_rpc.security_group_info_for_devices(
+                    self.context, list(device_ids))
+            except messaging.RemoteError as e:
+                LOG.warn(_("Unable to get the security group information "
+                           "of devices, falling back to their rules: %s"), e)
+                if e.exc_type in ('UnsupportedVersion', 'NoSuchMethod'):
+                    self.sg_info_supported = False
+            else:
+                # Remote groups come back unexpanded, along with the
+                # addresses of their members, which must be known before
+                # the rules using them are applied.
+                for sg_id, sg_members in info['sg_member_ips'].items():
+                    self.firewall.update_security_group_members(sg_id,
+                                                                sg_members)
+                return info['devices']
+        return self.plugin_rpc.security_group_rules_for_devices(
+            self.context, list(device_ids))
+
     def security_groups_rule_updated(self, security_groups):
         LOG.info(_("Security group "
                    "rule updated %r"), security_groups)
@@ -178,7 +221,7 @@ class SecurityGroupAgentRpcMixin(object):
     def _security_group_updated(self, security_groups, attribute):
         devices = []
         sec_grp_set = set(security_groups)
-        for device in self.firewall.ports.values():
+        for device in (self.firewall.ports or {}).values():
             if sec_grp_set & set(device.get(attribute, [])):
                 devices.append(device['device'])
         if devices:
@@ -204,24 +247,30 @@ class SecurityGroupAgentRpcMixin(object):
         if not device_ids:
             return
         LOG.info(_("Remove device filter for %r"), device_ids)
+        ports = self.firewall.ports or {}
         with self.firewall.defer_apply():
             for device_id in device_ids:
-                device = self.firewall.ports.get(device_id)
+                device = ports.get(device_id)
                 if not device:
                     continue
                 self.firewall.remove_port_filter(device)
 
     def refresh_firewall(self, device_ids=None):
         LOG.info(_("Refresh firewall rules"))
+        ports = self.firewall.ports or {}
         if not device_ids:
-            device_ids = self.firewall.ports.keys()
+            device_ids = ports.keys()
             if not device_ids:
                 LOG.info(_("No ports here to refresh firewall"))
                 return
-        devices = self.plugin_rpc.security_group_rules_for_devices(
-            self.context, device_ids)
+        devices = self._get_devices_for_filter(device_ids)
         with self.firewall.defer_apply():
             for device in devices.values():
+                if (cfg.CONF.SECURITYGROUP.enable_ipset and
+                        device == ports.get(device['device'])):
+                    # Only the members of its remote groups changed, which
+                    # updating the sets above took care of.
+                    continue
                 LOG.debug(_("Update port filter for %s"), device['device'])
                 self.firewall.update_port_filter(device)
 
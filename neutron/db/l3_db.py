@@ -12,6 +12,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import hashlib
+
 import netaddr
 import sqlalchemy as sa
 from sqlalchemy import orm
@@ -45,6 +47,9 @@ EXTERNAL_GW_INFO = l3.EXTERNAL_GW_INFO
 # Useful to keep the filtering between API and Database.
 API_TO_DB_COLUMN_MAP = {'port_id': 'fixed_port_id'}
 CORE_ROUTER_ATTRS = ('id', 'name', 'tenant_id', 'admin_state_up', 'status')
+# Columns left out of the router revisions. The operational status is set
+# by the agents and does not change the configuration of a router.
+REVISION_IGNORED_COLUMNS = ('status',)
 
 
 class Router(model_base.BASEV2, models_v2.HasId, models_v2.HasTenant):
@@ -1064,3 +1069,73 @@ class L3_NAT_db_mixin(l3.RouterPluginBase):
         self._process_floating_ips(context, routers_dict, floating_ips)
         self._process_interfaces(routers_dict, interfaces)
         return routers_dict.values()
+
+    def _update_revision(self, digest, row):
+        if row is None:
+            return
+        for prop in orm.object_mapper(row).column_attrs:
+            if prop.key not in REVISION_IGNORED_COLUMNS:
+                digest.update('%s=%r;' % (prop.key, getattr(row, prop.key)))
+
+    def get_router_revisions(self, context, router_ids=None):
+        """Return a revision marker of the sync data of each router.
+
+        The marker of a router is a digest of the rows its sync data is
+        built from: the router with its extra attributes and routes, the
+        ports it owns with their fixed IPs and bindings, the subnets of the
+        networks of these ports, and its floating IPs. It changes with any
+        of them, and is computed with four queries instead of building the
+        sync data.
+        @param router_ids: the list of router ids to query, all of them if
+                           it is None.
+        @return: a dict mapping the router ids to their revision
+        """
+        if router_ids is not None and not router_ids:
+            return {}
+        query = context.session.query(Router)
+        if router_ids:
+            query = query.filter(Router.id.in_(router_ids))
+        digests = {}
+        for router in query:
+            digest = digests[router.id] = hashlib.sha1()
+            self._update_revision(digest, router)
+            self._update_revision(digest,
+                                  getattr(router, 'extra_attributes', None))
+            for route in sorted(getattr(router, 'route_list', []),
+                                key=lambda r: (r.destination, r.nexthop)):
+                self._update_revision(digest, route)
+        if not digests:
+            return {}
+
+        routers_by_network = {}
+        query = context.session.query(models_v2.Port)
+        query = query.filter(models_v2.Port.device_id.in_(list(digests)))
+        for port in query.order_by(models_v2.Port.id):
+            digest = digests[port.device_id]
+            self._update_revision(digest, port)
+            for ip in sorted(port.fixed_ips,
+                             key=lambda ip: (ip.subnet_id, ip.ip_address)):
+                self._update_revision(digest, ip)
+            self._update_revision(digest, getattr(port, 'port_binding', None))
+            routers_by_network.setdefault(port.network_id,
+                                          set()).add(port.device_id)
+
+        # The subnets of the networks of the ports are part of the sync
+        # data, see _populate_subnet_for_ports
+        if routers_by_network:
+            query = context.session.query(models_v2.Subnet)
+            query = query.filter(
+                models_v2.Subnet.network_id.in_(list(routers_by_network)))
+            for subnet in query.order_by(models_v2.Subnet.id):
+                revision = ('%r;%r;%r;%r;%r;' %
+                            (subnet.id, subnet.network_id, subnet.cidr,
+                             subnet.gateway_ip, subnet.ipv6_ra_mode))
+                for router_id in routers_by_network[subnet.network_id]:
+                    digests[router_id].update(revision)
+
+        query = context.session.query(FloatingIP)
+        query = query.filter(FloatingIP.router_id.in_(list(digests)))
+        for floating_ip in query.order_by(FloatingIP.id):
+            self._update_revision(digests[floating_ip.router_id], floating_ip)
+        return dict((router_id, digest.hexdigest())
+                    for router_id, digest in digests.items())
@@ -65,6 +65,35 @@ class L3RpcCallbackMixin(object):
                   jsonutils.dumps(routers, indent=5))
         return routers
 
+    def get_router_revisions(self, context, **kwargs):
+        """Get the revisions of the routers of a specific agent.
+
+        The agent fetches the sync data of the routers whose revision
+        changed with sync_routers.
+        @param context: contain user information
+        @param kwargs: host, router_ids
+        @return: a dict mapping the router ids to their revision
+        """
+        router_ids = kwargs.get('router_ids')
+        host = kwargs.get('host')
+        context = neutron_context.get_admin_context()
+        l3plugin = manager.NeutronManager.get_service_plugins()[
+            plugin_constants.L3_ROUTER_NAT]
+        if not l3plugin:
+            LOG.error(_('No plugin for L3 routing registered! Will reply '
+                        'to l3 agent with empty router dictionary.'))
+            return {}
+        elif utils.is_extension_supported(
+                l3plugin, constants.L3_AGENT_SCHEDULER_EXT_ALIAS):
+            if cfg.CONF.router_auto_schedule:
+                l3plugin.auto_schedule_routers(context, host, router_ids)
+            router_ids = l3plugin.list_active_router_ids_on_active_l3_agent(
+                context, host, router_ids)
+        revisions = l3plugin.get_router_revisions(context, router_ids)
+        LOG.debug(_("Revisions of %(count)d routers returned to l3 agent "
+                    "on %(host)s"), {'count': len(revisions), 'host': host})
+        return revisions
+
     def _ensure_host_set_on_ports(self, context, plugin, host, routers):
         for router in routers:
             LOG.debug(_("Checking router: %(id)s for host: %(host)s"),
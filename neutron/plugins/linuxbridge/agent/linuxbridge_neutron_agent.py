@@ -31,6 +31,7 @@ from oslo.config import cfg
 
 from neutron.agent import l2population_rpc as l2pop_rpc
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import polling
 from neutron.agent.linux import utils
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
@@ -871,6 +872,8 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
             # resync is needed
             return True
 
+        devices_up = []
+        devices_down = []
         for device_details in devices_details_list:
             device = device_details['device']
             LOG.debug("Port %s added", device)
@@ -894,47 +897,39 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
                         device_details['physical_network'],
                         segmentation_id,
                         device_details['port_id']):
-
-                        # update plugin about port status
-                        self.plugin_rpc.update_device_up(self.context,
-                                                         device,
-                                                         self.agent_id,
-                                                         cfg.CONF.host)
+                        devices_up.append(device)
                     else:
-                        self.plugin_rpc.update_device_down(self.context,
-                                                           device,
-                                                           self.agent_id,
-                                                           cfg.CONF.host)
+                        devices_down.append(device)
                 else:
                     self.remove_port_binding(device_details['network_id'],
                                              device_details['port_id'])
             else:
                 LOG.info(_("Device %s not defined on plugin"), device)
-        return False
+        # update plugin about the status of the ports at once
+        failed_up = self.plugin_rpc.update_devices_status(
+            self.context, 'up', devices_up, self.agent_id, cfg.CONF.host)[1]
+        failed_down = self.plugin_rpc.update_devices_status(
+            self.context, 'down', devices_down, self.agent_id,
+            cfg.CONF.host)[1]
+        return bool(failed_up or failed_down)
 
     def treat_devices_removed(self, devices):
-        resync = False
         self.remove_devices_filter(devices)
         for device in devices:
             LOG.info(_("Attachment %s removed"), device)
-            details = None
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id,
-                                                             cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-            if details and details['exists']:
-                LOG.info(_("Port %s updated."), device)
+        devices_details_list, failed = self.plugin_rpc.update_devices_status(
+            self.context, 'down', devices, self.agent_id, cfg.CONF.host)
+        resync = bool(failed)
+        for details in devices_details_list:
+            if details['exists']:
+                LOG.info(_("Port %s updated."), details['device'])
             else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
-            self.br_mgr.remove_empty_bridges()
+                LOG.debug(_("Device %s not defined on plugin"),
+                          details['device'])
+        self.br_mgr.remove_empty_bridges()
         return resync
 
-    def scan_devices(self, previous, sync):
+    def scan_devices(self, previous, sync, link_changes=None):
         device_info = {}
 
         # Save and reinitialise the set variable that the port_update RPC uses.
@@ -943,6 +938,19 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
         updated_devices = self.updated_devices
         self.updated_devices = set()
 
+        if link_changes is not None and previous is not None and not sync:
+            # The links created and deleted since the previous scan are
+            # known, so the tap devices do not have to be listed.
+            added, removed = link_changes
+            added = set(device for device in added
+                        if device.startswith(TAP_INTERFACE_PREFIX))
+            current_devices = (previous['current'] - removed) | added
+            device_info['current'] = current_devices
+            device_info['added'] = added
+            device_info['removed'] = previous['current'] & removed
+            device_info['updated'] = updated_devices & current_devices
+            return device_info
+
         current_devices = self.br_mgr.get_tap_devices()
         device_info['current'] = current_devices
 
@@ -982,31 +990,45 @@ class LinuxBridgeNeutronAgentRPC(sg_rpc.SecurityGroupAgentRpcMixin):
 
     def daemon_loop(self):
         LOG.info(_("LinuxBridge Agent RPC Daemon Started!"))
+        with polling.get_link_polling_manager(
+                cfg.CONF.AGENT.minimize_polling) as pm:
+            self.rpc_loop(polling_manager=pm)
+
+    def rpc_loop(self, polling_manager=None):
+        if not polling_manager:
+            polling_manager = polling.AlwaysPoll()
         device_info = None
         sync = True
 
         while True:
             start = time.time()
 
-            device_info = self.scan_devices(previous=device_info, sync=sync)
-
-            if sync:
-                LOG.info(_("Agent out of sync with plugin!"))
-                sync = False
-
-            if self._device_info_has_changes(device_info):
-                LOG.debug(_("Agent loop found changes! %s"), device_info)
-                try:
-                    sync = self.process_network_devices(device_info)
-                except Exception:
-                    LOG.exception(_("Error in agent loop. Devices info: %s"),
-                                  device_info)
-                    sync = True
-
-            # sleep till end of polling interval
+            if (sync or self.updated_devices or
+                    polling_manager.is_polling_required):
+                device_info = self.scan_devices(
+                    previous=device_info, sync=sync,
+                    link_changes=polling_manager.get_link_changes())
+
+                if sync:
+                    LOG.info(_("Agent out of sync with plugin!"))
+                    sync = False
+
+                if self._device_info_has_changes(device_info):
+                    LOG.debug(_("Agent loop found changes! %s"), device_info)
+                    try:
+                        sync = self.process_network_devices(device_info)
+                    except Exception:
+                        LOG.exception(_("Error in agent loop. Devices info: "
+                                        "%s"), device_info)
+                        sync = True
+                if not sync:
+                    polling_manager.polling_completed()
+
+            # sleep till end of polling interval, or until links change
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
-                time.sleep(self.polling_interval - elapsed)
+                polling_manager.wait_for_updates(
+                    self.polling_interval - elapsed)
             else:
                 LOG.debug(_("Loop iteration exceeded interval "
                             "(%(polling_interval)s vs. %(elapsed)s)!"),
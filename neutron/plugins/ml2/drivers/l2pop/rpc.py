@@ -17,6 +17,10 @@
 # @author: Francois Eleouet, Orange
 # @author: Mathieu Rohon, Orange
 
+import collections
+import contextlib
+import threading
+
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron.openstack.common import log as logging
@@ -24,6 +28,41 @@ from neutron.openstack.common import log as logging
 
 LOG = logging.getLogger(__name__)
 
+# The notifications batched by the current thread, if any.
+_batch = threading.local()
+
+
+def _merge_fdb_entries(fdb_entries, new_entries):
+    for network_id, values in new_entries.items():
+        network = fdb_entries.setdefault(network_id,
+                                         dict(values, ports={}))
+        for agent_ip, entries in values['ports'].items():
+            ports = network['ports'].setdefault(agent_ip, [])
+            ports.extend(entry for entry in entries if entry not in ports)
+
+
+@contextlib.contextmanager
+def batch_notifications():
+    """Merge the fdb entries notified by the current thread.
+
+    The entries added or removed while in the context are sent in one
+    notification per method and host when leaving it, instead of one per
+    port.
+    """
+    if getattr(_batch, 'notifications', None) is not None:
+        # Already batched by an outer context
+        yield
+        return
+    _batch.notifications = collections.OrderedDict()
+    try:
+        yield
+    finally:
+        notifications = _batch.notifications
+        _batch.notifications = None
+        for (notifier, method, host), (context, fdb_entries) in (
+                notifications.items()):
+            notifier._notify(context, method, fdb_entries, host)
+
 
 class L2populationAgentNotifyAPI(n_rpc.RpcProxy):
     BASE_RPC_API_VERSION = '1.0'
@@ -58,23 +97,30 @@ class L2populationAgentNotifyAPI(n_rpc.RpcProxy):
                   self.make_msg(method, fdb_entries=fdb_entries),
                   topic='%s.%s' % (self.topic_l2pop_update, host))
 
+    def _notify(self, context, method, fdb_entries, host):
+        if host:
+            self._notification_host(context, method, fdb_entries, host)
+        else:
+            self._notification_fanout(context, method, fdb_entries)
+
+    def _batch_or_notify(self, context, method, fdb_entries, host):
+        notifications = getattr(_batch, 'notifications', None)
+        if notifications is None:
+            self._notify(context, method, fdb_entries, host)
+            return
+        batched = notifications.setdefault((self, method, host),
+                                           (context, {}))
+        _merge_fdb_entries(batched[1], fdb_entries)
+
     def add_fdb_entries(self, context, fdb_entries, host=None):
         if fdb_entries:
-            if host:
-                self._notification_host(context, 'add_fdb_entries',
-                                        fdb_entries, host)
-            else:
-                self._notification_fanout(context, 'add_fdb_entries',
-                                          fdb_entries)
+            self._batch_or_notify(context, 'add_fdb_entries', fdb_entries,
+                                  host)
 
     def remove_fdb_entries(self, context, fdb_entries, host=None):
         if fdb_entries:
-            if host:
-                self._notification_host(context, 'remove_fdb_entries',
-                                        fdb_entries, host)
-            else:
-                self._notification_fanout(context, 'remove_fdb_entries',
-                                          fdb_entries)
+            self._batch_or_notify(context, 'remove_fdb_entries', fdb_entries,
+                                  host)
 
     def update_fdb_entries(self, context, fdb_entries, host=None):
         if fdb_entries:
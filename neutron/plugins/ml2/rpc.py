@@ -27,6 +27,7 @@ from neutron.openstack.common import uuidutils
 from neutron.plugins.common import constants as service_constants
 from neutron.plugins.ml2 import db
 from neutron.plugins.ml2 import driver_api as api
+from neutron.plugins.ml2.drivers.l2pop import rpc as l2pop_rpc
 from neutron.plugins.ml2.drivers import type_tunnel
 # REVISIT(kmestery): Allow the type and mechanism drivers to supply the
 # mixins and eventually remove the direct dependencies on type_tunnel.
@@ -43,12 +44,14 @@ class RpcCallbacks(n_rpc.RpcCallback,
                    sg_db_rpc.SecurityGroupServerRpcCallbackMixin,
                    type_tunnel.TunnelRpcCallbackMixin):
 
-    RPC_API_VERSION = '1.3'
+    RPC_API_VERSION = '1.5'
     # history
     #   1.0 Initial version (from openvswitch/linuxbridge)
     #   1.1 Support Security Group RPC
     #   1.2 Support get_devices_details_list
     #   1.3 Support Distributed Virtual Router (DVR)
+    #   1.4 Support update_devices_up and update_devices_down
+    #   1.5 Support security_group_info_for_devices
 
     def __init__(self, notifier, type_manager):
         self.setup_tunnel_callback_mixin(notifier, type_manager)
@@ -183,7 +186,8 @@ class RpcCallbacks(n_rpc.RpcCallback,
             LOG.debug(_("Device %(device)s not bound to the"
                         " agent host %(host)s"),
                       {'device': device, 'host': host})
-            return
+            return {'device': device,
+                    'exists': True}
 
         port_id = plugin.update_port_status(rpc_context, port_id,
                                             q_const.PORT_STATUS_ACTIVE,
@@ -192,6 +196,34 @@ class RpcCallbacks(n_rpc.RpcCallback,
             service_constants.L3_ROUTER_NAT)
         if l3plugin:
             l3plugin.dvr_vmarp_table_update(rpc_context, port_id, "add")
+        return {'device': device,
+                'exists': bool(port_id)}
+
+    def _update_devices(self, rpc_context, update_device, **kwargs):
+        # The fdb entries of all the devices are sent to the l2 population
+        # agents in as few notifications as possible.
+        devices = kwargs.pop('devices', [])
+        res = []
+        with l2pop_rpc.batch_notifications():
+            for device in devices:
+                try:
+                    res.append(update_device(rpc_context, device=device,
+                                             **kwargs))
+                except Exception:
+                    LOG.exception(_("Failed to update the status of device "
+                                    "%s"), device)
+                    res.append({'device': device, 'failed': True})
+        return res
+
+    def update_devices_down(self, rpc_context, **kwargs):
+        """Devices no longer exist on agent."""
+        return self._update_devices(rpc_context, self.update_device_down,
+                                    **kwargs)
+
+    def update_devices_up(self, rpc_context, **kwargs):
+        """Devices are up on agent."""
+        return self._update_devices(rpc_context, self.update_device_up,
+                                    **kwargs)
 
     def get_dvr_mac_address_by_host(self, rpc_context, **kwargs):
         host = kwargs.get('host')
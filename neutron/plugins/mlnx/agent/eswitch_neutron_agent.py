@@ -324,6 +324,7 @@ class MlnxEswitchNeutronAgent(sg_rpc.SecurityGroupAgentRpcMixin):
             # resync is needed
             return True
 
+        devices_up = []
         for dev_details in devs_details_list:
             device = dev_details['device']
             LOG.info(_("Adding port with mac %s"), device)
@@ -339,29 +340,35 @@ class MlnxEswitchNeutronAgent(sg_rpc.SecurityGroupAgentRpcMixin):
                                     dev_details['segmentation_id'],
                                     dev_details['admin_state_up'])
                 if dev_details.get('admin_state_up'):
-                    self.plugin_rpc.update_device_up(self.context,
-                                                     device,
-                                                     self.agent_id)
+                    devices_up.append(device)
             else:
                 LOG.debug(_("Device with mac_address %s not defined "
                           "on Neutron Plugin"), device)
-        return False
+        # update plugin about the status of the ports at once
+        failed = self.plugin_rpc.update_devices_status(
+            self.context, 'up', devices_up, self.agent_id)[1]
+        return bool(failed)
 
     def treat_devices_removed(self, devices):
         resync = False
+        devices_by_port_id = {}
         for device in devices:
             LOG.info(_("Removing device with mac_address %s"), device)
             try:
                 port_id = self.eswitch.get_port_id_by_mac(device)
-                dev_details = self.plugin_rpc.update_device_down(self.context,
-                                                                 port_id,
-                                                                 self.agent_id,
-                                                                 cfg.CONF.host)
             except Exception as e:
                 LOG.debug(_("Removing port failed for device %(device)s "
                           "due to %(exc)s"), {'device': device, 'exc': e})
                 resync = True
                 continue
+            devices_by_port_id[port_id] = device
+        devs_details_list, failed = self.plugin_rpc.update_devices_status(
+            self.context, 'down', list(devices_by_port_id), self.agent_id,
+            cfg.CONF.host)
+        if failed:
+            resync = True
+        for dev_details in devs_details_list:
+            device = devices_by_port_id[dev_details['device']]
             if dev_details['exists']:
                 LOG.info(_("Port %s updated."), device)
             else:
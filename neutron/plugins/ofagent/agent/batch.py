@@ -0,0 +1,150 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import contextlib
+
+from ryu.app.ofctl import api as ryu_api
+from ryu.controller import event
+from ryu.lib import hub
+
+from neutron.common import exceptions
+from neutron.openstack.common import log as logging
+
+
+LOG = logging.getLogger(__name__)
+
+# Seconds to wait for the errors of a batch once its barrier is replied
+BATCH_TIMEOUT = 30
+
+
+class BatchError(exceptions.NeutronException):
+    message = _("%(count)d OpenFlow messages sent to datapaths %(dpids)s "
+                "failed: %(errors)s")
+
+
+class EventBatchSent(event.EventBase):
+    """Sent by the agent to the ryu app once the barrier of a batch is
+    replied, after the errors of the batch.
+    """
+
+    def __init__(self, batch):
+        super(EventBatchSent, self).__init__()
+        self.batch = batch
+
+
+class Batch(object):
+    """The messages queued for a datapath."""
+
+    def __init__(self, datapath):
+        self.datapath = datapath
+        self.msgs = []
+        # xids of the messages sent, to match the errors of the switch
+        self.xids = set()
+        self.errors = []
+        self.done = hub.Event()
+
+
+class MessageBatcher(object):
+    """Sends the OpenFlow messages of the agent in batches.
+
+    A message sent through ryu_api.send_msg is followed by a barrier whose
+    reply is waited for, i.e. each message costs a round trip to the
+    switch. Within a batch() block, the messages are queued per datapath
+    instead, and when the outermost block exits, the messages of each
+    datapath are sent back to back followed by a single barrier.
+
+    The switch replies to a failed message with an error carrying its xid,
+    which the ryu app hands to error_received. The errors of a batch are
+    all received before the reply to its barrier, and they are raised as a
+    BatchError once all the batches are sent. A batch whose errors are not
+    all handed over within timeout seconds fails too.
+    """
+
+    def __init__(self, ryuapp, timeout=BATCH_TIMEOUT):
+        self.ryuapp = ryuapp
+        self.timeout = timeout
+        self._batches = None
+        # (datapath id, xid) -> Batch of the messages awaiting the barrier
+        self._sent = {}
+
+    def send_msg(self, msg):
+        if self._batches is None:
+            return ryu_api.send_msg(self.ryuapp, msg)
+        datapath = msg.datapath
+        if datapath.id not in self._batches:
+            self._batches[datapath.id] = Batch(datapath)
+        self._batches[datapath.id].msgs.append(msg)
+
+    @contextlib.contextmanager
+    def batch(self):
+        if self._batches is not None:
+            # nested in a batch, whose exit sends the messages
+            yield
+            return
+        self._batches = collections.OrderedDict()
+        try:
+            yield
+        finally:
+            batches, self._batches = self._batches, None
+            self._send_batches(batches.values())
+
+    def _send_batches(self, batches):
+        failed = []
+        for batch in batches:
+            if not batch.msgs:
+                continue
+            self._send_batch(batch)
+            if batch.errors:
+                LOG.error(_("%(count)d of %(total)d OpenFlow messages sent "
+                            "to datapath %(dpid)s failed: %(errors)s"),
+                          {'count': len(batch.errors),
+                           'total': len(batch.msgs),
+                           'dpid': batch.datapath.id,
+                           'errors': batch.errors})
+                failed.append(batch)
+        if failed:
+            errors = [error for batch in failed for error in batch.errors]
+            raise BatchError(count=len(errors),
+                             dpids=[batch.datapath.id for batch in failed],
+                             errors=errors)
+
+    def _send_batch(self, batch):
+        datapath = batch.datapath
+        for msg in batch.msgs:
+            datapath.set_xid(msg)
+            batch.xids.add(msg.xid)
+            self._sent[(datapath.id, msg.xid)] = batch
+            datapath.send_msg(msg)
+        barrier = datapath.ofproto_parser.OFPBarrierRequest(datapath)
+        try:
+            ryu_api.send_msg(self.ryuapp, barrier,
+                             reply_cls=datapath.ofproto_parser.OFPBarrierReply)
+            # The errors of the batch may still be queued to the ryu app,
+            # which handles this event after them
+            self.ryuapp.send_event(self.ryuapp.name, EventBatchSent(batch))
+            if not batch.done.wait(self.timeout):
+                batch.errors.append(_("no reply within %d seconds") %
+                                    self.timeout)
+        finally:
+            for xid in batch.xids:
+                self._sent.pop((datapath.id, xid), None)
+
+    def error_received(self, msg):
+        # The errors of the messages sent out of a batch are returned by
+        # ryu_api.send_msg
+        batch = self._sent.get((msg.datapath.id, msg.xid))
+        if batch:
+            batch.errors.append(msg)
+
+    def batch_sent(self, batch):
+        batch.done.set()
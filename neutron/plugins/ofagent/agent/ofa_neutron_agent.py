@@ -23,10 +23,13 @@ import netaddr
 from oslo.config import cfg
 from ryu.app.ofctl import api as ryu_api
 from ryu.base import app_manager
+from ryu.controller import handler
+from ryu.controller import ofp_event
 from ryu.lib import hub
 from ryu.ofproto import ofproto_v1_3 as ryu_ofp13
 
 from neutron.agent import l2population_rpc
+from neutron.agent import local_vlan
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib
 from neutron.agent.linux import polling
@@ -41,6 +44,7 @@ from neutron import context
 from neutron.openstack.common import log as logging
 from neutron.openstack.common import loopingcall
 from neutron.plugins.common import constants as p_const
+from neutron.plugins.ofagent.agent import batch
 from neutron.plugins.ofagent.agent import ports
 from neutron.plugins.ofagent.common import config  # noqa
 from neutron.plugins.openvswitch.common import constants
@@ -132,6 +136,18 @@ class OFASecurityGroupAgent(sg_rpc.SecurityGroupAgentRpcMixin):
 class OFANeutronAgentRyuApp(app_manager.RyuApp):
     OFP_VERSIONS = [ryu_ofp13.OFP_VERSION]
 
+    def __init__(self, *args, **kwargs):
+        super(OFANeutronAgentRyuApp, self).__init__(*args, **kwargs)
+        self.msg_batcher = batch.MessageBatcher(self)
+
+    @handler.set_ev_cls(ofp_event.EventOFPErrorMsg, handler.MAIN_DISPATCHER)
+    def _error_msg_handler(self, ev):
+        self.msg_batcher.error_received(ev.msg)
+
+    @handler.set_ev_cls(batch.EventBatchSent)
+    def _batch_sent_handler(self, ev):
+        self.msg_batcher.batch_sent(ev.batch)
+
     def start(self):
 
         super(OFANeutronAgentRyuApp, self).start()
@@ -206,10 +222,11 @@ class OFANeutronAgent(n_rpc.RpcCallback,
         """
         super(OFANeutronAgent, self).__init__()
         self.ryuapp = ryuapp
+        self.msg_batcher = ryuapp.msg_batcher
         self.veth_mtu = veth_mtu
         self.root_helper = root_helper
-        self.available_local_vlans = set(xrange(n_const.MIN_VLAN_TAG,
-                                                n_const.MAX_VLAN_TAG))
+        self.local_vlans = local_vlan.LocalVlanAllocator(
+            cfg.CONF.AGENT.local_vlan_state_file)
         self.tunnel_types = tunnel_types or []
         self.agent_state = {
             'binary': 'neutron-ofa-agent',
@@ -228,6 +245,8 @@ class OFANeutronAgent(n_rpc.RpcCallback,
         self.int_br = OVSBridge(integ_br, self.root_helper, self.ryuapp)
         # Stores port update notifications for processing in main loop
         self.updated_ports = set()
+        # Set when the flows of l2pop entries failed to be programmed
+        self.fdb_resync = False
         self.setup_rpc()
         self.setup_integration_br()
         self.setup_physical_bridges(bridge_mappings)
@@ -276,7 +295,7 @@ class OFANeutronAgent(n_rpc.RpcCallback,
                      ip_address)
 
     def ryu_send_msg(self, msg):
-        result = ryu_api.send_msg(self.ryuapp, msg)
+        result = self.msg_batcher.send_msg(msg)
         LOG.info(_("ryu send_msg() result: %s"), result)
 
     def setup_rpc(self):
@@ -347,21 +366,49 @@ class OFANeutronAgent(n_rpc.RpcCallback,
 
     def fdb_add(self, context, fdb_entries):
         LOG.debug("fdb_add received")
-        for lvm, agent_ports in self.get_agent_ports(fdb_entries,
-                                                     self.local_vlan_map):
-            agent_ports.pop(self.local_ip, None)
-            if len(agent_ports):
-                self.fdb_add_tun(context, lvm, agent_ports,
-                                 self.tun_br_ofports)
+        try:
+            with self.msg_batcher.batch():
+                for lvm, agent_ports in self.get_agent_ports(
+                        fdb_entries, self.local_vlan_map):
+                    agent_ports.pop(self.local_ip, None)
+                    if len(agent_ports):
+                        self.fdb_add_tun(context, lvm, agent_ports,
+                                         self.tun_br_ofports)
+        except batch.BatchError:
+            LOG.warn(_("Failed to add fdb entries, scheduling a resync"))
+            self.fdb_resync = True
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug("fdb_remove received")
-        for lvm, agent_ports in self.get_agent_ports(fdb_entries,
-                                                     self.local_vlan_map):
-            agent_ports.pop(self.local_ip, None)
-            if len(agent_ports):
-                self.fdb_remove_tun(context, lvm, agent_ports,
-                                    self.tun_br_ofports)
+        try:
+            with self.msg_batcher.batch():
+                for lvm, agent_ports in self.get_agent_ports(
+                        fdb_entries, self.local_vlan_map):
+                    agent_ports.pop(self.local_ip, None)
+                    if len(agent_ports):
+                        self.fdb_remove_tun(context, lvm, agent_ports,
+                                            self.tun_br_ofports)
+        except batch.BatchError:
+            LOG.warn(_("Failed to remove fdb entries, scheduling a resync"))
+            self.fdb_resync = True
+
+    def resync_fdb_flooding_flows(self):
+        """Program the flooding flows of the tunnel networks again.
+
+        lvm.tun_ofports is updated before the flows are sent, so it is
+        the flooding wanted by the l2pop entries received even when their
+        flows failed.
+        """
+        self.fdb_resync = False
+        try:
+            with self.msg_batcher.batch():
+                for lvm in self.local_vlan_map.values():
+                    if lvm.tun_ofports:
+                        self._add_fdb_flooding_flow(lvm)
+        except batch.BatchError:
+            LOG.warn(_("Failed to program the fdb flooding flows, "
+                       "scheduling a resync"))
+            self.fdb_resync = True
 
     def _add_fdb_flooding_flow(self, lvm):
         datapath = self.tun_br.datapath
@@ -525,10 +572,10 @@ class OFANeutronAgent(n_rpc.RpcCallback,
         :param segmentation_id: the VID for 'vlan' or tunnel ID for 'tunnel'
         """
 
-        if not self.available_local_vlans:
+        lvid = self.local_vlans.allocate(net_uuid)
+        if lvid is None:
             LOG.error(_("No local VLAN available for net-id=%s"), net_uuid)
             return
-        lvid = self.available_local_vlans.pop()
         LOG.info(_("Assigning %(vlan_id)s as local vlan for "
                    "net-id=%(net_uuid)s"),
                  {'vlan_id': lvid, 'net_uuid': net_uuid})
@@ -656,7 +703,7 @@ class OFANeutronAgent(n_rpc.RpcCallback,
                       {'network_type': lvm.network_type,
                        'net_uuid': net_uuid})
 
-        self.available_local_vlans.add(lvm.vlan)
+        self.local_vlans.release(net_uuid)
 
     def port_bound(self, port, net_uuid,
                    network_type, physical_network, segmentation_id):
@@ -1142,50 +1189,57 @@ class OFANeutronAgent(n_rpc.RpcCallback,
         resync = False
         all_ports = dict((p.normalized_port_name(), p) for p in
                          self._get_ports(self.int_br) if p.is_neutron_port())
-        for device in devices:
-            LOG.debug(_("Processing port %s"), device)
-            if device not in all_ports:
-                # The port has disappeared and should not be processed
-                # There is no need to put the port DOWN in the plugin as
-                # it never went up in the first place
-                LOG.info(_("Port %s was not found on the integration bridge "
-                           "and will therefore not be processed"), device)
-                continue
-            port = all_ports[device]
-            try:
-                details = self.plugin_rpc.get_device_details(self.context,
-                                                             device,
-                                                             self.agent_id)
-            except Exception as e:
-                LOG.debug(_("Unable to get port details for "
-                            "%(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            if 'port_id' in details:
-                LOG.info(_("Port %(device)s updated. Details: %(details)s"),
-                         {'device': device, 'details': details})
-                self.treat_vif_port(port, details['port_id'],
-                                    details['network_id'],
-                                    details['network_type'],
-                                    details['physical_network'],
-                                    details['segmentation_id'],
-                                    details['admin_state_up'])
-
-                # update plugin about port status
-                if details.get('admin_state_up'):
-                    LOG.debug(_("Setting status for %s to UP"), device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+        # The flows of the ports are sent as a batch, and the status of the
+        # ports is reported once the switch has applied them.
+        wired_devices = []
+        with self.msg_batcher.batch():
+            for device in devices:
+                LOG.debug(_("Processing port %s"), device)
+                if device not in all_ports:
+                    # The port has disappeared and should not be processed
+                    # There is no need to put the port DOWN in the plugin as
+                    # it never went up in the first place
+                    LOG.info(_("Port %s was not found on the integration "
+                               "bridge and will therefore not be processed"),
+                             device)
+                    continue
+                port = all_ports[device]
+                try:
+                    details = self.plugin_rpc.get_device_details(
+                        self.context, device, self.agent_id)
+                except Exception as e:
+                    LOG.debug(_("Unable to get port details for "
+                                "%(device)s: %(e)s"),
+                              {'device': device, 'e': e})
+                    resync = True
+                    continue
+                if 'port_id' in details:
+                    LOG.info(_("Port %(device)s updated. Details: "
+                               "%(details)s"),
+                             {'device': device, 'details': details})
+                    self.treat_vif_port(port, details['port_id'],
+                                        details['network_id'],
+                                        details['network_type'],
+                                        details['physical_network'],
+                                        details['segmentation_id'],
+                                        details['admin_state_up'])
+                    wired_devices.append((device, details))
                 else:
-                    LOG.debug(_("Setting status for %s to DOWN"), device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
-                LOG.info(_("Configuration for device %s completed."), device)
+                    LOG.warn(_("Device %s not defined on plugin"), device)
+                    if (port and port.ofport != -1):
+                        self.port_dead(port)
+
+        for device, details in wired_devices:
+            # update plugin about port status
+            if details.get('admin_state_up'):
+                LOG.debug(_("Setting status for %s to UP"), device)
+                self.plugin_rpc.update_device_up(
+                    self.context, device, self.agent_id, cfg.CONF.host)
             else:
-                LOG.warn(_("Device %s not defined on plugin"), device)
-                if (port and port.ofport != -1):
-                    self.port_dead(port)
+                LOG.debug(_("Setting status for %s to DOWN"), device)
+                self.plugin_rpc.update_device_down(
+                    self.context, device, self.agent_id, cfg.CONF.host)
+            LOG.info(_("Configuration for device %s completed."), device)
         return resync
 
     def treat_ancillary_devices_added(self, devices):
@@ -1212,19 +1266,20 @@ class OFANeutronAgent(n_rpc.RpcCallback,
     def treat_devices_removed(self, devices):
         resync = False
         self.sg_agent.remove_devices_filter(devices)
-        for device in devices:
-            LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            self.port_unbound(device)
+        with self.msg_batcher.batch():
+            for device in devices:
+                LOG.info(_("Attachment %s removed"), device)
+                try:
+                    self.plugin_rpc.update_device_down(self.context,
+                                                       device,
+                                                       self.agent_id,
+                                                       cfg.CONF.host)
+                except Exception as e:
+                    LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
+                              {'device': device, 'e': e})
+                    resync = True
+                    continue
+                self.port_unbound(device)
         return resync
 
     def treat_ancillary_devices_removed(self, devices):
@@ -1344,6 +1399,9 @@ class OFANeutronAgent(n_rpc.RpcCallback,
             LOG.debug(_("Agent ovsdb_monitor_loop - "
                       "iteration:%d started"),
                       self.iter_num)
+            if self.fdb_resync:
+                sync = True
+                self.resync_fdb_flooding_flows()
             if sync:
                 LOG.info(_("Agent out of sync with plugin!"))
                 ports.clear()
@@ -1426,6 +1484,9 @@ class OFANeutronAgent(n_rpc.RpcCallback,
                             sync = sync | rc
 
                     polling_manager.polling_completed()
+                    if not sync:
+                        self.local_vlans.release_unclaimed()
+                    self.local_vlans.save()
                 except Exception:
                     LOG.exception(_("Error while processing VIF ports"))
                     # Put the ports back in self.updated_port
@@ -31,3 +31,4 @@ cfg.CONF.register_opts(ovs_config.agent_opts, 'AGENT')
 cfg.CONF.register_opts(agent_opts, 'AGENT')
 config.register_agent_state_opts_helper(cfg.CONF)
 config.register_root_helper(cfg.CONF)
+config.register_minimize_polling_opts_helper(cfg.CONF)
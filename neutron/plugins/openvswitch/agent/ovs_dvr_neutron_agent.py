@@ -14,6 +14,10 @@
 #    under the License.
 # @author: Vivekanandan Narasimhan, Hewlett-Packard Inc
 
+import collections
+import contextlib
+
+from oslo.config import cfg
 
 from neutron.api.rpc.handlers import dvr_rpc
 from neutron.common import constants as n_const
@@ -104,6 +108,41 @@ class OVSPort:
         return self.ofport
 
 
+class LocalComputePorts(object):
+    '''The compute ports bound on this host, by subnet.
+
+    When a router interface of a subnet is distributed to the host, the
+    compute ports to plumb are found here rather than asked to the plugin
+    and looked up on the integration bridge one by one.
+    '''
+
+    def __init__(self):
+        # subnet id -> {vif id: OVSPort}
+        self._ports = collections.defaultdict(dict)
+        # vif id -> subnet ids
+        self._subnets = {}
+
+    def add(self, ovsport, subnet_ids):
+        self.remove(ovsport.id)
+        for subnet_id in subnet_ids:
+            self._ports[subnet_id][ovsport.id] = ovsport
+        self._subnets[ovsport.id] = set(subnet_ids)
+
+    def remove(self, vif_id):
+        for subnet_id in self._subnets.pop(vif_id, ()):
+            ports = self._ports[subnet_id]
+            ports.pop(vif_id, None)
+            if not ports:
+                del self._ports[subnet_id]
+
+    def get_ports(self, subnet_id):
+        return self._ports.get(subnet_id, {}).values()
+
+    def clear(self):
+        self._ports.clear()
+        self._subnets.clear()
+
+
 class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
     '''
     Implements OVS-based DVR(Distributed Virtual Router), for overlay networks.
@@ -125,6 +164,12 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         self.host = host
         self.enable_tunneling = enable_tunneling
         self.enable_distributed_routing = enable_distributed_routing
+        self.local_compute_ports = LocalComputePorts()
+        # Subnet details received from the plugin, kept while the subnet
+        # is in local_dvr_map or until a router interface of it is unbound
+        self.subnet_info = {}
+        # Subnets whose flow is updated at the end of the batch
+        self._subnet_batch = None
 
     def reset_ovs_parameters(self, integ_br, tun_br,
                              patch_int_ofport, patch_tun_ofport):
@@ -135,6 +180,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         self.tun_br = tun_br
         self.patch_int_ofport = patch_int_ofport
         self.patch_tun_ofport = patch_tun_ofport
+        self.subnet_info.clear()
 
     def setup_dvr_flows_on_integ_tun_br(self):
         '''Setup up initial dvr flows into br-int and br-tun'''
@@ -145,6 +191,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         self.local_dvr_map = {}
         self.local_csnat_map = {}
         self.local_ports = {}
+        self.local_compute_ports.clear()
         self.registered_dvr_macs = set()
         # get the local DVR MAC Address
         try:
@@ -162,8 +209,10 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                                  priority=1, actions="normal")
             return
 
-        # Remove existing flows in integration bridge
-        self.int_br.remove_all_flows()
+        # Remove existing flows in integration bridge, unless they are kept
+        # by a warm restart of the agent
+        if not cfg.CONF.AGENT.warm_restart:
+            self.int_br.remove_all_flows()
 
         # Add a canary flow to int_br to track OVS restarts
         self.int_br.add_flow(table=constants.CANARY_TABLE, priority=0,
@@ -277,6 +326,64 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                              "resubmit(,%s)" %
                              (lvid, constants.DVR_NOT_LEARN))
 
+    def _get_subnet_info(self, subnet_uuid):
+        if subnet_uuid not in self.subnet_info:
+            subnet_info = self.plugin_rpc.get_subnet_for_dvr(self.context,
+                                                             subnet_uuid)
+            if not subnet_info:
+                return
+            self.subnet_info[subnet_uuid] = subnet_info
+        return self.subnet_info[subnet_uuid]
+
+    @contextlib.contextmanager
+    def deferred_subnet_flows(self):
+        '''Update the flows of the subnets once the block exits.
+
+        The flow forwarding the traffic routed to a subnet to its local
+        ports is only rewritten once for all the ports bound or unbound in
+        the block.
+        '''
+        if self._subnet_batch is not None:
+            yield
+            return
+        self._subnet_batch = {}
+        try:
+            yield
+        finally:
+            batch, self._subnet_batch = self._subnet_batch, None
+            for (local_vlan, subnet_uuid), ldm in batch.items():
+                self._set_subnet_flow(ldm, local_vlan)
+
+    def _update_subnet_flow(self, subnet_uuid, ldm, local_vlan):
+        if self._subnet_batch is not None:
+            self._subnet_batch[(local_vlan, subnet_uuid)] = ldm
+        else:
+            self._set_subnet_flow(ldm, local_vlan)
+
+    def _set_subnet_flow(self, ldm, local_vlan):
+        subnet_info = ldm.get_subnet_info()
+        ofports = ldm.get_compute_ofports().values()
+        if ldm.get_csnat_ofport() != constants.OFPORT_INVALID:
+            ofports = [ldm.get_csnat_ofport()] + ofports
+        if ofports:
+            # forward the frames routed to the subnet to its local ports
+            self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
+                                 priority=2,
+                                 proto='ip',
+                                 dl_vlan=local_vlan,
+                                 nw_dst=subnet_info['cidr'],
+                                 actions="strip_vlan,mod_dl_src:%s,"
+                                 "output:%s" %
+                                 (subnet_info['gateway_mac'],
+                                  ','.join(map(str, ofports))))
+        else:
+            # no ports (both csnat/compute) are available on this subnet
+            # in this agent anymore
+            self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
+                                     proto='ip',
+                                     dl_vlan=local_vlan,
+                                     nw_dst=subnet_info['cidr'])
+
     def _bind_distributed_router_interface_port(self, port, fixed_ips,
                                                 device_owner, local_vlan):
         # since router port must have only one fixed IP, directly
@@ -293,8 +400,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                 return
         else:
             # set up LocalDVRSubnetMapping available for this subnet
-            subnet_info = self.plugin_rpc.get_subnet_for_dvr(self.context,
-                                                             subnet_uuid)
+            subnet_info = self._get_subnet_info(subnet_uuid)
             if not subnet_info:
                 LOG.error(_("DVR: Unable to retrieve subnet information"
                           " for subnet_id %s"), subnet_uuid)
@@ -308,32 +414,23 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         ldm.set_dvr_owned(True)
 
         subnet_info = ldm.get_subnet_info()
-        ip_subnet = subnet_info['cidr']
-        local_compute_ports = (
-            self.plugin_rpc.get_compute_ports_on_host_by_subnet(
-                self.context, self.host, subnet_uuid))
-        LOG.debug("DVR: List of ports received from "
-                  "get_compute_ports_on_host_by_subnet %s",
-                  local_compute_ports)
-        for prt in local_compute_ports:
-            vif = self.int_br.get_vif_port_by_id(prt['id'])
-            if not vif:
-                continue
-            ldm.add_compute_ofport(vif.vif_id, vif.ofport)
-            if vif.vif_id in self.local_ports:
+        # The compute ports of the subnet are the ones bound on this host
+        for cport in self.local_compute_ports.get_ports(subnet_uuid):
+            ldm.add_compute_ofport(cport.id, cport.get_ofport())
+            if cport.id in self.local_ports:
                 # ensure if a compute port is already on
                 # a different dvr routed subnet
                 # if yes, queue this subnet to that port
-                ovsport = self.local_ports[vif.vif_id]
+                ovsport = self.local_ports[cport.id]
                 ovsport.add_subnet(subnet_uuid)
             else:
                 # the compute port is discovered first here that its on
                 # a dvr routed subnet queue this subnet to that port
-                ovsport = OVSPort(vif.vif_id, vif.ofport,
-                                  vif.vif_mac, prt['device_owner'])
+                ovsport = OVSPort(cport.id, cport.get_ofport(),
+                                  cport.get_mac(), cport.get_device_owner())
 
                 ovsport.add_subnet(subnet_uuid)
-                self.local_ports[vif.vif_id] = ovsport
+                self.local_ports[cport.id] = ovsport
 
             # create rule for just this vm port
             self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
@@ -347,18 +444,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
 
         # create rule to forward broadcast/multicast frames from dvr
         # router interface to appropriate local tenant ports
-        ofports = ','.join(map(str, ldm.get_compute_ofports().values()))
-        if csnat_ofport != constants.OFPORT_INVALID:
-            ofports = str(csnat_ofport) + ',' + ofports
-        if ofports:
-            self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                 priority=2,
-                                 proto='ip',
-                                 dl_vlan=local_vlan,
-                                 nw_dst=ip_subnet,
-                                 actions="strip_vlan,mod_dl_src:%s,"
-                                 "output:%s" %
-                                 (subnet_info['gateway_mac'], ofports))
+        self._update_subnet_flow(subnet_uuid, ldm, local_vlan)
 
         self.tun_br.add_flow(table=constants.DVR_PROCESS,
                              priority=3,
@@ -403,14 +489,18 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                 # and do plumbing for this vm later
                 continue
 
+            if (port.vif_id in self.local_ports and
+                    ldm.get_compute_ofports().get(port.vif_id) ==
+                    port.ofport):
+                # already plumbed on this subnet
+                continue
+
             # This confirms that this compute port belongs
             # to a dvr hosted subnet.
             # Accomodate this VM Port into the existing rule in
             # the integration bridge
             LOG.debug("DVR: Plumbing compute port %s", port.vif_id)
             subnet_info = ldm.get_subnet_info()
-            ip_subnet = subnet_info['cidr']
-            csnat_ofport = ldm.get_csnat_ofport()
             ldm.add_compute_ofport(port.vif_id, port.ofport)
             if port.vif_id in self.local_ports:
                 # ensure if a compute port is already on a different
@@ -435,18 +525,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                                  "output:%s" %
                                  (subnet_info['gateway_mac'],
                                   ovsport.get_ofport()))
-            ofports = ','.join(map(str, ldm.get_compute_ofports().values()))
-
-            if csnat_ofport != constants.OFPORT_INVALID:
-                ofports = str(csnat_ofport) + ',' + ofports
-            self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                 priority=2,
-                                 proto='ip',
-                                 dl_vlan=local_vlan,
-                                 nw_dst=ip_subnet,
-                                 actions="strip_vlan,mod_dl_src:%s,"
-                                 " output:%s" %
-                                 (subnet_info['gateway_mac'], ofports))
+            self._update_subnet_flow(subnet_uuid, ldm, local_vlan)
 
     def _bind_centralized_snat_port_on_dvr_subnet(self, port, fixed_ips,
                                                   device_owner, local_vlan):
@@ -467,8 +546,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         if subnet_uuid not in self.local_dvr_map:
             # no csnat ports seen on this subnet - create csnat state
             # for this subnet
-            subnet_info = self.plugin_rpc.get_subnet_for_dvr(self.context,
-                                                             subnet_uuid)
+            subnet_info = self._get_subnet_info(subnet_uuid)
             ldm = LocalDVRSubnetMapping(subnet_info, port.ofport)
             self.local_dvr_map[subnet_uuid] = ldm
         else:
@@ -491,17 +569,7 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                              " output:%s" %
                              (subnet_info['gateway_mac'],
                               ovsport.get_ofport()))
-        ofports = ','.join(map(str, ldm.get_compute_ofports().values()))
-        ofports = str(ldm.get_csnat_ofport()) + ',' + ofports
-        ip_subnet = subnet_info['cidr']
-        self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                             priority=2,
-                             proto='ip',
-                             dl_vlan=local_vlan,
-                             nw_dst=ip_subnet,
-                             actions="strip_vlan,mod_dl_src:%s,"
-                             " output:%s" %
-                             (subnet_info['gateway_mac'], ofports))
+        self._update_subnet_flow(subnet_uuid, ldm, local_vlan)
 
     def bind_port_to_dvr(self, port, network_type, fixed_ips,
                          device_owner, local_vlan_id):
@@ -518,6 +586,9 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                                                          local_vlan_id)
 
         if device_owner and device_owner.startswith('compute:'):
+            self.local_compute_ports.add(
+                OVSPort(port.vif_id, port.ofport, port.vif_mac, device_owner),
+                [ips['subnet_id'] for ips in fixed_ips])
             self._bind_compute_port_on_dvr_subnet(port, fixed_ips,
                                                   device_owner,
                                                   local_vlan_id)
@@ -541,7 +612,8 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
 
             ldm = self.local_dvr_map[sub_uuid]
             subnet_info = ldm.get_subnet_info()
-            ip_subnet = subnet_info['cidr']
+            # the gateway of the subnet goes away with its interface
+            self.subnet_info.pop(sub_uuid, None)
 
             # DVR is no more owner
             ldm.set_dvr_owned(False)
@@ -555,24 +627,11 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                                          dl_vlan=local_vlan,
                                          dl_dst=ovsport.get_mac())
             ldm.remove_all_compute_ofports()
+            # If there is a csnat port on this agent, it is left alone in
+            # the subnet flow
+            self._update_subnet_flow(sub_uuid, ldm, local_vlan)
 
-            if ldm.get_csnat_ofport() != -1:
-                # If there is a csnat port on this agent, preserve
-                # the local_dvr_map state
-                ofports = str(ldm.get_csnat_ofport())
-                self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                     priority=2,
-                                     proto='ip',
-                                     dl_vlan=local_vlan,
-                                     nw_dst=ip_subnet,
-                                     actions="strip_vlan,mod_dl_src:%s,"
-                                     " output:%s" %
-                                     (subnet_info['gateway_mac'], ofports))
-            else:
-                # removed port is a distributed router interface
-                self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
-                                         proto='ip', dl_vlan=local_vlan,
-                                         nw_dst=ip_subnet)
+            if ldm.get_csnat_ofport() == constants.OFPORT_INVALID:
                 # remove subnet from local_dvr_map as no dvr (or) csnat
                 # ports available on this agent anymore
                 self.local_dvr_map.pop(sub_uuid, None)
@@ -608,46 +667,13 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
                 continue
 
             ldm = self.local_dvr_map[sub_uuid]
-            subnet_info = ldm.get_subnet_info()
             ldm.remove_compute_ofport(port.vif_id)
-            ofports = ','.join(map(str, ldm.get_compute_ofports().values()))
-            ip_subnet = subnet_info['cidr']
 
             # first remove this vm port rule
             self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
                                      dl_vlan=local_vlan,
                                      dl_dst=ovsport.get_mac())
-            if ldm.get_csnat_ofport() != -1:
-                # If there is a csnat port on this agent, preserve
-                # the local_dvr_map state
-                ofports = str(ldm.get_csnat_ofport()) + ',' + ofports
-                self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                     priority=2,
-                                     proto='ip',
-                                     dl_vlan=local_vlan,
-                                     nw_dst=ip_subnet,
-                                     actions="strip_vlan,mod_dl_src:%s,"
-                                     " output:%s" %
-                                     (subnet_info['gateway_mac'], ofports))
-            else:
-                if ofports:
-                    self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                         priority=2,
-                                         proto='ip',
-                                         dl_vlan=local_vlan,
-                                         nw_dst=ip_subnet,
-                                         actions="strip_vlan,mod_dl_src:%s,"
-                                         " output:%s" %
-                                         (subnet_info['gateway_mac'],
-                                          ofports))
-                else:
-                    # remove the flow altogether, as no ports (both csnat/
-                    # compute) are available on this subnet in this
-                    # agent
-                    self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
-                                             proto='ip',
-                                             dl_vlan=local_vlan,
-                                             nw_dst=ip_subnet)
+            self._update_subnet_flow(sub_uuid, ldm, local_vlan)
         # release port state
         self.local_ports.pop(port.vif_id, None)
 
@@ -664,33 +690,17 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
         if sub_uuid not in self.local_dvr_map:
             return
         ldm = self.local_dvr_map[sub_uuid]
-        subnet_info = ldm.get_subnet_info()
-        ip_subnet = subnet_info['cidr']
         ldm.set_csnat_ofport(constants.OFPORT_INVALID)
         # then remove csnat port rule
         self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
                                  dl_vlan=local_vlan,
                                  dl_dst=ovsport.get_mac())
-
-        ofports = ','.join(map(str, ldm.get_compute_ofports().values()))
-        if ofports:
-            self.int_br.add_flow(table=constants.DVR_TO_SRC_MAC,
-                                 priority=2,
-                                 proto='ip',
-                                 dl_vlan=local_vlan,
-                                 nw_dst=ip_subnet,
-                                 actions="strip_vlan,mod_dl_src:%s,"
-                                 " output:%s" %
-                                 (subnet_info['gateway_mac'], ofports))
-        else:
-            self.int_br.delete_flows(table=constants.DVR_TO_SRC_MAC,
-                                     proto='ip',
-                                     dl_vlan=local_vlan,
-                                     nw_dst=ip_subnet)
+        self._update_subnet_flow(sub_uuid, ldm, local_vlan)
         if not ldm.is_dvr_owned():
             # if not owned by DVR (only used for csnat), remove this
             # subnet state altogether
             self.local_dvr_map.pop(sub_uuid, None)
+            self.subnet_info.pop(sub_uuid, None)
 
         # release port state
         self.local_ports.pop(port.vif_id, None)
@@ -698,6 +708,8 @@ class OVSDVRNeutronAgent(dvr_rpc.DVRAgentRpcApiMixin):
     def unbind_port_from_dvr(self, vif_port, local_vlan_id):
         if not (self.enable_tunneling and self.enable_distributed_routing):
             return
+        if vif_port:
+            self.local_compute_ports.remove(vif_port.vif_id)
         # Handle port removed use-case
         if vif_port and vif_port.vif_id not in self.local_ports:
             LOG.debug("DVR: Non distributed port, ignoring %s", vif_port)
@@ -14,7 +14,10 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import collections
+import contextlib
 import hashlib
+import random
 import signal
 import sys
 import time
@@ -24,10 +27,12 @@ eventlet.monkey_patch()
 
 import netaddr
 from neutron.plugins.openvswitch.agent import ovs_dvr_neutron_agent
+from neutron.plugins.openvswitch.agent import ovs_port_stats
 from oslo.config import cfg
 from six import moves
 
 from neutron.agent import l2population_rpc
+from neutron.agent import local_vlan
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib
 from neutron.agent.linux import polling
@@ -81,6 +86,102 @@ class LocalVLANMapping:
                  self.segmentation_id))
 
 
+class FdbTable(object):
+    '''The l2pop entries of remote ports programmed on the tunnel bridge.
+
+    An entry is keyed by (lvid, mac, ip) and maps to the ofport of the
+    tunnel towards the agent of the port. The unicast flows are per MAC and
+    the ARP responder flows per IP, so the entries using a MAC or an IP are
+    counted to know when its flow is no longer needed.
+    '''
+
+    def __init__(self):
+        # lvid -> {(mac, ip): ofport}
+        self._entries = collections.defaultdict(dict)
+        # lvid -> {mac or ip: number of entries using it}
+        self._users = collections.defaultdict(
+            lambda: collections.defaultdict(int))
+
+    def add(self, lvid, mac, ip, ofport):
+        '''Record an entry, returns False when it is already programmed.'''
+        entries = self._entries[lvid]
+        if (mac, ip) in entries:
+            if entries[mac, ip] == ofport:
+                return False
+        else:
+            self._users[lvid][mac] += 1
+            self._users[lvid][ip] += 1
+        entries[mac, ip] = ofport
+        return True
+
+    def remove(self, lvid, mac, ip):
+        '''Forget an entry.
+
+        Returns whether the flows of its MAC and of its IP are no longer
+        used by the other entries of the network.
+        '''
+        users = self._users[lvid]
+        entries = self._entries[lvid]
+        if (mac, ip) in entries:
+            del entries[mac, ip]
+            for key in (mac, ip):
+                users[key] -= 1
+                if not users[key]:
+                    del users[key]
+        return mac not in users, ip not in users
+
+    def remove_network(self, lvid):
+        self._entries.pop(lvid, None)
+        self._users.pop(lvid, None)
+
+    def clear(self):
+        self._entries.clear()
+        self._users.clear()
+
+
+class TunnelPortRefs(object):
+    '''The local networks using each l2pop tunnel port.
+
+    A tunnel port is referenced by the local VLANs of the networks which
+    flood to it. Once its last network releases it, it is marked unused
+    with the time, so that it can be removed after a grace period unless a
+    network uses it again in the meantime.
+    '''
+
+    def __init__(self):
+        # ofport -> set of lvids
+        self._refs = collections.defaultdict(set)
+        # ofport -> (tunnel_type, time it was marked unused)
+        self._unused = {}
+
+    def acquire(self, ofport, lvid):
+        self._refs[ofport].add(lvid)
+        self._unused.pop(ofport, None)
+
+    def release(self, ofport, lvid):
+        lvids = self._refs.get(ofport)
+        if lvids is not None:
+            lvids.discard(lvid)
+            if not lvids:
+                del self._refs[ofport]
+
+    def in_use(self, ofport):
+        return ofport in self._refs
+
+    def mark_unused(self, ofport, tunnel_type):
+        self._unused.setdefault(ofport, (tunnel_type, time.time()))
+
+    def pop_unused(self, grace_period):
+        '''Return the (ofport, tunnel_type) unused for grace_period.'''
+        now = time.time()
+        expired = [(ofport, tunnel_type)
+                   for ofport, (tunnel_type, since) in self._unused.items()
+                   if now - since >= grace_period]
+        for ofport, tunnel_type in expired:
+            del self._unused[ofport]
+        return expired
+
+
 class OVSPluginApi(agent_rpc.PluginApi,
                    dvr_rpc.DVRServerRpcApiMixin,
                    sg_rpc.SecurityGroupServerRpcApiMixin):
@@ -168,8 +269,16 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.use_veth_interconnection = use_veth_interconnection
         self.veth_mtu = veth_mtu
         self.root_helper = root_helper
-        self.available_local_vlans = set(moves.xrange(q_const.MIN_VLAN_TAG,
-                                                      q_const.MAX_VLAN_TAG))
+        self.warm_restart = cfg.CONF.AGENT.warm_restart
+        # The flows installed by this run of the agent carry its cookie, so
+        # that the flows of the previous run can be told apart on a warm
+        # restart.
+        self.agent_cookie = (random.randint(1, 2 ** 64 - 1)
+                             if self.warm_restart else None)
+        # Whether the flows of the bridges are recorded by sync_flows_on
+        self.syncing_flows = False
+        self.local_vlans = local_vlan.LocalVlanAllocator(
+            cfg.CONF.AGENT.local_vlan_state_file)
         self.tunnel_types = tunnel_types or []
         self.l2_pop = l2_population
         # TODO(ethuleau): Initially, local ARP responder is be dependent to the
@@ -195,8 +304,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
 
         # Keep track of int_br's device count for use by _report_state()
         self.int_br_device_count = 0
+        # Statistics of the polling manager, also used by _report_state()
+        self.polling_stats = {}
 
         self.int_br = ovs_lib.OVSBridge(integ_br, self.root_helper)
+        self.int_br.agent_cookie = self.agent_cookie
         self.setup_integration_br()
         # Stores port update notifications for processing in main rpc loop
         self.updated_ports = set()
@@ -204,8 +316,17 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.bridge_mappings = bridge_mappings
         self.setup_physical_bridges(self.bridge_mappings)
         self.local_vlan_map = {}
+        self.stale_flows_pending = self.warm_restart
+        if self.warm_restart:
+            self._recover_local_vlans()
         self.tun_br_ofports = {p_const.TYPE_GRE: {},
                                p_const.TYPE_VXLAN: {}}
+        # l2pop entries programmed on the tunnel bridge
+        self.fdb_table = FdbTable()
+        self.tunnel_refs = TunnelPortRefs()
+        self.tunnel_grace_period = cfg.CONF.AGENT.tunnel_grace_period
+        # Networks whose flooding flow is updated at the end of the batch
+        self._flood_batch = None
 
         self.polling_interval = polling_interval
         self.minimize_polling = minimize_polling
@@ -218,6 +339,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.local_ip = local_ip
         self.tunnel_count = 0
         self.vxlan_udp_port = cfg.CONF.AGENT.vxlan_udp_port
+        self.device_chunk_size = cfg.CONF.AGENT.device_chunk_size
+        # Time spent in each stage of the last processing of the ports
+        self.stage_timings = {}
         self.dont_fragment = cfg.CONF.AGENT.dont_fragment
         self.tun_br = None
         self.patch_int_ofport = constants.OFPORT_INVALID
@@ -251,6 +375,12 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.iter_num = 0
         self.run_daemon_loop = True
 
+        self.stats_collector = None
+        if cfg.CONF.AGENT.stats_interval:
+            self.stats_collector = ovs_port_stats.PortStatsCollector(
+                self, cfg.CONF.AGENT.stats_delta_only)
+            self.stats_collector.start(cfg.CONF.AGENT.stats_interval)
+
     def _check_arp_responder_support(self):
         '''Check if OVS supports to modify ARP headers.
 
@@ -269,6 +399,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         # How many devices are likely used by a VM
         self.agent_state.get('configurations')['devices'] = (
             self.int_br_device_count)
+        if self.polling_stats:
+            self.agent_state.get('configurations')['polling_stats'] = (
+                self.polling_stats)
         try:
             self.state_rpc.report_state(self.context,
                                         self.agent_state)
@@ -350,41 +483,85 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         if not self.l2_pop:
             self._setup_tunnel_port(tun_name, tunnel_ip, tunnel_type)
 
-    def fdb_add(self, context, fdb_entries):
-        LOG.debug("fdb_add received")
+    @contextlib.contextmanager
+    def _deferred_tun_flows(self):
+        '''Apply the flows of the tunnel bridge once the block exits.
+
+        The flooding flow of each network changed in the block is only
+        updated once, with the tunnel ports the network floods to by then.
+        '''
+        if self._flood_batch is not None:
+            yield
+            return
+        self._flood_batch = set()
+        # The DVR flows do not support the deferred apply yet
+        defer = not self.enable_distributed_routing
+        if defer:
+            self.tun_br.defer_apply_on()
+        try:
+            yield
+        finally:
+            batch, self._flood_batch = self._flood_batch, None
+            for lvm in batch:
+                self._set_flood_flow(lvm)
+            if defer:
+                self.tun_br.defer_apply_off()
+
+    def _update_flood_flow(self, lvm):
+        if self._flood_batch is not None:
+            self._flood_batch.add(lvm)
+        else:
+            self._set_flood_flow(lvm)
+
+    def _set_flood_flow(self, lvm):
+        if self.l2_pop:
+            ofports = ','.join(lvm.tun_ofports)
+        else:
+            ofports = ','.join(
+                self.tun_br_ofports[lvm.network_type].values())
+        if ofports:
+            self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
+                                 dl_vlan=lvm.vlan,
+                                 actions="strip_vlan,set_tunnel:%s,"
+                                 "output:%s" % (lvm.segmentation_id, ofports))
+        else:
+            # This local vlan doesn't require any more tunnelling
+            self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
+                                     dl_vlan=lvm.vlan)
+
+    def _get_remote_agent_ports(self, fdb_entries):
         for lvm, agent_ports in self.get_agent_ports(fdb_entries,
                                                      self.local_vlan_map):
             agent_ports.pop(self.local_ip, None)
             if len(agent_ports):
-                if not self.enable_distributed_routing:
-                    self.tun_br.defer_apply_on()
-                self.fdb_add_tun(context, lvm, agent_ports,
-                                 self.tun_br_ofports)
-                if not self.enable_distributed_routing:
-                    self.tun_br.defer_apply_off()
+                yield lvm, agent_ports
+
+    def fdb_add(self, context, fdb_entries):
+        LOG.debug("fdb_add received")
+        networks = list(self._get_remote_agent_ports(fdb_entries))
+        if networks:
+            with self._deferred_tun_flows():
+                for lvm, agent_ports in networks:
+                    self.fdb_add_tun(context, lvm, agent_ports,
+                                     self.tun_br_ofports)
 
     def fdb_remove(self, context, fdb_entries):
         LOG.debug("fdb_remove received")
-        for lvm, agent_ports in self.get_agent_ports(fdb_entries,
-                                                     self.local_vlan_map):
-            agent_ports.pop(self.local_ip, None)
-            if len(agent_ports):
-                if not self.enable_distributed_routing:
-                    self.tun_br.defer_apply_on()
-                self.fdb_remove_tun(context, lvm, agent_ports,
-                                    self.tun_br_ofports)
-                if not self.enable_distributed_routing:
-                    self.tun_br.defer_apply_off()
+        networks = list(self._get_remote_agent_ports(fdb_entries))
+        if networks:
+            with self._deferred_tun_flows():
+                for lvm, agent_ports in networks:
+                    self.fdb_remove_tun(context, lvm, agent_ports,
+                                        self.tun_br_ofports)
 
     def add_fdb_flow(self, port_info, remote_ip, lvm, ofport):
         if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.add(ofport)
-            ofports = ','.join(lvm.tun_ofports)
-            self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
-                                 dl_vlan=lvm.vlan,
-                                 actions="strip_vlan,set_tunnel:%s,"
-                                 "output:%s" % (lvm.segmentation_id, ofports))
-        else:
+            self.tunnel_refs.acquire(ofport, lvm.vlan)
+            if ofport not in lvm.tun_ofports:
+                lvm.tun_ofports.add(ofport)
+                self._update_flood_flow(lvm)
+        elif self.fdb_table.add(lvm.vlan, port_info[0], port_info[1],
+                                ofport):
             self._set_arp_responder('add', lvm.vlan, port_info[0],
                                     port_info[1])
             if not self.dvr_agent.is_dvr_router_interface(port_info[1]):
@@ -398,24 +575,20 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
 
     def del_fdb_flow(self, port_info, remote_ip, lvm, ofport):
         if port_info == q_const.FLOODING_ENTRY:
-            lvm.tun_ofports.remove(ofport)
-            if len(lvm.tun_ofports) > 0:
-                ofports = ','.join(lvm.tun_ofports)
-                self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
-                                     dl_vlan=lvm.vlan,
-                                     actions="strip_vlan,"
-                                     "set_tunnel:%s,output:%s" %
-                                     (lvm.segmentation_id, ofports))
-            else:
-                # This local vlan doesn't require any more tunnelling
-                self.tun_br.delete_flows(table=constants.FLOOD_TO_TUN,
-                                         dl_vlan=lvm.vlan)
+            self.tunnel_refs.release(ofport, lvm.vlan)
+            if ofport in lvm.tun_ofports:
+                lvm.tun_ofports.remove(ofport)
+                self._update_flood_flow(lvm)
         else:
-            self._set_arp_responder('remove', lvm.vlan, port_info[0],
-                                    port_info[1])
-            self.tun_br.delete_flows(table=constants.UCAST_TO_TUN,
-                                     dl_vlan=lvm.vlan,
-                                     dl_dst=port_info[0])
+            mac_unused, ip_unused = self.fdb_table.remove(
+                lvm.vlan, port_info[0], port_info[1])
+            if ip_unused:
+                self._set_arp_responder('remove', lvm.vlan, port_info[0],
+                                        port_info[1])
+            if mac_unused:
+                self.tun_br.delete_flows(table=constants.UCAST_TO_TUN,
+                                         dl_vlan=lvm.vlan,
+                                         dl_dst=port_info[0])
 
     def _fdb_chg_ip(self, context, fdb_entries):
         '''fdb update when an IP of a port is updated.
@@ -438,25 +611,39 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         '''
         LOG.debug(_("update chg_ip received"))
 
-        # TODO(ethuleau): Use OVS defer apply flows for all rules will be an
-        # interesting improvement here. But actually, OVS lib defer apply flows
-        # methods doesn't ensure the add flows will be applied before delete.
-        for network_id, agent_ports in fdb_entries.items():
-            lvm = self.local_vlan_map.get(network_id)
-            if not lvm:
-                continue
-
-            for agent_ip, state in agent_ports.items():
-                if agent_ip == self.local_ip:
+        # The ARP responder flow of an IP is only deleted when no entry uses
+        # the IP anymore, so the deleted flows are never added back by the
+        # same batch and the order in which it is applied does not matter.
+        with self._deferred_tun_flows():
+            for network_id, agent_ports in fdb_entries.items():
+                lvm = self.local_vlan_map.get(network_id)
+                if not lvm:
                     continue
 
-                after = state.get('after')
-                for mac, ip in after:
-                    self._set_arp_responder('add', lvm.vlan, mac, ip)
-
-                before = state.get('before')
-                for mac, ip in before:
-                    self._set_arp_responder('remove', lvm.vlan, mac, ip)
+                for agent_ip, state in agent_ports.items():
+                    if agent_ip == self.local_ip:
+                        continue
+                    ofport = self.tun_br_ofports[lvm.network_type].get(
+                        agent_ip)
+
+                    after = state.get('after')
+                    if ofport is None:
+                        # The entries of the agent are added along with its
+                        # tunnel by fdb_add.
+                        LOG.debug("No tunnel to %s, not adding its entries",
+                                  agent_ip)
+                        after = []
+                    for mac, ip in after:
+                        if self.fdb_table.add(lvm.vlan, mac, ip, ofport):
+                            self._set_arp_responder('add', lvm.vlan, mac, ip)
+
+                    before = state.get('before')
+                    for mac, ip in before:
+                        mac_unused, ip_unused = self.fdb_table.remove(
+                            lvm.vlan, mac, ip)
+                        if ip_unused:
+                            self._set_arp_responder('remove', lvm.vlan, mac,
+                                                    ip)
 
     def _set_arp_responder(self, action, lvid, mac_str, ip_str):
         '''Set the ARP respond entry.
@@ -500,7 +687,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             LOG.warning(_('Action %s not supported'), action)
 
     def provision_local_vlan(self, net_uuid, network_type, physical_network,
-                             segmentation_id):
+                             segmentation_id, cur_tag=None):
         '''Provisions a local VLAN.
 
         :param net_uuid: the uuid of the network associated with this vlan.
@@ -508,6 +695,8 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                                'local')
         :param physical_network: the physical network for 'vlan' or 'flat'
         :param segmentation_id: the VID for 'vlan' or tunnel ID for 'tunnel'
+        :param cur_tag: the current tag of a port of the network, reused as
+                        local vlan if the network has none saved.
         '''
 
         # On a restart or crash of OVS, the network associated with this VLAN
@@ -517,10 +706,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         if lvm:
             lvid = lvm.vlan
         else:
-            if not self.available_local_vlans:
+            lvid = self.local_vlans.allocate(net_uuid, preferred=cur_tag)
+            if lvid is None:
                 LOG.error(_("No local VLAN available for net-id=%s"), net_uuid)
                 return
-            lvid = self.available_local_vlans.pop()
             self.local_vlan_map[net_uuid] = LocalVLANMapping(lvid,
                                                              network_type,
                                                              physical_network,
@@ -623,6 +812,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         LOG.info(_("Reclaiming vlan = %(vlan_id)s from net-id = %(net_uuid)s"),
                  {'vlan_id': lvm.vlan,
                   'net_uuid': net_uuid})
+        self.fdb_table.remove_network(lvm.vlan)
 
         if lvm.network_type in constants.TUNNEL_NETWORK_TYPES:
             if self.enable_tunneling:
@@ -633,6 +823,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 if self.l2_pop:
                     # Try to remove tunnel ports if not used by other networks
                     for ofport in lvm.tun_ofports:
+                        self.tunnel_refs.release(ofport, lvm.vlan)
                         self.cleanup_tunnel_port(ofport, lvm.network_type)
         elif lvm.network_type == p_const.TYPE_FLAT:
             if lvm.physical_network in self.phys_brs:
@@ -665,12 +856,12 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                       {'network_type': lvm.network_type,
                        'net_uuid': net_uuid})
 
-        self.available_local_vlans.add(lvm.vlan)
+        self.local_vlans.release(net_uuid)
 
     def port_bound(self, port, net_uuid,
                    network_type, physical_network,
                    segmentation_id, fixed_ips, device_owner,
-                   ovs_restarted):
+                   ovs_restarted, cur_tag=None):
         '''Bind port to net_uuid/lsw_id and install flow for inbound traffic
         to vm.
 
@@ -682,10 +873,14 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         :param fixed_ips: the ip addresses assigned to this port
         :param device_owner: the string indicative of owner of this port
         :param ovs_restarted: indicates if this is called for an OVS restart.
+        :param cur_tag: the current tag of the port, read from OVSDB if None.
         '''
+        if cur_tag is None:
+            cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
         if net_uuid not in self.local_vlan_map or ovs_restarted:
             self.provision_local_vlan(net_uuid, network_type,
-                                      physical_network, segmentation_id)
+                                      physical_network, segmentation_id,
+                                      cur_tag=cur_tag)
         lvm = self.local_vlan_map[net_uuid]
         lvm.vif_ports[port.vif_id] = port
 
@@ -694,12 +889,25 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                         local_vlan_id=lvm.vlan)
 
         # Do not bind a port if it's already bound
-        cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
-        if cur_tag != str(lvm.vlan):
+        if str(cur_tag) != str(lvm.vlan):
             self.int_br.set_db_attribute("Port", port.port_name, "tag",
                                          str(lvm.vlan))
             if port.ofport != -1:
-                self.int_br.delete_flows(in_port=port.ofport)
+                # Within a transaction, the flows of the port are only
+                # deleted once it is tagged
+                self.int_br.after_commit(self.int_br.delete_flows,
+                                         in_port=port.ofport)
+
+    def _recover_local_vlans(self):
+        '''Reserve the local VLANs of the ports of the integration bridge.
+
+        After a warm restart, a network without a saved local VLAN gets
+        back the one its ports are tagged with when it is provisioned
+        again, so that the ports are not retagged.
+        '''
+        recovered = [tag for tag in self.int_br.get_port_tag_dict().values()
+                     if self.local_vlans.reserve(tag)]
+        LOG.info(_("Recovered local vlans %s"), sorted(recovered))
 
     def port_unbound(self, vif_id, net_uuid=None):
         '''Unbind port.
@@ -729,23 +937,30 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         if not lvm.vif_ports:
             self.reclaim_local_vlan(net_uuid)
 
-    def port_dead(self, port):
+    def port_dead(self, port, cur_tag=None):
         '''Once a port has no binding, put it on the "dead vlan".
 
         :param port: a ovs_lib.VifPort object.
+        :param cur_tag: the current tag of the port, read from OVSDB if None.
         '''
         # Don't kill a port if it's already dead
-        cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
-        if cur_tag != DEAD_VLAN_TAG:
+        if cur_tag is None:
+            cur_tag = self.int_br.db_get_val("Port", port.port_name, "tag")
+        if str(cur_tag) != DEAD_VLAN_TAG:
             self.int_br.set_db_attribute("Port", port.port_name, "tag",
                                          DEAD_VLAN_TAG)
             self.int_br.add_flow(priority=2, in_port=port.ofport,
                                  actions="drop")
+        elif self.stale_flows_pending:
+            # The drop flow of the previous run is about to be deleted
+            self.int_br.add_flow(priority=2, in_port=port.ofport,
+                                 actions="drop")
 
     def setup_integration_br(self):
         '''Setup the integration bridge.
 
-        Create patch ports and remove all existing flows.
+        Create patch ports and remove all existing flows, unless they are
+        kept by a warm restart.
 
         :param bridge_name: the name of the integration bridge.
         :returns: the integration bridge
@@ -757,8 +972,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         self.int_br.create()
         self.int_br.set_secure_mode()
 
-        self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
-        self.int_br.remove_all_flows()
+        if not self.warm_restart:
+            self.int_br.delete_port(cfg.CONF.OVS.int_peer_patch_port)
+            self.int_br.remove_all_flows()
         # switch all traffic using L2 learning
         self.int_br.add_flow(priority=1, actions="normal")
         # Add a canary flow to int_br to track OVS restarts
@@ -801,19 +1017,26 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         '''
         if not self.tun_br:
             self.tun_br = ovs_lib.OVSBridge(tun_br, self.root_helper)
+            self.tun_br.agent_cookie = self.agent_cookie
 
-        self.tun_br.reset_bridge()
-        self.patch_tun_ofport = self.int_br.add_patch_port(
-            cfg.CONF.OVS.int_peer_patch_port, cfg.CONF.OVS.tun_peer_patch_port)
-        self.patch_int_ofport = self.tun_br.add_patch_port(
-            cfg.CONF.OVS.tun_peer_patch_port, cfg.CONF.OVS.int_peer_patch_port)
+        if self.warm_restart:
+            self.tun_br.create()
+        else:
+            self.tun_br.reset_bridge()
+        self.patch_tun_ofport = self._add_patch_port(
+            self.int_br, cfg.CONF.OVS.int_peer_patch_port,
+            cfg.CONF.OVS.tun_peer_patch_port)
+        self.patch_int_ofport = self._add_patch_port(
+            self.tun_br, cfg.CONF.OVS.tun_peer_patch_port,
+            cfg.CONF.OVS.int_peer_patch_port)
         if int(self.patch_tun_ofport) < 0 or int(self.patch_int_ofport) < 0:
             LOG.error(_("Failed to create OVS patch port. Cannot have "
                         "tunneling enabled on this agent, since this version "
                         "of OVS does not support tunnels or patch ports. "
                         "Agent terminated!"))
             exit(1)
-        self.tun_br.remove_all_flows()
+        if not self.warm_restart:
+            self.tun_br.remove_all_flows()
 
         # Table 0 (default) will sort incoming traffic depending on in_port
         self.tun_br.add_flow(priority=1,
@@ -886,6 +1109,17 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                              priority=0,
                              actions="drop")
 
+    def _get_kept_ofport(self, br, port_name):
+        '''Return the ofport of a port kept by a warm restart, or None.'''
+        if self.warm_restart:
+            ofport = br.get_port_ofport(port_name)
+            if int(ofport) > 0:
+                return ofport
+
+    def _add_patch_port(self, br, local_name, remote_name):
+        return (self._get_kept_ofport(br, local_name) or
+                br.add_patch_port(local_name, remote_name))
+
     def get_peer_name(self, prefix, name):
         """Construct a peer name based on the prefix and name.
 
@@ -936,7 +1170,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                            'bridge': bridge})
                 sys.exit(1)
             br = ovs_lib.OVSBridge(bridge, self.root_helper)
-            br.remove_all_flows()
+            br.agent_cookie = self.agent_cookie
+            if self.syncing_flows:
+                br.sync_flows_on()
+            if not self.warm_restart:
+                br.remove_all_flows()
             br.add_flow(priority=1, actions="normal")
             self.phys_brs[physical_network] = br
 
@@ -945,9 +1183,18 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                              bridge)
             phys_if_name = self.get_peer_name(constants.PEER_PHYSICAL_PREFIX,
                                               bridge)
-            self.int_br.delete_port(int_if_name)
-            br.delete_port(phys_if_name)
-            if self.use_veth_interconnection:
+            int_ofport = self._get_kept_ofport(self.int_br, int_if_name)
+            phys_ofport = self._get_kept_ofport(br, phys_if_name)
+            if int_ofport and phys_ofport:
+                LOG.info(_("Keeping the interconnection of bridge %s"),
+                         bridge)
+                if self.use_veth_interconnection:
+                    int_veth = ip_lib.IPDevice(int_if_name, self.root_helper)
+                    phys_veth = ip_lib.IPDevice(phys_if_name,
+                                                self.root_helper)
+            elif self.use_veth_interconnection:
+                self.int_br.delete_port(int_if_name)
+                br.delete_port(phys_if_name)
                 if ip_lib.device_exists(int_if_name, self.root_helper):
                     ip_lib.IPDevice(int_if_name,
                                     self.root_helper).link.delete()
@@ -960,6 +1207,8 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 int_ofport = self.int_br.add_port(int_veth)
                 phys_ofport = br.add_port(phys_veth)
             else:
+                self.int_br.delete_port(int_if_name)
+                br.delete_port(phys_if_name)
                 # Create patch ports without associating them in order to block
                 # untranslated traffic before association
                 int_ofport = self.int_br.add_patch_port(
@@ -1056,7 +1305,7 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
 
     def treat_vif_port(self, vif_port, port_id, network_id, network_type,
                        physical_network, segmentation_id, admin_state_up,
-                       fixed_ips, device_owner, ovs_restarted):
+                       fixed_ips, device_owner, ovs_restarted, cur_tag=None):
         # When this function is called for a port, the port should have
         # an OVS ofport configured, as only these ports were considered
         # for being treated. If that does not happen, it is a potential
@@ -1068,9 +1317,10 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
             if admin_state_up:
                 self.port_bound(vif_port, network_id, network_type,
                                 physical_network, segmentation_id,
-                                fixed_ips, device_owner, ovs_restarted)
+                                fixed_ips, device_owner, ovs_restarted,
+                                cur_tag)
             else:
-                self.port_dead(vif_port)
+                self.port_dead(vif_port, cur_tag)
         else:
             LOG.debug(_("No VIF port for port %s defined on agent."), port_id)
 
@@ -1100,17 +1350,11 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                              actions="resubmit(,%s)" %
                              constants.TUN_TABLE[tunnel_type])
 
-        ofports = ','.join(self.tun_br_ofports[tunnel_type].values())
-        if ofports and not self.l2_pop:
+        if not self.l2_pop:
             # Update flooding flows to include the new tunnel
-            for network_id, vlan_mapping in self.local_vlan_map.iteritems():
+            for vlan_mapping in self.local_vlan_map.itervalues():
                 if vlan_mapping.network_type == tunnel_type:
-                    self.tun_br.mod_flow(table=constants.FLOOD_TO_TUN,
-                                         dl_vlan=vlan_mapping.vlan,
-                                         actions="strip_vlan,"
-                                         "set_tunnel:%s,output:%s" %
-                                         (vlan_mapping.segmentation_id,
-                                          ofports))
+                    self._update_flood_flow(vlan_mapping)
         return ofport
 
     def setup_tunnel_port(self, remote_ip, network_type):
@@ -1125,72 +1369,128 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
 
     def cleanup_tunnel_port(self, tun_ofport, tunnel_type):
         # Check if this tunnel port is still used
-        for lvm in self.local_vlan_map.values():
-            if tun_ofport in lvm.tun_ofports:
-                break
-        # If not, remove it
+        if self.tunnel_refs.in_use(tun_ofport):
+            return
+        # If not, remove it once the grace period is over
+        if self.tunnel_grace_period > 0:
+            self.tunnel_refs.mark_unused(tun_ofport, tunnel_type)
         else:
-            for remote_ip, ofport in self.tun_br_ofports[tunnel_type].items():
-                if ofport == tun_ofport:
-                    port_name = '%s-%s' % (tunnel_type,
-                                           self.get_ip_in_hex(remote_ip))
-                    self.tun_br.delete_port(port_name)
-                    self.tun_br.delete_flows(in_port=ofport)
-                    self.tun_br_ofports[tunnel_type].pop(remote_ip, None)
-
-    def treat_devices_added_or_updated(self, devices, ovs_restarted):
-        skipped_devices = []
+            self._remove_tunnel_port(tun_ofport, tunnel_type)
+
+    def _remove_tunnel_port(self, tun_ofport, tunnel_type):
+        for remote_ip, ofport in self.tun_br_ofports[tunnel_type].items():
+            if ofport == tun_ofport:
+                port_name = '%s-%s' % (tunnel_type,
+                                       self.get_ip_in_hex(remote_ip))
+                self.tun_br.delete_port(port_name)
+                self.tun_br.delete_flows(in_port=ofport)
+                self.tun_br_ofports[tunnel_type].pop(remote_ip, None)
+
+    def remove_unused_tunnel_ports(self):
+        '''Remove the tunnel ports unused for the grace period.'''
+        for ofport, tunnel_type in self.tunnel_refs.pop_unused(
+                self.tunnel_grace_period):
+            LOG.debug(_("Removing unused %(type)s tunnel port %(ofport)s"),
+                      {'type': tunnel_type, 'ofport': ofport})
+            self._remove_tunnel_port(ofport, tunnel_type)
+
+    def get_devices_details(self, devices):
         try:
-            devices_details_list = self.plugin_rpc.get_devices_details_list(
-                self.context,
-                devices,
-                self.agent_id,
-                cfg.CONF.host)
+            return self.plugin_rpc.get_devices_details_list(self.context,
+                                                            devices,
+                                                            self.agent_id,
+                                                            cfg.CONF.host)
         except Exception as e:
             raise DeviceListRetrievalError(devices=devices, error=e)
-        for details in devices_details_list:
-            device = details['device']
-            LOG.debug("Processing port: %s", device)
-            port = self.int_br.get_vif_port_by_id(device)
-            if not port:
-                # The port disappeared and cannot be processed
-                LOG.info(_("Port %s was not found on the integration bridge "
-                           "and will therefore not be processed"), device)
-                skipped_devices.append(device)
-                continue
 
-            if 'port_id' in details:
-                LOG.info(_("Port %(device)s updated. Details: %(details)s"),
-                         {'device': device, 'details': details})
-                self.treat_vif_port(port, details['port_id'],
-                                    details['network_id'],
-                                    details['network_type'],
-                                    details['physical_network'],
-                                    details['segmentation_id'],
-                                    details['admin_state_up'],
-                                    details['fixed_ips'],
-                                    details['device_owner'],
-                                    ovs_restarted)
-                # update plugin about port status
-                # FIXME(salv-orlando): Failures while updating device status
-                # must be handled appropriately. Otherwise this might prevent
-                # neutron server from sending network-vif-* events to the nova
-                # API server, thus possibly preventing instance spawn.
-                if details.get('admin_state_up'):
-                    LOG.debug(_("Setting status for %s to UP"), device)
-                    self.plugin_rpc.update_device_up(
-                        self.context, device, self.agent_id, cfg.CONF.host)
+    def _add_stage_time(self, stage, start):
+        self.stage_timings[stage] = (self.stage_timings.get(stage, 0) +
+                                     time.time() - start)
+
+    def treat_devices_added_or_updated(self, devices, ovs_restarted,
+                                       devices_details_list=None):
+        skipped_devices = []
+        if devices_details_list is None:
+            start = time.time()
+            devices_details_list = self.get_devices_details(devices)
+            self._add_stage_time('details', start)
+        start = time.time()
+        # Read the tags of all the ports at once and bind the ports in a
+        # single OVSDB transaction, then report their status once they are
+        # bound.
+        port_tags = self.int_br.get_port_tag_dict()
+        treated_devices = []
+        with contextlib.nested(self.int_br.ovsdb_transaction(),
+                               self.dvr_agent.deferred_subnet_flows()):
+            for details in devices_details_list:
+                device = details['device']
+                LOG.debug("Processing port: %s", device)
+                port = self.int_br.get_vif_port_by_id(device)
+                if not port:
+                    # The port disappeared and cannot be processed
+                    LOG.info(_("Port %s was not found on the integration "
+                               "bridge and will therefore not be processed"),
+                             device)
+                    skipped_devices.append(device)
+                    continue
+
+                cur_tag = port_tags.get(port.port_name)
+                if 'port_id' in details:
+                    LOG.info(_("Port %(device)s updated. Details: "
+                               "%(details)s"),
+                             {'device': device, 'details': details})
+                    self.treat_vif_port(port, details['port_id'],
+                                        details['network_id'],
+                                        details['network_type'],
+                                        details['physical_network'],
+                                        details['segmentation_id'],
+                                        details['admin_state_up'],
+                                        details['fixed_ips'],
+                                        details['device_owner'],
+                                        ovs_restarted,
+                                        cur_tag)
+                    treated_devices.append(details)
                 else:
-                    LOG.debug(_("Setting status for %s to DOWN"), device)
-                    self.plugin_rpc.update_device_down(
-                        self.context, device, self.agent_id, cfg.CONF.host)
-                LOG.info(_("Configuration for device %s completed."), device)
-            else:
-                LOG.warn(_("Device %s not defined on plugin"), device)
-                if (port and port.ofport != -1):
-                    self.port_dead(port)
+                    LOG.warn(_("Device %s not defined on plugin"), device)
+                    if (port and port.ofport != -1):
+                        self.port_dead(port, cur_tag)
+        self._add_stage_time('wiring', start)
+
+        start = time.time()
+        # update plugin about the status of all the ports at once. The
+        # devices whose status could not be updated are skipped, so that
+        # they are processed again by the next iteration.
+        devices_up = [details['device'] for details in treated_devices
+                      if details.get('admin_state_up')]
+        devices_down = [details['device'] for details in treated_devices
+                        if not details.get('admin_state_up')]
+        LOG.debug(_("Setting status for %(up)s to UP and for %(down)s to "
+                    "DOWN"), {'up': devices_up, 'down': devices_down})
+        failed_devices = self.update_devices_status(devices_up, devices_down)
+        for details in treated_devices:
+            if details['device'] not in failed_devices:
+                LOG.info(_("Configuration for device %s completed."),
+                         details['device'])
+        skipped_devices.extend(failed_devices)
+        self._add_stage_time('status', start)
         return skipped_devices
 
+    def update_devices_status(self, devices_up, devices_down):
+        """Report the status of devices to the plugin in bulk.
+
+        Returns the set of devices whose status could not be updated.
+        """
+        failed_devices = set()
+        for status, devices in (('up', devices_up), ('down', devices_down)):
+            failed = self.plugin_rpc.update_devices_status(
+                self.context, status, devices, self.agent_id,
+                cfg.CONF.host)[1]
+            for device in failed:
+                LOG.warn(_("Failed to update the status of device %s"),
+                         device)
+            failed_devices.update(failed)
+        return failed_devices
+
     def treat_ancillary_devices_added(self, devices):
         try:
             devices_details_list = self.plugin_rpc.get_devices_details_list(
@@ -1201,46 +1501,37 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         except Exception as e:
             raise DeviceListRetrievalError(devices=devices, error=e)
 
-        for details in devices_details_list:
-            device = details['device']
+        devices_up = [details['device'] for details in devices_details_list]
+        for device in devices_up:
             LOG.info(_("Ancillary Port %s added"), device)
 
-            # update plugin about port status
-            self.plugin_rpc.update_device_up(self.context,
-                                             device,
-                                             self.agent_id,
-                                             cfg.CONF.host)
+        # update plugin about port status, resyncing if it failed
+        return bool(self.update_devices_status(devices_up, []))
+
+    def _remove_devices(self, devices):
+        for device in devices:
+            LOG.info(_("Attachment %s removed"), device)
+        updated, failed = self.plugin_rpc.update_devices_status(
+            self.context, 'down', devices, self.agent_id, cfg.CONF.host)
+        return updated + [{'device': device, 'failed': True}
+                          for device in failed]
 
     def treat_devices_removed(self, devices):
         resync = False
         self.sg_agent.remove_devices_filter(devices)
-        for device in devices:
-            LOG.info(_("Attachment %s removed"), device)
-            try:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
-                resync = True
-                continue
-            self.port_unbound(device)
+        with self.dvr_agent.deferred_subnet_flows():
+            for details in self._remove_devices(devices):
+                if details.get('failed'):
+                    resync = True
+                    continue
+                self.port_unbound(details['device'])
         return resync
 
     def treat_ancillary_devices_removed(self, devices):
         resync = False
-        for device in devices:
-            LOG.info(_("Attachment %s removed"), device)
-            try:
-                details = self.plugin_rpc.update_device_down(self.context,
-                                                             device,
-                                                             self.agent_id,
-                                                             cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("port_removed failed for %(device)s: %(e)s"),
-                          {'device': device, 'e': e})
+        for details in self._remove_devices(devices):
+            device = details['device']
+            if details.get('failed'):
                 resync = True
                 continue
             if details['exists']:
@@ -1250,58 +1541,107 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 LOG.debug(_("Device %s not defined on plugin"), device)
         return resync
 
+    def _chunk_devices(self, port_info):
+        added = port_info.get('added', set())
+        # A device might be both in the 'added' and 'updated' list at the
+        # same time; avoid processing it twice. New devices come first as
+        # they are the ones waited for.
+        devices = list(added) + list(port_info.get('updated', set()) - added)
+        size = self.device_chunk_size
+        return [set(devices[i:i + size])
+                for i in moves.xrange(0, len(devices), size)]
+
     def process_network_ports(self, port_info, ovs_restarted):
         resync_a = False
         resync_b = False
+        self.stage_timings = {}
+        added = port_info.get('added', set())
+        updated = port_info.get('updated', set())
         # TODO(salv-orlando): consider a solution for ensuring notifications
         # are processed exactly in the same order in which they were
         # received. This is tricky because there are two notification
         # sources: the neutron server, and the ovs db monitor process
-        # If there is an exception while processing security groups ports
-        # will not be wired anyway, and a resync will be triggered
-        # TODO(salv-orlando): Optimize avoiding applying filters unnecessarily
-        # (eg: when there are no IP address changes)
-        self.sg_agent.setup_port_filters(port_info.get('added', set()),
-                                         port_info.get('updated', set()))
         # VIF wiring needs to be performed always for 'new' devices.
         # For updated ports, re-wiring is not needed in most cases, but needs
         # to be performed anyway when the admin state of a device is changed.
-        # A device might be both in the 'added' and 'updated'
-        # list at the same time; avoid processing it twice.
-        devices_added_updated = (port_info.get('added', set()) |
-                                 port_info.get('updated', set()))
-        if devices_added_updated:
-            start = time.time()
-            try:
-                skipped_devices = self.treat_devices_added_or_updated(
-                    devices_added_updated, ovs_restarted)
-                LOG.debug(_("process_network_ports - iteration:%(iter_num)d -"
-                            "treat_devices_added_or_updated completed. "
-                            "Skipped %(num_skipped)d devices of "
-                            "%(num_current)d devices currently available. "
-                            "Time elapsed: %(elapsed).3f"),
-                          {'iter_num': self.iter_num,
-                           'num_skipped': len(skipped_devices),
-                           'num_current': len(port_info['current']),
-                           'elapsed': time.time() - start})
-                # Update the list of current ports storing only those which
-                # have been actually processed.
-                port_info['current'] = (port_info['current'] -
-                                        set(skipped_devices))
-            except DeviceListRetrievalError:
-                # Need to resync as there was an error with server
-                # communication.
-                LOG.exception(_("process_network_ports - iteration:%d - "
-                                "failure while retrieving port details "
-                                "from server"), self.iter_num)
-                resync_a = True
+        # The devices are processed in chunks: the details of the next chunk
+        # are fetched while the current one is filtered and wired, and the
+        # status of each chunk is reported once it is wired, so that the
+        # first devices become active without waiting for all the others.
+        chunks = self._chunk_devices(port_info)
+        if not chunks:
+            # Firewall refreshes are still needed without device changes
+            self.sg_agent.setup_port_filters(set(), set())
+        next_details = None
+        try:
+            for i, chunk in enumerate(chunks):
+                try:
+                    details = None
+                    if next_details is not None:
+                        start = time.time()
+                        pending, next_details = next_details, None
+                        details = pending.wait()
+                        self._add_stage_time('details', start)
+                    if i + 1 < len(chunks):
+                        next_details = eventlet.spawn(
+                            self.get_devices_details, chunks[i + 1])
+                    # If there is an exception while processing security
+                    # groups ports will not be wired anyway, and a resync
+                    # will be triggered
+                    # TODO(salv-orlando): Optimize avoiding applying filters
+                    # unnecessarily (eg: when there are no IP address
+                    # changes)
+                    start = time.time()
+                    self.sg_agent.setup_port_filters(added & chunk,
+                                                     updated & chunk)
+                    self._add_stage_time('filters', start)
+                    if details is None:
+                        skipped_devices = self.treat_devices_added_or_updated(
+                            chunk, ovs_restarted)
+                    else:
+                        skipped_devices = self.treat_devices_added_or_updated(
+                            chunk, ovs_restarted, devices_details_list=details)
+                    LOG.debug(_("process_network_ports - iteration:"
+                                "%(iter_num)d - "
+                                "treat_devices_added_or_updated completed "
+                                "for chunk %(chunk)d of %(num_chunks)d. "
+                                "Skipped %(num_skipped)d devices of "
+                                "%(num_current)d devices currently "
+                                "available."),
+                              {'iter_num': self.iter_num,
+                               'chunk': i + 1,
+                               'num_chunks': len(chunks),
+                               'num_skipped': len(skipped_devices),
+                               'num_current': len(port_info['current'])})
+                    # Update the list of current ports storing only those
+                    # which have been actually processed.
+                    port_info['current'] = (port_info['current'] -
+                                            set(skipped_devices))
+                except DeviceListRetrievalError:
+                    # Need to resync as there was an error with server
+                    # communication.
+                    LOG.exception(_("process_network_ports - iteration:%d - "
+                                    "failure while retrieving port details "
+                                    "from server"), self.iter_num)
+                    resync_a = True
+                    break
+        finally:
+            # Do not leave the prefetch of the next chunk running when the
+            # processing is aborted
+            if next_details is not None:
+                next_details.kill()
         if 'removed' in port_info:
             start = time.time()
             resync_b = self.treat_devices_removed(port_info['removed'])
+            self._add_stage_time('removal', start)
             LOG.debug(_("process_network_ports - iteration:%(iter_num)d -"
                         "treat_devices_removed completed in %(elapsed).3f"),
                       {'iter_num': self.iter_num,
                        'elapsed': time.time() - start})
+        LOG.debug(_("process_network_ports - iteration:%(iter_num)d - "
+                    "time spent per stage: %(stage_timings)s"),
+                  {'iter_num': self.iter_num,
+                   'stage_timings': self.stage_timings})
         # If one of the above operations fails => resync with plugin
         return (resync_a | resync_b)
 
@@ -1311,7 +1651,8 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
         if 'added' in port_info:
             start = time.time()
             try:
-                self.treat_ancillary_devices_added(port_info['added'])
+                resync_a = self.treat_ancillary_devices_added(
+                    port_info['added'])
                 LOG.debug(_("process_ancillary_network_ports - iteration: "
                             "%(iter_num)d - treat_ancillary_devices_added "
                             "completed in %(elapsed).3f"),
@@ -1353,27 +1694,33 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                                                       self.local_ip,
                                                       tunnel_type)
                 if not self.l2_pop:
-                    tunnels = details['tunnels']
-                    for tunnel in tunnels:
-                        if self.local_ip != tunnel['ip_address']:
-                            tunnel_id = tunnel.get('id')
-                            # Unlike the OVS plugin, ML2 doesn't return an id
-                            # key. So use ip_address to form port name instead.
-                            # Port name must be <=15 chars, so use shorter hex.
-                            remote_ip = tunnel['ip_address']
-                            remote_ip_hex = self.get_ip_in_hex(remote_ip)
-                            if not tunnel_id and not remote_ip_hex:
-                                continue
-                            tun_name = '%s-%s' % (tunnel_type,
-                                                  tunnel_id or remote_ip_hex)
-                            self._setup_tunnel_port(
-                                tun_name, tunnel['ip_address'], tunnel_type)
+                    # The flooding flows are updated once all the tunnels
+                    # are set up
+                    with self._deferred_tun_flows():
+                        self._setup_tunnel_ports(tunnel_type,
+                                                 details['tunnels'])
         except Exception as e:
             LOG.debug(_("Unable to sync tunnel IP %(local_ip)s: %(e)s"),
                       {'local_ip': self.local_ip, 'e': e})
             resync = True
         return resync
 
+    def _setup_tunnel_ports(self, tunnel_type, tunnels):
+        for tunnel in tunnels:
+            if self.local_ip != tunnel['ip_address']:
+                tunnel_id = tunnel.get('id')
+                # Unlike the OVS plugin, ML2 doesn't return an id
+                # key. So use ip_address to form port name instead.
+                # Port name must be <=15 chars, so use shorter hex.
+                remote_ip = tunnel['ip_address']
+                remote_ip_hex = self.get_ip_in_hex(remote_ip)
+                if not tunnel_id and not remote_ip_hex:
+                    continue
+                tun_name = '%s-%s' % (tunnel_type,
+                                      tunnel_id or remote_ip_hex)
+                self._setup_tunnel_port(
+                    tun_name, tunnel['ip_address'], tunnel_type)
+
     def _agent_has_updates(self, polling_manager):
         return (polling_manager.is_polling_required or
                 self.updated_ports or
@@ -1384,6 +1731,39 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 port_info.get('removed') or
                 port_info.get('updated'))
 
+    def _get_bridges(self):
+        bridges = [self.int_br] + self.phys_brs.values()
+        if self.tun_br:
+            bridges.append(self.tun_br)
+        return bridges
+
+    def cleanup_stale_flows(self):
+        '''Complete a warm restart once the ports are synchronized.
+
+        The flows installed since the restart carry the agent cookie, so
+        the other ones are the stale flows of the previous run.
+        '''
+        for br in self._get_bridges():
+            br.delete_stale_flows()
+        self.stale_flows_pending = False
+
+    def sync_flows_on(self):
+        '''Record the flows of the bridges instead of installing them.
+
+        When OVS restarted, the flows of the bridges and of the ports are
+        recorded while they are reprogrammed, and sync_flows_off installs
+        them with a few batched flow mods per bridge.
+        '''
+        self.syncing_flows = True
+        for br in self._get_bridges():
+            br.sync_flows_on()
+
+    def sync_flows_off(self):
+        '''Install the flows recorded since sync_flows_on.'''
+        self.syncing_flows = False
+        for br in self._get_bridges():
+            br.sync_flows_off()
+
     def check_ovs_restart(self):
         # Check for the canary flow
         canary_flow = self.int_br.dump_flows_for_table(constants.CANARY_TABLE)
@@ -1416,6 +1796,9 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 polling_manager.force_polling()
             ovs_restarted = self.check_ovs_restart()
             if ovs_restarted:
+                # The flows of the l2pop entries are gone with the others
+                self.fdb_table.clear()
+                self.sync_flows_on()
                 self.setup_integration_br()
                 self.setup_physical_bridges(self.bridge_mappings)
                 if self.enable_tunneling:
@@ -1434,6 +1817,8 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                 except Exception:
                     LOG.exception(_("Error while synchronizing tunnels"))
                     tunnel_sync = True
+            if self.enable_tunneling and self.l2_pop:
+                self.remove_unused_tunnel_ports()
             if self._agent_has_updates(polling_manager) or ovs_restarted:
                 try:
                     LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d - "
@@ -1500,19 +1885,34 @@ class OVSNeutronAgent(n_rpc.RpcCallback,
                             sync = sync | rc
 
                     polling_manager.polling_completed()
+                    if not sync:
+                        # The networks of the ports have claimed their
+                        # local VLANs
+                        self.local_vlans.release_unclaimed()
+                    self.local_vlans.save()
+                    if (self.stale_flows_pending and not sync and
+                            not (self.enable_tunneling and tunnel_sync)):
+                        self.cleanup_stale_flows()
                 except Exception:
                     LOG.exception(_("Error while processing VIF ports"))
                     # Put the ports back in self.updated_port
                     self.updated_ports |= updated_ports_copy
                     sync = True
+            if ovs_restarted:
+                # The flows of the ports which failed are added by the
+                # next iterations
+                self.sync_flows_off()
 
             # sleep till end of polling interval
             elapsed = (time.time() - start)
+            self.polling_stats = polling_manager.get_stats()
             LOG.debug(_("Agent rpc_loop - iteration:%(iter_num)d "
                         "completed. Processed ports statistics: "
-                        "%(port_stats)s. Elapsed:%(elapsed).3f"),
+                        "%(port_stats)s. Polling statistics: "
+                        "%(polling_stats)s. Elapsed:%(elapsed).3f"),
                       {'iter_num': self.iter_num,
                        'port_stats': port_stats,
+                       'polling_stats': self.polling_stats,
                        'elapsed': elapsed})
             if (elapsed < self.polling_interval):
                 time.sleep(self.polling_interval - elapsed)
@@ -1567,6 +1967,10 @@ def create_agent_config_map(config):
     if config.OVS.enable_tunneling and not kwargs['tunnel_types']:
         kwargs['tunnel_types'] = [p_const.TYPE_GRE]
 
+    if config.AGENT.device_chunk_size < 1:
+        raise ValueError(_('device_chunk_size must be at least 1, got %d.') %
+                         config.AGENT.device_chunk_size)
+
     # Verify the tunnel_types specified are valid
     for tun in kwargs['tunnel_types']:
         if tun not in constants.TUNNEL_NETWORK_TYPES:
@@ -0,0 +1,182 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import re
+
+from oslo.config import cfg
+
+from neutron.common import rpc as n_rpc
+from neutron.openstack.common import log as logging
+from neutron.openstack.common import loopingcall
+from neutron.openstack.common import timeutils
+
+
+LOG = logging.getLogger(__name__)
+
+EVENT_TYPE = 'port.stats'
+
+_DL_VLAN_RE = re.compile(r'^dl_vlan=(\d+)$')
+_MOD_VLAN_VID_RE = re.compile(r'mod_vlan_vid:(\d+)')
+
+
+def _flow_local_vlan(flow, tagging):
+    '''Return the local VLAN a flow is for, or None.
+
+    The flows of the integration and tunnel bridges tag the frames coming
+    in with their local VLAN, while the ones of the physical bridges
+    replace it with the VLAN of the physical network: the local VLAN is
+    then the one they match.
+    '''
+    if tagging and flow.actions:
+        match = _MOD_VLAN_VID_RE.search(flow.actions)
+        if match:
+            return int(match.group(1))
+    for field in flow.match:
+        match = _DL_VLAN_RE.match(field)
+        if match:
+            return int(match.group(1))
+
+
+class PortStatsCollector(object):
+    '''Exports the counters of the ports and networks of the OVS agent.
+
+    Each sample takes a single dump-ports of the integration bridge and a
+    single dump-flows of each bridge of the agent, whatever the number of
+    ports. The port counters are attributed to the Neutron ports and the
+    flow counters to the networks through the local VLAN mappings of the
+    agent, and all of them are published in one notification.
+
+    In delta only mode, the counters are the increase since the previous
+    sample and the ports and networks whose counters did not change are
+    left out.
+    '''
+
+    def __init__(self, agent, delta_only=False):
+        self.agent = agent
+        self.delta_only = delta_only
+        # counters of the previous sample, by port or (network, bridge)
+        self._last_counters = {}
+        self._notifier = None
+
+    def start(self, interval):
+        self._loop = loopingcall.FixedIntervalLoopingCall(self.publish)
+        self._loop.start(interval=interval)
+
+    def _bridges(self):
+        bridges = [(self.agent.int_br, True)]
+        if self.agent.enable_tunneling and self.agent.tun_br:
+            bridges.append((self.agent.tun_br, True))
+        bridges.extend((br, False) for br in self.agent.phys_brs.values())
+        return bridges
+
+    def _delta(self, key, counters):
+        last, self._last_counters[key] = (self._last_counters.get(key),
+                                          counters)
+        if not self.delta_only:
+            return counters
+        if last is None or any(value < last.get(name, 0)
+                               for name, value in counters.items()):
+            # new port or counters reset by the port being recreated
+            return counters
+        delta = dict((name, value - last.get(name, 0))
+                     for name, value in counters.items())
+        if any(delta.values()):
+            return delta
+
+    def collect(self):
+        '''Take a sample and return its counters, or None.'''
+        # Snapshot the mappings, which the rpc loop may change while the
+        # bridges are dumped
+        networks = dict((lvm.vlan, (net_id, lvm.vif_ports.values()))
+                        for net_id, lvm in self.agent.local_vlan_map.items())
+        if not networks:
+            return None
+        # the counters of the previous sample are only forgotten for the
+        # ports and networks no longer found by complete dumps
+        seen = set()
+        complete = True
+        ports = []
+        port_stats = self.agent.int_br.dump_port_stats()
+        if port_stats is None:
+            complete = False
+            port_stats = {}
+        for vlan, (net_id, vif_ports) in networks.items():
+            for vif_port in vif_ports:
+                counters = port_stats.get(vif_port.ofport)
+                if counters is None:
+                    continue
+                seen.add(vif_port.vif_id)
+                counters = self._delta(vif_port.vif_id, counters)
+                if counters is None:
+                    continue
+                entry = {'port_id': vif_port.vif_id,
+                         'network_id': net_id,
+                         'local_vlan': vlan,
+                         'ofport': vif_port.ofport}
+                entry.update(counters)
+                ports.append(entry)
+
+        flows = []
+        for br, tagging in self._bridges():
+            net_flows = {}
+            br_flows = br.dump_all_flows()
+            if br_flows is None:
+                complete = False
+                br_flows = []
+            for flow in br_flows:
+                vlan = _flow_local_vlan(flow, tagging)
+                if vlan not in networks:
+                    continue
+                count = net_flows.setdefault(vlan, {'flows': 0,
+                                                    'packets': 0,
+                                                    'bytes': 0})
+                count['flows'] += 1
+                count['packets'] += flow.n_packets
+                count['bytes'] += flow.n_bytes
+            for vlan, count in net_flows.items():
+                net_id = networks[vlan][0]
+                key = (net_id, br.br_name)
+                seen.add(key)
+                counters = self._delta(key, {'packets': count['packets'],
+                                             'bytes': count['bytes']})
+                if counters is None:
+                    continue
+                entry = {'network_id': net_id,
+                         'local_vlan': vlan,
+                         'bridge': br.br_name,
+                         'flows': count['flows']}
+                entry.update(counters)
+                flows.append(entry)
+
+        if complete:
+            for key in set(self._last_counters) - seen:
+                del self._last_counters[key]
+        return {'host': cfg.CONF.host,
+                'timestamp': timeutils.strtime(),
+                'delta_only': self.delta_only,
+                'ports': ports,
+                'networks': flows}
+
+    def publish(self):
+        try:
+            stats = self.collect()
+            if not stats or not (stats['ports'] or stats['networks']):
+                return
+            if self._notifier is None:
+                self._notifier = n_rpc.get_notifier('network')
+            LOG.debug(_("Publishing the counters of %(ports)d ports and "
+                        "%(networks)d networks"),
+                      {'ports': len(stats['ports']),
+                       'networks': len(stats['networks'])})
+            self._notifier.info(self.agent.context, EVENT_TYPE, stats)
+        except Exception:
+            LOG.exception(_("Failed publishing the port statistics"))
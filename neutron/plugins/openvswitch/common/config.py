@@ -63,10 +63,6 @@ agent_opts = [
     cfg.IntOpt('polling_interval', default=2,
                help=_("The number of seconds the agent will wait between "
                       "polling for local device changes.")),
-    cfg.BoolOpt('minimize_polling',
-                default=True,
-                help=_("Minimize polling by monitoring ovsdb for interface "
-                       "changes.")),
     cfg.IntOpt('ovsdb_monitor_respawn_interval',
                default=constants.DEFAULT_OVSDBMON_RESPAWN,
                help=_("The number of seconds to wait before respawning the "
@@ -88,6 +84,39 @@ agent_opts = [
                        "outgoing IP packet carrying GRE/VXLAN tunnel")),
     cfg.BoolOpt('enable_distributed_routing', default=False,
                 help=_("Make the l2 agent run in DVR mode ")),
+    cfg.IntOpt('device_chunk_size', default=100,
+               help=_("The maximum number of added or updated devices "
+                      "fetched, wired and reported as a single chunk. The "
+                      "devices of a chunk are reported to the server as "
+                      "soon as they are wired.")),
+    cfg.IntOpt('tunnel_grace_period', default=60,
+               help=_("Seconds during which a tunnel port created for l2 "
+                      "population is kept once no local network uses it, "
+                      "so that it is reused if a network needs it again. "
+                      "Set to 0 to remove the unused tunnel ports at "
+                      "once.")),
+    cfg.BoolOpt('warm_restart', default=False,
+                help=_("Keep the flows, patch ports and local VLANs of the "
+                       "bridges when the agent starts, so that the traffic "
+                       "of the ports is not interrupted. The flows left by "
+                       "the previous run of the agent are deleted once the "
+                       "ports are synchronized.")),
+    cfg.StrOpt('local_vlan_state_file',
+               default='$state_path/local_vlans.json',
+               help=_("File in which the local VLANs of the networks are "
+                      "saved, so that a network keeps its local VLAN when "
+                      "the agent restarts. Set to an empty string to "
+                      "allocate new local VLANs on each start.")),
+    cfg.IntOpt('stats_interval', default=0,
+               help=_("Seconds between two exports of the counters of the "
+                      "ports and networks of the agent in a notification. "
+                      "Each export dumps the ports of the integration "
+                      "bridge and the flows of each bridge once. Set to 0 "
+                      "to disable the export.")),
+    cfg.BoolOpt('stats_delta_only', default=False,
+                help=_("Export the increase of the counters since the "
+                       "previous export, leaving out the ports and networks "
+                       "whose counters did not change.")),
 ]
 
 
@@ -95,3 +124,4 @@ cfg.CONF.register_opts(ovs_opts, "OVS")
 cfg.CONF.register_opts(agent_opts, "AGENT")
 config.register_agent_state_opts_helper(cfg.CONF)
 config.register_root_helper(cfg.CONF)
+config.register_minimize_polling_opts_helper(cfg.CONF)
@@ -86,3 +86,5 @@ cfg.CONF.register_opts(agent_opts, 'AGENT')
 cfg.CONF.register_opts(sriov_nic_opts, 'SRIOV_NIC')
 config.register_agent_state_opts_helper(cfg.CONF)
 config.register_root_helper(cfg.CONF)
+# netlink polling is opt-in for the agents which used to always poll
+config.register_minimize_polling_opts_helper(cfg.CONF, default=False)
@@ -23,6 +23,7 @@ eventlet.monkey_patch()
 
 from oslo.config import cfg
 
+from neutron.agent.linux import polling
 from neutron.agent import rpc as agent_rpc
 from neutron.agent import securitygroups_rpc as sg_rpc
 from neutron.common import config as common_config
@@ -173,26 +174,21 @@ class SriovNicSwitchAgent(sg_rpc.SecurityGroupAgentRpcMixin):
         return (resync_a | resync_b)
 
     def treat_device(self, device, pci_slot, admin_state_up):
+        """Set the state of a device.
+
+        Returns whether the state of the device was set.
+        """
         if self.eswitch_mgr.device_exists(device, pci_slot):
             try:
                 self.eswitch_mgr.set_device_state(device, pci_slot,
                                                   admin_state_up)
             except exc.SriovNicError:
                 LOG.exception(_("Failed to set device %s state"), device)
-                return
-            if admin_state_up:
-                # update plugin about port status
-                self.plugin_rpc.update_device_up(self.context,
-                                                 device,
-                                                 self.agent_id,
-                                                 cfg.CONF.host)
-            else:
-                self.plugin_rpc.update_device_down(self.context,
-                                                   device,
-                                                   self.agent_id,
-                                                   cfg.CONF.host)
+                return False
+            return True
         else:
             LOG.info(_("No device with MAC %s defined on agent."), device)
+            return False
 
     def treat_devices_added_updated(self, devices):
         try:
@@ -205,6 +201,8 @@ class SriovNicSwitchAgent(sg_rpc.SecurityGroupAgentRpcMixin):
             # resync is needed
             return True
 
+        devices_up = []
+        devices_down = []
         for device_details in devices_details_list:
             device = device_details['device']
             LOG.debug("Port with MAC address %s is added", device)
@@ -213,39 +211,50 @@ class SriovNicSwitchAgent(sg_rpc.SecurityGroupAgentRpcMixin):
                 LOG.info(_("Port %(device)s updated. Details: %(details)s"),
                          {'device': device, 'details': device_details})
                 profile = device_details['profile']
-                self.treat_device(device_details['device'],
-                                  profile.get('pci_slot'),
-                                  device_details['admin_state_up'])
+                admin_state_up = device_details['admin_state_up']
+                if self.treat_device(device_details['device'],
+                                     profile.get('pci_slot'),
+                                     admin_state_up):
+                    if admin_state_up:
+                        devices_up.append(device)
+                    else:
+                        devices_down.append(device)
             else:
                 LOG.info(_("Device with MAC %s not defined on plugin"), device)
-        return False
+        # update plugin about the status of the ports at once
+        failed_up = self.plugin_rpc.update_devices_status(
+            self.context, 'up', devices_up, self.agent_id, cfg.CONF.host)[1]
+        failed_down = self.plugin_rpc.update_devices_status(
+            self.context, 'down', devices_down, self.agent_id,
+            cfg.CONF.host)[1]
+        return bool(failed_up or failed_down)
 
     def treat_devices_removed(self, devices):
-        resync = False
         for device in devices:
             LOG.info(_("Removing device with mac_address %s"), device)
-            try:
-                dev_details = self.plugin_rpc.update_device_down(self.context,
-                                                                 device,
-                                                                 self.agent_id,
-                                                                 cfg.CONF.host)
-            except Exception as e:
-                LOG.debug(_("Removing port failed for device %(device)s "
-                          "due to %(exc)s"), {'device': device, 'exc': e})
-                resync = True
-                continue
+        devices_details_list, failed = self.plugin_rpc.update_devices_status(
+            self.context, 'down', devices, self.agent_id, cfg.CONF.host)
+        resync = bool(failed)
+        for dev_details in devices_details_list:
             if dev_details['exists']:
-                LOG.info(_("Port %s updated."), device)
+                LOG.info(_("Port %s updated."), dev_details['device'])
             else:
-                LOG.debug(_("Device %s not defined on plugin"), device)
+                LOG.debug(_("Device %s not defined on plugin"),
+                          dev_details['device'])
         return resync
 
     def daemon_loop(self):
+        LOG.info(_("SRIOV NIC Agent RPC Daemon Started!"))
+        with polling.get_link_polling_manager(
+                cfg.CONF.AGENT.minimize_polling) as pm:
+            self.rpc_loop(polling_manager=pm)
+
+    def rpc_loop(self, polling_manager=None):
+        if not polling_manager:
+            polling_manager = polling.AlwaysPoll()
         sync = True
         devices = set()
 
-        LOG.info(_("SRIOV NIC Agent RPC Daemon Started!"))
-
         while True:
             start = time.time()
             LOG.debug("Agent rpc_loop - iteration:%d started",
@@ -254,33 +263,44 @@ class SriovNicSwitchAgent(sg_rpc.SecurityGroupAgentRpcMixin):
                 LOG.info(_("Agent out of sync with plugin!"))
                 devices.clear()
                 sync = False
+                polling_manager.force_polling()
             device_info = {}
-            # Save updated devices dict to perform rollback in case
-            # resync would be needed, and then clear self.updated_devices.
-            # As the greenthread should not yield between these
-            # two statements, this will should be thread-safe.
-            updated_devices_copy = self.updated_devices
-            self.updated_devices = set()
-            try:
-                device_info = self.scan_devices(devices, updated_devices_copy)
-                if self._device_info_has_changes(device_info):
-                    LOG.debug(_("Agent loop found changes! %s"), device_info)
-                    # If treat devices fails - indicates must resync with
-                    # plugin
-                    sync = self.process_network_devices(device_info)
-                    devices = device_info['current']
-            except Exception:
-                LOG.exception(_("Error in agent loop. Devices info: %s"),
-                              device_info)
-                sync = True
-                # Restore devices that were removed from this set earlier
-                # without overwriting ones that may have arrived since.
-                self.updated_devices |= updated_devices_copy
-
-            # sleep till end of polling interval
+            # The virtual functions are identified by their MAC address,
+            # which is set on the physical function link, so any link
+            # change requires to scan the assigned devices.
+            if self.updated_devices or polling_manager.is_polling_required:
+                polling_manager.get_link_changes()
+                # Save updated devices dict to perform rollback in case
+                # resync would be needed, and then clear self.updated_devices.
+                # As the greenthread should not yield between these
+                # two statements, this will should be thread-safe.
+                updated_devices_copy = self.updated_devices
+                self.updated_devices = set()
+                try:
+                    device_info = self.scan_devices(devices,
+                                                    updated_devices_copy)
+                    if self._device_info_has_changes(device_info):
+                        LOG.debug(_("Agent loop found changes! %s"),
+                                  device_info)
+                        # If treat devices fails - indicates must resync
+                        # with plugin
+                        sync = self.process_network_devices(device_info)
+                        devices = device_info['current']
+                    if not sync:
+                        polling_manager.polling_completed()
+                except Exception:
+                    LOG.exception(_("Error in agent loop. Devices info: %s"),
+                                  device_info)
+                    sync = True
+                    # Restore devices that were removed from this set earlier
+                    # without overwriting ones that may have arrived since.
+                    self.updated_devices |= updated_devices_copy
+
+            # sleep till end of polling interval, or until links change
             elapsed = (time.time() - start)
             if (elapsed < self.polling_interval):
-                time.sleep(self.polling_interval - elapsed)
+                polling_manager.wait_for_updates(
+                    self.polling_interval - elapsed)
             else:
                 LOG.debug(_("Loop iteration exceeded interval "
                             "(%(polling_interval)s vs. %(elapsed)s)!"),
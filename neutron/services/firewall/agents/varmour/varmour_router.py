@@ -53,7 +53,7 @@ class vArmourL3NATAgent(l3_agent.L3NATAgent,
     def _destroy_router_namespaces(self, only_router_id=None):
         return
 
-    def _destroy_router_namespace(self, namespace):
+    def _destroy_router_namespace(self, namespace, devices=None):
         return
 
     def _create_router_namespace(self, ri):
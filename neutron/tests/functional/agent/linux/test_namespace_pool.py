@@ -0,0 +1,71 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of bringing up namespaces serially and with a namespace pool.
+
+Each namespace is created and its loopback device set up, as the agents
+do for their routers and networks.
+"""
+
+import time
+
+from testtools import content
+
+from neutron.agent.linux import ip_lib
+from neutron.agent.linux import namespace_pool
+from neutron.tests.functional.agent.linux import base
+
+NAMESPACES = 500
+NS_PREFIX = 'test-nspool-'
+
+
+class TestNamespacePoolBenchmark(base.BaseLinuxTestCase):
+
+    def setUp(self):
+        super(TestNamespacePoolBenchmark, self).setUp()
+        self.check_sudo_enabled()
+        self.ip = ip_lib.IPWrapper(self.root_helper)
+
+    def _bring_up(self, namespace):
+        self.ip.netns.add(namespace)
+        ip_lib.IPWrapper(self.root_helper, namespace).netns.execute(
+            ['ip', 'link', 'set', 'lo', 'up'])
+
+    def _cleanup(self, namespaces):
+        pool = namespace_pool.NamespacePool()
+        for namespace in namespaces:
+            pool.submit(namespace, self.ip.netns.delete, namespace)
+        pool.waitall()
+
+    def _namespaces(self, name):
+        namespaces = ['%s%s-%d' % (NS_PREFIX, name, i)
+                      for i in range(NAMESPACES)]
+        self.addCleanup(self._cleanup, namespaces)
+        return namespaces
+
+    def test_pool_brings_up_namespaces_faster(self):
+        start = time.time()
+        for namespace in self._namespaces('serial'):
+            self._bring_up(namespace)
+        serial = time.time() - start
+
+        pool = namespace_pool.NamespacePool()
+        start = time.time()
+        namespace_pool.wait_all([pool.submit(ns, self._bring_up, ns)
+                                 for ns in self._namespaces('pool')])
+        pooled = time.time() - start
+
+        self.addDetail('seconds_for_%d_namespaces' % NAMESPACES,
+                       content.text_content('serial: %.1f, pool of %d: %.1f'
+                                            % (serial, pool.size, pooled)))
+        self.assertGreater(serial, pooled)
@@ -0,0 +1,63 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Micro-benchmark of privileged commands run through the root helper daemon
+compared to forking the root helper for each command.
+
+The daemon command is read from OS_ROOTWRAP_DAEMON_CMD, e.g.
+
+  sudo /usr/local/bin/neutron-rootwrap-daemon /etc/neutron/rootwrap.conf
+"""
+
+import os
+import time
+
+from oslo.config import cfg
+from testtools import content
+
+from neutron.agent.common import config
+from neutron.agent.linux import utils
+from neutron.tests.functional.agent.linux import base
+
+ITERATIONS = 100
+
+
+class TestRootwrapDaemon(base.BaseLinuxTestCase):
+
+    def setUp(self):
+        super(TestRootwrapDaemon, self).setUp()
+        self.check_sudo_enabled()
+        self.daemon_cmd = os.environ.get('OS_ROOTWRAP_DAEMON_CMD')
+        if not self.daemon_cmd:
+            self.skipTest('OS_ROOTWRAP_DAEMON_CMD is not set')
+        config.register_root_helper(cfg.CONF)
+
+    def _commands_per_second(self, use_daemon):
+        cmd = ['ip', 'link', 'show', 'lo']
+        self.config(root_helper_daemon=self.daemon_cmd if use_daemon else '',
+                    group='AGENT')
+        # Spawn the daemon outside of the measured loop.
+        utils.execute(cmd, root_helper=self.root_helper)
+        start = time.time()
+        for i in range(ITERATIONS):
+            output = utils.execute(cmd, root_helper=self.root_helper)
+            self.assertIn('lo:', output)
+        return ITERATIONS / (time.time() - start)
+
+    def test_daemon_runs_commands(self):
+        # The rates are only recorded, they depend too much on the host
+        # to be compared reliably.
+        daemon_rate = self._commands_per_second(use_daemon=True)
+        fork_rate = self._commands_per_second(use_daemon=False)
+        self.addDetail('commands_per_second', content.text_content(
+            'daemon: %.1f, fork: %.1f' % (daemon_rate, fork_rate)))
@@ -0,0 +1,293 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""In-memory fakes of Open vSwitch and of the plugin RPC for benchmarks.
+
+The fake switch only replaces the execution of the commands, so that the
+agents run the same ovs_lib code as with a real switch, including the
+building and parsing of the commands, and the commands they would have
+run can be counted.
+"""
+
+import collections
+
+from neutron.agent.linux import ovs_lib
+from neutron.openstack.common import jsonutils
+
+VSCTL = 'ovs-vsctl'
+OFCTL = 'ovs-ofctl'
+
+
+def _split_vsctl_commands(args):
+    """Split the arguments of ovs-vsctl into its commands.
+
+    Options, like --may-exist or --columns, are kept with the command
+    they precede.
+    """
+    commands = [[]]
+    for arg in args:
+        if arg == '--':
+            commands.append([])
+        else:
+            commands[-1].append(arg)
+    return [command for command in commands
+            if [arg for arg in command if not arg.startswith('--')]]
+
+
+def _split_options(command):
+    options = dict(arg[2:].partition('=')[::2] for arg in command
+                   if arg.startswith('--'))
+    return options, [arg for arg in command if not arg.startswith('--')]
+
+
+class FakeOVS(object):
+    """The bridges, ports and flows of a fake Open vSwitch.
+
+    Its execute method stands for utils.execute: every command is recorded
+    in commands as a (tool, args) tuple, and the ovs-vsctl and ovs-ofctl
+    commands used by the agents are run against the fake switch.
+    """
+
+    def __init__(self):
+        self.bridges = collections.OrderedDict()
+        self.interfaces = {}
+        self.flows = {}
+        self.commands = []
+        self._last_ofport = {}
+        self._iface_ids = {}
+
+    def execute(self, cmd, root_helper=None, process_input=None, **kwargs):
+        if cmd[0] == VSCTL:
+            return self.vsctl([arg for arg in cmd[1:]
+                               if not arg.startswith('--timeout=')])
+        if cmd[0] == OFCTL:
+            return self.ofctl(cmd[2], cmd[1], cmd[3:], process_input)
+        self.commands.append((cmd[0], list(cmd[1:])))
+        return ''
+
+    def add_bridge(self, br_name):
+        if br_name not in self.bridges:
+            self.bridges[br_name] = []
+            self.flows[br_name] = ovs_lib.FlowTable()
+
+    def delete_bridge(self, br_name):
+        for port_name in list(self.bridges.get(br_name, [])):
+            self.delete_port(port_name)
+        self.bridges.pop(br_name, None)
+        self.flows.pop(br_name, None)
+
+    def add_port(self, br_name, port_name, external_ids=None):
+        """Add a port, which gets an ofport at once, and return the ofport."""
+        if port_name in self.interfaces:
+            return self.interfaces[port_name]['ofport']
+        self.add_bridge(br_name)
+        ofport = self._last_ofport.get(br_name, 0) + 1
+        self._last_ofport[br_name] = ofport
+        self.bridges[br_name].append(port_name)
+        self.interfaces[port_name] = {'bridge': br_name,
+                                      'ofport': ofport,
+                                      'external_ids': external_ids or {},
+                                      'tag': None}
+        if external_ids and 'iface-id' in external_ids:
+            self._iface_ids[external_ids['iface-id']] = port_name
+        return ofport
+
+    def add_vif_port(self, br_name, port_name, iface_id, mac):
+        return self.add_port(br_name, port_name,
+                             {'iface-id': iface_id, 'attached-mac': mac})
+
+    def delete_port(self, port_name):
+        interface = self.interfaces.pop(port_name, None)
+        if interface:
+            self.bridges[interface['bridge']].remove(port_name)
+            self._iface_ids.pop(interface['external_ids'].get('iface-id'),
+                                None)
+
+    def count_commands(self, tool=None, since=0):
+        return len([cmd for cmd in self.commands[since:]
+                    if tool is None or cmd[0] == tool])
+
+    def vsctl(self, args):
+        self.commands.append((VSCTL, list(args)))
+        json_format = '--format=json' in args
+        return '\n'.join(self._run_vsctl_command(command, json_format)
+                         for command in _split_vsctl_commands(args))
+
+    def _run_vsctl_command(self, command, json_format):
+        options, args = _split_options(command)
+        cmd = args[0]
+        if cmd == 'add-br':
+            self.add_bridge(args[1])
+        elif cmd == 'del-br':
+            self.delete_bridge(args[1])
+        elif cmd == 'list-br':
+            return '\n'.join(self.bridges)
+        elif cmd == 'iface-to-br':
+            interface = self.interfaces.get(args[1])
+            return interface['bridge'] if interface else ''
+        elif cmd == 'add-port':
+            self.add_port(args[1], args[2])
+        elif cmd == 'del-port':
+            self.delete_port(args[2])
+        elif cmd == 'list-ports':
+            return '\n'.join(self.bridges.get(args[1], []))
+        elif cmd == 'set' and args[1] == 'Port' and args[2] in self.interfaces:
+            for column in args[3:]:
+                name, _sep, value = column.partition('=')
+                if name == 'tag':
+                    self.interfaces[args[2]]['tag'] = int(value)
+        elif cmd == 'clear' and args[1] == 'Port' and args[3] == 'tag':
+            if args[2] in self.interfaces:
+                self.interfaces[args[2]]['tag'] = None
+        elif cmd == 'get' and args[1] == 'Interface':
+            interface = self.interfaces.get(args[2])
+            if interface and args[3] == 'ofport':
+                return str(interface['ofport'])
+            if interface and args[3] == 'external_ids':
+                return '{%s}' % ', '.join(
+                    '%s="%s"' % item
+                    for item in interface['external_ids'].items())
+            return '[]'
+        elif cmd in ('list', 'find') and json_format:
+            return self._list(options['columns'].split(','), args[2:])
+        return ''
+
+    def _list(self, columns, conditions):
+        names = None
+        for condition in conditions:
+            if condition.startswith('external_ids:iface-id='):
+                iface_id = condition.split('=', 1)[1].strip('"')
+                names = [name for name in [self._iface_ids.get(iface_id)]
+                         if name]
+        if names is None:
+            names = sorted(self.interfaces)
+        data = []
+        for name in names:
+            interface = self.interfaces[name]
+            row = []
+            for column in columns:
+                if column == 'name':
+                    row.append(name)
+                elif column == 'external_ids':
+                    row.append(['map',
+                                sorted(interface['external_ids'].items())])
+                elif interface[column] is None:
+                    row.append(['set', []])
+                else:
+                    row.append(interface[column])
+            data.append(row)
+        return jsonutils.dumps({'headings': columns, 'data': data})
+
+    def ofctl(self, br_name, cmd, args, process_input=None):
+        self.commands.append((OFCTL, [cmd, br_name] + list(args)))
+        flows = self.flows.setdefault(br_name, ovs_lib.FlowTable())
+        strict = '--strict' in args
+        args = [arg for arg in args if arg != '--strict']
+        if args == ['-']:
+            lines = process_input.splitlines()
+        else:
+            lines = args
+        if cmd == 'dump-flows':
+            table = lines and ovs_lib.Flow(lines[0]).table
+            return '\n'.join(['NXST_FLOW reply (xid=0x4):'] +
+                             [' %s' % flow for flow in flows
+                              if table is None or flow.table == table])
+        for line in lines:
+            flow = ovs_lib.Flow(line)
+            if cmd in ('add-flow', 'add-flows'):
+                flows.add(flow)
+            elif cmd == 'mod-flows':
+                flows.modify(flow)
+            elif cmd == 'del-flows' and strict:
+                flows.flows.pop(flow.key, None)
+            elif cmd == 'del-flows':
+                flows.delete(flow)
+        if cmd == 'del-flows' and not lines:
+            flows.clear()
+        return ''
+
+
+class FakeOVSPluginApi(object):
+    """Answers the RPC calls of the OVS agent like a plugin would.
+
+    The details of the ports known to the plugin are kept in ports, and
+    the number of calls of each method in calls.
+    """
+
+    def __init__(self, tunnels=None):
+        self.ports = {}
+        self.tunnels = tunnels or []
+        self.devices_up = set()
+        self.calls = collections.Counter()
+
+    def add_port(self, device, network_id, network_type, segmentation_id,
+                 physical_network=None, admin_state_up=True):
+        self.ports[device] = {'device': device,
+                              'port_id': device,
+                              'network_id': network_id,
+                              'network_type': network_type,
+                              'physical_network': physical_network,
+                              'segmentation_id': segmentation_id,
+                              'admin_state_up': admin_state_up,
+                              'fixed_ips': [],
+                              'device_owner': 'compute:None'}
+
+    def count_calls(self):
+        return sum(self.calls.values())
+
+    def get_device_details(self, context, device, agent_id, host=None):
+        self.calls['get_device_details'] += 1
+        return self.ports.get(device, {'device': device})
+
+    def get_devices_details_list(self, context, devices, agent_id,
+                                 host=None):
+        self.calls['get_devices_details_list'] += 1
+        return [self.ports.get(device, {'device': device})
+                for device in devices]
+
+    def update_devices_up(self, context, devices, agent_id, host=None):
+        self.calls['update_devices_up'] += 1
+        self.devices_up.update(devices)
+        return [{'device': device, 'exists': device in self.ports}
+                for device in devices]
+
+    def update_devices_down(self, context, devices, agent_id, host=None):
+        self.calls['update_devices_down'] += 1
+        self.devices_up.difference_update(devices)
+        return [{'device': device, 'exists': device in self.ports}
+                for device in devices]
+
+    def update_devices_status(self, context, status, devices, agent_id,
+                              host=None):
+        # not an RPC call, the updates are counted by status
+        if not devices:
+            return [], []
+        update = getattr(self, 'update_devices_%s' % status)
+        return update(context, devices, agent_id, host), []
+
+    def tunnel_sync(self, context, tunnel_ip, tunnel_type=None):
+        self.calls['tunnel_sync'] += 1
+        return {'tunnels': self.tunnels}
+
+    def _security_group_devices(self, devices):
+        return dict((device, {'device': device, 'security_groups': [],
+                              'security_group_rules': []})
+                    for device in devices)
+
+    def security_group_rules_for_devices(self, context, devices):
+        self.calls['security_group_rules_for_devices'] += 1
+        return self._security_group_devices(devices)
+
+    def security_group_info_for_devices(self, context, devices):
+        self.calls['security_group_info_for_devices'] += 1
+        return {'devices': self._security_group_devices(devices),
+                'sg_member_ips': {}}
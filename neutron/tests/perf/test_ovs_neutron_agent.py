@@ -0,0 +1,160 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Benchmark of the OVS agent wiring ports at scale.
+
+The rpc_loop of the agent is run against a fake Open vSwitch and a fake
+plugin: the first iteration wires all the ports found on the integration
+bridge and the second one finds nothing to do. For each scale the ports
+wired per second, the ovs-vsctl and ovs-ofctl commands and RPC calls
+issued per port and the latency of the iterations are attached to the
+test results.
+"""
+
+import collections
+import time
+
+import mock
+from oslo.config import cfg
+from testtools import content
+
+from neutron.agent.linux import polling
+from neutron.agent.linux import utils
+from neutron.agent import rpc as agent_rpc
+from neutron.plugins.common import constants as p_const
+from neutron.plugins.openvswitch.agent import ovs_neutron_agent
+from neutron.tests import base
+from neutron.tests.perf import fakes
+
+PORTS_PER_NETWORK = 10
+TUNNEL_PEERS = 10
+LOCAL_IP = '10.0.0.1'
+
+IterationStats = collections.namedtuple(
+    'IterationStats', ['seconds', 'vsctl', 'ofctl', 'rpc_calls'])
+
+
+class BenchmarkPollingManager(polling.AlwaysPoll):
+    """Polls at each iteration and measures the processing of the ports.
+
+    The rpc_loop of the agent is stopped after the given number of
+    iterations.
+    """
+
+    def __init__(self, agent, ovs, plugin, iterations):
+        super(BenchmarkPollingManager, self).__init__()
+        self.agent = agent
+        self.ovs = ovs
+        self.plugin = plugin
+        self.iterations = iterations
+        self.started = 0
+        self._start = None
+        # IterationStats of each completed iteration
+        self.stats = []
+
+    @property
+    def is_polling_required(self):
+        self.started += 1
+        if self.started >= self.iterations:
+            self.agent.run_daemon_loop = False
+        self._start = (time.time(), len(self.ovs.commands),
+                       self.plugin.count_calls())
+        return True
+
+    def polling_completed(self):
+        super(BenchmarkPollingManager, self).polling_completed()
+        start, commands, calls = self._start
+        self.stats.append(IterationStats(
+            time.time() - start,
+            self.ovs.count_commands(fakes.VSCTL, since=commands),
+            self.ovs.count_commands(fakes.OFCTL, since=commands),
+            self.plugin.count_calls() - calls))
+
+
+class TestOVSAgentBenchmark(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOVSAgentBenchmark, self).setUp()
+        cfg.CONF.set_override('rpc_backend',
+                              'neutron.openstack.common.rpc.impl_fake')
+        cfg.CONF.set_override('firewall_driver',
+                              'neutron.agent.firewall.NoopFirewallDriver',
+                              group='SECURITYGROUP')
+        cfg.CONF.set_override('report_interval', 0, group='AGENT')
+        cfg.CONF.set_override('tunnel_types', [p_const.TYPE_VXLAN],
+                              group='AGENT')
+        cfg.CONF.set_override('local_ip', LOCAL_IP, group='OVS')
+        self.ovs = fakes.FakeOVS()
+        self.plugin = fakes.FakeOVSPluginApi(
+            tunnels=[{'ip_address': '10.0.1.%d' % i}
+                     for i in range(1, TUNNEL_PEERS + 1)])
+        mock.patch.object(utils, 'execute', new=self.ovs.execute).start()
+        mock.patch.object(ovs_neutron_agent, 'OVSPluginApi',
+                          return_value=self.plugin).start()
+        mock.patch.object(agent_rpc, 'PluginReportStateAPI').start()
+        mock.patch.object(agent_rpc, 'create_consumers').start()
+        kwargs = ovs_neutron_agent.create_agent_config_map(cfg.CONF)
+        kwargs['polling_interval'] = 0
+        self.agent = ovs_neutron_agent.OVSNeutronAgent(**kwargs)
+
+    def _add_ports(self, ports):
+        for i in range(ports):
+            device = 'port-%d' % i
+            self.ovs.add_vif_port(self.agent.int_br.br_name, 'tap%d' % i,
+                                 device, 'fa:16:3e:%02x:%02x:%02x' % (
+                                     i >> 16, (i >> 8) & 0xff, i & 0xff))
+            network = i // PORTS_PER_NETWORK
+            self.plugin.add_port(device, 'net-%d' % network,
+                                 p_const.TYPE_VXLAN, network + 1)
+
+    def _run_benchmark(self, ports):
+        self._add_ports(ports)
+        pm = BenchmarkPollingManager(self.agent, self.ovs, self.plugin, 2)
+        self.agent.rpc_loop(polling_manager=pm)
+
+        self.assertEqual(2, len(pm.stats))
+        self.assertEqual(set(self.plugin.ports), self.plugin.devices_up)
+        self.assertTrue(all(self.ovs.interfaces['tap%d' % i]['tag']
+                            for i in range(ports)))
+        wiring, idle = pm.stats
+        ports = float(ports)
+        self.addDetail('ports_wired_per_second',
+                       content.text_content('%.1f' % (ports / wiring.seconds)))
+        self.addDetail('commands_per_port',
+                       content.text_content(
+                           'ovs-vsctl: %.3f, ovs-ofctl: %.3f' % (
+                               wiring.vsctl / ports, wiring.ofctl / ports)))
+        self.addDetail('rpc_calls_per_port',
+                       content.text_content(
+                           '%.3f' % (wiring.rpc_calls / ports)))
+        self.addDetail('iteration_seconds',
+                       content.text_content(
+                           'wiring: %.3f, idle: %.3f' % (wiring.seconds,
+                                                         idle.seconds)))
+        self.addDetail('idle_iteration_commands',
+                       content.text_content(
+                           'ovs-vsctl: %d, ovs-ofctl: %d' % (idle.vsctl,
+                                                             idle.ofctl)))
+        self.addDetail('stage_seconds',
+                       content.text_content(', '.join(
+                           '%s: %.3f' % item for item in
+                           sorted(self.agent.stage_timings.items()))))
+
+    def test_100_ports(self):
+        self._run_benchmark(100)
+
+    def test_1000_ports(self):
+        self._run_benchmark(1000)
+
+    def test_10000_ports(self):
+        self._run_benchmark(10000)
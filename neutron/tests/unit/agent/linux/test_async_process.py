@@ -117,6 +117,24 @@ class TestAsyncProcess(base.BaseTestCase):
     def test__read_returns_none_for_missing_output(self):
         self._test_read_output_queues_and_returns_result('')
 
+    def test_construtor_raises_exception_for_invalid_max_queue_size(self):
+        with testtools.ExpectedException(ValueError):
+            async_process.AsyncProcess(['fakecmd'], max_queue_size=0)
+
+    def test__read_drops_output_when_queue_is_full(self):
+        proc = async_process.AsyncProcess(['fakecmd'], max_queue_size=1)
+        mock_stream = mock.Mock()
+        mock_stream.readline.side_effect = ['foo', 'bar']
+        with mock.patch.object(proc, '_handle_overflow') as handle_overflow:
+            proc._read(mock_stream, proc._stdout_lines)
+            self.assertEqual('bar', proc._read(mock_stream,
+                                               proc._stdout_lines))
+        handle_overflow.assert_called_once_with()
+        self.assertEqual(['foo'], list(proc.iter_stdout()))
+        self.assertEqual({'stdout_queue_depth': 0,
+                          'stderr_queue_depth': 0,
+                          'dropped_lines': 1}, proc.get_stats())
+
     def test_start_raises_exception_if_process_already_started(self):
         self.proc._kill_event = True
         with testtools.ExpectedException(async_process.AsyncProcessException):
@@ -0,0 +1,91 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ipset_manager
+from neutron.tests import base
+
+SG_ID = 'fake_sgid'
+SET_NAME = 'IPv4fake_sgid'
+TMP_SET_NAME = 'IPv4fake_sgid-new'
+
+
+class IpsetManagerTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IpsetManagerTestCase, self).setUp()
+        self.root_helper = 'sudo'
+        self.execute = mock.Mock()
+        self.ipset = ipset_manager.IpsetManager(execute=self.execute,
+                                                root_helper=self.root_helper)
+
+    def expect_restore(self, lines):
+        return mock.call(['ipset', 'restore', '-exist'],
+                         process_input='\n'.join(lines) + '\n',
+                         root_helper=self.root_helper)
+
+    def test_get_set_name_is_truncated(self):
+        name = ipset_manager.get_set_name('a' * 36, 'IPv6')
+        self.assertEqual(ipset_manager.MAX_SET_NAME_LENGTH, len(name))
+        self.assertTrue(name.startswith('IPv6a'))
+
+    def test_set_members_new_set_is_swapped_in(self):
+        self.ipset.set_members(SG_ID, 'IPv4', ['10.0.0.2', '10.0.0.1'])
+        self.assertEqual(
+            [self.expect_restore(
+                ['create %s hash:net family inet' % SET_NAME,
+                 'create %s hash:net family inet' % TMP_SET_NAME,
+                 'flush %s' % TMP_SET_NAME,
+                 'add %s 10.0.0.1' % TMP_SET_NAME,
+                 'add %s 10.0.0.2' % TMP_SET_NAME,
+                 'swap %s %s' % (TMP_SET_NAME, SET_NAME),
+                 'destroy %s' % TMP_SET_NAME])],
+            self.execute.mock_calls)
+        self.assertTrue(self.ipset.set_exists(SG_ID, 'IPv4'))
+        self.assertFalse(self.ipset.set_exists(SG_ID, 'IPv6'))
+
+    def test_set_members_only_changes_difference(self):
+        self.ipset.set_members(SG_ID, 'IPv4', ['10.0.0.1', '10.0.0.2'])
+        self.execute.reset_mock()
+        self.ipset.set_members(SG_ID, 'IPv4', ['10.0.0.2', '10.0.0.3'])
+        self.assertEqual(
+            [self.expect_restore(['add %s 10.0.0.3' % SET_NAME,
+                                  'del %s 10.0.0.1' % SET_NAME])],
+            self.execute.mock_calls)
+
+    def test_set_members_unchanged_runs_nothing(self):
+        self.ipset.set_members(SG_ID, 'IPv4', ['10.0.0.1'])
+        self.execute.reset_mock()
+        self.ipset.set_members(SG_ID, 'IPv4', ['10.0.0.1'])
+        self.assertFalse(self.execute.called)
+
+    def test_destroy_set(self):
+        self.ipset.set_members(SG_ID, 'IPv4', [])
+        self.execute.reset_mock()
+        self.ipset.destroy_set(SET_NAME)
+        self.execute.assert_called_once_with(
+            ['ipset', 'destroy', SET_NAME], process_input=None,
+            root_helper=self.root_helper)
+        self.assertEqual(set(), self.ipset.set_names())
+
+    def test_destroy_unknown_set_runs_nothing(self):
+        self.ipset.destroy_set(SET_NAME)
+        self.assertFalse(self.execute.called)
+
+    def test_namespace(self):
+        self.ipset.namespace = 'qrouter'
+        self.ipset.sets[SET_NAME] = set()
+        self.ipset.destroy_set(SET_NAME)
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'qrouter', 'ipset', 'destroy', SET_NAME],
+            process_input=None, root_helper=self.root_helper)
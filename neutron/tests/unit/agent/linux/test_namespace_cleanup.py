@@ -0,0 +1,104 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+from oslo.config import cfg
+
+from neutron.agent.linux import ip_lib
+from neutron.agent.linux import namespace_cleanup
+from neutron.agent.linux import netlink_lib
+from neutron.tests import base
+
+
+class FakeDevice(object):
+    def __init__(self, name):
+        self.name = name
+
+
+class TestNamespaceCleaner(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestNamespaceCleaner, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        self.ip_cls = mock.patch.object(ip_lib, 'IPWrapper').start()
+        self.devices = {'ns1': [FakeDevice('qr-1'), FakeDevice('qg-1')],
+                        'ns2': []}
+
+        def ip_wrapper(root_helper, namespace):
+            ip = mock.Mock()
+            if namespace in self.devices:
+                ip.get_devices.return_value = self.devices[namespace]
+            else:
+                ip.get_devices.side_effect = RuntimeError()
+            return ip
+
+        self.ip_cls.side_effect = ip_wrapper
+        self.cleaner = namespace_cleanup.NamespaceCleaner('sudo', 4)
+
+    def test_list_devices(self):
+        self.assertEqual({'ns1': ['qr-1', 'qg-1'], 'ns2': [], 'gone': None},
+                         self.cleaner.list_devices(['ns1', 'ns2', 'gone']))
+        self.assertEqual([mock.call('sudo', ns)
+                          for ns in ('gone', 'ns1', 'ns2')],
+                         sorted(self.ip_cls.call_args_list))
+
+    def test_list_devices_in_bulk_with_netlink(self):
+        cfg.CONF.set_override('ip_lib_backend', ip_lib.NETLINK_BACKEND)
+
+        def links(*names):
+            return {netlink_lib.LINKS: [{'name': name} for name in names]}
+
+        with mock.patch.object(netlink_lib, 'dump_all') as dump_all:
+            dump_all.return_value = {'ns1': links('lo', 'qr-1'),
+                                     'ns2': links('lo'),
+                                     'other': links('lo', 'tap1')}
+            self.assertEqual({'ns1': ['qr-1'], 'ns2': []},
+                             self.cleaner.list_devices(['ns1', 'ns2']))
+        dump_all.assert_called_once_with((netlink_lib.LINKS,), 'sudo')
+        self.assertFalse(self.ip_cls.called)
+
+    def test_cleanup(self):
+        destroyed = []
+
+        def destroy(ns, devices):
+            destroyed.append((ns, devices))
+            if ns == 'ns2':
+                raise RuntimeError()
+
+        with mock.patch.object(namespace_cleanup.LOG,
+                               'exception') as log_exception:
+            failed = self.cleaner.cleanup(['ns1', 'ns2', 'gone'], destroy)
+        self.assertEqual(['ns2'], failed)
+        self.assertEqual(1, log_exception.call_count)
+        self.assertEqual([('gone', None), ('ns1', ['qr-1', 'qg-1']),
+                          ('ns2', [])],
+                         sorted(destroyed))
+
+    def test_cleanup_skips_namespaces_in_use(self):
+        destroy = mock.Mock()
+        self.cleaner.cleanup(['ns1', 'ns2'], destroy,
+                             skip=lambda ns: ns == 'ns1')
+        destroy.assert_called_once_with('ns2', [])
+
+    def test_cleanup_with_listed_devices(self):
+        destroy = mock.Mock()
+        self.cleaner.cleanup(['ns1', 'gone'], destroy,
+                             devices={'ns1': ['qr-1'], 'ns2': []})
+        destroy.assert_called_once_with('ns1', ['qr-1'])
+        self.assertFalse(self.ip_cls.called)
+
+    def test_cleanup_in_background(self):
+        destroy = mock.Mock()
+        thread = self.cleaner.cleanup_in_background(['ns1'], destroy)
+        self.assertFalse(destroy.called)
+        self.assertEqual([], thread.wait())
+        destroy.assert_called_once_with('ns1', ['qr-1', 'qg-1'])
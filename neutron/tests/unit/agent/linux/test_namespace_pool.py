@@ -0,0 +1,83 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import eventlet
+import mock
+
+from neutron.agent.linux import namespace_pool
+from neutron.tests import base
+
+
+class TestNamespacePool(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestNamespacePool, self).setUp()
+        self.pool = namespace_pool.NamespacePool(size=4)
+        self.calls = []
+
+    def _operation(self, namespace, value):
+        self.calls.append(('start', namespace, value))
+        eventlet.sleep(0)
+        self.calls.append(('end', namespace, value))
+        return value
+
+    def test_operations_of_a_namespace_run_in_order(self):
+        events = [self.pool.submit('ns1', self._operation, 'ns1', i)
+                  for i in range(3)]
+        self.assertEqual([0, 1, 2], namespace_pool.wait_all(events))
+        self.assertEqual([('start', 'ns1', 0), ('end', 'ns1', 0),
+                          ('start', 'ns1', 1), ('end', 'ns1', 1),
+                          ('start', 'ns1', 2), ('end', 'ns1', 2)],
+                         self.calls)
+
+    def test_namespaces_run_concurrently(self):
+        events = [self.pool.submit(ns, self._operation, ns, 0)
+                  for ns in ('ns1', 'ns2')]
+        namespace_pool.wait_all(events)
+        self.assertEqual([('start', 'ns1', 0), ('start', 'ns2', 0)],
+                         self.calls[:2])
+
+    def test_pool_is_bounded(self):
+        running = []
+
+        def operation():
+            running.append(len(self.pool._pool.coroutines_running))
+            eventlet.sleep(0)
+
+        for i in range(10):
+            self.pool.submit('ns%d' % i, operation)
+        self.pool.waitall()
+        self.assertEqual(10, len(running))
+        self.assertTrue(max(running) <= 4)
+
+    def test_failure_is_raised_by_wait(self):
+        def fail():
+            raise RuntimeError()
+
+        failed = self.pool.submit('ns1', fail)
+        done = self.pool.submit('ns1', self._operation, 'ns1', 1)
+        self.assertRaises(RuntimeError, failed.wait)
+        self.assertEqual(1, done.wait())
+        self.assertRaises(RuntimeError, namespace_pool.wait_all,
+                          [failed, done])
+
+    def test_execute(self):
+        with mock.patch('neutron.agent.linux.ip_lib.IPWrapper') as ip_cls:
+            ip = ip_cls.return_value
+            ip.netns.execute.side_effect = ['out1', 'out2']
+            done = self.pool.execute('ns1', [['ip', 'a'], ['ip', 'r']],
+                                     root_helper='sudo')
+            self.assertEqual(['out1', 'out2'], done.wait())
+        ip_cls.assert_called_once_with('sudo', 'ns1')
+        ip.netns.execute.assert_has_calls([
+            mock.call(['ip', 'a'], check_exit_code=True),
+            mock.call(['ip', 'r'], check_exit_code=True)])
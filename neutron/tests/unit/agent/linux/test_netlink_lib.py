@@ -0,0 +1,191 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import socket
+import struct
+
+import mock
+
+from neutron.agent.linux import netlink_lib
+from neutron.tests import base
+
+
+def _attr(attr_type, value):
+    length = netlink_lib.RTATTR.size + len(value)
+    padding = '\0' * (netlink_lib._align(length) - length)
+    return netlink_lib.RTATTR.pack(length, attr_type) + value + padding
+
+
+def _message(msg_type, payload=''):
+    return netlink_lib.NLMSGHDR.pack(netlink_lib.NLMSGHDR.size + len(payload),
+                                     msg_type, 0, 1, 0) + payload
+
+
+def _uint32(value):
+    return struct.pack('=I', value)
+
+
+LINK = _message(
+    netlink_lib.RTM_NEWLINK,
+    netlink_lib.IFINFOMSG.pack(socket.AF_UNSPEC, 1, 2, 0, 0) +
+    _attr(netlink_lib.IFLA_IFNAME, 'qr-1\0') +
+    _attr(netlink_lib.IFLA_ADDRESS, '\xcc\xdd\xee\xff\xab\xcd') +
+    _attr(netlink_lib.IFLA_MTU, _uint32(1500)) +
+    _attr(netlink_lib.IFLA_QDISC, 'mq\0') +
+    _attr(netlink_lib.IFLA_OPERSTATE, '\x06'))
+
+ADDRESS = _message(
+    netlink_lib.RTM_NEWADDR,
+    netlink_lib.IFADDRMSG.pack(socket.AF_INET, 24, 0x80, 0, 2) +
+    _attr(netlink_lib.IFA_ADDRESS, socket.inet_aton('10.0.0.1')) +
+    _attr(netlink_lib.IFA_LOCAL, socket.inet_aton('10.0.0.1')))
+
+ROUTE = _message(
+    netlink_lib.RTM_NEWROUTE,
+    netlink_lib.RTMSG.pack(socket.AF_INET, 0, 0, 0, 254, 0, 0, 1, 0) +
+    _attr(netlink_lib.RTA_GATEWAY, socket.inet_aton('10.0.0.254')) +
+    _attr(netlink_lib.RTA_OIF, _uint32(2)))
+
+DONE = _message(netlink_lib.NLMSG_DONE, _uint32(0))
+
+
+class TestParseMessages(base.BaseTestCase):
+
+    def _parse(self, data, table):
+        request_type, reply_type, header, parser = netlink_lib._DUMPS[table]
+        return netlink_lib.parse_messages(data, reply_type, parser)
+
+    def test_parse_link(self):
+        entries, done = self._parse(LINK + DONE, netlink_lib.LINKS)
+        self.assertTrue(done)
+        self.assertEqual([{'index': 2,
+                           'name': 'qr-1',
+                           'link_type': 'ether',
+                           'address': 'cc:dd:ee:ff:ab:cd',
+                           'broadcast': None,
+                           'mtu': 1500,
+                           'qdisc': 'mq',
+                           'qlen': None,
+                           'state': 'UP',
+                           'alias': None}], entries)
+
+    def test_parse_address(self):
+        entries, done = self._parse(ADDRESS, netlink_lib.ADDRESSES)
+        self.assertFalse(done)
+        self.assertEqual([{'index': 2,
+                           'cidr': '10.0.0.1/24',
+                           'broadcast': '10.0.0.255',
+                           'scope': 'global',
+                           'ip_version': 4,
+                           'dynamic': False,
+                           'label': ''}], entries)
+
+    def test_parse_route(self):
+        entries, done = self._parse(ROUTE + DONE, netlink_lib.ROUTES)
+        self.assertEqual([{'ip_version': 4,
+                           'dst': 'default',
+                           'table': 254,
+                           'scope': 'global',
+                           'oif': 2,
+                           'gateway': '10.0.0.254',
+                           'metric': None}], entries)
+
+    def test_parse_link_events(self):
+        deleted = LINK[:4] + struct.pack('=H', netlink_lib.RTM_DELLINK) + \
+            LINK[6:]
+        events = netlink_lib.parse_link_events(LINK + ADDRESS + deleted)
+        self.assertEqual([(True, 'qr-1'), (False, 'qr-1')],
+                         [(created, link['name'])
+                          for created, link in events])
+
+    def test_parse_error(self):
+        error = _message(netlink_lib.NLMSG_ERROR, struct.pack('=i', -1))
+        self.assertRaises(RuntimeError, self._parse, error,
+                          netlink_lib.LINKS)
+
+
+class TestNetlinkSocket(base.BaseTestCase):
+
+    def test_dump_reads_until_done(self):
+        with mock.patch('socket.socket') as sock_cls:
+            sock = sock_cls.return_value
+            sock.recv.side_effect = [LINK, LINK + DONE]
+            links = netlink_lib.NetlinkSocket().dump(netlink_lib.LINKS)
+        self.assertEqual(2, len(links))
+        request = sock.sendall.call_args[0][0]
+        length, msg_type, flags, seq, pid = (
+            netlink_lib.NLMSGHDR.unpack_from(request))
+        self.assertEqual(len(request), length)
+        self.assertEqual(netlink_lib.RTM_GETLINK, msg_type)
+        self.assertEqual(netlink_lib.NLM_F_REQUEST | netlink_lib.NLM_F_DUMP,
+                         flags)
+
+
+class TestDump(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestDump, self).setUp()
+        self.execute = mock.patch.object(netlink_lib.utils,
+                                         'execute').start()
+        self.dump_tables = mock.patch.object(netlink_lib,
+                                             'dump_tables').start()
+        self.geteuid = mock.patch('os.geteuid').start()
+        self.geteuid.return_value = 1000
+
+    def test_dump_own_namespace_in_process(self):
+        netlink_lib.dump((netlink_lib.LINKS,), root_helper='sudo')
+        self.dump_tables.assert_called_once_with((netlink_lib.LINKS,), None)
+        self.assertFalse(self.execute.called)
+
+    def test_dump_namespace_as_root_in_process(self):
+        self.geteuid.return_value = 0
+        netlink_lib.dump((netlink_lib.LINKS,), 'ns', 'sudo')
+        self.dump_tables.assert_called_once_with((netlink_lib.LINKS,), 'ns')
+        self.assertFalse(self.execute.called)
+
+    def test_dump_namespace_runs_helper(self):
+        self.execute.return_value = '{"links": []}'
+        tables = netlink_lib.dump((netlink_lib.LINKS, netlink_lib.ROUTES),
+                                  'ns', 'sudo')
+        self.assertEqual({'links': []}, tables)
+        self.execute.assert_called_once_with(
+            ['neutron-netlink-dump', 'ns', 'links', 'routes'],
+            root_helper='sudo')
+        self.assertFalse(self.dump_tables.called)
+
+    def test_helper_rejects_paths(self):
+        with mock.patch('sys.argv', ['neutron-netlink-dump', '../ns']):
+            self.assertRaises(SystemExit, netlink_lib.main)
+        self.assertFalse(self.dump_tables.called)
+
+    def test_dump_all_runs_helper_once(self):
+        self.execute.return_value = '{"ns1": {"links": []}}'
+        tables = netlink_lib.dump_all((netlink_lib.LINKS,), 'sudo')
+        self.assertEqual({'ns1': {'links': []}}, tables)
+        self.execute.assert_called_once_with(
+            ['neutron-netlink-dump', '--all', 'links'], root_helper='sudo')
+        self.assertFalse(self.dump_tables.called)
+
+    def test_dump_all_tables_skips_deleted_namespaces(self):
+        self.dump_tables.side_effect = [{'links': []}, IOError(),
+                                        {'links': []}]
+        with mock.patch('os.listdir', return_value=['ns1', 'ns2', 'ns3']):
+            tables = netlink_lib.dump_all_tables((netlink_lib.LINKS,))
+        self.assertEqual({'ns1': {'links': []}, 'ns3': {'links': []}},
+                         tables)
+        self.dump_tables.assert_has_calls(
+            [mock.call((netlink_lib.LINKS,), ns)
+             for ns in ('ns1', 'ns2', 'ns3')])
+
+    def test_dump_all_tables_without_namespaces(self):
+        with mock.patch('os.listdir', side_effect=OSError()):
+            self.assertEqual({}, netlink_lib.dump_all_tables())
@@ -18,6 +18,7 @@ from oslo.config import cfg
 import testtools
 
 from neutron.agent.linux import ovs_lib
+from neutron.agent.linux import ovsdb_client
 from neutron.agent.linux import utils
 from neutron.common import exceptions
 from neutron.openstack.common import jsonutils
@@ -26,6 +27,7 @@ from neutron.plugins.common import constants as p_const
 from neutron.plugins.openvswitch.common import constants as const
 from neutron.tests import base
 from neutron.tests import tools
+from neutron.tests.unit.agent.linux import test_ovsdb_client
 
 try:
     OrderedDict = collections.OrderedDict
@@ -494,6 +496,183 @@ class OVS_Lib_Test(base.BaseTestCase):
             mock.call('mod-flows', ['-'], 'modified_flow_2\n')
         ])
 
+    def _dump_flows(self, *flows):
+        return '\n'.join(['NXST_FLOW reply (xid=0x4):'] +
+                         [' cookie=%s, duration=1.2s, table=%s, n_packets=0, '
+                          'n_bytes=0, idle_age=1, %s' % flow
+                          for flow in flows]) + '\n'
+
+    def test_flow_parsing(self):
+        dumped = ovs_lib.Flow(' cookie=0x1, duration=1.2s, table=2, '
+                              'n_packets=0, n_bytes=0, idle_age=1, '
+                              'priority=1,arp,tun_id=0x5 '
+                              'actions=mod_vlan_vid:1,NORMAL')
+        built = ovs_lib.Flow('hard_timeout=0,idle_timeout=0,priority=1,'
+                             'table=2,arp,tun_id=5,'
+                             'actions=mod_vlan_vid:1,normal')
+        self.assertEqual(1, dumped.cookie)
+        self.assertEqual(built.key, dumped.key)
+        self.assertEqual(built.normalized_actions, dumped.normalized_actions)
+        self.assertEqual('table=2,priority=1,arp,tun_id=0x5',
+                         dumped.match_str())
+        self.assertTrue(ovs_lib.Flow('table=2,arp').covers(dumped))
+        self.assertFalse(ovs_lib.Flow('table=3').covers(dumped))
+        self.assertFalse(ovs_lib.Flow('in_port=1').covers(dumped))
+
+    def test_flow_match_normalizes_protocols(self):
+        def match(flow_str):
+            return ovs_lib.Flow(flow_str).normalized_match
+
+        self.assertEqual(match('dl_type=0x0806,nw_dst=10.0.0.1'),
+                         match('arp,arp_tpa=10.0.0.1'))
+        self.assertEqual(match('eth_type=0x0800'), match('ip'))
+        self.assertEqual(match('dl_type=0x86dd,nw_proto=58'),
+                         match('icmp6'))
+        self.assertEqual(match('ip,ip_proto=17,tp_dst=67'),
+                         match('udp,tp_dst=67'))
+        self.assertEqual(match('tunnel_id=0x5'), match('tun_id=5'))
+        self.assertNotEqual(match('tcp'), match('tcp6'))
+        self.assertNotEqual(match('ip,nw_dst=10.0.0.1'),
+                            match('arp,arp_tpa=10.0.0.1'))
+        self.assertTrue(ovs_lib.Flow('ip').covers(
+            ovs_lib.Flow('tcp,tp_dst=80')))
+        self.assertFalse(ovs_lib.Flow('udp').covers(
+            ovs_lib.Flow('tcp,tp_dst=80')))
+
+    def test_diff_flows_ignores_equivalent_matches(self):
+        desired = ovs_lib.Flow('cookie=0x1,priority=1,'
+                               'dl_type=0x0806,nw_dst=10.0.0.1,'
+                               'actions=normal')
+        installed = ovs_lib.Flow(' cookie=0x1, duration=1.2s, table=0, '
+                                 'n_packets=0, n_bytes=0, idle_age=1, '
+                                 'priority=1,arp,arp_tpa=10.0.0.1 '
+                                 'actions=NORMAL')
+        self.assertEqual(([], [], []),
+                         ovs_lib.diff_flows([desired], [installed], 0x1))
+
+    def test_flow_parsing_keeps_statistics(self):
+        dumped = ovs_lib.Flow(' cookie=0x1, duration=1.2s, table=2, '
+                              'n_packets=7, n_bytes=420, idle_age=1, '
+                              'priority=1,dl_vlan=3 actions=NORMAL')
+        self.assertEqual(7, dumped.n_packets)
+        self.assertEqual(420, dumped.n_bytes)
+        self.assertEqual(['dl_vlan=3'], dumped.match)
+        self.assertEqual(0, ovs_lib.Flow('dl_vlan=3,actions=NORMAL').n_packets)
+
+    def test_dump_port_stats(self):
+        self.execute.return_value = (
+            'OFPST_PORT reply (xid=0x2): 3 ports\n'
+            '  port  2: rx pkts=8, bytes=648, drop=0, errs=0, frame=0, '
+            'over=0, crc=0\n'
+            '           tx pkts=3, bytes=210, drop=1, errs=?, coll=0\n'
+            '  port LOCAL: rx pkts=1, bytes=90, drop=0, errs=0, frame=0, '
+            'over=0, crc=0\n'
+            '           tx pkts=0, bytes=0, drop=0, errs=0, coll=0\n')
+        self.assertEqual({2: {'rx_packets': 8, 'rx_bytes': 648,
+                              'rx_dropped': 0, 'rx_errors': 0,
+                              'tx_packets': 3, 'tx_bytes': 210,
+                              'tx_dropped': 1}},
+                         self.br.dump_port_stats())
+        self.execute.assert_called_once_with(
+            ["ovs-ofctl", "dump-ports", self.BR_NAME],
+            root_helper=self.root_helper,
+            process_input=None)
+
+    def test_dump_port_stats_fails(self):
+        self.execute.side_effect = RuntimeError()
+        self.assertIsNone(self.br.dump_port_stats())
+
+    def test_sync_flows_applies_differences(self):
+        self.br.agent_cookie = 0x1
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        run_ofctl.return_value = self._dump_flows(
+            ('0x1', 0, 'priority=1 actions=NORMAL'),
+            ('0x0', 0, 'priority=2,in_port=1 actions=drop'),
+            ('0x1', 0, 'priority=3,in_port=2 actions=drop'),
+            ('0x1', 1, 'priority=1,dl_vlan=1 actions=output:1'),
+            ('0x2', 1, 'priority=1,dl_vlan=2 actions=output:1'),
+            ('0x0', 20, 'hard_timeout=300, priority=1,dl_vlan=1 '
+             'actions=output:2'))
+
+        self.br.sync_flows_on()
+        self.br.remove_all_flows()
+        self.br.add_flow(priority=1, actions='normal')
+        self.br.add_flow(priority=2, in_port=1, actions='drop')
+        self.br.add_flow(table=1, priority=1, dl_vlan=1, actions='output:2')
+        self.br.add_flow(table=1, priority=1, dl_vlan=3, actions='output:1')
+        self.br.add_flow(table=1, priority=1, dl_vlan=4, actions='output:1')
+        self.br.delete_flows(table=1, dl_vlan=4)
+        self.br.mod_flow(table=1, dl_vlan=3, actions='output:3')
+        self.assertEqual(0, run_ofctl.call_count)
+        self.br.sync_flows_off()
+
+        run_ofctl.assert_has_calls([
+            mock.call('dump-flows', []),
+            mock.call('del-flows', ['--strict', '-'],
+                      'table=0,priority=3,in_port=2\n'),
+            mock.call('mod-flows', ['--strict', '-'], mock.ANY),
+            mock.call('add-flows', ['-'],
+                      'cookie=0x1,table=1,priority=1,dl_vlan=3,'
+                      'actions=output:3\n')])
+        self.assertEqual(4, run_ofctl.call_count)
+        modified = sorted(run_ofctl.call_args_list[2][0][2].splitlines())
+        self.assertEqual(['cookie=0x1,table=0,priority=2,in_port=1,'
+                          'actions=drop',
+                          'cookie=0x1,table=1,priority=1,dl_vlan=1,'
+                          'actions=output:2'], modified)
+        self.assertIsNone(self.br.desired_flows)
+
+    def test_sync_flows_replace(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.sync_flows_on()
+        self.br.add_flow(priority=1, actions='normal')
+        self.br.sync_flows_off(replace=True)
+        run_ofctl.assert_called_once_with(
+            'replace-flows', ['-'],
+            'cookie=0x0,table=0,priority=1,actions=normal\n')
+
+    def test_sync_flows_replaces_when_dump_fails(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        run_ofctl.return_value = None
+        self.br.sync_flows_on()
+        self.br.sync_flows_off()
+        run_ofctl.assert_has_calls([mock.call('dump-flows', []),
+                                    mock.call('replace-flows', ['-'], '')])
+
+    def test_flow_calls_carry_agent_cookie(self):
+        self.br.agent_cookie = 0x1
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.add_flow(priority=1, actions='normal')
+        self.br.mod_flow(table=1, actions='drop')
+        run_ofctl.assert_has_calls([
+            mock.call('add-flow', ['hard_timeout=0,idle_timeout=0,'
+                                   'priority=1,cookie=0x1,actions=normal']),
+            mock.call('mod-flows', [mock.ANY])])
+        self.assertEqual(
+            set(['table=1', 'cookie=0x1', 'actions=drop']),
+            set(run_ofctl.call_args_list[1][0][1][0].split(',')))
+
+    def test_delete_stale_flows(self):
+        self.br.agent_cookie = 0x1
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        run_ofctl.return_value = self._dump_flows(
+            ('0x1', 0, 'priority=1 actions=NORMAL'),
+            ('0x0', 0, 'priority=2,in_port=1 actions=drop'),
+            ('0x2', 1, 'priority=1,dl_vlan=2 actions=output:1'),
+            ('0x0', 20, 'hard_timeout=300, priority=1,dl_vlan=1 '
+             'actions=output:2'))
+        self.br.delete_stale_flows()
+        run_ofctl.assert_has_calls([
+            mock.call('dump-flows', []),
+            mock.call('del-flows', ['--strict', '-'],
+                      'cookie=0x0/-1,table=0,priority=2,in_port=1\n'
+                      'cookie=0x2/-1,table=1,priority=1,dl_vlan=2\n')])
+
+    def test_delete_stale_flows_without_agent_cookie(self):
+        run_ofctl = mock.patch.object(self.br, 'run_ofctl').start()
+        self.br.delete_stale_flows()
+        self.assertFalse(run_ofctl.called)
+
     def test_add_tunnel_port(self):
         pname = "tap99"
         local_ip = "1.1.1.1"
@@ -777,6 +956,111 @@ class OVS_Lib_Test(base.BaseTestCase):
             ["ovs-vsctl", self.TO, "clear", "Port", pname, "tag"],
             root_helper=self.root_helper)
 
+    def test_ovsdb_transaction(self):
+        self.execute.return_value = '\n\n'
+        with self.br.ovsdb_transaction() as txn:
+            self.br.set_db_attribute("Port", "tap1", "tag", "1")
+            self.assertIsNone(self.br.add_port("tap3"))
+            self.assertEqual(2, len(txn.commands))
+            self.assertFalse(self.execute.called)
+        self.execute.assert_called_once_with(
+            ["ovs-vsctl", self.TO, "--oneline",
+             "--", "set", "Port", "tap1", "tag=1",
+             "--", "--may-exist", "add-port", self.BR_NAME, "tap3"],
+            root_helper=self.root_helper)
+
+    def test_ovsdb_transaction_reads_ofport_at_once(self):
+        self.execute.side_effect = ['5\n', '\n']
+        with self.br.ovsdb_transaction() as txn:
+            self.br.set_db_attribute("Port", "tap1", "tag", "1")
+            self.assertEqual("5", self.br.get_port_ofport("tap2"))
+            self.assertEqual(1, len(txn.commands))
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_ovsdb_transaction_reads_values_at_once(self):
+        self.execute.side_effect = ['1\n', '{foo="a"}\n', '\n']
+        with self.br.ovsdb_transaction() as txn:
+            self.br.set_db_attribute("Port", "tap1", "tag", "2")
+            self.assertEqual("1", self.br.db_get_val("Port", "tap1", "tag"))
+            self.assertEqual({"foo": "a"},
+                             self.br.db_get_map("Interface", "tap1",
+                                                "external_ids"))
+            self.assertEqual(1, len(txn.commands))
+        self.assertEqual(3, self.execute.call_count)
+
+    def test_ovsdb_transaction_after_commit(self):
+        calls = []
+        self.execute.side_effect = lambda *args, **kwargs: calls.append(
+            'commit')
+        with self.br.ovsdb_transaction():
+            self.br.set_db_attribute("Port", "tap1", "tag", "2")
+            self.br.after_commit(calls.append, 'after')
+            self.assertEqual([], calls)
+        self.assertEqual(['commit', 'after'], calls)
+        self.br.after_commit(calls.append, 'now')
+        self.assertEqual(['commit', 'after', 'now'], calls)
+
+    def test_ovsdb_transaction_nested(self):
+        with self.br.ovsdb_transaction():
+            self.br.clear_db_attribute("Port", "tap1", "tag")
+            with self.br.ovsdb_transaction():
+                self.br.delete_port("tap2")
+            self.assertFalse(self.execute.called)
+        self.execute.assert_called_once_with(
+            ["ovs-vsctl", self.TO, "--oneline",
+             "--", "clear", "Port", "tap1", "tag",
+             "--", "--if-exists", "del-port", self.BR_NAME, "tap2"],
+            root_helper=self.root_helper)
+
+    def test_ovsdb_transaction_failure(self):
+        self.execute.side_effect = RuntimeError()
+        with self.br.ovsdb_transaction():
+            self.assertEqual(const.INVALID_OFPORT,
+                             self.br.get_port_ofport("tap1"))
+            self.br.set_db_attribute("Port", "tap1", "tag", "1")
+        self.assertEqual(2, self.execute.call_count)
+
+    def test_ovsdb_transaction_not_committed_on_error(self):
+        with testtools.ExpectedException(ValueError):
+            with self.br.ovsdb_transaction():
+                self.br.delete_port("tap1")
+                raise ValueError()
+        self.assertFalse(self.execute.called)
+        self.br.delete_port("tap1")
+        self.assertEqual(1, self.execute.call_count)
+
+    def _setup_native_ovsdb(self):
+        self.br.ovsdb = ovsdb_client.OvsdbClient('unix:/fake/db.sock')
+        self.br.ovsdb._handle_message(test_ovsdb_client.MONITOR_REPLY)
+
+    def test_native_ovsdb_queries(self):
+        self._setup_native_ovsdb()
+        self.assertEqual(['tap1', 'tap2'],
+                         sorted(self.br.get_port_name_list()))
+        self.assertEqual({'tap1': 1, 'tap2': []},
+                         self.br.get_port_tag_dict())
+        self.assertEqual(set(['port1']), self.br.get_vif_port_set())
+        vif_ports = self.br.get_vif_ports()
+        self.assertEqual([('tap1', 1, 'port1', 'aa:bb:cc:dd:ee:ff')],
+                         [(p.port_name, p.ofport, p.vif_id, p.vif_mac)
+                          for p in vif_ports])
+        self.assertFalse(self.execute.called)
+
+    def test_native_ovsdb_get_vif_port_by_id(self):
+        self._setup_native_ovsdb()
+        port = self.br.get_vif_port_by_id('port1')
+        self.assertEqual(('tap1', 1, 'aa:bb:cc:dd:ee:ff'),
+                         (port.port_name, port.ofport, port.vif_mac))
+        self.assertIsNone(self.br.get_vif_port_by_id('port2'))
+        self.assertFalse(self.execute.called)
+
+    def test_native_ovsdb_not_synced_runs_vsctl(self):
+        self._setup_native_ovsdb()
+        self.br.ovsdb.synced = False
+        self.execute.return_value = 'tap1\n'
+        self.assertEqual(['tap1'], self.br.get_port_name_list())
+        self.assertTrue(self.execute.called)
+
     def _test_iface_to_br(self, exp_timeout=None):
         iface = 'tap0'
         br = 'br-int'
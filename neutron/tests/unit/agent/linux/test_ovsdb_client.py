@@ -0,0 +1,130 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ovsdb_client
+from neutron.openstack.common import jsonutils
+from neutron.tests import base
+
+MONITOR_REPLY = {
+    'id': ovsdb_client.MONITOR_REQUEST_ID,
+    'error': None,
+    'result': {
+        'Bridge': {
+            'br1': {'new': {'name': 'br-int',
+                            'ports': ['set', [['uuid', 'p1'],
+                                              ['uuid', 'p2']]]}},
+            'br2': {'new': {'name': 'br-tun',
+                            'ports': ['uuid', 'p3']}}},
+        'Port': {
+            'p1': {'new': {'name': 'tap1', 'tag': 1,
+                           'interfaces': ['uuid', 'i1']}},
+            'p2': {'new': {'name': 'tap2', 'tag': ['set', []],
+                           'interfaces': ['uuid', 'i2']}},
+            'p3': {'new': {'name': 'gre-1', 'tag': ['set', []],
+                           'interfaces': ['uuid', 'i3']}}},
+        'Interface': {
+            'i1': {'new': {'name': 'tap1', 'ofport': 1,
+                           'external_ids': ['map', [
+                               ['iface-id', 'port1'],
+                               ['attached-mac', 'aa:bb:cc:dd:ee:ff']]]}},
+            'i2': {'new': {'name': 'tap2', 'ofport': ['set', []],
+                           'external_ids': ['map', []]}},
+            'i3': {'new': {'name': 'gre-1', 'ofport': 3,
+                           'external_ids': ['map', []]}}},
+    },
+}
+
+
+class TestDecodeValue(base.BaseTestCase):
+
+    def test_decode_value(self):
+        self.assertEqual(1, ovsdb_client.decode_value(1))
+        self.assertEqual('u1', ovsdb_client.decode_value(['uuid', 'u1']))
+        self.assertEqual([], ovsdb_client.decode_value(['set', []]))
+        self.assertEqual(['u1', 'u2'], ovsdb_client.decode_value(
+            ['set', [['uuid', 'u1'], ['uuid', 'u2']]]))
+        self.assertEqual({'a': 'b'}, ovsdb_client.decode_value(
+            ['map', [['a', 'b']]]))
+
+
+class TestJsonStream(base.BaseTestCase):
+
+    def test_feed_splits_messages(self):
+        stream = ovsdb_client.JsonStream()
+        data = '{"id": 1, "s": "}{\\""} {"id": 2, "l": [{}]}'
+        self.assertEqual([], stream.feed(data[:7]))
+        self.assertEqual([{'id': 1, 's': '}{"'}], stream.feed(data[7:24]))
+        self.assertEqual([{'id': 2, 'l': [{}]}], stream.feed(data[24:]))
+
+
+class TestOvsdbClient(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestOvsdbClient, self).setUp()
+        self.client = ovsdb_client.OvsdbClient('unix:/fake/db.sock')
+        self.client._sock = mock.Mock()
+        self.listener = mock.Mock()
+        self.client.add_listener(self.listener)
+        self.client._handle_message(MONITOR_REPLY)
+
+    def test_monitor_reply_syncs_replica(self):
+        self.assertTrue(self.client.synced)
+        self.assertEqual({'_uuid': 'p2', 'name': 'tap2', 'tag': [],
+                          'interfaces': 'i2'},
+                         self.client.tables['Port']['p2'])
+        self.listener.assert_called_once_with(
+            set(ovsdb_client.MONITORED_COLUMNS))
+
+    def test_monitor_error_raises(self):
+        self.assertRaises(RuntimeError, self.client._handle_message,
+                          {'id': ovsdb_client.MONITOR_REQUEST_ID,
+                           'error': 'unknown table', 'result': None})
+
+    def test_update(self):
+        self.listener.reset_mock()
+        self.client._handle_message(
+            {'method': 'update', 'id': None,
+             'params': [ovsdb_client.MONITOR_ID,
+                        {'Interface': {'i2': {'old': {'ofport': ['set', []]},
+                                              'new': {'ofport': 2}},
+                                       'i3': {'old': {'name': 'gre-1'}}}}]})
+        self.assertEqual(2, self.client.tables['Interface']['i2']['ofport'])
+        self.assertEqual('tap2', self.client.tables['Interface']['i2']['name'])
+        self.assertNotIn('i3', self.client.tables['Interface'])
+        self.listener.assert_called_once_with(set(['Interface']))
+
+    def test_echo(self):
+        self.client._handle_message({'method': 'echo', 'params': [],
+                                     'id': 'echo'})
+        self.client._sock.sendall.assert_called_once_with(
+            jsonutils.dumps({'result': [], 'error': None, 'id': 'echo'}))
+
+    def test_get_bridge_interfaces(self):
+        self.assertEqual(['tap1', 'tap2'],
+                         sorted(i['name'] for i in
+                                self.client.get_bridge_interfaces('br-int')))
+        self.assertEqual([], self.client.get_bridge_interfaces('br-ex'))
+
+    def test_get_bridge_name_for_interface(self):
+        self.assertEqual('br-tun',
+                         self.client.get_bridge_name_for_interface('i3'))
+        self.assertIsNone(self.client.get_bridge_name_for_interface('i4'))
+
+    def test_close_unsyncs(self):
+        self.client._close()
+        self.assertFalse(self.client.synced)
+
+    def test_unsupported_connection(self):
+        client = ovsdb_client.OvsdbClient('ssl:127.0.0.1:6640')
+        self.assertRaises(ValueError, client._connect)
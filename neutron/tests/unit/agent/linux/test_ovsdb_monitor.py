@@ -16,6 +16,7 @@ import eventlet.event
 import mock
 
 from neutron.agent.linux import ovsdb_monitor
+from neutron.openstack.common import jsonutils
 from neutron.tests import base
 
 
@@ -101,3 +102,84 @@ class TestSimpleInterfaceMonitor(base.BaseTestCase):
                 return_value=output):
             self.monitor._read_stdout()
         self.assertFalse(self.monitor.data_received)
+
+    def _output(self, *rows):
+        return jsonutils.dumps({'headings': ['row', 'action', 'name',
+                                             'ofport'],
+                                'data': [list(row) for row in rows]})
+
+    def test_events_are_coalesced(self):
+        self.monitor._process_output(self._output(
+            ('u1', 'initial', 'tap1', 1),
+            ('u2', 'insert', 'tap2', ['set', []])))
+        self.monitor._process_output(self._output(
+            ('u2', 'old', None, ['set', []]),
+            ('u2', 'new', 'tap2', 2),
+            ('u3', 'insert', 'tap3', 3),
+            ('u4', 'old', None, 4),
+            ('u4', 'new', 'tap4', 5)))
+        self.monitor._process_output(self._output(
+            ('u3', 'delete', 'tap3', 3),
+            ('u5', 'delete', 'tap5', 6)))
+        self.assertEqual(4, self.monitor.get_stats()['pending_events'])
+        events = self.monitor.get_events()
+        self.assertEqual([('tap1', 1), ('tap2', 2)], sorted(events['added']))
+        self.assertEqual([('tap5', 6)], events['removed'])
+        self.assertEqual([('tap4', 5)], events['modified'])
+        self.assertEqual({'added': [], 'removed': [], 'modified': []},
+                         self.monitor.get_events())
+
+    def test_overflow_requires_resync(self):
+        self.monitor.max_events = 1
+        self.monitor._process_output(self._output(
+            ('u1', 'insert', 'tap1', 1), ('u2', 'insert', 'tap2', 2)))
+        self.assertEqual(1, self.monitor.get_stats()['overflows'])
+        self.assertIsNone(self.monitor.get_events())
+        self.assertEqual({'added': [], 'removed': [], 'modified': []},
+                         self.monitor.get_events())
+
+    def test_unparsable_output_requires_resync(self):
+        self.monitor._process_output('{"data": ')
+        self.assertIsNone(self.monitor.get_events())
+
+    def test_has_updates_consumes_events(self):
+        target = ('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
+                  '.is_active')
+        with mock.patch(target,
+                        new_callable=mock.PropertyMock(return_value=True)):
+            self.monitor._process_output(self._output(
+                ('u1', 'insert', 'tap1', 1)))
+            self.assertTrue(self.monitor.has_updates)
+            self.assertFalse(self.monitor.has_updates)
+
+
+class TestNativeInterfaceMonitor(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestNativeInterfaceMonitor, self).setUp()
+        self.client = mock.Mock()
+        self.client.synced = True
+        self.monitor = ovsdb_monitor.NativeInterfaceMonitor(self.client)
+
+    def test_start_registers_listener(self):
+        self.monitor.start()
+        self.client.add_listener.assert_called_once_with(
+            self.monitor._tables_updated)
+        self.client.start.assert_called_once_with()
+
+    def test_stop_keeps_connection(self):
+        self.monitor.stop()
+        self.client.remove_listener.assert_called_once_with(
+            self.monitor._tables_updated)
+        self.assertFalse(self.client.stop.called)
+
+    def test_has_updates_consumes_interface_updates(self):
+        self.monitor._tables_updated(set(['Port']))
+        self.assertFalse(self.monitor.has_updates)
+        self.monitor._tables_updated(set(['Port', 'Interface']))
+        self.assertTrue(self.monitor.has_updates)
+        self.assertFalse(self.monitor.has_updates)
+
+    def test_has_updates_is_true_when_not_synced(self):
+        self.client.synced = False
+        self.assertTrue(self.monitor.has_updates)
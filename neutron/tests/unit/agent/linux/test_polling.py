@@ -12,8 +12,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+import errno
+import socket
+
 import mock
 
+from neutron.agent.linux import netlink_lib
+from neutron.agent.linux import ovsdb_monitor
 from neutron.agent.linux import polling
 from neutron.tests import base
 
@@ -37,6 +43,25 @@ class TestGetPollingManager(base.BaseTestCase):
             mock_start.assert_has_calls(mock.call())
 
 
+class TestGetLinkPollingManager(base.BaseTestCase):
+
+    def test_return_always_poll_by_default(self):
+        with polling.get_link_polling_manager() as pm:
+            self.assertEqual(pm.__class__, polling.AlwaysPoll)
+            self.assertIsNone(pm.get_link_changes())
+
+    def test_manage_link_polling_minimizer(self):
+        mock_target = 'neutron.agent.linux.polling.LinkPollingMinimizer'
+        with contextlib.nested(
+            mock.patch('%s.start' % mock_target),
+            mock.patch('%s.stop' % mock_target)
+        ) as (mock_start, mock_stop):
+            with polling.get_link_polling_manager(minimize_polling=True) as pm:
+                self.assertEqual(pm.__class__, polling.LinkPollingMinimizer)
+            mock_start.assert_called_once_with()
+            mock_stop.assert_called_once_with()
+
+
 class TestBasePollingManager(base.BaseTestCase):
 
     def setUp(self):
@@ -91,6 +116,13 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
         super(TestInterfacePollingMinimizer, self).setUp()
         self.pm = polling.InterfacePollingMinimizer()
 
+    def test_native_ovsdb_uses_native_monitor(self):
+        self.config(ovsdb_interface='native')
+        with mock.patch('neutron.agent.linux.ovsdb_client.get_client'):
+            pm = polling.InterfacePollingMinimizer()
+        self.assertIsInstance(pm._monitor,
+                              ovsdb_monitor.NativeInterfaceMonitor)
+
     def test_start_calls_monitor_start(self):
         with mock.patch.object(self.pm._monitor, 'start') as mock_start:
             self.pm.start()
@@ -101,6 +133,12 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
             self.pm.stop()
         mock_stop.assert_called_with()
 
+    def test_get_stats_returns_monitor_stats(self):
+        stats = {'dropped_lines': 0}
+        with mock.patch.object(self.pm._monitor, 'get_stats',
+                               return_value=stats):
+            self.assertEqual(stats, self.pm.get_stats())
+
     def mock_has_updates(self, return_value):
         target = ('neutron.agent.linux.ovsdb_monitor.SimpleInterfaceMonitor'
                   '.has_updates')
@@ -112,3 +150,90 @@ class TestInterfacePollingMinimizer(base.BaseTestCase):
     def test__is_polling_required_returns_when_updates_are_present(self):
         with self.mock_has_updates(True):
             self.assertTrue(self.pm._is_polling_required())
+
+
+def _link(name):
+    return {'name': name}
+
+
+class StopLoop(Exception):
+    pass
+
+
+class TestLinkPollingMinimizer(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLinkPollingMinimizer, self).setUp()
+        self.sock_cls = mock.patch.object(netlink_lib,
+                                          'NetlinkSocket').start()
+        mock.patch.object(netlink_lib, 'dump_tables',
+                          return_value={'links': [_link('lo'),
+                                                  _link('tap1')]}).start()
+        self.spawn = mock.patch('eventlet.spawn').start()
+        self.pm = polling.LinkPollingMinimizer()
+        self.pm.start()
+
+    def test_start_subscribes_to_link_notifications(self):
+        self.sock_cls.assert_called_once_with(groups=netlink_lib.RTMGRP_LINK)
+        self.spawn.assert_called_once_with(self.pm._run)
+        self.assertEqual(set(['lo', 'tap1']), self.pm._links)
+
+    def test_changes_unknown_until_first_call(self):
+        self.assertTrue(self.pm.is_polling_required)
+        self.assertIsNone(self.pm.get_link_changes())
+        self.assertEqual((set(), set()), self.pm.get_link_changes())
+
+    def test_link_changes(self):
+        self.assertTrue(self.pm.is_polling_required)
+        self.pm.get_link_changes()
+        self.pm.polling_completed()
+        self.assertFalse(self.pm.is_polling_required)
+        self.pm._process_events([(True, _link('tap1')),
+                                 (True, _link('tap2')),
+                                 (False, _link('tap3')),
+                                 (False, _link('tap1')),
+                                 (False, _link('tap4')),
+                                 (True, _link('tap4'))])
+        self.assertTrue(self.pm.is_polling_required)
+        self.assertEqual((set(['tap2', 'tap4']), set(['tap1', 'tap3'])),
+                         self.pm.get_link_changes())
+
+    def test_lost_notifications(self):
+        self.pm.get_link_changes()
+        self.pm._sock.receive_link_events.side_effect = [
+            socket.error(errno.ENOBUFS, 'No buffer space available'),
+            [(True, _link('tap2'))],
+            StopLoop()]
+        self.assertRaises(StopLoop, self.pm._run)
+        self.assertIsNone(self.pm.get_link_changes())
+        self.assertEqual(1, self.sock_cls.call_count)
+
+    def test_socket_reopened_on_error(self):
+        self.pm.get_link_changes()
+        self.assertTrue(self.pm.is_polling_required)
+        self.pm.polling_completed()
+        sock = self.pm._sock
+        sock.receive_link_events.side_effect = [
+            socket.error(errno.EBADF, 'Bad file descriptor'),
+            StopLoop()]
+        self.sock_cls.side_effect = [socket.error(errno.EMFILE, 'Too many'),
+                                     sock]
+        with contextlib.nested(
+            mock.patch('eventlet.sleep'),
+            mock.patch.object(polling.LOG, 'error'),
+            mock.patch.object(polling.LOG, 'exception')
+        ) as (sleep, log_error, log_exception):
+            self.assertRaises(StopLoop, self.pm._run)
+        sock.close.assert_called_once_with()
+        self.assertEqual(3, self.sock_cls.call_count)
+        sleep.assert_called_once_with(polling.LinkPollingMinimizer.
+                                      REOPEN_INTERVAL)
+        self.assertTrue(log_error.called)
+        self.assertTrue(self.pm.is_polling_required)
+        self.assertIsNone(self.pm.get_link_changes())
+
+    def test_wait_for_updates_returns_on_updates(self):
+        self.pm._process_events([(True, _link('tap2'))])
+        with mock.patch('eventlet.Timeout') as timeout:
+            self.pm.wait_for_updates(10)
+        self.assertFalse(timeout.called)
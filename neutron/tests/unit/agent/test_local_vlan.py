@@ -0,0 +1,142 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import os
+
+import mock
+
+from neutron.agent import local_vlan
+from neutron.agent.linux import utils
+from neutron.openstack.common import jsonutils
+from neutron.tests import base
+
+
+class TestLocalVlanAllocator(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestLocalVlanAllocator, self).setUp()
+        self.state_file = os.path.join(self.temp_dir, 'vlans')
+        self.allocator = local_vlan.LocalVlanAllocator(self.state_file)
+
+    def _write_state(self, networks):
+        utils.replace_file(self.state_file, jsonutils.dumps(networks))
+
+    def _read_state(self):
+        with open(self.state_file) as f:
+            return jsonutils.loads(f.read())
+
+    def test_allocate_lowest_free_vlan(self):
+        self.assertEqual(1, self.allocator.allocate('net1'))
+        self.assertEqual(2, self.allocator.allocate('net2'))
+        self.assertEqual(1, self.allocator.allocate('net1'))
+        self.allocator.release('net1')
+        self.assertTrue(self.allocator.is_free(1))
+        self.assertEqual(1, self.allocator.allocate('net3'))
+        self.assertEqual(3, self.allocator.allocate('net4'))
+
+    def test_allocate_preferred_vlan_if_free(self):
+        self.assertEqual(5, self.allocator.allocate('net1', preferred='5'))
+        self.assertEqual(1, self.allocator.allocate('net2', preferred=5))
+        self.assertEqual(2, self.allocator.allocate('net3', preferred=4095))
+        self.assertEqual(3, self.allocator.allocate('net4', preferred=[]))
+
+    def test_allocate_fails_once_exhausted(self):
+        allocator = local_vlan.LocalVlanAllocator(min_vlan=10, max_vlan=25)
+        self.assertEqual(range(10, 26),
+                         [allocator.allocate('net%d' % i)
+                          for i in range(16)])
+        self.assertIsNone(allocator.allocate('net'))
+        allocator.release('net7')
+        self.assertEqual(17, allocator.allocate('net'))
+
+    def test_reserved_vlan_claimed_by_network_of_port(self):
+        self.assertTrue(self.allocator.reserve(5))
+        self.assertFalse(self.allocator.reserve(5))
+        self.assertFalse(self.allocator.reserve(4095))
+        self.assertEqual(1, self.allocator.allocate('net1'))
+        self.allocator.release('net1')
+        self.assertEqual(5, self.allocator.allocate('net2', preferred=5))
+        self.assertEqual(set(), self.allocator.reserved())
+
+    def test_release_unclaimed(self):
+        self._write_state({'net1': 3, 'net2': 4})
+        allocator = local_vlan.LocalVlanAllocator(self.state_file)
+        allocator.reserve(5)
+        self.assertEqual(4, allocator.allocate('net2', preferred=5))
+        self.assertEqual(set([3, 5]), allocator.reserved())
+        allocator.release_unclaimed()
+        self.assertEqual(set(), allocator.reserved())
+        self.assertTrue(allocator.is_free(3))
+        self.assertTrue(allocator.is_free(5))
+        self.assertFalse(allocator.is_free(4))
+        allocator.save()
+        self.assertEqual({'net2': 4}, self._read_state())
+
+    def test_unclaimed_vlans_allocated_once_exhausted(self):
+        self._write_state({'net1': 1})
+        allocator = local_vlan.LocalVlanAllocator(self.state_file,
+                                                  min_vlan=1, max_vlan=2)
+        allocator.reserve(2)
+        self.assertEqual(2, allocator.allocate('net2'))
+        self.assertEqual(1, allocator.allocate('net3'))
+        self.assertIsNone(allocator.allocate('net4'))
+
+    def test_save_and_restore(self):
+        self.allocator.allocate('net1')
+        self.allocator.allocate('net2')
+        self.allocator.allocate('net3')
+        self.allocator.release('net2')
+        self.allocator.save()
+        self.assertEqual({'net1': 1, 'net3': 3}, self._read_state())
+
+        allocator = local_vlan.LocalVlanAllocator(self.state_file)
+        self.assertEqual(set([1, 3]), allocator.reserved())
+        self.assertEqual(2, allocator.allocate('net4'))
+        self.assertEqual(3, allocator.allocate('net3', preferred=7))
+        # the unclaimed mappings are saved until they are released
+        allocator.save()
+        self.assertEqual({'net1': 1, 'net3': 3, 'net4': 2},
+                         self._read_state())
+
+    def test_save_only_changes(self):
+        with mock.patch.object(utils, 'replace_file') as replace_file:
+            self.allocator.save()
+            self.allocator.allocate('net1')
+            self.allocator.save()
+            self.allocator.allocate('net1')
+            self.allocator.save()
+        self.assertEqual(1, replace_file.call_count)
+
+    def test_save_failure_is_logged(self):
+        self.allocator.allocate('net1')
+        with contextlib.nested(
+            mock.patch.object(utils, 'replace_file', side_effect=IOError()),
+            mock.patch.object(local_vlan.LOG, 'exception')
+        ) as (replace_file, log):
+            self.allocator.save()
+        self.assertTrue(log.called)
+        # saved again by the next call
+        self.allocator.save()
+        self.assertEqual({'net1': 1}, self._read_state())
+
+    def test_restore_ignores_invalid_state(self):
+        self._write_state({'net1': 1, 'net2': 1, 'net3': 5000, 'net4': 'x'})
+        allocator = local_vlan.LocalVlanAllocator(self.state_file)
+        self.assertEqual(1, len(allocator.reserved()))
+        self._write_state(['net1'])
+        allocator = local_vlan.LocalVlanAllocator(self.state_file)
+        self.assertEqual(set(), allocator.reserved())
+        with open(self.state_file, 'w') as f:
+            f.write('{')
+        allocator = local_vlan.LocalVlanAllocator(self.state_file)
+        self.assertEqual(set(), allocator.reserved())
@@ -20,6 +20,7 @@ from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import utils
+from neutron.agent import rpc as agent_rpc
 from neutron.common import constants
 from neutron.common import exceptions
 from neutron.plugins.common import constants as p_const
@@ -117,11 +118,11 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                                                                      None)
         devices = [DEVICE_1]
         with contextlib.nested(
-            mock.patch.object(agent.plugin_rpc, "update_device_down"),
+            mock.patch.object(agent.plugin_rpc, "update_devices_down"),
             mock.patch.object(agent, "remove_devices_filter")
         ) as (fn_udd, fn_rdf):
-            fn_udd.return_value = {'device': DEVICE_1,
-                                   'exists': True}
+            fn_udd.return_value = [{'device': DEVICE_1,
+                                    'exists': True}]
             with mock.patch.object(linuxbridge_neutron_agent.LOG,
                                    'info') as log:
                 resync = agent.treat_devices_removed(devices)
@@ -136,11 +137,11 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                                                                      None)
         devices = [DEVICE_1]
         with contextlib.nested(
-            mock.patch.object(agent.plugin_rpc, "update_device_down"),
+            mock.patch.object(agent.plugin_rpc, "update_devices_down"),
             mock.patch.object(agent, "remove_devices_filter")
         ) as (fn_udd, fn_rdf):
-            fn_udd.return_value = {'device': DEVICE_1,
-                                   'exists': False}
+            fn_udd.return_value = [{'device': DEVICE_1,
+                                    'exists': False}]
             with mock.patch.object(linuxbridge_neutron_agent.LOG,
                                    'debug') as log:
                 resync = agent.treat_devices_removed(devices)
@@ -155,14 +156,13 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                                                                      None)
         devices = [DEVICE_1]
         with contextlib.nested(
-            mock.patch.object(agent.plugin_rpc, "update_device_down"),
+            mock.patch.object(agent.plugin_rpc, "update_devices_down"),
             mock.patch.object(agent, "remove_devices_filter")
         ) as (fn_udd, fn_rdf):
             fn_udd.side_effect = Exception()
-            with mock.patch.object(linuxbridge_neutron_agent.LOG,
-                                   'debug') as log:
+            with mock.patch.object(agent_rpc.LOG, 'debug') as log:
                 resync = agent.treat_devices_removed(devices)
-                self.assertEqual(2, log.call_count)
+                self.assertEqual(1, log.call_count)
                 self.assertTrue(resync)
                 self.assertTrue(fn_udd.called)
                 self.assertTrue(fn_rdf.called)
@@ -283,6 +283,36 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
         self._test_scan_devices(previous, updated, fake_current, expected,
                                 sync=True)
 
+    def test_scan_devices_from_link_changes(self):
+        previous = {'current': set(['tap1', 'tap2']),
+                    'updated': set(),
+                    'added': set(),
+                    'removed': set()}
+        self.agent.br_mgr = mock.Mock()
+        self.agent.updated_devices = set(['tap2', 'tap3'])
+        results = self.agent.scan_devices(
+            previous, False,
+            link_changes=(set(['tap2', 'tap3', 'vxlan-1']),
+                          set(['tap1', 'tap4'])))
+        self.assertEqual({'current': set(['tap2', 'tap3']),
+                          'updated': set(['tap2', 'tap3']),
+                          'added': set(['tap2', 'tap3']),
+                          'removed': set(['tap1'])}, results)
+        self.assertFalse(self.agent.br_mgr.get_tap_devices.called)
+
+    def test_scan_devices_link_changes_ignored_on_sync(self):
+        previous = {'current': set(['tap1']),
+                    'updated': set(),
+                    'added': set(),
+                    'removed': set()}
+        self.agent.updated_devices = set()
+        self.agent.br_mgr = mock.Mock()
+        self.agent.br_mgr.get_tap_devices.return_value = set(['tap2'])
+        results = self.agent.scan_devices(
+            previous, True, link_changes=(set(), set()))
+        self.assertEqual(set(['tap2']), results['current'])
+        self.assertEqual(set(['tap1']), results['removed'])
+
     def test_process_network_devices(self):
         agent = self.agent
         device_info = {'current': set(),
@@ -314,6 +344,8 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                         'physical_network': 'physnet1'}
         agent.plugin_rpc = mock.Mock()
         agent.plugin_rpc.get_devices_details_list.return_value = [mock_details]
+        agent.plugin_rpc.update_devices_status.return_value = (
+            [{'device': 'dev123', 'exists': True}], [])
         agent.br_mgr = mock.Mock()
         agent.br_mgr.add_interface.return_value = True
         resync_needed = agent.treat_devices_added_updated(set(['tap1']))
@@ -322,7 +354,28 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
         agent.br_mgr.add_interface.assert_called_with('net123', 'vlan',
                                                       'physnet1', 100,
                                                       'port123')
-        self.assertTrue(agent.plugin_rpc.update_device_up.called)
+        agent.plugin_rpc.update_devices_status.assert_has_calls([
+            mock.call(agent.context, 'up', ['dev123'], agent.agent_id,
+                      cfg.CONF.host),
+            mock.call(agent.context, 'down', [], agent.agent_id,
+                      cfg.CONF.host)])
+
+    def test_treat_devices_added_updated_failed_status_update(self):
+        agent = self.agent
+        mock_details = {'device': 'dev123',
+                        'port_id': 'port123',
+                        'network_id': 'net123',
+                        'admin_state_up': True,
+                        'network_type': 'vlan',
+                        'segmentation_id': 100,
+                        'physical_network': 'physnet1'}
+        agent.plugin_rpc = mock.Mock()
+        agent.plugin_rpc.get_devices_details_list.return_value = [mock_details]
+        agent.plugin_rpc.update_devices_status.side_effect = [
+            ([], ['dev123']), ([], [])]
+        agent.br_mgr = mock.Mock()
+        agent.br_mgr.add_interface.return_value = True
+        self.assertTrue(agent.treat_devices_added_updated(set(['tap1'])))
 
     def test_treat_devices_added_updated_admin_state_up_false(self):
         agent = self.agent
@@ -335,12 +388,14 @@ class TestLinuxBridgeAgent(base.BaseTestCase):
                         'physical_network': 'physnet1'}
         agent.plugin_rpc = mock.Mock()
         agent.plugin_rpc.get_devices_details_list.return_value = [mock_details]
+        agent.plugin_rpc.update_devices_status.return_value = ([], [])
         agent.remove_port_binding = mock.Mock()
         resync_needed = agent.treat_devices_added_updated(set(['tap1']))
 
         self.assertFalse(resync_needed)
         agent.remove_port_binding.assert_called_with('net123', 'port123')
-        self.assertFalse(agent.plugin_rpc.update_device_up.called)
+        agent.plugin_rpc.update_devices_status.assert_any_call(
+            agent.context, 'up', [], agent.agent_id, cfg.CONF.host)
 
 
 class TestLinuxBridgeManager(base.BaseTestCase):
@@ -30,8 +30,10 @@ from neutron import manager
 from neutron.openstack.common import timeutils
 from neutron.plugins.ml2 import config as config
 from neutron.plugins.ml2.drivers.l2pop import constants as l2_consts
+from neutron.plugins.ml2.drivers.l2pop import rpc as l2pop_rpc
 from neutron.plugins.ml2 import managers
 from neutron.plugins.ml2 import rpc
+from neutron.tests import base
 from neutron.tests.unit import test_db_plugin as test_plugin
 
 HOST = 'my_l2_host'
@@ -190,6 +192,51 @@ class TestL2PopulationRpcTestCase(test_plugin.NeutronDbPluginV2TestCase):
                     self.mock_fanout.assert_called_with(
                         mock.ANY, expected, topic=self.fanout_topic)
 
+    def test_fdb_add_batched_for_devices_up(self):
+        self._register_ml2_agents()
+
+        with self.subnet(network=self._network) as subnet:
+            host_arg = {portbindings.HOST_ID: HOST}
+            with self.port(subnet=subnet,
+                           device_owner=DEVICE_OWNER_COMPUTE,
+                           arg_list=(portbindings.HOST_ID,),
+                           **host_arg) as port1:
+                with self.port(subnet=subnet,
+                               device_owner=DEVICE_OWNER_COMPUTE,
+                               arg_list=(portbindings.HOST_ID,),
+                               **host_arg) as port2:
+                    p1 = port1['port']
+                    p2 = port2['port']
+                    devices = ['tap' + p1['id'], 'tap' + p2['id']]
+
+                    self.mock_fanout.reset_mock()
+                    res = self.callbacks.update_devices_up(self.adminContext,
+                                                           agent_id=HOST,
+                                                           devices=devices)
+                    self.assertEqual([{'device': device, 'exists': True}
+                                      for device in devices], res)
+
+                    p1_ips = [p['ip_address'] for p in p1['fixed_ips']]
+                    p2_ips = [p['ip_address'] for p in p2['fixed_ips']]
+                    expected = {'args':
+                                {'fdb_entries':
+                                 {p1['network_id']:
+                                  {'ports':
+                                   {'20.0.0.1': [constants.FLOODING_ENTRY,
+                                                 [p1['mac_address'],
+                                                  p1['device_owner'],
+                                                  p1_ips[0]],
+                                                 [p2['mac_address'],
+                                                  p2['device_owner'],
+                                                  p2_ips[0]]]},
+                                   'network_type': 'vxlan',
+                                   'segment_id': 1}}},
+                                'namespace': None,
+                                'method': 'add_fdb_entries'}
+
+                    self.mock_fanout.assert_called_once_with(
+                        mock.ANY, expected, topic=self.fanout_topic)
+
     def test_fdb_add_not_called_type_local(self):
         self._register_ml2_agents()
 
@@ -758,3 +805,41 @@ class TestL2PopulationRpcTestCase(test_plugin.NeutronDbPluginV2TestCase):
 
                     self.mock_fanout.assert_called_with(
                         mock.ANY, expected, topic=self.fanout_topic)
+
+
+class TestL2populationBatchNotifications(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestL2populationBatchNotifications, self).setUp()
+        self.notifier = l2pop_rpc.L2populationAgentNotifyAPI()
+        self.fanout = mock.patch.object(self.notifier,
+                                        '_notification_fanout').start()
+        self.host = mock.patch.object(self.notifier,
+                                      '_notification_host').start()
+
+    def _fdb_entries(self, *entries):
+        return {'net1': {'segment_id': 1, 'network_type': 'vxlan',
+                         'ports': {'20.0.0.1': list(entries)}}}
+
+    def test_notifications_are_merged(self):
+        port1 = ['aa:bb:cc:dd:ee:01', 'compute:None', '10.0.0.1']
+        port2 = ['aa:bb:cc:dd:ee:02', 'compute:None', '10.0.0.2']
+        with l2pop_rpc.batch_notifications():
+            self.notifier.add_fdb_entries(
+                'ctxt', self._fdb_entries(constants.FLOODING_ENTRY, port1))
+            self.notifier.add_fdb_entries(
+                'ctxt', self._fdb_entries(constants.FLOODING_ENTRY, port2))
+            self.notifier.add_fdb_entries('ctxt', self._fdb_entries(port1),
+                                          'host1')
+            self.assertFalse(self.fanout.called)
+        self.fanout.assert_called_once_with(
+            'ctxt', 'add_fdb_entries',
+            self._fdb_entries(constants.FLOODING_ENTRY, port1, port2))
+        self.host.assert_called_once_with(
+            'ctxt', 'add_fdb_entries', self._fdb_entries(port1), 'host1')
+
+    def test_notifications_are_sent_without_batch(self):
+        entries = self._fdb_entries(constants.FLOODING_ENTRY)
+        self.notifier.remove_fdb_entries('ctxt', entries)
+        self.fanout.assert_called_once_with('ctxt', 'remove_fdb_entries',
+                                            entries)
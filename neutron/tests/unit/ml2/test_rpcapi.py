@@ -17,12 +17,16 @@
 Unit Tests for ml2 rpc
 """
 
+import contextlib
+
 import mock
+from oslo import messaging
 
 from neutron.agent import rpc as agent_rpc
 from neutron.common import rpc as n_rpc
 from neutron.common import topics
 from neutron.openstack.common import context
+from neutron.plugins.ml2.drivers.l2pop import rpc as l2pop_rpc
 from neutron.plugins.ml2.drivers import type_tunnel
 from neutron.plugins.ml2 import rpc as plugin_rpc
 from neutron.tests import base
@@ -108,6 +112,68 @@ class RpcApiTestCase(base.BaseTestCase):
                            agent_id='fake_agent_id',
                            host='fake_host')
 
+    def test_update_devices_down(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, topics.PLUGIN,
+                           'update_devices_down', rpc_method='call',
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id', host='fake_host',
+                           version='1.4')
+
+    def test_update_devices_up(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        self._test_rpc_api(rpcapi, topics.PLUGIN,
+                           'update_devices_up', rpc_method='call',
+                           devices=['fake_device1', 'fake_device2'],
+                           agent_id='fake_agent_id', host='fake_host',
+                           version='1.4')
+
+    def _test_update_devices_up_falls_back(self, error):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        ctxt = context.RequestContext('fake_user', 'fake_project')
+        with mock.patch.object(n_rpc.RpcProxy, 'call') as rpc_mock:
+            rpc_mock.side_effect = [error, None, Exception()]
+            res = rpcapi.update_devices_up(ctxt, ['fake_device1',
+                                                  'fake_device2'],
+                                           'fake_agent_id', 'fake_host')
+        self.assertEqual([{'device': 'fake_device1', 'exists': True},
+                          {'device': 'fake_device2', 'failed': True}], res)
+        rpc_mock.assert_called_with(
+            ctxt, rpcapi.make_msg('update_device_up', device='fake_device2',
+                                  agent_id='fake_agent_id',
+                                  host='fake_host'),
+            topic=topics.PLUGIN)
+        self.assertFalse(rpcapi.bulk_update_supported)
+
+        # the bulk call is not tried again
+        with mock.patch.object(n_rpc.RpcProxy, 'call') as rpc_mock:
+            rpcapi.update_devices_down(ctxt, ['fake_device1'],
+                                       'fake_agent_id', 'fake_host')
+        rpc_mock.assert_called_once_with(
+            ctxt, rpcapi.make_msg('update_device_down', device='fake_device1',
+                                  agent_id='fake_agent_id',
+                                  host='fake_host'),
+            topic=topics.PLUGIN)
+
+    def test_update_devices_up_falls_back_to_update_device_up(self):
+        self._test_update_devices_up_falls_back(
+            messaging.UnsupportedVersion('1.4'))
+
+    def test_update_devices_up_falls_back_for_old_server(self):
+        # the server raises UnsupportedVersion as a RemoteError
+        self._test_update_devices_up_falls_back(
+            messaging.RemoteError('UnsupportedVersion'))
+
+    def test_update_devices_up_raises_other_remote_errors(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        with mock.patch.object(n_rpc.RpcProxy, 'call') as rpc_mock:
+            rpc_mock.side_effect = messaging.RemoteError('RuntimeError')
+            self.assertRaises(messaging.RemoteError,
+                              rpcapi.update_devices_up, None,
+                              ['fake_device1'], 'fake_agent_id')
+        self.assertEqual(1, rpc_mock.call_count)
+        self.assertTrue(rpcapi.bulk_update_supported)
+
     def test_tunnel_sync(self):
         rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
         self._test_rpc_api(rpcapi, topics.PLUGIN,
@@ -122,3 +188,64 @@ class RpcApiTestCase(base.BaseTestCase):
                            device='fake_device',
                            agent_id='fake_agent_id',
                            host='fake_host')
+
+    def test_update_devices_status_splits_failed_devices(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        details = [{'device': 'fake_device1', 'exists': True},
+                   {'device': 'fake_device2', 'failed': True}]
+        with mock.patch.object(rpcapi, 'update_devices_down',
+                               return_value=details) as update:
+            res = rpcapi.update_devices_status(
+                'fake_context', 'down', ['fake_device1', 'fake_device2'],
+                'fake_agent_id', 'fake_host')
+        self.assertEqual(([details[0]], ['fake_device2']), res)
+        update.assert_called_once_with(
+            'fake_context', ['fake_device1', 'fake_device2'],
+            'fake_agent_id', 'fake_host')
+
+    def test_update_devices_status_fails_all_devices_on_error(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        with mock.patch.object(rpcapi, 'update_devices_up',
+                               side_effect=Exception()):
+            res = rpcapi.update_devices_status(
+                'fake_context', 'up', ['fake_device1', 'fake_device2'],
+                'fake_agent_id')
+        self.assertEqual(([], ['fake_device1', 'fake_device2']), res)
+
+    def test_update_devices_status_without_devices(self):
+        rpcapi = agent_rpc.PluginApi(topics.PLUGIN)
+        with mock.patch.object(rpcapi, 'update_devices_up') as update:
+            self.assertEqual(([], []), rpcapi.update_devices_status(
+                'fake_context', 'up', [], 'fake_agent_id'))
+        self.assertFalse(update.called)
+
+
+class RpcCallbacksTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(RpcCallbacksTestCase, self).setUp()
+        self.callbacks = plugin_rpc.RpcCallbacks(mock.Mock(), mock.Mock())
+
+    def test_update_devices_down_returns_result_of_each_device(self):
+        with mock.patch.object(self.callbacks, 'update_device_down') as down:
+            down.side_effect = [{'device': 'fake_device1', 'exists': True},
+                                Exception()]
+            res = self.callbacks.update_devices_down(
+                'fake_context', devices=['fake_device1', 'fake_device2'],
+                agent_id='fake_agent_id', host='fake_host')
+        self.assertEqual([{'device': 'fake_device1', 'exists': True},
+                          {'device': 'fake_device2', 'failed': True}], res)
+        down.assert_called_with('fake_context', device='fake_device2',
+                                agent_id='fake_agent_id', host='fake_host')
+
+    def test_update_devices_up_batches_l2pop_notifications(self):
+        with contextlib.nested(
+            mock.patch.object(self.callbacks, 'update_device_up'),
+            mock.patch.object(l2pop_rpc, 'batch_notifications')
+        ) as (up, batch):
+            self.callbacks.update_devices_up('fake_context',
+                                             devices=['fake_device1'],
+                                             agent_id='fake_agent_id')
+        up.assert_called_once_with('fake_context', device='fake_device1',
+                                   agent_id='fake_agent_id')
+        batch.assert_called_once_with()
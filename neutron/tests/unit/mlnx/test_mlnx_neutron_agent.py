@@ -98,11 +98,13 @@ class TestEswitchAgent(base.BaseTestCase):
             mock.patch.object(self.agent.plugin_rpc,
                               'get_devices_details_list',
                               return_value=[details]),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_status',
+                              return_value=([], [])),
             mock.patch.object(self.agent, func_name)
-        ) as (vnics_fn, get_dev_fn, upd_dev_up, func):
+        ) as (vnics_fn, get_dev_fn, upd_dev_status, func):
             self.assertFalse(self.agent.treat_devices_added([{}]))
-        return (func.called, upd_dev_up.called)
+        devices_up = upd_dev_status.call_args[0][2]
+        return (func.called, bool(devices_up))
 
     def test_treat_devices_added_updates_known_port(self):
         details = mock.MagicMock()
@@ -126,18 +128,42 @@ class TestEswitchAgent(base.BaseTestCase):
         self.assertFalse(dev_up)
 
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                               side_effect=Exception()):
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_status',
+                              return_value=([], [])),
+            mock.patch.object(self.agent.eswitch, 'get_port_id_by_mac',
+                              side_effect=Exception())
+        ) as (upd_dev_status, get_port_id):
             self.assertTrue(self.agent.treat_devices_removed([{}]))
+        upd_dev_status.assert_called_once_with(
+            self.agent.context, 'down', [], self.agent.agent_id,
+            cfg.CONF.host)
+
+    def _mock_treat_devices_removed(self, updated, failed):
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_status',
+                              return_value=(updated, failed)),
+            mock.patch.object(self.agent.eswitch, 'get_port_id_by_mac',
+                              return_value='1234567890'),
+            mock.patch.object(self.agent.eswitch, 'port_release')
+        ) as (upd_dev_status, get_port_id, port_release):
+            resync = self.agent.treat_devices_removed(['01:02:03:04:05:06'])
+        upd_dev_status.assert_called_once_with(
+            self.agent.context, 'down', ['1234567890'], self.agent.agent_id,
+            cfg.CONF.host)
+        return resync, port_release.called
 
     def test_treat_devices_removed_releases_port(self):
-        details = dict(exists=False)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                               return_value=details):
-            with mock.patch.object(self.agent.eswitch,
-                                   'port_release') as port_release:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
-                self.assertTrue(port_release.called)
+        resync, released = self._mock_treat_devices_removed(
+            [{'device': '1234567890', 'exists': False}], [])
+        self.assertFalse(resync)
+        self.assertTrue(released)
+
+    def test_treat_devices_removed_returns_true_for_failed_device(self):
+        resync, released = self._mock_treat_devices_removed(
+            [], ['1234567890'])
+        self.assertTrue(resync)
+        self.assertFalse(released)
 
     def test_process_network_ports(self):
         current_ports = set(['01:02:03:04:05:06'])
@@ -98,6 +98,8 @@ class _Mod(object):
 def patch_fake_oflib_of():
     ryu_mod = mock.Mock()
     ryu_base_mod = ryu_mod.base
+    ryu_ctrl_mod = ryu_mod.controller
+    ryu_ctrl_mod.event.EventBase = object
     ryu_lib_mod = ryu_mod.lib
     ryu_lib_hub = ryu_lib_mod.hub
     ryu_ofproto_mod = ryu_mod.ofproto
@@ -110,6 +112,10 @@ def patch_fake_oflib_of():
     ryu_ofctl_api = ryu_app_ofctl_mod.api
     modules = {'ryu': ryu_mod,
                'ryu.base': ryu_base_mod,
+               'ryu.controller': ryu_ctrl_mod,
+               'ryu.controller.event': ryu_ctrl_mod.event,
+               'ryu.controller.handler': ryu_ctrl_mod.handler,
+               'ryu.controller.ofp_event': ryu_ctrl_mod.ofp_event,
                'ryu.lib': ryu_lib_mod,
                'ryu.lib.hub': ryu_lib_hub,
                'ryu.ofproto': ryu_ofproto_mod,
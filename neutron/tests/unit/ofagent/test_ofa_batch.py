@@ -0,0 +1,128 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import itertools
+
+import mock
+
+from neutron.openstack.common import importutils
+from neutron.tests import base
+from neutron.tests.unit.ofagent import fake_oflib
+
+
+class FakeDatapath(object):
+    def __init__(self, dpid, xids):
+        self.id = dpid
+        self.ofproto_parser = importutils.import_module(
+            'ryu.ofproto.ofproto_v1_3_parser')
+        self.sent = []
+        self._xids = xids
+
+    def set_xid(self, msg):
+        msg.xid = next(self._xids)
+
+    def send_msg(self, msg):
+        self.sent.append(msg)
+
+
+class TestMessageBatcher(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestMessageBatcher, self).setUp()
+        fake_oflib.patch_fake_oflib_of().start()
+        self.mod_batch = importutils.import_module(
+            'neutron.plugins.ofagent.agent.batch')
+        self.ryuapp = mock.Mock()
+        self.batcher = self.mod_batch.MessageBatcher(self.ryuapp)
+        self.ryuapp.send_event.side_effect = (
+            lambda name, ev: self.batcher.batch_sent(ev.batch))
+        self.send_msg = mock.patch.object(self.mod_batch.ryu_api,
+                                          'send_msg').start()
+        xids = itertools.count(1)
+        self.dp1 = FakeDatapath(1, xids)
+        self.dp2 = FakeDatapath(2, xids)
+
+    def _msg(self, datapath):
+        return mock.Mock(datapath=datapath, xid=None)
+
+    def test_send_msg_out_of_batch(self):
+        msg = self._msg(self.dp1)
+        self.batcher.send_msg(msg)
+        self.send_msg.assert_called_once_with(self.ryuapp, msg)
+        self.assertEqual([], self.dp1.sent)
+
+    def test_batch_sends_messages_with_one_barrier_per_datapath(self):
+        msgs1 = [self._msg(self.dp1) for i in range(3)]
+        msgs2 = [self._msg(self.dp2)]
+        nested = self._msg(self.dp1)
+        with self.batcher.batch():
+            for msg in msgs1 + msgs2:
+                self.batcher.send_msg(msg)
+            with self.batcher.batch():
+                self.batcher.send_msg(nested)
+            self.assertFalse(self.send_msg.called)
+            self.assertEqual([], self.dp1.sent)
+        self.assertEqual(msgs1 + [nested], self.dp1.sent)
+        self.assertEqual(msgs2, self.dp2.sent)
+        ofpp = self.dp1.ofproto_parser
+        self.assertEqual(
+            [mock.call(self.ryuapp, ofpp.OFPBarrierRequest(dp),
+                       reply_cls=ofpp.OFPBarrierReply)
+             for dp in (self.dp1, self.dp2)],
+            self.send_msg.call_args_list)
+        self.assertEqual({}, self.batcher._sent)
+
+    def test_batch_raises_errors_of_its_messages(self):
+        msgs = [self._msg(self.dp1) for i in range(3)]
+        error = mock.Mock(datapath=self.dp1)
+
+        def barrier(app, msg, reply_cls):
+            # the switch fails the second message of the batch
+            error.xid = msgs[1].xid
+            self.batcher.error_received(error)
+            # errors of messages sent out of a batch are not recorded
+            self.batcher.error_received(mock.Mock(datapath=self.dp1,
+                                                  xid=99))
+
+        self.send_msg.side_effect = barrier
+        with mock.patch.object(self.mod_batch.LOG, 'error') as log:
+            try:
+                with self.batcher.batch():
+                    for msg in msgs:
+                        self.batcher.send_msg(msg)
+            except self.mod_batch.BatchError as e:
+                self.assertIn('1 OpenFlow messages sent to datapaths [1]',
+                              str(e))
+            else:
+                self.fail('BatchError not raised')
+        self.assertEqual(1, log.call_count)
+        self.assertEqual({}, self.batcher._sent)
+
+    def test_batch_fails_without_reply_in_time(self):
+        # the ryu app never handles the event of the batch
+        self.ryuapp.send_event.side_effect = None
+        with contextlib.nested(
+            mock.patch.object(self.mod_batch.hub, 'Event'),
+            mock.patch.object(self.mod_batch.LOG, 'error')
+        ) as (event_cls, log):
+            event_cls.return_value.wait.return_value = False
+            try:
+                with self.batcher.batch():
+                    self.batcher.send_msg(self._msg(self.dp1))
+            except self.mod_batch.BatchError as e:
+                self.assertIn('no reply within 30 seconds', str(e))
+            else:
+                self.fail('BatchError not raised')
+        event_cls.return_value.wait.assert_called_once_with(
+            self.mod_batch.BATCH_TIMEOUT)
+        self.assertEqual({}, self.batcher._sent)
@@ -60,6 +60,8 @@ class OFAAgentTestCase(base.BaseTestCase):
                              'neutron.agent.firewall.NoopFirewallDriver',
                              group='SECURITYGROUP')
         self.ryuapp = mock.Mock()
+        self.ryuapp.msg_batcher = self.mod_agent.batch.MessageBatcher(
+            self.ryuapp)
         cfg.CONF.register_cli_opts([
             cfg.StrOpt('ofp-listen-host', default='',
                        help='openflow listen host'),
@@ -524,6 +526,31 @@ class TestOFANeutronAgent(OFAAgentTestCase):
             self.assertTrue(upd_dev_down.called)
         _get_ports.assert_called_once_with(self.agent.int_br)
 
+    def test_treat_devices_added_updated_reports_up_once_flows_sent(self):
+        details = {'admin_state_up': True,
+                   'port_id': 'xxx',
+                   'device': 'xxx',
+                   'network_id': 'yyy',
+                   'physical_network': 'foo',
+                   'segmentation_id': 'bar',
+                   'network_type': 'baz'}
+        calls = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'get_device_details',
+                              return_value=details),
+            mock.patch.object(self.agent, '_get_ports',
+                              return_value=[_mock_port(True, 'xxx')]),
+            mock.patch.object(self.agent.plugin_rpc, 'update_device_up',
+                              new=calls.update_device_up),
+            mock.patch.object(self.agent.msg_batcher, '_send_batches',
+                              new=calls.send_batches),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ):
+            self.assertFalse(self.agent.treat_devices_added_or_updated(
+                ['xxx']))
+        self.assertEqual(['send_batches', 'update_device_up'],
+                         [name for name, args, kwargs in calls.mock_calls])
+
     def test_treat_devices_removed_returns_true_for_missing_device(self):
         with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
                                side_effect=Exception()):
@@ -747,6 +774,44 @@ class TestOFANeutronAgent(OFAAgentTestCase):
             self.agent.fdb_add(None, fdb_entry)
             self.assertEqual(ryu_send_msg_fn.call_count, 2)
 
+    def _test_fdb_batch_error(self, method):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {self.lvms[1].net:
+                     {'network_type': self.tunnel_type,
+                      'segment_id': 'tun2',
+                      'ports':
+                      {self.lvms[1].ip:
+                       [['mac', 'ip'],
+                        n_const.FLOODING_ENTRY]}}}
+        error = self.mod_agent.batch.BatchError(count=1, dpids=[1],
+                                                errors=['error'])
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'ryu_send_msg'),
+            mock.patch.object(self.agent.msg_batcher, '_send_batches',
+                              side_effect=error)
+        ):
+            getattr(self.agent, method)(None, fdb_entry)
+        self.assertTrue(self.agent.fdb_resync)
+
+    def test_fdb_add_schedules_resync_on_batch_error(self):
+        self._test_fdb_batch_error('fdb_add')
+
+    def test_fdb_remove_schedules_resync_on_batch_error(self):
+        self._test_fdb_batch_error('fdb_remove')
+
+    def test_resync_fdb_flooding_flows(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.local_vlan_map['net3'] = mock.Mock(tun_ofports=set())
+        self.agent.fdb_resync = True
+        with mock.patch.object(self.agent,
+                               '_add_fdb_flooding_flow') as add_flow_fn:
+            self.agent.resync_fdb_flooding_flows()
+        self.assertEqual(
+            sorted([self.agent.local_vlan_map['net1'],
+                    self.agent.local_vlan_map['net2']]),
+            sorted(args[0] for args, kwargs in add_flow_fn.call_args_list))
+        self.assertFalse(self.agent.fdb_resync)
+
     def test_fdb_del_flows(self):
         self._prepare_l2_pop_ofports()
         fdb_entry = {self.lvms[1].net:
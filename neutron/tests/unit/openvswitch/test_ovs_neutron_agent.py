@@ -24,6 +24,7 @@ from neutron.agent.linux import async_process
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib
 from neutron.agent.linux import utils
+from neutron.agent import local_vlan
 from neutron.common import constants as n_const
 from neutron.openstack.common import log
 from neutron.plugins.common import constants as p_const
@@ -77,6 +78,11 @@ class CreateAgentConfigMap(base.BaseTestCase):
         with testtools.ExpectedException(ValueError):
             ovs_neutron_agent.create_agent_config_map(cfg.CONF)
 
+    def test_create_agent_config_map_fails_for_invalid_chunk_size(self):
+        cfg.CONF.set_override('device_chunk_size', 0, group='AGENT')
+        with testtools.ExpectedException(ValueError):
+            ovs_neutron_agent.create_agent_config_map(cfg.CONF)
+
     def test_create_agent_config_map_multiple_tunnel_types(self):
         cfg.CONF.set_override('local_ip', '10.10.10.10', group='OVS')
         cfg.CONF.set_override('tunnel_types', [p_const.TYPE_GRE,
@@ -145,6 +151,10 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.agent.tun_br = mock.Mock()
         self.agent.sg_agent = mock.Mock()
 
+    @staticmethod
+    def _update_devices(context, devices, agent_id, host=None):
+        return [{'device': device, 'exists': True} for device in devices]
+
     def _mock_port_bound(self, ofport=None, new_local_vlan=None,
                          old_local_vlan=None):
         port = mock.Mock()
@@ -214,6 +224,72 @@ class TestOvsNeutronAgent(base.BaseTestCase):
     def test_port_bound_does_not_rewire_if_already_bound(self):
         self._mock_port_bound(ofport=-1, new_local_vlan=1, old_local_vlan=1)
 
+    def test_port_bound_in_transaction_deletes_flows_once_tagged(self):
+        port = mock.Mock(ofport=1, port_name='tap1')
+        self.agent.local_vlan_map['my-net-uuid'] = (
+            ovs_neutron_agent.LocalVLANMapping(2, None, None, None))
+        calls = mock.Mock()
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'run_vsctl',
+                              side_effect=['1\n', '\n']),
+            mock.patch.object(self.agent.int_br, 'delete_flows')
+        ) as (run_vsctl, delete_flows):
+            calls.attach_mock(run_vsctl, 'run_vsctl')
+            calls.attach_mock(delete_flows, 'delete_flows')
+            with self.agent.int_br.ovsdb_transaction():
+                self.agent.port_bound(port, 'my-net-uuid', 'local', None,
+                                      None, [], "compute:None", False)
+                self.assertFalse(delete_flows.called)
+        # the current tag is read at once and the flows are deleted after
+        # the commit of the new one
+        self.assertEqual(
+            [mock.call.run_vsctl(['get', 'Port', 'tap1', 'tag'], False),
+             mock.call.run_vsctl(['--oneline', '--', 'set', 'Port', 'tap1',
+                                  'tag=2'], False),
+             mock.call.delete_flows(in_port=1)],
+            calls.mock_calls)
+
+    def test_port_bound_reuses_recovered_local_vlan(self):
+        port = mock.Mock()
+        port.ofport = 1
+        self.agent.local_vlans.reserve(5)
+        self.agent.local_vlans.reserve(6)
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'set_db_attribute'),
+            mock.patch.object(self.agent.int_br, 'delete_flows')
+        ) as (set_ovs_db_func, delete_flows_func):
+            self.agent.port_bound(port, 'netuid12345', 'local', None, None,
+                                  [], "compute:None", False, cur_tag=5)
+        self.assertEqual(5, self.agent.local_vlan_map['netuid12345'].vlan)
+        self.assertEqual(set([6]), self.agent.local_vlans.reserved())
+        self.assertFalse(set_ovs_db_func.called)
+        self.assertFalse(delete_flows_func.called)
+
+    def test_port_bound_reuses_saved_local_vlan(self):
+        utils.replace_file(cfg.CONF.AGENT.local_vlan_state_file,
+                           '{"netuid12345": 7}')
+        self.agent.local_vlans = local_vlan.LocalVlanAllocator(
+            cfg.CONF.AGENT.local_vlan_state_file)
+        port = mock.Mock()
+        port.ofport = 1
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'set_db_attribute'),
+            mock.patch.object(self.agent.int_br, 'delete_flows')
+        ) as (set_ovs_db_func, delete_flows_func):
+            self.agent.port_bound(port, 'netuid12345', 'local', None, None,
+                                  [], "compute:None", False, cur_tag=7)
+        self.assertEqual(7, self.agent.local_vlan_map['netuid12345'].vlan)
+        self.assertFalse(set_ovs_db_func.called)
+        self.assertFalse(delete_flows_func.called)
+
+    def test_recover_local_vlans(self):
+        with mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                               return_value={'tap1': 5, 'tap2': 5,
+                                             'tap3': 4095, 'patch-tun': []}):
+            self.agent._recover_local_vlans()
+        self.assertEqual(set([5]), self.agent.local_vlans.reserved())
+        self.assertFalse(self.agent.local_vlans.is_free(5))
+
     def test_port_bound_for_dvr_interface(self, ofport=10):
         self._setup_for_dvr_test()
         with mock.patch('neutron.agent.linux.ovs_lib.OVSBridge.'
@@ -362,8 +438,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                              return_value=None),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                              side_effect=self._update_devices),
             mock.patch.object(self.agent.dvr_agent.int_br, 'delete_flows'),
             mock.patch.object(self.agent.dvr_agent.tun_br,
                               'delete_flows')) as (reclaim_vlan_fn,
@@ -417,8 +493,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                              return_value=None),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                              side_effect=self._update_devices),
             mock.patch.object(self.agent.dvr_agent.int_br,
                               'delete_flows')) as (reclaim_vlan_fn,
                                                    update_dev_down_fn,
@@ -463,8 +539,8 @@ class TestOvsNeutronAgent(base.BaseTestCase):
 
         with contextlib.nested(
             mock.patch.object(self.agent, 'reclaim_local_vlan'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                              return_value=None),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                              side_effect=self._update_devices),
             mock.patch.object(self.agent.dvr_agent.int_br,
                               'delete_flows')) as (reclaim_vlan_fn,
                                                    update_dev_down_fn,
@@ -472,6 +548,108 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 self.agent.treat_devices_removed([self._port.vif_id])
                 self.assertTrue(delete_flows_int_fn.called)
 
+    def _dvr_subnet_flows(self, add_flow_fn):
+        return [c for c in add_flow_fn.call_args_list
+                if c[1].get('priority') == 2]
+
+    def _bind_dvr_ports(self, *ports):
+        dvr_agent = self.agent.dvr_agent
+        with contextlib.nested(
+            mock.patch.object(dvr_agent.plugin_rpc, 'get_subnet_for_dvr',
+                              return_value={
+                                  'gateway_ip': '1.1.1.1',
+                                  'cidr': '1.1.1.0/24',
+                                  'gateway_mac': 'aa:bb:cc:11:22:33'}),
+            mock.patch.object(dvr_agent.plugin_rpc,
+                              'get_compute_ports_on_host_by_subnet'),
+            mock.patch.object(dvr_agent.int_br, 'get_vif_port_by_id'),
+            mock.patch.object(dvr_agent.int_br, 'add_flow'),
+            mock.patch.object(dvr_agent.int_br, 'delete_flows')
+        ) as (get_subnet_fn, get_cphost_fn, get_vif_fn,
+              add_flow_int_fn, delete_flows_int_fn):
+            with dvr_agent.deferred_subnet_flows():
+                for port, fixed_ips, device_owner in ports:
+                    dvr_agent.bind_port_to_dvr(port, 'vxlan', fixed_ips,
+                                               device_owner, 1)
+        self.assertFalse(get_cphost_fn.called)
+        self.assertFalse(get_vif_fn.called)
+        return get_subnet_fn, add_flow_int_fn
+
+    def test_bind_dvr_interface_plumbs_known_compute_ports(self):
+        self._setup_for_dvr_test()
+        self._compute_port.vif_mac = 'fa:16:3e:00:00:01'
+        get_subnet_fn, add_flow_int_fn = self._bind_dvr_ports(
+            (self._compute_port, self._compute_fixed_ips, 'compute:None'),
+            (self._port, self._fixed_ips,
+             n_const.DEVICE_OWNER_DVR_INTERFACE))
+        self.assertEqual(1, get_subnet_fn.call_count)
+        self.assertIn(self._compute_port.vif_id,
+                      self.agent.dvr_agent.local_ports)
+        add_flow_int_fn.assert_any_call(
+            table=constants.DVR_TO_SRC_MAC, priority=4, dl_vlan=1,
+            dl_dst='fa:16:3e:00:00:01',
+            actions='strip_vlan,mod_dl_src:aa:bb:cc:11:22:33,output:20')
+        self.assertEqual(1, len(self._dvr_subnet_flows(add_flow_int_fn)))
+
+    def test_bind_dvr_compute_ports_writes_subnet_flow_once(self):
+        self._setup_for_dvr_test()
+        self._bind_dvr_ports((self._port, self._fixed_ips,
+                              n_const.DEVICE_OWNER_DVR_INTERFACE))
+        ports = []
+        for i in range(3):
+            port = mock.Mock(vif_id='compute-%d' % i, ofport=20 + i,
+                             vif_mac='fa:16:3e:00:00:%02x' % i)
+            ports.append((port, self._compute_fixed_ips, 'compute:None'))
+        get_subnet_fn, add_flow_int_fn = self._bind_dvr_ports(*ports)
+        self.assertFalse(get_subnet_fn.called)
+        subnet_flows = self._dvr_subnet_flows(add_flow_int_fn)
+        self.assertEqual(1, len(subnet_flows))
+        actions = subnet_flows[0][1]['actions']
+        self.assertEqual(['20', '21', '22'],
+                         sorted(actions.split('output:')[1].split(',')))
+
+        # the ports are already plumbed when they are bound again
+        get_subnet_fn, add_flow_int_fn = self._bind_dvr_ports(*ports)
+        self.assertFalse(add_flow_int_fn.called)
+
+    def test_unbind_dvr_interface_invalidates_subnet_info(self):
+        self._setup_for_dvr_test()
+        self._bind_dvr_ports((self._port, self._fixed_ips,
+                              n_const.DEVICE_OWNER_DVR_INTERFACE))
+        self.assertIn('my-subnet-uuid', self.agent.dvr_agent.subnet_info)
+        with contextlib.nested(
+            mock.patch.object(self.agent.dvr_agent.int_br, 'delete_flows'),
+            mock.patch.object(self.agent.dvr_agent.tun_br, 'delete_flows')
+        ):
+            self.agent.dvr_agent.unbind_port_from_dvr(self._port, 1)
+        self.assertNotIn('my-subnet-uuid', self.agent.dvr_agent.subnet_info)
+        self.assertNotIn('my-subnet-uuid', self.agent.dvr_agent.local_dvr_map)
+        get_subnet_fn = self._bind_dvr_ports(
+            (self._port, self._fixed_ips,
+             n_const.DEVICE_OWNER_DVR_INTERFACE))[0]
+        self.assertEqual(1, get_subnet_fn.call_count)
+
+    def test_unbind_csnat_port_invalidates_subnet_info(self):
+        self._setup_for_dvr_test()
+        self._bind_dvr_ports((self._port, self._fixed_ips,
+                              n_const.DEVICE_OWNER_ROUTER_SNAT))
+        self.assertIn('my-subnet-uuid', self.agent.dvr_agent.subnet_info)
+        with mock.patch.object(self.agent.dvr_agent.int_br, 'delete_flows'):
+            self.agent.dvr_agent.unbind_port_from_dvr(self._port, 1)
+        self.assertNotIn('my-subnet-uuid', self.agent.dvr_agent.subnet_info)
+        self.assertNotIn('my-subnet-uuid', self.agent.dvr_agent.local_dvr_map)
+
+    def test_reset_ovs_parameters_clears_subnet_info(self):
+        self._setup_for_dvr_test()
+        self._bind_dvr_ports((self._port, self._fixed_ips,
+                              n_const.DEVICE_OWNER_DVR_INTERFACE))
+        dvr_agent = self.agent.dvr_agent
+        self.assertIn('my-subnet-uuid', dvr_agent.subnet_info)
+        dvr_agent.reset_ovs_parameters(dvr_agent.int_br, dvr_agent.tun_br,
+                                       dvr_agent.patch_int_ofport,
+                                       dvr_agent.patch_tun_ofport)
+        self.assertEqual({}, dvr_agent.subnet_info)
+
     def test_setup_dvr_flows_on_int_br(self):
         self._setup_for_dvr_test()
         with contextlib.nested(
@@ -522,6 +700,19 @@ class TestOvsNeutronAgent(base.BaseTestCase):
     def test_port_dead_with_port_already_dead(self):
         self._test_port_dead(ovs_neutron_agent.DEAD_VLAN_TAG)
 
+    def test_port_dead_readds_drop_flow_on_warm_restart(self):
+        port = mock.Mock()
+        port.ofport = 1
+        self.agent.stale_flows_pending = True
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'set_db_attribute'),
+            mock.patch.object(self.agent.int_br, 'add_flow')
+        ) as (set_ovs_db_func, add_flow_func):
+            self.agent.port_dead(port, ovs_neutron_agent.DEAD_VLAN_TAG)
+        self.assertFalse(set_ovs_db_func.called)
+        add_flow_func.assert_called_once_with(priority=2, in_port=1,
+                                              actions="drop")
+
     def mock_scan_ports(self, vif_port_set=None, registered_ports=None,
                         updated_ports=None, port_tags_dict=None):
         if port_tags_dict is None:  # Because empty dicts evaluate as False.
@@ -628,10 +819,13 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[details]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=port),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={}),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, func_name)
-        ) as (get_dev_fn, get_vif_func, upd_dev_up, upd_dev_down, func):
+        ) as (get_dev_fn, get_vif_func, get_tags_func, upd_dev_up,
+              upd_dev_down, func):
             skip_devs = self.agent.treat_devices_added_or_updated([{}], False)
             # The function should not raise
             self.assertFalse(skip_devs)
@@ -672,10 +866,12 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[dev_mock]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=None),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={}),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
-        ) as (get_dev_fn, get_vif_func, upd_dev_up,
+        ) as (get_dev_fn, get_vif_func, get_tags_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
             skip_devs = self.agent.treat_devices_added_or_updated([{}], False)
             # The function should return False for resync and no device
@@ -704,10 +900,12 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                               return_value=[fake_details_dict]),
             mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
                               return_value=mock.MagicMock()),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_up'),
-            mock.patch.object(self.agent.plugin_rpc, 'update_device_down'),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={}),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down'),
             mock.patch.object(self.agent, 'treat_vif_port')
-        ) as (get_dev_fn, get_vif_func, upd_dev_up,
+        ) as (get_dev_fn, get_vif_func, get_tags_func, upd_dev_up,
               upd_dev_down, treat_vif_port):
             skip_devs = self.agent.treat_devices_added_or_updated([{}], False)
             # The function should return False for resync
@@ -715,18 +913,130 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertTrue(treat_vif_port.called)
             self.assertTrue(upd_dev_down.called)
 
+    def test_treat_devices_added_updated_binds_ports_in_one_transaction(self):
+        details = []
+        ports = {}
+        for device, tag in (('port1', 1), ('port2', 2)):
+            details.append({'admin_state_up': True,
+                            'port_id': device,
+                            'device': device,
+                            'network_id': 'net',
+                            'physical_network': None,
+                            'segmentation_id': None,
+                            'network_type': 'local',
+                            'fixed_ips': [],
+                            'device_owner': 'compute:None'})
+            ports[device] = ovs_lib.VifPort('tap-%s' % device, tag, device,
+                                            'aa:bb:cc:dd:ee:ff',
+                                            self.agent.int_br)
+        self.agent.local_vlan_map['net'] = (
+            ovs_neutron_agent.LocalVLANMapping(1, 'local', None, None))
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=details),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              side_effect=ports.get),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={'tap-port1': 1,
+                                            'tap-port2': []}),
+            mock.patch.object(self.agent.int_br, 'run_vsctl'),
+            mock.patch.object(self.agent.int_br, 'delete_flows'),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up',
+                              side_effect=self._update_devices)
+        ) as (get_dev_fn, get_vif_func, get_tags_func, run_vsctl,
+              delete_flows, upd_dev_up):
+            self.agent.treat_devices_added_or_updated(['port1', 'port2'],
+                                                      False)
+        run_vsctl.assert_called_once_with(
+            ['--oneline', '--', 'set', 'Port', 'tap-port2', 'tag=1'], False)
+        delete_flows.assert_called_once_with(in_port=2)
+        upd_dev_up.assert_called_once_with(self.agent.context,
+                                           ['port1', 'port2'],
+                                           self.agent.agent_id,
+                                           cfg.CONF.host)
+        self.assertEqual(set(['details', 'wiring', 'status']),
+                         set(self.agent.stage_timings))
+
+    def test_treat_devices_added_updated_skips_failed_status_update(self):
+        details = {'admin_state_up': True, 'port_id': 'xxx',
+                   'device': 'xxx', 'network_id': 'yyy',
+                   'physical_network': 'foo', 'segmentation_id': 'bar',
+                   'network_type': 'baz', 'fixed_ips': [],
+                   'device_owner': 'compute:None'}
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={}),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up',
+                              return_value=[{'device': 'xxx',
+                                             'failed': True}]),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ):
+            self.assertEqual(
+                ['xxx'], self.agent.treat_devices_added_or_updated(['xxx'],
+                                                                   False))
+
+    def test_treat_devices_added_updated_skips_status_update_error(self):
+        details = {'admin_state_up': True, 'port_id': 'xxx',
+                   'device': 'xxx', 'network_id': 'yyy',
+                   'physical_network': 'foo', 'segmentation_id': 'bar',
+                   'network_type': 'baz', 'fixed_ips': [],
+                   'device_owner': 'compute:None'}
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[details]),
+            mock.patch.object(self.agent.int_br, 'get_vif_port_by_id',
+                              return_value=mock.MagicMock()),
+            mock.patch.object(self.agent.int_br, 'get_port_tag_dict',
+                              return_value={}),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up',
+                              side_effect=Exception()),
+            mock.patch.object(self.agent, 'treat_vif_port')
+        ):
+            self.assertEqual(
+                ['xxx'], self.agent.treat_devices_added_or_updated(['xxx'],
+                                                                   False))
+
+    def test_treat_ancillary_devices_added_returns_true_on_error(self):
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc,
+                              'get_devices_details_list',
+                              return_value=[{'device': 'xxx'}]),
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_up',
+                              side_effect=Exception())
+        ):
+            self.assertTrue(self.agent.treat_ancillary_devices_added(['xxx']))
+
     def test_treat_devices_removed_returns_true_for_missing_device(self):
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
                                side_effect=Exception()):
-            self.assertTrue(self.agent.treat_devices_removed([{}]))
+            self.assertTrue(self.agent.treat_devices_removed(['tap1']))
+
+    def test_treat_devices_removed_returns_true_for_failed_device(self):
+        details = [{'device': 'tap1', 'failed': True},
+                   {'device': 'tap2', 'exists': True}]
+        with contextlib.nested(
+            mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                              return_value=details),
+            mock.patch.object(self.agent, 'port_unbound')
+        ) as (upd_dev_down, port_unbound):
+            self.assertTrue(self.agent.treat_devices_removed(['tap1',
+                                                              'tap2']))
+        port_unbound.assert_called_once_with('tap2')
 
     def _mock_treat_devices_removed(self, port_exists):
-        details = dict(exists=port_exists)
-        with mock.patch.object(self.agent.plugin_rpc, 'update_device_down',
-                               return_value=details):
+        details = dict(device='tap1', exists=port_exists)
+        with mock.patch.object(self.agent.plugin_rpc, 'update_devices_down',
+                               return_value=[details]):
             with mock.patch.object(self.agent, 'port_unbound') as port_unbound:
-                self.assertFalse(self.agent.treat_devices_removed([{}]))
-        self.assertTrue(port_unbound.called)
+                self.assertFalse(self.agent.treat_devices_removed(['tap1']))
+        port_unbound.assert_called_once_with('tap1')
 
     def test_treat_devices_removed_unbinds_port(self):
         self._mock_treat_devices_removed(True)
@@ -763,6 +1073,93 @@ class TestOvsNeutronAgent(base.BaseTestCase):
              'removed': set(['eth0']),
              'added': set(['eth1'])})
 
+    def test_process_network_ports_in_chunks(self):
+        self.agent.device_chunk_size = 2
+        port_info = {'current': set(['tap1', 'tap2', 'tap3']),
+                     'added': set(['tap1', 'tap2', 'tap3'])}
+        details = [{'device': 'tap3'}]
+        with contextlib.nested(
+            mock.patch.object(self.agent.sg_agent, "setup_port_filters"),
+            mock.patch.object(self.agent, "get_devices_details",
+                              return_value=details),
+            mock.patch.object(self.agent, "treat_devices_added_or_updated",
+                              return_value=['tap3'])
+        ) as (setup_port_filters, get_details, device_added_updated):
+            self.assertFalse(self.agent.process_network_ports(port_info,
+                                                              False))
+        chunks = [c[0][0] for c in device_added_updated.call_args_list]
+        self.assertEqual(2, len(chunks))
+        self.assertEqual(port_info['added'], chunks[0] | chunks[1])
+        get_details.assert_called_once_with(chunks[1])
+        device_added_updated.assert_has_calls([
+            mock.call(chunks[0], False),
+            mock.call(chunks[1], False, devices_details_list=details)])
+        setup_port_filters.assert_has_calls([mock.call(chunks[0], set()),
+                                             mock.call(chunks[1], set())])
+        self.assertEqual(set(['tap1', 'tap2']), port_info['current'])
+        self.assertEqual(set(['details', 'filters']),
+                         set(self.agent.stage_timings))
+
+    def test_process_network_ports_stops_on_details_failure(self):
+        self.agent.device_chunk_size = 1
+        port_info = {'current': set(['tap1', 'tap2']),
+                     'added': set(['tap1', 'tap2'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent.sg_agent, "setup_port_filters"),
+            mock.patch.object(self.agent, "get_devices_details"),
+            mock.patch.object(
+                self.agent, "treat_devices_added_or_updated",
+                side_effect=ovs_neutron_agent.DeviceListRetrievalError(
+                    devices=[], error=None))
+        ) as (setup_port_filters, get_details, device_added_updated):
+            self.assertTrue(self.agent.process_network_ports(port_info,
+                                                             False))
+        self.assertEqual(1, device_added_updated.call_count)
+
+    def test_process_network_ports_resyncs_on_prefetch_failure(self):
+        self.agent.device_chunk_size = 1
+        port_info = {'current': set(['tap1', 'tap2']),
+                     'added': set(['tap1', 'tap2']),
+                     'removed': set(['tap3'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent.sg_agent, "setup_port_filters"),
+            mock.patch.object(
+                self.agent, "get_devices_details",
+                side_effect=ovs_neutron_agent.DeviceListRetrievalError(
+                    devices=[], error=None)),
+            mock.patch.object(self.agent, "treat_devices_added_or_updated",
+                              return_value=[]),
+            mock.patch.object(self.agent, "treat_devices_removed",
+                              return_value=False)
+        ) as (setup_port_filters, get_details, device_added_updated,
+              device_removed):
+            self.assertTrue(self.agent.process_network_ports(port_info,
+                                                             False))
+        self.assertEqual(1, device_added_updated.call_count)
+        device_removed.assert_called_once_with(set(['tap3']))
+
+    def test_process_network_ports_kills_prefetch_on_error(self):
+        self.agent.device_chunk_size = 1
+        port_info = {'current': set(['tap1', 'tap2']),
+                     'added': set(['tap1', 'tap2'])}
+        with contextlib.nested(
+            mock.patch.object(self.agent.sg_agent, "setup_port_filters"),
+            mock.patch('eventlet.spawn'),
+            mock.patch.object(self.agent, "treat_devices_added_or_updated",
+                              side_effect=RuntimeError())
+        ) as (setup_port_filters, spawn, device_added_updated):
+            self.assertRaises(RuntimeError,
+                              self.agent.process_network_ports,
+                              port_info, False)
+        spawn.return_value.kill.assert_called_once_with()
+
+    def test_process_network_ports_refreshes_firewall_without_changes(self):
+        with mock.patch.object(self.agent.sg_agent,
+                               "setup_port_filters") as setup_port_filters:
+            self.assertFalse(self.agent.process_network_ports(
+                {'current': set(['tap0'])}, False))
+        setup_port_filters.assert_called_once_with(set(), set())
+
     def test_report_state(self):
         with mock.patch.object(self.agent.state_rpc,
                                "report_state") as report_st:
@@ -775,6 +1172,16 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                 self.agent.agent_state["configurations"]["devices"],
                 self.agent.int_br_device_count
             )
+            self.assertNotIn("polling_stats",
+                             self.agent.agent_state["configurations"])
+
+    def test_report_state_includes_polling_stats(self):
+        stats = {'dropped_lines': 2, 'stdout_queue_depth': 1}
+        with mock.patch.object(self.agent.state_rpc, "report_state"):
+            self.agent.polling_stats = stats
+            self.agent._report_state()
+        self.assertEqual(
+            stats, self.agent.agent_state["configurations"]["polling_stats"])
 
     def test_network_delete(self):
         with contextlib.nested(
@@ -853,6 +1260,18 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertEqual(self.agent.phys_ofports["physnet1"],
                              "phy_ofport")
 
+    def test_setup_physical_bridges_records_flows_while_syncing(self):
+        self.agent.syncing_flows = True
+        with contextlib.nested(
+            mock.patch.object(ovs_lib, 'OVSBridge'),
+            mock.patch.object(ovs_lib, 'get_bridges',
+                              return_value=['br-eth']),
+            mock.patch.object(self.agent, 'int_br')
+        ) as (ovs_bridge, get_bridges, int_br):
+            self.agent.setup_physical_bridges({'physnet1': 'br-eth'})
+        ovs_bridge.return_value.assert_has_calls(
+            [mock.call.sync_flows_on(), mock.call.remove_all_flows()])
+
     def test_setup_physical_bridges_using_veth_interconnection(self):
         self.agent.use_veth_interconnection = True
         with contextlib.nested(
@@ -896,6 +1315,43 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.assertEqual(self.agent.phys_ofports["physnet1"],
                              "int_ofport")
 
+    def test_setup_physical_bridges_on_warm_restart(self):
+        self.agent.warm_restart = True
+        with contextlib.nested(
+            mock.patch.object(ovs_lib, "get_bridges",
+                              return_value=["br-eth"]),
+            mock.patch.object(ovs_lib.OVSBridge, "remove_all_flows"),
+            mock.patch.object(ovs_lib.OVSBridge, "add_flow"),
+            mock.patch.object(ovs_lib.OVSBridge, "get_port_ofport",
+                              return_value="3"),
+            mock.patch.object(ovs_lib.OVSBridge, "add_patch_port"),
+            mock.patch.object(ovs_lib.OVSBridge, "delete_port"),
+            mock.patch.object(ovs_lib.OVSBridge, "set_db_attribute"),
+            mock.patch.object(self.agent.int_br, "add_flow"),
+            mock.patch.object(self.agent.int_br, "get_port_ofport",
+                              return_value="4"),
+            mock.patch.object(self.agent.int_br, "add_patch_port"),
+            mock.patch.object(self.agent.int_br, "delete_port"),
+            mock.patch.object(self.agent.int_br, "set_db_attribute"),
+        ) as (get_br_fn, remflows_fn, ovs_add_flow_fn, ovs_get_ofport_fn,
+              ovs_addpatch_port_fn, ovs_delport_fn, ovs_set_attr_fn,
+              br_add_flow_fn, br_get_ofport_fn, br_addpatch_port_fn,
+              br_delport_fn, br_set_attr_fn):
+            self.agent.setup_physical_bridges({"physnet1": "br-eth"})
+        self.assertFalse(remflows_fn.called)
+        self.assertFalse(ovs_addpatch_port_fn.called)
+        self.assertFalse(ovs_delport_fn.called)
+        self.assertFalse(br_addpatch_port_fn.called)
+        self.assertFalse(br_delport_fn.called)
+        br_add_flow_fn.assert_called_once_with(priority=2, in_port="4",
+                                               actions="drop")
+        br_set_attr_fn.assert_called_once_with('Interface', 'int-br-eth',
+                                               'options:peer', 'phy-br-eth')
+        self.assertEqual("4", self.agent.int_ofports["physnet1"])
+        self.assertEqual("3", self.agent.phys_ofports["physnet1"])
+        self.assertEqual(self.agent.agent_cookie,
+                         self.agent.phys_brs["physnet1"].agent_cookie)
+
     def test_get_peer_name(self):
             bridge1 = "A_REALLY_LONG_BRIDGE_NAME1"
             bridge2 = "A_REALLY_LONG_BRIDGE_NAME2"
@@ -924,6 +1380,121 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.agent.setup_tunnel_br(None)
             self.assertTrue(intbr_patch_fn.called)
 
+    def test_setup_tunnel_br_on_warm_restart(self):
+        self.agent.warm_restart = True
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, "get_port_ofport",
+                              return_value="1"),
+            mock.patch.object(self.agent.int_br, "add_patch_port"),
+        ) as (intbr_get_ofport_fn, intbr_patch_fn):
+            self.agent.tun_br.get_port_ofport.return_value = "2"
+            self.agent.setup_tunnel_br(None)
+        self.assertFalse(intbr_patch_fn.called)
+        self.assertFalse(self.agent.tun_br.add_patch_port.called)
+        self.assertFalse(self.agent.tun_br.reset_bridge.called)
+        self.assertFalse(self.agent.tun_br.remove_all_flows.called)
+        self.assertTrue(self.agent.tun_br.create.called)
+        self.assertEqual("1", self.agent.patch_tun_ofport)
+        self.assertEqual("2", self.agent.patch_int_ofport)
+
+    def test_cleanup_stale_flows(self):
+        phys_br = mock.Mock()
+        self.agent.phys_brs = {'physnet1': phys_br}
+        self.agent.stale_flows_pending = True
+        with mock.patch.object(self.agent.int_br,
+                               'delete_stale_flows') as int_delete_fn:
+            self.agent.cleanup_stale_flows()
+        self.assertTrue(int_delete_fn.called)
+        self.assertTrue(phys_br.delete_stale_flows.called)
+        self.assertTrue(self.agent.tun_br.delete_stale_flows.called)
+        self.assertFalse(self.agent.stale_flows_pending)
+
+    def _test_rpc_loop_cleans_stale_flows(self, resync):
+        self.agent.stale_flows_pending = True
+
+        def process_network_ports(port_info, ovs_restarted):
+            self.agent.run_daemon_loop = False
+            return resync
+
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'check_ovs_restart',
+                              return_value=False),
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value={'current': set(['tap1']),
+                                            'added': set(['tap1']),
+                                            'removed': set()}),
+            mock.patch.object(self.agent, 'process_network_ports',
+                              side_effect=process_network_ports),
+            mock.patch.object(self.agent, 'cleanup_stale_flows'),
+            mock.patch.object(self.agent, 'local_vlans'),
+            mock.patch('time.sleep')
+        ) as (check_ovs_restart, scan_ports, process_network_ports,
+              cleanup_stale_flows, local_vlans, sleep):
+            self.agent.rpc_loop(polling_manager=mock.Mock())
+        self.assertEqual(not resync, cleanup_stale_flows.called)
+        self.assertEqual(not resync, local_vlans.release_unclaimed.called)
+        local_vlans.save.assert_called_once_with()
+
+    def test_rpc_loop_cleans_stale_flows_after_first_sync(self):
+        self._test_rpc_loop_cleans_stale_flows(False)
+
+    def test_rpc_loop_keeps_stale_flows_until_sync_succeeds(self):
+        self._test_rpc_loop_cleans_stale_flows(True)
+
+    def test_sync_flows(self):
+        phys_br = mock.Mock()
+        self.agent.phys_brs = {'physnet1': phys_br}
+        with contextlib.nested(
+            mock.patch.object(self.agent.int_br, 'sync_flows_on'),
+            mock.patch.object(self.agent.int_br, 'sync_flows_off')
+        ) as (int_sync_on, int_sync_off):
+            self.agent.sync_flows_on()
+            self.assertTrue(self.agent.syncing_flows)
+            int_sync_on.assert_called_once_with()
+            phys_br.sync_flows_on.assert_called_once_with()
+            self.agent.tun_br.sync_flows_on.assert_called_once_with()
+            self.agent.sync_flows_off()
+            self.assertFalse(self.agent.syncing_flows)
+            int_sync_off.assert_called_once_with()
+            phys_br.sync_flows_off.assert_called_once_with()
+            self.agent.tun_br.sync_flows_off.assert_called_once_with()
+
+    def test_rpc_loop_syncs_flows_on_ovs_restart(self):
+        calls = mock.Mock()
+
+        def process_network_ports(port_info, ovs_restarted):
+            calls.process_network_ports(ovs_restarted)
+            self.agent.run_daemon_loop = False
+            return False
+
+        with contextlib.nested(
+            mock.patch.object(self.agent, 'check_ovs_restart',
+                              return_value=True),
+            mock.patch.object(self.agent, 'scan_ports',
+                              return_value={'current': set(['tap1']),
+                                            'added': set(['tap1']),
+                                            'removed': set()}),
+            mock.patch.object(self.agent, 'process_network_ports',
+                              side_effect=process_network_ports),
+            mock.patch.object(self.agent, 'setup_integration_br'),
+            mock.patch.object(self.agent, 'setup_physical_bridges'),
+            mock.patch.object(self.agent, 'sync_flows_on'),
+            mock.patch.object(self.agent, 'sync_flows_off'),
+            mock.patch.object(self.agent, 'local_vlans'),
+            mock.patch('time.sleep')
+        ) as (check_ovs_restart, scan_ports, _process_network_ports,
+              setup_int_br, setup_phys_brs, sync_flows_on, sync_flows_off,
+              local_vlans, sleep):
+            calls.attach_mock(setup_int_br, 'setup_integration_br')
+            calls.attach_mock(sync_flows_on, 'sync_flows_on')
+            calls.attach_mock(sync_flows_off, 'sync_flows_off')
+            self.agent.rpc_loop(polling_manager=mock.Mock())
+        self.assertEqual([mock.call.sync_flows_on(),
+                          mock.call.setup_integration_br(),
+                          mock.call.process_network_ports(True),
+                          mock.call.sync_flows_off()],
+                         calls.mock_calls)
+
     def test_setup_tunnel_port(self):
         self.agent.tun_br = mock.Mock()
         self.agent.l2_pop = False
@@ -970,6 +1541,11 @@ class TestOvsNeutronAgent(base.BaseTestCase):
         self.agent.local_vlan_map = {'net1': lvm1, 'net2': lvm2}
         self.agent.tun_br_ofports = {'gre':
                                      {'1.1.1.1': '1', '2.2.2.2': '2'}}
+        for lvm in (lvm1, lvm2):
+            for ofport in lvm.tun_ofports:
+                self.agent.tunnel_refs.acquire(ofport, lvm.vlan)
+        self.agent.tunnel_grace_period = 0
+        self.agent.l2_pop = True
         self.agent.arp_responder_enabled = True
 
     def test_fdb_ignore_network(self):
@@ -1051,6 +1627,60 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                            actions='strip_vlan,'
                                            'set_tunnel:seg1,output:1,2')
 
+    def test_fdb_add_skips_programmed_entries(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports':
+                      {'2.2.2.2':
+                       [[FAKE_MAC, FAKE_IP1],
+                        n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+        ) as (add_flow_fn, mod_flow_fn):
+            self.agent.fdb_add(None, fdb_entry)
+            self.assertEqual(2, add_flow_fn.call_count)
+            self.assertEqual(1, mod_flow_fn.call_count)
+            self.agent.fdb_add(None, fdb_entry)
+            self.assertEqual(2, add_flow_fn.call_count)
+            self.assertEqual(1, mod_flow_fn.call_count)
+
+    def test_fdb_add_applies_flows_of_all_networks_at_once(self):
+        self._prepare_l2_pop_ofports()
+        fdb_entry = {'net1': {'network_type': 'gre',
+                              'segment_id': 'tun1',
+                              'ports': {'2.2.2.2': [[FAKE_MAC, FAKE_IP1]]}},
+                     'net2': {'network_type': 'gre',
+                              'segment_id': 'tun2',
+                              'ports': {'2.2.2.2': [[FAKE_MAC, FAKE_IP1]]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'defer_apply_on'),
+            mock.patch.object(self.agent.tun_br, 'defer_apply_off'),
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+        ) as (defer_on_fn, defer_off_fn, add_flow_fn):
+            self.agent.fdb_add(None, fdb_entry)
+        defer_on_fn.assert_called_once_with()
+        defer_off_fn.assert_called_once_with()
+        self.assertEqual(4, add_flow_fn.call_count)
+
+    def test_fdb_del_keeps_flows_of_entries_in_use(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.fdb_table.add('vlan2', FAKE_MAC, FAKE_IP1, '2')
+        self.agent.fdb_table.add('vlan2', FAKE_MAC, FAKE_IP2, '2')
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports': {'2.2.2.2': [[FAKE_MAC, FAKE_IP1]]}}}
+        with mock.patch.object(self.agent.tun_br,
+                               'delete_flows') as del_flow_fn:
+            self.agent.fdb_remove(None, fdb_entry)
+        del_flow_fn.assert_called_once_with(table=constants.ARP_RESPONDER,
+                                            proto='arp',
+                                            dl_vlan='vlan2',
+                                            nw_dst=FAKE_IP1)
+
     def test_fdb_del_flows(self):
         self._prepare_l2_pop_ofports()
         fdb_entry = {'net2':
@@ -1109,11 +1739,72 @@ class TestOvsNeutronAgent(base.BaseTestCase):
             self.agent.fdb_remove(None, fdb_entry)
             del_port_fn.assert_called_once_with('gre-02020202')
 
+    def test_fdb_add_updates_flood_flow_once(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.tun_br_ofports['gre']['3.3.3.3'] = '3'
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports': {'2.2.2.2': [n_const.FLOODING_ENTRY],
+                                '3.3.3.3': [n_const.FLOODING_ENTRY]}}}
+        with mock.patch.object(self.agent.tun_br, 'mod_flow') as mod_flow_fn:
+            self.agent.fdb_add(None, fdb_entry)
+        mod_flow_fn.assert_called_once_with(
+            table=constants.FLOOD_TO_TUN, dl_vlan='vlan1',
+            actions='strip_vlan,set_tunnel:seg1,output:%s' %
+            ','.join(set(['1', '2', '3'])))
+
+    def _remove_flooding_entry(self):
+        fdb_entry = {'net2':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun2',
+                      'ports': {'2.2.2.2': [n_const.FLOODING_ENTRY]}}}
+        self.agent.fdb_remove(None, fdb_entry)
+
+    def test_fdb_del_port_after_grace_period(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.tunnel_grace_period = 60
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'delete_flows'),
+            mock.patch.object(self.agent.tun_br, 'delete_port'),
+            mock.patch('time.time', return_value=1000)
+        ) as (del_flow_fn, del_port_fn, time_fn):
+            self._remove_flooding_entry()
+            self.assertFalse(del_port_fn.called)
+            time_fn.return_value = 1059
+            self.agent.remove_unused_tunnel_ports()
+            self.assertFalse(del_port_fn.called)
+            time_fn.return_value = 1060
+            self.agent.remove_unused_tunnel_ports()
+        del_port_fn.assert_called_once_with('gre-02020202')
+        self.assertNotIn('2.2.2.2', self.agent.tun_br_ofports['gre'])
+
+    def test_fdb_add_reuses_tunnel_port_in_grace_period(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.tunnel_grace_period = 60
+        fdb_entry = {'net1':
+                     {'network_type': 'gre',
+                      'segment_id': 'tun1',
+                      'ports': {'2.2.2.2': [n_const.FLOODING_ENTRY]}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'delete_flows'),
+            mock.patch.object(self.agent.tun_br, 'delete_port'),
+            mock.patch.object(self.agent.tun_br, 'mod_flow'),
+            mock.patch.object(self.agent, '_setup_tunnel_port'),
+            mock.patch('time.time', return_value=1000)
+        ) as (del_flow_fn, del_port_fn, mod_flow_fn, add_tun_fn, time_fn):
+            self._remove_flooding_entry()
+            self.agent.fdb_add(None, fdb_entry)
+            time_fn.return_value = 2000
+            self.agent.remove_unused_tunnel_ports()
+        self.assertFalse(add_tun_fn.called)
+        self.assertFalse(del_port_fn.called)
+
     def test_fdb_update_chg_ip(self):
         self._prepare_l2_pop_ofports()
         fdb_entries = {'chg_ip':
                        {'net1':
-                        {'agent_ip':
+                        {'1.1.1.1':
                          {'before': [[FAKE_MAC, FAKE_IP1]],
                           'after': [[FAKE_MAC, FAKE_IP2]]}}}}
         with contextlib.nested(
@@ -1142,6 +1833,56 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                                 dl_vlan='vlan1',
                                                 nw_dst=FAKE_IP1)
 
+    def test_fdb_update_chg_ip_keeps_moved_ip(self):
+        self._prepare_l2_pop_ofports()
+        other_mac = '00:11:22:33:44:66'
+        self.agent.fdb_table.add('vlan1', FAKE_MAC, FAKE_IP1, '1')
+        fdb_entries = {'chg_ip':
+                       {'net1':
+                        {'1.1.1.1':
+                         {'before': [[FAKE_MAC, FAKE_IP1]],
+                          'after': [[other_mac, FAKE_IP1]]}}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'delete_flows')
+        ) as (add_flow_fn, del_flow_fn):
+            self.agent.fdb_update(None, fdb_entries)
+        add_flow_fn.assert_called_once_with(table=constants.ARP_RESPONDER,
+                                            priority=1,
+                                            proto='arp',
+                                            dl_vlan='vlan1',
+                                            nw_dst=FAKE_IP1,
+                                            actions=mock.ANY)
+        self.assertFalse(del_flow_fn.called)
+
+    def test_fdb_update_chg_ip_skips_agent_without_tunnel(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.fdb_table.add('vlan1', FAKE_MAC, FAKE_IP1, '1')
+        fdb_entries = {'chg_ip':
+                       {'net1':
+                        {'3.3.3.3':
+                         {'before': [[FAKE_MAC, FAKE_IP1]],
+                          'after': [[FAKE_MAC, FAKE_IP2]]}}}}
+        with contextlib.nested(
+            mock.patch.object(self.agent.tun_br, 'add_flow'),
+            mock.patch.object(self.agent.tun_br, 'delete_flows')
+        ) as (add_flow_fn, del_flow_fn):
+            self.agent.fdb_update(None, fdb_entries)
+        self.assertFalse(add_flow_fn.called)
+        del_flow_fn.assert_called_once_with(table=constants.ARP_RESPONDER,
+                                            proto='arp',
+                                            dl_vlan='vlan1',
+                                            nw_dst=FAKE_IP1)
+        # no entry is recorded without a tunnel
+        self.assertEqual({}, self.agent.fdb_table._entries['vlan1'])
+
+    def test_reclaim_local_vlan_forgets_fdb_entries(self):
+        self._prepare_l2_pop_ofports()
+        self.agent.fdb_table.add('vlan1', FAKE_MAC, FAKE_IP1, '1')
+        self.agent.reclaim_local_vlan('net1')
+        self.assertTrue(self.agent.fdb_table.add('vlan1', FAKE_MAC, FAKE_IP1,
+                                                 '1'))
+
     def test_recl_lv_port_to_preserve(self):
         self._prepare_l2_pop_ofports()
         self.agent.l2_pop = True
@@ -1280,6 +2021,23 @@ class TestOvsNeutronAgent(base.BaseTestCase):
                                         '100.101.31.15', 'vxlan')]
             _setup_tunnel_port_fn.assert_has_calls(expected_calls)
 
+    def test_tunnel_sync_updates_flood_flows_once(self):
+        fake_tunnel_details = {'tunnels': [{'ip_address': '100.101.31.15'},
+                                           {'ip_address': '100.101.31.16'}]}
+        lvm = ovs_neutron_agent.LocalVLANMapping(1, 'vxlan', None, 'seg1')
+        self.agent.local_vlan_map = {'net1': lvm}
+        self.agent.tunnel_types = ['vxlan']
+        self.agent.tun_br.add_tunnel_port.side_effect = ['5', '6']
+        with mock.patch.object(self.agent.plugin_rpc, 'tunnel_sync',
+                               return_value=fake_tunnel_details):
+            self.agent.tunnel_sync()
+        self.agent.tun_br.mod_flow.assert_called_once_with(
+            table=constants.FLOOD_TO_TUN, dl_vlan=1,
+            actions='strip_vlan,set_tunnel:seg1,output:%s' %
+            ','.join(self.agent.tun_br_ofports['vxlan'].values()))
+        self.assertEqual(set(['5', '6']),
+                         set(self.agent.tun_br_ofports['vxlan'].values()))
+
     def test_tunnel_sync_invalid_ip_address(self):
         fake_tunnel_details = {'tunnels': [{'ip_address': '300.300.300.300'},
                                            {'ip_address': '100.100.100.100'}]}
@@ -0,0 +1,117 @@
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import mock
+
+from neutron.agent.linux import ovs_lib
+from neutron.plugins.openvswitch.agent import ovs_neutron_agent
+from neutron.plugins.openvswitch.agent import ovs_port_stats
+from neutron.tests import base
+
+
+def _counters(packets, bytes):
+    return {'rx_packets': packets, 'rx_bytes': bytes,
+            'tx_packets': packets, 'tx_bytes': bytes}
+
+
+class TestPortStatsCollector(base.BaseTestCase):
+
+    def setUp(self):
+        super(TestPortStatsCollector, self).setUp()
+        self.agent = mock.Mock()
+        self.agent.enable_tunneling = True
+        self.agent.int_br.br_name = 'br-int'
+        self.agent.tun_br.br_name = 'br-tun'
+        self.phys_br = mock.Mock(br_name='br-eth1')
+        self.agent.phys_brs = {'physnet1': self.phys_br}
+        lvm = ovs_neutron_agent.LocalVLANMapping(1, 'vxlan', None, 100)
+        lvm.vif_ports['port1'] = mock.Mock(vif_id='port1', ofport=5)
+        lvm.vif_ports['port2'] = mock.Mock(vif_id='port2', ofport=6)
+        self.agent.local_vlan_map = {'net1': lvm}
+        self.agent.int_br.dump_port_stats.return_value = {
+            5: _counters(10, 1000), 6: _counters(20, 2000),
+            7: _counters(1, 1)}
+        self.agent.int_br.dump_all_flows.return_value = [
+            ovs_lib.Flow('n_packets=3,n_bytes=300,priority=3,in_port=1,'
+                         'dl_vlan=100,actions=mod_vlan_vid:1,normal'),
+            ovs_lib.Flow('n_packets=9,n_bytes=900,actions=normal')]
+        self.agent.tun_br.dump_all_flows.return_value = [
+            ovs_lib.Flow('n_packets=2,n_bytes=200,table=4,tun_id=0x64,'
+                         'actions=mod_vlan_vid:1,resubmit(,10)'),
+            ovs_lib.Flow('n_packets=4,n_bytes=400,table=21,dl_vlan=1,'
+                         'actions=strip_vlan,output:2')]
+        self.phys_br.dump_all_flows.return_value = [
+            ovs_lib.Flow('n_packets=5,n_bytes=500,in_port=2,dl_vlan=2,'
+                         'actions=mod_vlan_vid:1,normal')]
+        self.collector = ovs_port_stats.PortStatsCollector(self.agent)
+
+    def test_collect_attributes_counters_to_ports_and_networks(self):
+        stats = self.collector.collect()
+        self.assertEqual(
+            [dict(_counters(10, 1000), port_id='port1', network_id='net1',
+                  local_vlan=1, ofport=5),
+             dict(_counters(20, 2000), port_id='port2', network_id='net1',
+                  local_vlan=1, ofport=6)],
+            sorted(stats['ports'], key=lambda port: port['port_id']))
+        self.assertEqual(
+            [{'network_id': 'net1', 'local_vlan': 1, 'bridge': 'br-int',
+              'flows': 1, 'packets': 3, 'bytes': 300},
+             {'network_id': 'net1', 'local_vlan': 1, 'bridge': 'br-tun',
+              'flows': 2, 'packets': 6, 'bytes': 600}],
+            stats['networks'])
+        self.assertEqual(1, self.agent.int_br.dump_port_stats.call_count)
+        self.assertEqual(1, self.agent.tun_br.dump_all_flows.call_count)
+
+    def test_collect_nothing_without_networks(self):
+        self.agent.local_vlan_map = {}
+        self.assertIsNone(self.collector.collect())
+        self.assertFalse(self.agent.int_br.dump_port_stats.called)
+
+    def test_collect_deltas_only(self):
+        self.collector.delta_only = True
+        self.collector.collect()
+        self.agent.int_br.dump_port_stats.return_value = {
+            5: _counters(15, 1500), 6: _counters(20, 2000)}
+        stats = self.collector.collect()
+        self.assertEqual([dict(_counters(5, 500), port_id='port1',
+                               network_id='net1', local_vlan=1, ofport=5)],
+                         stats['ports'])
+        self.assertEqual([], stats['networks'])
+
+    def test_collect_full_counters_once_reset(self):
+        self.collector.delta_only = True
+        self.collector.collect()
+        self.agent.int_br.dump_port_stats.return_value = {
+            5: _counters(2, 200), 6: _counters(20, 2000)}
+        stats = self.collector.collect()
+        self.assertEqual([dict(_counters(2, 200), port_id='port1',
+                               network_id='net1', local_vlan=1, ofport=5)],
+                         stats['ports'])
+
+    def test_publish(self):
+        with mock.patch.object(ovs_port_stats.n_rpc,
+                               'get_notifier') as get_notifier:
+            self.collector.publish()
+            self.collector.publish()
+        get_notifier.assert_called_once_with('network')
+        notifier = get_notifier.return_value
+        self.assertEqual(2, notifier.info.call_count)
+        context, event_type, stats = notifier.info.call_args[0]
+        self.assertEqual(self.agent.context, context)
+        self.assertEqual('port.stats', event_type)
+        self.assertEqual(2, len(stats['ports']))
+
+    def test_publish_failure_is_logged(self):
+        self.agent.int_br.dump_port_stats.side_effect = RuntimeError()
+        with mock.patch.object(ovs_port_stats.LOG, 'exception') as log:
+            self.collector.publish()
+        self.assertTrue(log.called)
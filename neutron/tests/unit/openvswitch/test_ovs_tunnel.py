@@ -21,6 +21,7 @@ from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
 from neutron.agent.linux import ovs_lib
+from neutron.agent import local_vlan
 from neutron.openstack.common import log
 from neutron.plugins.common import constants as p_const
 from neutron.plugins.openvswitch.agent import ovs_neutron_agent
@@ -338,7 +339,8 @@ class TunnelTest(base.BaseTestCase):
         ]
 
         a = self._build_agent()
-        a.available_local_vlans = set([LV_ID])
+        a.local_vlans = local_vlan.LocalVlanAllocator(min_vlan=LV_ID,
+                                                      max_vlan=LV_ID)
         a.tun_br_ofports = TUN_OFPORTS
         a.provision_local_vlan(NET_UUID, p_const.TYPE_GRE, None, LS_ID)
         self._verify_mock_calls()
@@ -355,7 +357,8 @@ class TunnelTest(base.BaseTestCase):
                                dl_vlan=65535, actions=action_string))
 
         a = self._build_agent()
-        a.available_local_vlans = set([LV_ID])
+        a.local_vlans = local_vlan.LocalVlanAllocator(min_vlan=LV_ID,
+                                                      max_vlan=LV_ID)
         a.phys_brs['net1'] = self.mock_map_tun_bridge
         a.phys_ofports['net1'] = self.MAP_TUN_PHY_OFPORT
         a.int_ofports['net1'] = self.INT_OFPORT
@@ -379,7 +382,8 @@ class TunnelTest(base.BaseTestCase):
                                dl_vlan=LV_ID, actions=action_string))
 
         a = self._build_agent()
-        a.available_local_vlans = set([LV_ID])
+        a.local_vlans = local_vlan.LocalVlanAllocator(min_vlan=LV_ID,
+                                                      max_vlan=LV_ID)
         a.phys_brs['net1'] = self.mock_map_tun_bridge
         a.phys_ofports['net1'] = self.MAP_TUN_PHY_OFPORT
         a.int_ofports['net1'] = self.INT_OFPORT
@@ -399,10 +403,11 @@ class TunnelTest(base.BaseTestCase):
         ]
 
         a = self._build_agent()
-        a.available_local_vlans = set()
+        a.local_vlans.allocate(NET_UUID, preferred=LVM.vlan)
         a.local_vlan_map[NET_UUID] = LVM
         a.reclaim_local_vlan(NET_UUID)
-        self.assertIn(LVM.vlan, a.available_local_vlans)
+        self.assertIsNone(a.local_vlans.get(NET_UUID))
+        self.assertTrue(a.local_vlans.is_free(LVM.vlan))
         self._verify_mock_calls()
 
     def test_reclaim_local_vlan_flat(self):
@@ -418,10 +423,11 @@ class TunnelTest(base.BaseTestCase):
         a.phys_ofports['net1'] = self.MAP_TUN_PHY_OFPORT
         a.int_ofports['net1'] = self.INT_OFPORT
 
-        a.available_local_vlans = set()
+        a.local_vlans.allocate(NET_UUID, preferred=LVM_FLAT.vlan)
         a.local_vlan_map[NET_UUID] = LVM_FLAT
         a.reclaim_local_vlan(NET_UUID)
-        self.assertIn(LVM_FLAT.vlan, a.available_local_vlans)
+        self.assertIsNone(a.local_vlans.get(NET_UUID))
+        self.assertTrue(a.local_vlans.is_free(LVM_FLAT.vlan))
         self._verify_mock_calls()
 
     def test_reclaim_local_vlan_vlan(self):
@@ -437,10 +443,11 @@ class TunnelTest(base.BaseTestCase):
         a.phys_ofports['net1'] = self.MAP_TUN_PHY_OFPORT
         a.int_ofports['net1'] = self.INT_OFPORT
 
-        a.available_local_vlans = set()
+        a.local_vlans.allocate(NET_UUID, preferred=LVM_VLAN.vlan)
         a.local_vlan_map[NET_UUID] = LVM_VLAN
         a.reclaim_local_vlan(NET_UUID)
-        self.assertIn(LVM_VLAN.vlan, a.available_local_vlans)
+        self.assertIsNone(a.local_vlans.get(NET_UUID))
+        self.assertTrue(a.local_vlans.is_free(LVM_VLAN.vlan))
         self._verify_mock_calls()
 
     def test_port_bound(self):
@@ -448,7 +455,8 @@ class TunnelTest(base.BaseTestCase):
             mock.call.db_get_val('Port', VIF_PORT.port_name, 'tag'),
             mock.call.set_db_attribute('Port', VIF_PORT.port_name,
                                        'tag', str(LVM.vlan)),
-            mock.call.delete_flows(in_port=VIF_PORT.ofport)
+            mock.call.after_commit(self.mock_int_bridge.delete_flows,
+                                   in_port=VIF_PORT.ofport)
         ]
 
         a = self._build_agent()
@@ -479,7 +487,8 @@ class TunnelTest(base.BaseTestCase):
         ]
 
         a = self._build_agent()
-        a.available_local_vlans = set([LV_ID])
+        a.local_vlans = local_vlan.LocalVlanAllocator(min_vlan=LV_ID,
+                                                      max_vlan=LV_ID)
         a.local_vlan_map[NET_UUID] = LVM
         a.port_dead(VIF_PORT)
         self._verify_mock_calls()
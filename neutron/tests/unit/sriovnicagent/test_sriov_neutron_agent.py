@@ -17,6 +17,7 @@
 import mock
 from oslo.config import cfg
 
+from neutron.agent import rpc as agent_rpc
 from neutron.plugins.sriovnicagent.common import config  # noqa
 from neutron.plugins.sriovnicagent import sriov_nic_agent
 from neutron.tests import base
@@ -55,9 +56,9 @@ class TestSriovAgent(base.BaseTestCase):
         agent = sriov_nic_agent.SriovNicSwitchAgent({}, {}, 0, None)
         devices = [DEVICE_MAC]
         with mock.patch.object(agent.plugin_rpc,
-                               "update_device_down") as fn_udd:
-            fn_udd.return_value = {'device': DEVICE_MAC,
-                                   'exists': True}
+                               "update_devices_down") as fn_udd:
+            fn_udd.return_value = [{'device': DEVICE_MAC,
+                                    'exists': True}]
             with mock.patch.object(sriov_nic_agent.LOG,
                                    'info') as log:
                 resync = agent.treat_devices_removed(devices)
@@ -69,9 +70,9 @@ class TestSriovAgent(base.BaseTestCase):
         agent = sriov_nic_agent.SriovNicSwitchAgent({}, {}, 0, None)
         devices = [DEVICE_MAC]
         with mock.patch.object(agent.plugin_rpc,
-                               "update_device_down") as fn_udd:
-            fn_udd.return_value = {'device': DEVICE_MAC,
-                                   'exists': False}
+                               "update_devices_down") as fn_udd:
+            fn_udd.return_value = [{'device': DEVICE_MAC,
+                                    'exists': False}]
             with mock.patch.object(sriov_nic_agent.LOG,
                                    'debug') as log:
                 resync = agent.treat_devices_removed(devices)
@@ -83,10 +84,9 @@ class TestSriovAgent(base.BaseTestCase):
         agent = sriov_nic_agent.SriovNicSwitchAgent({}, {}, 0, None)
         devices = [DEVICE_MAC]
         with mock.patch.object(agent.plugin_rpc,
-                               "update_device_down") as fn_udd:
+                               "update_devices_down") as fn_udd:
             fn_udd.side_effect = Exception()
-            with mock.patch.object(sriov_nic_agent.LOG,
-                                   'debug') as log:
+            with mock.patch.object(agent_rpc.LOG, 'debug') as log:
                 resync = agent.treat_devices_removed(devices)
                 self.assertEqual(1, log.call_count)
                 self.assertTrue(resync)
@@ -182,6 +182,8 @@ class TestSriovAgent(base.BaseTestCase):
                         'physical_network': 'physnet1'}
         agent.plugin_rpc = mock.Mock()
         agent.plugin_rpc.get_devices_details_list.return_value = [mock_details]
+        agent.plugin_rpc.update_devices_status.return_value = (
+            [{'device': 'aa:bb:cc:dd:ee:ff', 'exists': True}], [])
         agent.eswitch_mgr = mock.Mock()
         agent.eswitch_mgr.device_exists.return_value = True
         agent.set_device_state = mock.Mock()
@@ -195,7 +197,9 @@ class TestSriovAgent(base.BaseTestCase):
                                         'aa:bb:cc:dd:ee:ff',
                                         '1:2:3.0',
                                         True)
-        self.assertTrue(agent.plugin_rpc.update_device_up.called)
+        agent.plugin_rpc.update_devices_status.assert_any_call(
+            agent.context, 'up', ['aa:bb:cc:dd:ee:ff'], agent.agent_id,
+            cfg.CONF.host)
 
     def test_treat_devices_added_updated_admin_state_up_false(self):
         agent = self.agent
@@ -209,9 +213,11 @@ class TestSriovAgent(base.BaseTestCase):
                         'physical_network': 'physnet1'}
         agent.plugin_rpc = mock.Mock()
         agent.plugin_rpc.get_devices_details_list.return_value = [mock_details]
+        agent.plugin_rpc.update_devices_status.return_value = ([], [])
         agent.remove_port_binding = mock.Mock()
         resync_needed = agent.treat_devices_added_updated(
                             set(['aa:bb:cc:dd:ee:ff']))
 
         self.assertFalse(resync_needed)
-        self.assertFalse(agent.plugin_rpc.update_device_up.called)
+        agent.plugin_rpc.update_devices_status.assert_any_call(
+            agent.context, 'up', [], agent.agent_id, cfg.CONF.host)
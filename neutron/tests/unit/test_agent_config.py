@@ -40,3 +40,16 @@ class TestRootHelper(base.BaseTestCase):
         conf = config.setup_conf()
         config.register_root_helper(conf)
         self.assertEqual(config.get_root_helper(conf), 'sudo')
+
+
+class TestMinimizePolling(base.BaseTestCase):
+
+    def test_minimize_polling_default(self):
+        conf = config.setup_conf()
+        config.register_minimize_polling_opts_helper(conf)
+        self.assertTrue(conf.AGENT.minimize_polling)
+
+    def test_minimize_polling_opt_in(self):
+        conf = config.setup_conf()
+        config.register_minimize_polling_opts_helper(conf, default=False)
+        self.assertFalse(conf.AGENT.minimize_polling)
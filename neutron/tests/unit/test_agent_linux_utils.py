@@ -14,8 +14,10 @@
 
 import fixtures
 import mock
+from oslo.config import cfg
 import testtools
 
+from neutron.agent.common import config
 from neutron.agent.linux import utils
 from neutron.tests import base
 
@@ -111,6 +113,64 @@ class AgentUtilsExecuteTest(base.BaseTestCase):
                 self.assertTrue(log.debug.called)
 
 
+class AgentUtilsExecuteRootwrapDaemonTest(base.BaseTestCase):
+    def setUp(self):
+        super(AgentUtilsExecuteRootwrapDaemonTest, self).setUp()
+        config.register_root_helper(cfg.CONF)
+        cfg.CONF.set_override('root_helper_daemon',
+                              'sudo neutron-rootwrap-daemon', 'AGENT')
+        self.addCleanup(cfg.CONF.clear_override,
+                        'root_helper_daemon', 'AGENT')
+        get_client_p = mock.patch.object(utils.RootwrapDaemonHelper,
+                                         'get_client')
+        self.client = get_client_p.start().return_value
+        self.create_process = mock.patch.object(
+            utils, 'create_process').start()
+
+    def test_execute_uses_daemon(self):
+        self.client.execute.return_value = (0, 'out', '')
+        result = utils.execute(['ip', 'link', 1], root_helper='sudo',
+                               process_input='in')
+        self.assertEqual('out', result)
+        self.client.execute.assert_called_once_with(['ip', 'link', '1'],
+                                                    stdin='in')
+        self.assertFalse(self.create_process.called)
+
+    def test_execute_return_stderr(self):
+        self.client.execute.return_value = (0, 'out', 'err')
+        result = utils.execute(['ls'], root_helper='sudo',
+                               return_stderr=True)
+        self.assertEqual(('out', 'err'), result)
+
+    def test_execute_failure_raises(self):
+        self.client.execute.return_value = (1, '', 'err')
+        self.assertRaises(RuntimeError, utils.execute, ['ls'],
+                          root_helper='sudo')
+
+    def test_daemon_error_fails_command(self):
+        self.client.execute.side_effect = Exception('Unauthorized command')
+        with mock.patch.object(utils, 'LOG') as log:
+            self.assertEqual('', utils.execute(['ls'], root_helper='sudo',
+                                               check_exit_code=False))
+            self.assertTrue(log.error.called)
+
+    def _test_execute_forks(self, **kwargs):
+        self.create_process.return_value = FakeCreateProcess(0), 'ls'
+        utils.execute(['ls'], **kwargs)
+        self.assertTrue(self.create_process.called)
+        self.assertFalse(self.client.execute.called)
+
+    def test_execute_without_root_helper_forks(self):
+        self._test_execute_forks()
+
+    def test_execute_with_addl_env_forks(self):
+        self._test_execute_forks(root_helper='sudo', addl_env={'foo': 'bar'})
+
+    def test_execute_without_daemon_configured_forks(self):
+        cfg.CONF.set_override('root_helper_daemon', None, 'AGENT')
+        self._test_execute_forks(root_helper='sudo')
+
+
 class AgentUtilsGetInterfaceMAC(base.BaseTestCase):
     def test_get_interface_mac(self):
         expect_val = '01:02:03:04:05:06'
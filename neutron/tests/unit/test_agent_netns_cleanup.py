@@ -13,6 +13,8 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import contextlib
+
 import mock
 
 from neutron.agent.linux import interface
@@ -190,67 +192,96 @@ class TestNetnsCleanup(base.BaseTestCase):
         conf = mock.Mock()
         conf.AGENT.root_helper = 'sudo'
         with mock.patch('neutron.agent.linux.ip_lib.IPWrapper') as ip_wrap:
-            ip_wrap.side_effect = Exception()
-            util.destroy_namespace(conf, ns)
-
-    def test_main(self):
-        namespaces = ['ns1', 'ns2']
-        with mock.patch('neutron.agent.linux.ip_lib.IPWrapper') as ip_wrap:
-            ip_wrap.get_namespaces.return_value = namespaces
+            ip_wrap.side_effect = RuntimeError()
+            self.assertRaises(RuntimeError, util.destroy_namespace, conf, ns)
 
-            with mock.patch('eventlet.sleep') as eventlet_sleep:
-                conf = mock.Mock()
-                conf.force = False
-                methods_to_mock = dict(
-                    eligible_for_deletion=mock.DEFAULT,
-                    destroy_namespace=mock.DEFAULT,
-                    setup_conf=mock.DEFAULT)
-
-                with mock.patch.multiple(util, **methods_to_mock) as mocks:
-                    mocks['eligible_for_deletion'].return_value = True
-                    mocks['setup_conf'].return_value = conf
-                    with mock.patch('neutron.common.config.setup_logging'):
-                        util.main()
-
-                        mocks['eligible_for_deletion'].assert_has_calls(
-                            [mock.call(conf, 'ns1', False),
-                             mock.call(conf, 'ns2', False)])
-
-                        mocks['destroy_namespace'].assert_has_calls(
-                            [mock.call(conf, 'ns1', False),
-                             mock.call(conf, 'ns2', False)])
-
-                        ip_wrap.assert_has_calls(
-                            [mock.call.get_namespaces(conf.AGENT.root_helper)])
+    def test_destroy_namespace_with_devices_forced(self):
+        ns = 'qrouter-6e322ac7-ab50-4f53-9cdc-d1d3c1164b6d'
+        conf = mock.Mock()
+        with contextlib.nested(
+            mock.patch('neutron.agent.linux.ip_lib.IPWrapper'),
+            mock.patch('neutron.agent.linux.ip_lib.IPDevice'),
+            mock.patch.object(util, 'unplug_device'),
+            mock.patch.object(util, 'kill_dhcp')
+        ) as (ip_wrap, ip_dev, unplug, kill_dhcp):
+            ip_wrap.return_value.netns.exists.return_value = True
+            util.destroy_namespace(conf, ns, True, ['tap1', 'tap2'])
 
-                        eventlet_sleep.assert_called_once_with(2)
+            self.assertFalse(ip_wrap.return_value.get_devices.called)
+            ip_dev.assert_has_calls(
+                [mock.call(name, conf.AGENT.root_helper, ns)
+                 for name in ('tap1', 'tap2')])
+            self.assertEqual(2, unplug.call_count)
+            ip = ip_wrap.return_value
+            ip.garbage_collect_namespace.assert_called_once_with()
 
-    def test_main_no_candidates(self):
-        namespaces = ['ns1', 'ns2']
+    def test_eligible_for_deletion_with_devices(self):
+        ns = 'qrouter-6e322ac7-ab50-4f53-9cdc-d1d3c1164b6d'
         with mock.patch('neutron.agent.linux.ip_lib.IPWrapper') as ip_wrap:
+            self.assertTrue(util.eligible_for_deletion(None, ns, False, []))
+            self.assertFalse(
+                util.eligible_for_deletion(None, ns, False, ['tap1']))
+            self.assertTrue(
+                util.eligible_for_deletion(None, ns, True, ['tap1']))
+            self.assertFalse(ip_wrap.called)
+
+    def _test_main(self, eligible, check):
+        ns1 = 'qrouter-6e322ac7-ab50-4f53-9cdc-d1d3c1164b6d'
+        ns2 = 'qdhcp-7e322ac7-ab50-4f53-9cdc-d1d3c1164b6d'
+        namespaces = [ns1, 'other', ns2]
+        devices = {ns1: [], ns2: ['tap1']}
+        with contextlib.nested(
+            mock.patch('neutron.agent.linux.ip_lib.IPWrapper'),
+            mock.patch('neutron.agent.linux.namespace_cleanup.'
+                       'NamespaceCleaner'),
+            mock.patch('eventlet.sleep'),
+            mock.patch('neutron.common.config.setup_logging'),
+            mock.patch.multiple(util,
+                                eligible_for_deletion=mock.DEFAULT,
+                                destroy_namespace=mock.DEFAULT,
+                                setup_conf=mock.DEFAULT)
+        ) as (ip_wrap, cleaner_cls, eventlet_sleep, setup_logging, mocks):
             ip_wrap.get_namespaces.return_value = namespaces
+            cleaner = cleaner_cls.return_value
+            cleaner.list_devices.return_value = devices
+            conf = mock.Mock()
+            conf.force = False
+            mocks['setup_conf'].return_value = conf
+            mocks['eligible_for_deletion'].return_value = eligible
+
+            util.main()
+
+            ip_wrap.assert_has_calls(
+                [mock.call.get_namespaces(conf.AGENT.root_helper)])
+            cleaner_cls.assert_called_once_with(conf.AGENT.root_helper)
+            cleaner.list_devices.assert_called_once_with([ns1, ns2])
+            mocks['eligible_for_deletion'].assert_has_calls(
+                [mock.call(conf, ns1, False, []),
+                 mock.call(conf, ns2, False, ['tap1'])])
+            check(cleaner, eventlet_sleep, mocks)
 
-            with mock.patch('eventlet.sleep') as eventlet_sleep:
-                conf = mock.Mock()
-                conf.force = False
-                methods_to_mock = dict(
-                    eligible_for_deletion=mock.DEFAULT,
-                    destroy_namespace=mock.DEFAULT,
-                    setup_conf=mock.DEFAULT)
-
-                with mock.patch.multiple(util, **methods_to_mock) as mocks:
-                    mocks['eligible_for_deletion'].return_value = False
-                    mocks['setup_conf'].return_value = conf
-                    with mock.patch('neutron.common.config.setup_logging'):
-                        util.main()
-
-                        ip_wrap.assert_has_calls(
-                            [mock.call.get_namespaces(conf.AGENT.root_helper)])
-
-                        mocks['eligible_for_deletion'].assert_has_calls(
-                            [mock.call(conf, 'ns1', False),
-                             mock.call(conf, 'ns2', False)])
+    def test_main(self):
+        self._test_main(True, self._check_main)
+
+    def _check_main(self, cleaner, eventlet_sleep, mocks):
+        eventlet_sleep.assert_called_once_with(2)
+        self.assertEqual(1, cleaner.cleanup.call_count)
+        candidates, destroy = cleaner.cleanup.call_args[0]
+        self.assertEqual(
+            ['qrouter-6e322ac7-ab50-4f53-9cdc-d1d3c1164b6d',
+             'qdhcp-7e322ac7-ab50-4f53-9cdc-d1d3c1164b6d'], candidates)
+        # the devices are not listed again
+        self.assertEqual({'devices': cleaner.list_devices.return_value},
+                         cleaner.cleanup.call_args[1])
+        self.assertFalse(mocks['destroy_namespace'].called)
+        destroy('ns', ['tap1'])
+        mocks['destroy_namespace'].assert_called_once_with(
+            mocks['setup_conf'].return_value, 'ns', False, ['tap1'])
 
-                        self.assertFalse(mocks['destroy_namespace'].called)
+    def test_main_no_candidates(self):
+        self._test_main(False, self._check_main_no_candidates)
 
-                        self.assertFalse(eventlet_sleep.called)
+    def _check_main_no_candidates(self, cleaner, eventlet_sleep, mocks):
+        self.assertFalse(cleaner.cleanup.called)
+        self.assertFalse(mocks['destroy_namespace'].called)
+        self.assertFalse(eventlet_sleep.called)
@@ -1221,3 +1221,53 @@ class IptablesFirewallTestCase(base.BaseTestCase):
                  mock.call.add_rule('ofake_dev', '-j $sg-fallback'),
                  mock.call.add_rule('sg-chain', '-j ACCEPT')]
         self.v4filter_inst.assert_has_calls(calls)
+
+
+class IptablesFirewallEnhancedIpsetTestCase(IptablesFirewallTestCase):
+    def setUp(self):
+        cfg.CONF.set_override('enable_ipset', True, group='SECURITYGROUP')
+        super(IptablesFirewallEnhancedIpsetTestCase, self).setUp()
+        self.firewall.ipset = mock.Mock()
+        self.firewall.ipset.set_exists.return_value = True
+        self.firewall.ipset.set_names.return_value = set()
+
+    def _fake_port_with_remote_group(self):
+        port = self._fake_port()
+        port['security_group_rules'] = [
+            {'ethertype': 'IPv4',
+             'direction': 'ingress',
+             'protocol': 'tcp',
+             'port_range_min': 22,
+             'port_range_max': 22,
+             'remote_group_id': 'fake_sgid'}]
+        return port
+
+    def test_update_security_group_members(self):
+        self.firewall.update_security_group_members(
+            'fake_sgid', {'IPv4': ['10.0.0.1']})
+        self.firewall.ipset.assert_has_calls(
+            [mock.call.set_members('fake_sgid', 'IPv4', ['10.0.0.1']),
+             mock.call.set_members('fake_sgid', 'IPv6', [])])
+
+    def test_prepare_port_filter_matches_remote_group_set(self):
+        self.firewall.prepare_port_filter(
+            self._fake_port_with_remote_group())
+        self.v4filter_inst.add_rule.assert_any_call(
+            'ifake_dev',
+            '-p tcp -m tcp --dport 22 -m set --match-set IPv4fake_sgid src '
+            '-j RETURN')
+
+    def test_prepare_port_filter_skips_unknown_remote_group(self):
+        self.firewall.ipset.set_exists.return_value = False
+        self.firewall.prepare_port_filter(
+            self._fake_port_with_remote_group())
+        for call in self.v4filter_inst.add_rule.call_args_list:
+            self.assertNotIn('--match-set', call[0][1])
+
+    def test_unused_sets_destroyed_after_apply(self):
+        port = self._fake_port_with_remote_group()
+        self.firewall.ipset.set_names.return_value = set(['IPv4fake_sgid',
+                                                          'IPv4other'])
+        with self.firewall.defer_apply():
+            self.firewall.prepare_port_filter(port)
+        self.firewall.ipset.destroy_set.assert_called_once_with('IPv4other')
@@ -693,6 +693,101 @@ class IptablesManagerStateFulTestCase(base.BaseTestCase):
         self.assertIsNone(ret_str)
 
 
+class IptablesManagerIncrementalTestCase(base.BaseTestCase):
+
+    def setUp(self):
+        super(IptablesManagerIncrementalTestCase, self).setUp()
+        self.config(iptables_incremental_apply=True)
+        self.root_helper = 'sudo'
+        self.iptables = (iptables_manager.
+                         IptablesManager(root_helper=self.root_helper))
+        self.execute = mock.patch.object(self.iptables, "execute").start()
+        self.execute.return_value = ''
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+    def _restore_call(self, lines):
+        return mock.call(['iptables-restore', '--noflush'],
+                         process_input='\n'.join(lines) + '\n',
+                         root_helper=self.root_helper)
+
+    def test_first_apply_is_full(self):
+        self.assertEqual(1, self.iptables.apply_stats['full_applies'])
+        self.assertEqual(0, self.iptables.apply_stats['incremental_applies'])
+
+    def test_apply_unchanged_runs_nothing(self):
+        self.iptables.apply()
+        self.assertFalse(self.execute.called)
+        self.assertEqual(1, self.iptables.apply_stats['incremental_applies'])
+        self.assertEqual(0, self.iptables.apply_stats['last_lines_written'])
+
+    def test_apply_writes_only_changed_chains(self):
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('filter', '-j DROP')
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j $filter')
+        self.iptables.apply()
+
+        expected = ['*filter',
+                    ':%(bn)s-INPUT - [0:0]' % IPTABLES_ARG,
+                    ':%(bn)s-filter - [0:0]' % IPTABLES_ARG,
+                    '-A %(bn)s-INPUT -j %(bn)s-filter' % IPTABLES_ARG,
+                    '-A %(bn)s-filter -j DROP' % IPTABLES_ARG,
+                    'COMMIT']
+        self.assertEqual([self._restore_call(expected)],
+                         self.execute.mock_calls)
+        self.assertEqual(len(expected),
+                         self.iptables.apply_stats['last_lines_written'])
+
+    def test_apply_removes_chain(self):
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.ipv4['filter'].add_rule('INPUT', '-j $filter')
+        self.iptables.apply()
+        self.execute.reset_mock()
+
+        self.iptables.ipv4['filter'].remove_chain('filter')
+        self.iptables.apply()
+
+        expected = ['*filter',
+                    ':%(bn)s-INPUT - [0:0]' % IPTABLES_ARG,
+                    ':%(bn)s-filter - [0:0]' % IPTABLES_ARG,
+                    '-X %(bn)s-filter' % IPTABLES_ARG,
+                    'COMMIT']
+        self.assertEqual([self._restore_call(expected)],
+                         self.execute.mock_calls)
+
+    def test_apply_unwrapped_change_is_full(self):
+        self.iptables.ipv4['filter'].add_rule('FORWARD', '-j DROP',
+                                              wrap=False)
+        self.iptables.apply()
+
+        self.execute.assert_has_calls(
+            [mock.call(['iptables-save', '-c'],
+                       root_helper=self.root_helper)])
+        self.assertEqual(2, self.iptables.apply_stats['full_applies'])
+
+    def test_apply_full_after_resync_interval(self):
+        self.iptables.full_resync_interval = 10
+        with mock.patch.object(iptables_manager.time, 'time',
+                               return_value=(
+                                   self.iptables._last_full_apply + 10)):
+            self.iptables.apply()
+        self.assertEqual(2, self.iptables.apply_stats['full_applies'])
+
+    def test_apply_falls_back_to_full_on_failure(self):
+        def iptables_restore_failer(*args, **kwargs):
+            if '--noflush' in args[0]:
+                raise RuntimeError()
+            return ''
+        self.execute.side_effect = iptables_restore_failer
+
+        self.iptables.ipv4['filter'].add_chain('filter')
+        self.iptables.apply()
+
+        self.assertEqual(2, self.iptables.apply_stats['full_applies'])
+        self.assertEqual(0, self.iptables.apply_stats['incremental_applies'])
+        self.assertIsNotNone(self.iptables._applied_state)
+
+
 class IptablesManagerStateLessTestCase(base.BaseTestCase):
 
     def setUp(self):
@@ -54,6 +54,8 @@ class TestExclusiveRouterProcessor(base.BaseTestCase):
         self.assertFalse(not_master._i_am_master())
         self.assertTrue(master_2._i_am_master())
         self.assertFalse(not_master_2._i_am_master())
+        self.assertTrue(master.is_master)
+        self.assertFalse(not_master.is_master)
 
         master.__exit__(None, None, None)
         master_2.__exit__(None, None, None)
@@ -118,6 +120,53 @@ class TestExclusiveRouterProcessor(base.BaseTestCase):
         self.assertEqual(2, len([i for i in master.updates()]))
 
 
+class TestRouterProcessingQueue(base.BaseTestCase):
+
+    def test_updates_queued_by_priority(self):
+        router_id = _uuid()
+        queue = l3_agent.RouterProcessingQueue()
+        queue.add(l3_agent.RouterUpdate(router_id,
+                                        l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+        queue.add(l3_agent.RouterUpdate(_uuid(), l3_agent.PRIORITY_RPC))
+        self.assertEqual(1, queue.depth(l3_agent.PRIORITY_RPC))
+        self.assertEqual(1,
+                         queue.depth(l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+
+        updates = [update for rp, update in queue.each_update_to_next_router(
+            l3_agent.PRIORITY_SYNC_ROUTERS_TASK)]
+        self.assertEqual([router_id], [update.id for update in updates])
+        self.assertEqual(1, queue.depth(l3_agent.PRIORITY_RPC))
+        self.assertEqual(0,
+                         queue.depth(l3_agent.PRIORITY_SYNC_ROUTERS_TASK))
+
+
+class TestGratuitousArpSender(base.BaseTestCase):
+
+    def test_queued_addresses_sent_once(self):
+        send = mock.Mock()
+        sender = l3_agent.GratuitousArpSender(send, 2)
+        for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.1', '10.0.0.3'):
+            sender.queue('ns', 'qg-1', ip, False)
+        sender.waitall()
+        self.assertEqual([mock.call('ns', 'qg-1', ip, False)
+                          for ip in ('10.0.0.1', '10.0.0.2', '10.0.0.3')],
+                         send.call_args_list)
+        # queued again once sent
+        sender.queue('ns', 'qg-1', '10.0.0.1', False)
+        sender.waitall()
+        self.assertEqual(4, send.call_count)
+
+    def test_sends_rate_limited(self):
+        send = mock.Mock()
+        sender = l3_agent.GratuitousArpSender(send, 2, rate_limit=50)
+        with mock.patch.object(l3_agent.eventlet, 'sleep') as sleep:
+            for i in range(3):
+                sender.queue('ns', 'qg-1', '10.0.0.%d' % i, False)
+            sender.waitall()
+        self.assertEqual(3, send.call_count)
+        self.assertEqual([mock.call(0.02)] * 3, sleep.call_args_list)
+
+
 def router_append_interface(router, count=1, ip_version=4, ra_mode=None,
                             addr_mode=None):
     if ip_version == 4:
@@ -256,17 +305,67 @@ class TestBasicRouterOperations(base.BaseTestCase):
 
     def test__sync_routers_task_raise_exception(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        self.plugin_api.get_router_revisions.return_value = {FAKE_ID: 'r1'}
         self.plugin_api.get_routers.side_effect = Exception()
         with mock.patch.object(agent, '_cleanup_namespaces') as f:
             agent._sync_routers_task(agent.context)
         self.assertFalse(f.called)
+        self.assertTrue(agent.fullsync)
 
     def test__sync_routers_task_call_clean_stale_namespaces(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
-        self.plugin_api.get_routers.return_value = []
+        self.plugin_api.get_router_revisions.return_value = {}
         with mock.patch.object(agent, '_cleanup_namespaces') as f:
             agent._sync_routers_task(agent.context)
         self.assertTrue(f.called)
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+    def test__sync_routers_task_fetches_changed_routers_by_chunks(self):
+        self.conf.set_override('sync_routers_chunk_size', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
+        for router_id in ('r1', 'r2', 'r3', 'r5'):
+            agent.router_info[router_id] = mock.Mock()
+        agent._router_revisions = {'r1': 'a', 'r2': 'old', 'r3': 'c'}
+        self.plugin_api.get_router_revisions.return_value = {
+            'r1': 'a', 'r2': 'b', 'r3': 'c', 'r4': 'd', 'r5': 'e'}
+        self.plugin_api.get_routers.side_effect = lambda context, ids: [
+            {'id': router_id} for router_id in ids if router_id != 'r5']
+        with mock.patch.object(agent, '_cleanup_namespaces'):
+            agent._sync_routers_task(agent.context)
+
+        self.assertEqual([mock.call(agent.context, ['r2', 'r4']),
+                          mock.call(agent.context, ['r5'])],
+                         self.plugin_api.get_routers.call_args_list)
+        updates = [c[0][0] for c in agent._queue.add.call_args_list]
+        self.assertEqual([('r2', 'b', None), ('r4', 'd', None),
+                          ('r5', None, l3_agent.DELETE_ROUTER)],
+                         [(u.id, u.revision, u.action) for u in updates])
+        self.assertFalse(agent.fullsync)
+
+    def test__sync_routers_task_without_revisions(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._queue = mock.Mock()
+        self.plugin_api.get_router_revisions.side_effect = (
+            l3_agent.n_rpc.RemoteError())
+        self.plugin_api.get_routers.return_value = [{'id': FAKE_ID}]
+        with mock.patch.object(agent, '_cleanup_namespaces'):
+            agent._sync_routers_task(agent.context)
+        self.plugin_api.get_routers.assert_called_once_with(agent.context,
+                                                            None)
+        update = agent._queue.add.call_args[0][0]
+        self.assertEqual(FAKE_ID, update.id)
+        self.assertIsNone(update.revision)
+        self.assertFalse(agent.fullsync)
+
+    def test_process_router_failure_forgets_revision(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        ri = mock.Mock(router_id=FAKE_ID)
+        agent._router_revisions[FAKE_ID] = 'r1'
+        with mock.patch.object(agent, 'process_router',
+                               side_effect=RuntimeError()):
+            self.assertRaises(RuntimeError, agent._process_router, ri)
+        self.assertNotIn(FAKE_ID, agent._router_revisions)
 
     def test_router_info_create(self):
         id = _uuid()
@@ -677,7 +776,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.process_router(ri)
         ex_gw_port = agent._get_ex_gw_port(ri)
         agent.process_router_floating_ip_addresses.assert_called_with(
-            ri, ex_gw_port)
+            ri, ex_gw_port, None)
         agent.process_router_floating_ip_addresses.reset_mock()
         agent.process_router_floating_ip_nat_rules.assert_called_with(ri)
         agent.process_router_floating_ip_nat_rules.reset_mock()
@@ -689,8 +788,10 @@ class TestBasicRouterOperations(base.BaseTestCase):
         router[l3_constants.FLOATINGIP_KEY] = fake_floatingips2['floatingips']
         agent.process_router(ri)
         ex_gw_port = agent._get_ex_gw_port(ri)
+        # the addresses listed with the devices are reused as the gateway
+        # is unchanged
         agent.process_router_floating_ip_addresses.assert_called_with(
-            ri, ex_gw_port)
+            ri, ex_gw_port, self.mock_ip.get_addresses.return_value)
         agent.process_router_floating_ip_addresses.reset_mock()
         agent.process_router_floating_ip_nat_rules.assert_called_with(ri)
         agent.process_router_floating_ip_nat_rules.reset_mock()
@@ -700,7 +801,7 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.process_router(ri)
         ex_gw_port = agent._get_ex_gw_port(ri)
         agent.process_router_floating_ip_addresses.assert_called_with(
-            ri, ex_gw_port)
+            ri, ex_gw_port, None)
         agent.process_router_floating_ip_addresses.reset_mock()
         agent.process_router_floating_ip_nat_rules.assert_called_with(ri)
         agent.process_router_floating_ip_nat_rules.reset_mock()
@@ -728,6 +829,78 @@ class TestBasicRouterOperations(base.BaseTestCase):
                          fip_statuses)
         device.addr.add.assert_called_once_with(4, '15.1.2.3/32', '15.1.2.3')
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_addresses_batch(self, IPDevice):
+        fips = [{'id': _uuid(), 'port_id': _uuid(),
+                 'floating_ip_address': '15.1.2.%d' % i,
+                 'fixed_ip_address': '192.168.0.%d' % i}
+                for i in range(3)]
+        IPDevice.return_value = device = mock.Mock()
+        device.addr.list.return_value = [{'cidr': '15.1.2.0/32'},
+                                         {'cidr': '15.1.2.8/32'},
+                                         {'cidr': '15.1.2.9/32'}]
+        ri = mock.MagicMock()
+        ri.router.get.return_value = fips
+        ri.router['distributed'].__nonzero__ = lambda self: False
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        fip_statuses = agent.process_router_floating_ip_addresses(
+            ri, {'id': _uuid()})
+
+        self.assertEqual(
+            dict((fip['id'], l3_constants.FLOATINGIP_STATUS_ACTIVE)
+                 for fip in fips),
+            fip_statuses)
+        self.assertEqual(
+            [mock.call(add=[('15.1.2.1/32', '15.1.2.1'),
+                            ('15.1.2.2/32', '15.1.2.2')]),
+             mock.call(delete=mock.ANY)],
+            device.addr.batch.call_args_list)
+        self.assertEqual(['15.1.2.8/32', '15.1.2.9/32'],
+                         sorted(device.addr.batch.call_args[1]['delete']))
+        self.assertFalse(device.addr.add.called)
+        self.assertFalse(device.addr.delete.called)
+        self.assertEqual(2, self.send_arp.call_count)
+
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_addresses_batch_error(self,
+                                                              IPDevice):
+        fips = [{'id': _uuid(), 'port_id': _uuid(),
+                 'floating_ip_address': '15.1.2.%d' % i,
+                 'fixed_ip_address': '192.168.0.%d' % i}
+                for i in range(3)]
+        IPDevice.return_value = device = mock.Mock()
+        # the second address of the batch failed
+        device.addr.list.side_effect = [[], [{'cidr': '15.1.2.0/32'},
+                                             {'cidr': '15.1.2.2/32'}]]
+        device.addr.batch.side_effect = RuntimeError()
+        ri = mock.MagicMock()
+        ri.router.get.return_value = fips
+        ri.router['distributed'].__nonzero__ = lambda self: False
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        fip_statuses = agent.process_router_floating_ip_addresses(
+            ri, {'id': _uuid()})
+
+        active = l3_constants.FLOATINGIP_STATUS_ACTIVE
+        self.assertEqual({fips[0]['id']: active,
+                          fips[1]['id']: l3_constants.FLOATINGIP_STATUS_ERROR,
+                          fips[2]['id']: active},
+                         fip_statuses)
+        self.assertEqual(1, device.addr.batch.call_count)
+        self.assertFalse(device.addr.add.called)
+        self.assertEqual(2, self.send_arp.call_count)
+
+    def test_send_gratuitous_arp_packet_queued(self):
+        self.send_arp_p.stop()
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with mock.patch.object(agent._garp_sender, 'queue') as queue:
+            agent._send_gratuitous_arp_packet('ns', 'qg-1', '15.1.2.3')
+            queue.assert_called_once_with('ns', 'qg-1', '15.1.2.3', False)
+            self.conf.set_override('send_arp_for_ha', 0)
+            agent._send_gratuitous_arp_packet('ns', 'qg-1', '15.1.2.4')
+            self.assertEqual(1, queue.call_count)
+
     def test_process_router_floating_ip_nat_rules_add(self):
         fip = {
             'id': _uuid(), 'port_id': _uuid(),
@@ -744,10 +917,11 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
+        self.assertFalse(nat.remove_rule.called)
         rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
         for chain, rule in rules:
             nat.add_rule.assert_any_call(chain, rule, tag='floating_ip')
+        self.assertEqual({fip['id']: rules}, ri.floating_ip_nat_rules)
 
     def test_process_router_cent_floating_ip_add(self):
         fake_floatingips = {'floatingips': [
@@ -809,17 +983,72 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertEqual({}, fip_statuses)
         device.addr.delete.assert_called_once_with(4, '15.1.2.3/32')
 
+    @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
+    def test_process_router_floating_ip_addresses_listed(self, IPDevice):
+        IPDevice.return_value = device = mock.Mock()
+
+        ri = mock.MagicMock()
+        ri.router.get.return_value = []
+        ri.router['distributed'].__nonzero__ = lambda self: False
+
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        gw_port_id = _uuid()
+        interface_name = agent.get_external_device_name(gw_port_id)
+
+        fip_statuses = agent.process_router_floating_ip_addresses(
+            ri, {'id': gw_port_id},
+            {interface_name: [{'cidr': '15.1.2.3/32'}]})
+        self.assertEqual({}, fip_statuses)
+        self.assertFalse(device.addr.list.called)
+        device.addr.delete.assert_called_once_with(4, '15.1.2.3/32')
+
     def test_process_router_floating_ip_nat_rules_remove(self):
         ri = mock.MagicMock()
         ri.router.get.return_value = []
 
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        rules = agent.floating_forward_rules('15.1.2.3', '192.168.0.1')
+        ri.floating_ip_nat_rules = {_uuid(): rules}
 
         agent.process_router_floating_ip_nat_rules(ri)
 
         nat = ri.iptables_manager.ipv4['nat']
-        nat = ri.iptables_manager.ipv4['nat`']
-        nat.clear_rules_by_tag.assert_called_once_with('floating_ip')
+        self.assertEqual([mock.call(chain, rule) for chain, rule in rules],
+                         nat.remove_rule.call_args_list)
+        self.assertFalse(nat.add_rule.called)
+        self.assertEqual({}, ri.floating_ip_nat_rules)
+
+    def test_process_router_floating_ip_nat_rules_changes_only(self):
+        fips = [{'id': _uuid(), 'port_id': _uuid(),
+                 'floating_ip_address': '15.1.2.%d' % i,
+                 'fixed_ip_address': '192.168.0.%d' % i}
+                for i in range(3)]
+        router = prepare_router_data()
+        router[l3_constants.FLOATINGIP_KEY] = fips
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent.process_router_floating_ip_nat_rules(ri)
+        nat = ri.iptables_manager.ipv4['nat']
+        self.assertEqual(9, len([rule for rule in nat.rules
+                                 if rule.tag == 'floating_ip']))
+
+        # remap the first floating ip and remove the second one
+        fips[0]['fixed_ip_address'] = '192.168.0.9'
+        del fips[1]
+        with contextlib.nested(
+            mock.patch.object(nat, 'add_rule', wraps=nat.add_rule),
+            mock.patch.object(nat, 'remove_rule', wraps=nat.remove_rule)
+        ) as (add_rule, remove_rule):
+            agent.process_router_floating_ip_nat_rules(ri)
+        self.assertEqual(6, remove_rule.call_count)
+        self.assertEqual(3, add_rule.call_count)
+        expected = [rule for fip in fips
+                    for rule in agent.floating_forward_rules(
+                        fip['floating_ip_address'], fip['fixed_ip_address'])]
+        self.assertEqual(sorted(expected),
+                         sorted((rule.chain, rule.rule) for rule in nat.rules
+                                if rule.tag == 'floating_ip'))
 
     @mock.patch('neutron.agent.linux.ip_lib.IPDevice')
     def test_process_router_floating_ip_addresses_remap(self, IPDevice):
@@ -1219,6 +1448,114 @@ class TestBasicRouterOperations(base.BaseTestCase):
                 mock.ANY, ri.router_id,
                 {fip_id: l3_constants.FLOATINGIP_STATUS_ERROR})
 
+    def _process_router_with_fip(self, agent):
+        router = prepare_router_data(num_internal_ports=1)
+        router[l3_constants.FLOATINGIP_KEY] = [
+            {'id': _uuid(),
+             'floating_ip_address': '8.8.8.8',
+             'fixed_ip_address': '7.7.7.7',
+             'status': l3_constants.FLOATINGIP_STATUS_DOWN,
+             'port_id': router[l3_constants.INTERFACE_KEY][0]['id']}]
+        # the payload as fetched, which the agent adds subnet details to
+        payload = copy.deepcopy(router)
+        ri = l3_agent.RouterInfo(router['id'], self.conf.root_helper,
+                                 self.conf.use_namespaces, router=router)
+        agent.external_gateway_added = mock.Mock()
+        agent.process_router(ri)
+        return ri, payload
+
+    def test_process_router_unchanged(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with contextlib.nested(
+            mock.patch.object(agent.plugin_rpc, 'update_floatingip_statuses'),
+            mock.patch.object(agent, '_get_existing_addresses',
+                              return_value={})
+        ) as (update_fip_statuses, get_addresses):
+            ri, router = self._process_router_with_fip(agent)
+            self.assertEqual(1, get_addresses.call_count)
+            self.assertEqual(1, update_fip_statuses.call_count)
+
+            # the same payload fetched again, with the status of its
+            # floating IP reported by the agent
+            router[l3_constants.FLOATINGIP_KEY][0]['status'] = (
+                l3_constants.FLOATINGIP_STATUS_ACTIVE)
+            ri.router = router
+            with mock.patch.object(ri.iptables_manager,
+                                   'defer_apply_on') as defer_apply_on:
+                agent.process_router(ri)
+            self.assertFalse(defer_apply_on.called)
+            self.assertEqual(1, get_addresses.call_count)
+            self.assertEqual(1, update_fip_statuses.call_count)
+            self.assertEqual(2, self.send_arp.call_count)
+
+    def test_process_router_changes_only(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with contextlib.nested(
+            mock.patch.object(agent.plugin_rpc, 'update_floatingip_statuses'),
+            mock.patch.object(agent, '_get_existing_addresses',
+                              return_value={}),
+            mock.patch.object(agent, 'routes_updated'),
+            mock.patch.object(agent, 'internal_network_added')
+        ) as (update_fip_statuses, get_addresses, routes_updated,
+              internal_network_added):
+            ri, payload = self._process_router_with_fip(agent)
+            self.assertEqual(1, routes_updated.call_count)
+            self.assertEqual(1, internal_network_added.call_count)
+
+            router = copy.deepcopy(payload)
+            router['routes'] = [{'destination': '8.8.4.0/24',
+                                 'nexthop': '35.4.0.10'}]
+            ri.router = router
+            agent.process_router(ri)
+            self.assertEqual(2, routes_updated.call_count)
+            self.assertEqual(1, get_addresses.call_count)
+            self.assertEqual(1, update_fip_statuses.call_count)
+
+            router = copy.deepcopy(router)
+            router[l3_constants.FLOATINGIP_KEY] = []
+            ri.router = router
+            agent.process_router(ri)
+            self.assertEqual(2, routes_updated.call_count)
+            self.assertEqual(1, get_addresses.call_count)
+            self.assertEqual(2, update_fip_statuses.call_count)
+
+            router = copy.deepcopy(router)
+            router_append_interface(router)
+            ri.router = router
+            agent.process_router(ri)
+            self.assertEqual(2, internal_network_added.call_count)
+            self.assertEqual(2, get_addresses.call_count)
+            self.assertEqual(2, update_fip_statuses.call_count)
+
+    def test_process_router_failed_floatingips_reprocessed(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with contextlib.nested(
+            mock.patch.object(agent.plugin_rpc, 'update_floatingip_statuses'),
+            mock.patch.object(agent, 'process_router_floating_ip_addresses',
+                              side_effect=RuntimeError)
+        ) as (update_fip_statuses, process_addresses):
+            ri, payload = self._process_router_with_fip(agent)
+            ri.router = payload
+            agent.process_router(ri)
+        self.assertEqual(2, process_addresses.call_count)
+        self.assertEqual(2, update_fip_statuses.call_count)
+
+    def test_process_router_failure_processed_in_full(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        ri, payload = self._process_router_with_fip(agent)
+        with mock.patch.object(agent, 'routes_updated',
+                               side_effect=RuntimeError):
+            router = copy.deepcopy(payload)
+            router['routes'] = [{'destination': '8.8.4.0/24',
+                                 'nexthop': '35.4.0.10'}]
+            ri.router = router
+            self.assertRaises(RuntimeError, agent.process_router, ri)
+        with mock.patch.object(agent, '_get_existing_addresses',
+                               return_value={}) as get_addresses:
+            ri.router = router
+            agent.process_router(ri)
+        self.assertEqual(1, get_addresses.call_count)
+
     def test_handle_router_snat_rules_add_back_jump(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         ri = mock.MagicMock()
@@ -1263,18 +1600,11 @@ class TestBasicRouterOperations(base.BaseTestCase):
                         matchers.LessThan(nat_rules.index(internal_net_rule)))
 
     def test_process_router_delete_stale_internal_devices(self):
-        class FakeDev(object):
-            def __init__(self, name):
-                self.name = name
-
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
-        stale_devlist = [FakeDev('qr-a1b2c3d4-e5'),
-                         FakeDev('qr-b2c3d4e5-f6')]
-        stale_devnames = [dev.name for dev in stale_devlist]
+        stale_devnames = ['qr-a1b2c3d4-e5', 'qr-b2c3d4e5-f6']
 
-        get_devices_return = []
-        get_devices_return.extend(stale_devlist)
-        self.mock_ip.get_devices.return_value = get_devices_return
+        self.mock_ip.get_addresses.return_value = dict(
+            (name, []) for name in stale_devnames)
 
         router = prepare_router_data(enable_snat=True, num_internal_ports=1)
         ri = l3_agent.RouterInfo(router['id'],
@@ -1315,13 +1645,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
             self.mock_driver.unplug.assert_has_calls(calls, any_order=True)
 
     def test_process_router_delete_stale_external_devices(self):
-        class FakeDev(object):
-            def __init__(self, name):
-                self.name = name
-
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
-        stale_devlist = [FakeDev('qg-a1b2c3d4-e5')]
-        stale_devnames = [dev.name for dev in stale_devlist]
+        stale_devnames = ['qg-a1b2c3d4-e5']
 
         router = prepare_router_data(enable_snat=True, num_internal_ports=1)
         del router['gw_port']
@@ -1330,7 +1655,8 @@ class TestBasicRouterOperations(base.BaseTestCase):
                                  self.conf.use_namespaces,
                                  router=router)
 
-        self.mock_ip.get_devices.return_value = stale_devlist
+        self.mock_ip.get_addresses.return_value = dict(
+            (name, []) for name in stale_devnames)
 
         agent.process_router(ri)
 
@@ -1364,6 +1690,36 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent.router_added_to_agent(None, [FAKE_ID])
         agent._queue.add.assert_called_once()
 
+    def test_process_router_update_of_priority(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        router = {'id': _uuid()}
+        agent._queue.add(l3_agent.RouterUpdate(
+            router['id'], l3_agent.PRIORITY_SYNC_ROUTERS_TASK, router=router))
+        agent._queue.add(l3_agent.RouterUpdate(_uuid(),
+                                               l3_agent.PRIORITY_RPC))
+        with mock.patch.object(agent, '_process_routers') as process:
+            agent._process_router_update(l3_agent.PRIORITY_SYNC_ROUTERS_TASK)
+        process.assert_called_once_with([router])
+        self.assertFalse(self.plugin_api.get_routers.called)
+
+        stats = agent.get_processing_stats()
+        self.assertEqual(1, stats['rpc_updates_queued'])
+        self.assertEqual(0, stats['sync_updates_queued'])
+        self.assertEqual(1, stats['routers_processed'])
+        self.assertEqual(0, agent.get_processing_stats()['routers_processed'])
+
+    def test_after_start_spawns_workers_by_priority(self):
+        self.conf.set_override('rpc_router_workers', 4)
+        self.conf.set_override('sync_router_workers', 2)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        with mock.patch.object(l3_agent.eventlet, 'spawn_n') as spawn_n:
+            agent.after_start()
+        self.assertEqual(
+            [mock.call(agent._process_routers_loop, l3_agent.PRIORITY_RPC, 4),
+             mock.call(agent._process_routers_loop,
+                       l3_agent.PRIORITY_SYNC_ROUTERS_TASK, 2)],
+            spawn_n.call_args_list)
+
     def test_process_router_delete(self):
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
         ex_gw_port = {'id': _uuid(),
@@ -1585,6 +1941,17 @@ class TestBasicRouterOperations(base.BaseTestCase):
             msg = "Error importing interface driver 'wrong_driver'"
             log.error.assert_called_once_with(msg)
 
+    def test_invalid_router_workers(self):
+        for opt in ('rpc_router_workers', 'sync_router_workers',
+                    'sync_routers_chunk_size'):
+            self.conf.set_override(opt, 0)
+            with mock.patch.object(l3_agent, 'LOG') as log:
+                self.assertRaises(SystemExit, l3_agent.L3NATAgent,
+                                  HOSTNAME, self.conf)
+                msg = '%s must be at least 1, got 0.' % opt
+                log.error.assert_called_once_with(msg)
+            self.conf.clear_override(opt)
+
     def test_metadata_filter_rules(self):
         self.conf.set_override('enable_metadata_proxy', False)
         agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
@@ -1619,6 +1986,9 @@ class TestBasicRouterOperations(base.BaseTestCase):
         agent._destroy_router_namespace = mock.MagicMock()
         ns_list = agent._list_namespaces()
         agent._cleanup_namespaces(ns_list, [r['id'] for r in router_list])
+        self.assertFalse(agent._clean_stale_namespaces)
+        # the namespaces are destroyed in the background
+        agent._namespace_cleanup.wait()
 
         # Expect process manager to disable two processes (metadata_proxy
         # and radvd) per stale namespace.
@@ -1626,10 +1996,62 @@ class TestBasicRouterOperations(base.BaseTestCase):
         self.assertEqual(expected_pm_disables, pm.disable.call_count)
         self.assertEqual(agent._destroy_router_namespace.call_count,
                          len(stale_namespace_list))
-        expected_args = [mock.call(ns) for ns in stale_namespace_list]
+        expected_args = [mock.call(ns, []) for ns in stale_namespace_list]
         agent._destroy_router_namespace.assert_has_calls(expected_args,
                                                          any_order=True)
-        self.assertFalse(agent._clean_stale_namespaces)
+
+    def test_cleanup_namespace_skips_added_router(self):
+        self.conf.set_override('router_delete_namespaces', True)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._destroy_router_namespace = mock.MagicMock()
+        router = prepare_router_data()
+        agent._cleanup_namespaces(
+            set([l3_agent.NS_PREFIX + 'foo',
+                 l3_agent.NS_PREFIX + router['id']]), [])
+        # the router is added before its namespace is destroyed
+        agent._router_added(router['id'], router)
+        agent._namespace_cleanup.wait()
+        agent._destroy_router_namespace.assert_called_once_with(
+            l3_agent.NS_PREFIX + 'foo', [])
+
+    def test_cleanup_namespace_skips_router_in_process(self):
+        self.conf.set_override('router_delete_namespaces', True)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._destroy_router_namespace = mock.MagicMock()
+        with l3_agent.ExclusiveRouterProcessor('foo'):
+            agent._destroy_stale_router_namespace(
+                l3_agent.NS_PREFIX + 'foo', [])
+        self.assertFalse(agent._destroy_router_namespace.called)
+
+    def test_cleanup_namespace_queues_router_updates_again(self):
+        self.conf.set_override('router_delete_namespaces', True)
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        update = l3_agent.RouterUpdate('foo', l3_agent.PRIORITY_RPC)
+
+        def destroy(ns, devices):
+            # an update of the router comes in meanwhile
+            with l3_agent.ExclusiveRouterProcessor('foo') as rp:
+                rp.queue_update(update)
+                self.assertEqual([], list(rp.updates()))
+
+        agent._destroy_router_namespace = mock.Mock(side_effect=destroy)
+        with mock.patch.object(agent._queue, 'add') as add:
+            agent._destroy_stale_router_namespace(
+                l3_agent.NS_PREFIX + 'foo', [])
+        agent._destroy_router_namespace.assert_called_once_with(
+            l3_agent.NS_PREFIX + 'foo', [])
+        add.assert_called_once_with(update)
+
+    def test_destroy_router_namespace_with_devices(self):
+        agent = l3_agent.L3NATAgent(HOSTNAME, self.conf)
+        agent._destroy_router_namespace('fakens', ['qr-aaaa', 'qg-bbbb',
+                                                   'tap0'])
+        self.assertFalse(self.mock_ip.get_devices.called)
+        self.assertEqual(
+            [mock.call('qr-aaaa', namespace='fakens', prefix='qr-'),
+             mock.call('qg-bbbb', bridge='br-ex', namespace='fakens',
+                       prefix='qg-')],
+            self.mock_driver.unplug.call_args_list)
 
     def test_cleanup_namespace(self):
         self.conf.set_override('router_id', None)
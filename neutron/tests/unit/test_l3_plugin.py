@@ -1848,6 +1848,76 @@ class L3AgentDbTestCaseBase(L3NatTestCaseMixin):
             self.assertIsNotNone(floatingips[0]['fixed_ip_address'])
             self.assertIsNotNone(floatingips[0]['router_id'])
 
+    def test_l3_agent_router_revisions(self):
+        ctx = context.get_admin_context()
+        with contextlib.nested(self.router(), self.router()) as (r1, r2):
+            r1_id, r2_id = r1['router']['id'], r2['router']['id']
+            revisions = self.plugin.get_router_revisions(ctx)
+            self.assertEqual(set([r1_id, r2_id]), set(revisions))
+            self.assertEqual({r1_id: revisions[r1_id]},
+                             self.plugin.get_router_revisions(ctx, [r1_id]))
+            self.assertEqual({}, self.plugin.get_router_revisions(ctx, []))
+
+            # the operational status is left out
+            self.plugin.update_router(ctx, r1_id,
+                                      {'router': {'name': r1['router'][
+                                          'name']}})
+            self.assertEqual(revisions, self.plugin.get_router_revisions(ctx))
+
+            with self.port(do_delete=False) as p:
+                self._router_interface_action('add', r1_id, None,
+                                              p['port']['id'])
+                new_revisions = self.plugin.get_router_revisions(ctx)
+                self.assertNotEqual(revisions[r1_id], new_revisions[r1_id])
+                self.assertEqual(revisions[r2_id], new_revisions[r2_id])
+                self._router_interface_action('remove', r1_id, None,
+                                              p['port']['id'])
+            self.assertEqual(revisions, self.plugin.get_router_revisions(ctx))
+
+    def test_l3_agent_router_revisions_subnets(self):
+        ctx = context.get_admin_context()
+        # the gateway_ip of the subnet is moved out of its pool, and the
+        # interface does not use it
+        pools = [{'start': '10.0.0.2', 'end': '10.0.0.100'}]
+        with contextlib.nested(self.router(), self.network()) as (r, n):
+            router_id = r['router']['id']
+            with self.subnet(network=n, allocation_pools=pools) as s:
+                with self.port(subnet=s, do_delete=False) as p:
+                    self._router_interface_action('add', router_id, None,
+                                                  p['port']['id'])
+                    revisions = self.plugin.get_router_revisions(
+                        ctx, [router_id])
+                    self._update('subnets', s['subnet']['id'],
+                                 {'subnet': {'gateway_ip': '10.0.0.254'}})
+                    new_revisions = self.plugin.get_router_revisions(
+                        ctx, [router_id])
+                    self.assertNotEqual(revisions, new_revisions)
+                    with self.subnet(network=n, cidr='10.0.1.0/24'):
+                        self.assertNotEqual(
+                            new_revisions,
+                            self.plugin.get_router_revisions(ctx,
+                                                             [router_id]))
+                    self._router_interface_action('remove', router_id, None,
+                                                  p['port']['id'])
+
+    def test_l3_agent_router_revisions_floatingips(self):
+        ctx = context.get_admin_context()
+        with self.floatingip_with_assoc() as fip:
+            router_id = fip['floatingip']['router_id']
+            revisions = self.plugin.get_router_revisions(ctx, [router_id])
+            self.plugin.update_floatingip_status(
+                ctx, fip['floatingip']['id'],
+                l3_constants.FLOATINGIP_STATUS_ACTIVE)
+            self.assertEqual(revisions,
+                             self.plugin.get_router_revisions(ctx,
+                                                              [router_id]))
+            self.plugin.update_floatingip(
+                ctx, fip['floatingip']['id'],
+                {'floatingip': {'port_id': None}})
+            self.assertNotEqual(revisions,
+                                self.plugin.get_router_revisions(ctx,
+                                                                 [router_id]))
+
     def _test_notify_op_agent(self, target_func, *args):
         l3_rpc_agent_api_str = (
             'neutron.api.rpc.agentnotifiers.l3_rpc_agent_api.L3AgentNotifyAPI')
@@ -2038,6 +2108,19 @@ class L3NatDBIntAgentSchedulingTestCase(L3BaseForIntTests,
                 r['router']['id'],
                 s2['subnet']['network_id'])
 
+    def test_get_router_revisions_of_agent(self):
+        with contextlib.nested(self.router(), self.router()) as (r1, r2):
+            l3_rpc = l3_rpc_base.L3RpcCallbackMixin()
+            self._register_one_l3_agent(host='host1')
+            revisions = l3_rpc.get_router_revisions(self.adminContext,
+                                                    host='host1')
+            self.assertEqual(set([r1['router']['id'], r2['router']['id']]),
+                             set(revisions))
+            revisions = l3_rpc.get_router_revisions(
+                self.adminContext, host='host1',
+                router_ids=[r1['router']['id']])
+            self.assertEqual([r1['router']['id']], revisions.keys())
+
     def test_router_update_gateway_no_eligible_l3_agent(self):
         with self.router() as r:
             with self.subnet() as s1:
@@ -14,8 +14,10 @@
 #    under the License.
 
 import mock
+from oslo.config import cfg
 
 from neutron.agent.linux import ip_lib
+from neutron.agent.linux import netlink_lib
 from neutron.common import exceptions
 from neutron.tests import base
 
@@ -191,6 +193,22 @@ class TestSubProcessBase(base.BaseTestCase):
                           base._as_root,
                           [], 'link', ('list',))
 
+    def test_as_root_batch_namespace(self):
+        base = ip_lib.SubProcessBase('sudo', 'ns')
+        base._as_root_batch([['addr', 'del', '10.0.0.1/32', 'dev', 'qg-1'],
+                             ('link', 'set', 'qg-1', 'mtu', 1400)])
+        self.execute.assert_called_once_with(
+            ['ip', 'netns', 'exec', 'ns', 'ip', '-force', '-batch', '-'],
+            root_helper='sudo',
+            process_input='addr del 10.0.0.1/32 dev qg-1\n'
+                          'link set qg-1 mtu 1400\n')
+
+    def test_as_root_batch_no_root_helper(self):
+        base = ip_lib.SubProcessBase()
+        self.assertRaises(exceptions.SudoRequired,
+                          base._as_root_batch,
+                          [['link', 'list']])
+
 
 class TestIpWrapper(base.BaseTestCase):
     def setUp(self):
@@ -242,6 +260,28 @@ class TestIpWrapper(base.BaseTestCase):
         self.execute.assert_called_once_with(['o', 'd'], 'link', ('list',),
                                              'sudo', None)
 
+    def test_get_addresses(self):
+        self.execute.return_value = (
+            '1: lo: <LOOPBACK,UP,LOWER_UP> mtu 65536 qdisc noqueue\n'
+            '    link/loopback 00:00:00:00:00:00 brd 00:00:00:00:00:00\n'
+            '    inet 127.0.0.1/8 scope host lo\n' +
+            ADDR_SAMPLE.replace('eth0', 'qg-1@if5', 1).lstrip('\n') +
+            '3: qr-1: <BROADCAST,MULTICAST> mtu 1500 qdisc noop\n'
+            '    link/ether cc:dd:ee:ff:ab:cd brd ff:ff:ff:ff:ff:ff\n')
+        retval = ip_lib.IPWrapper('sudo', 'ns').get_addresses(
+            exclude_loopback=True)
+        self.assertEqual(['qg-1', 'qr-1'], sorted(retval))
+        self.assertEqual([], retval['qr-1'])
+        self.assertEqual(dict(cidr='172.16.77.240/24',
+                              broadcast='172.16.77.255',
+                              scope='global',
+                              ip_version=4,
+                              dynamic=False),
+                         retval['qg-1'][0])
+        self.assertEqual(6, len(retval['qg-1']))
+        self.execute.assert_called_once_with([], 'addr', ('show',),
+                                             'sudo', 'ns')
+
     def test_get_namespaces(self):
         self.execute.return_value = '\n'.join(NETNS_SAMPLE)
         retval = ip_lib.IPWrapper.get_namespaces('sudo')
@@ -502,6 +542,7 @@ class TestIPCmdBase(base.BaseTestCase):
         self.parent = mock.Mock()
         self.parent.name = 'eth0'
         self.parent.root_helper = 'sudo'
+        self.parent.use_netlink = False
 
     def _assert_call(self, options, args):
         self.parent.assert_has_calls([
@@ -616,6 +657,21 @@ class TestIpAddrCommand(TestIPCmdBase):
         self._assert_sudo([4],
                           ('del', '192.168.45.100/24', 'dev', 'tap0'))
 
+    def test_batch(self):
+        self.addr_cmd.batch(add=[('192.168.45.100/32', '192.168.45.100'),
+                                 ('192.168.45.101/32', '192.168.45.101')],
+                            delete=['192.168.45.102/32'])
+        self.parent._as_root_batch.assert_called_once_with(
+            [['addr', 'add', '192.168.45.100/32', 'brd', '192.168.45.100',
+              'scope', 'global', 'dev', 'tap0'],
+             ['addr', 'add', '192.168.45.101/32', 'brd', '192.168.45.101',
+              'scope', 'global', 'dev', 'tap0'],
+             ['addr', 'del', '192.168.45.102/32', 'dev', 'tap0']])
+
+    def test_batch_nothing(self):
+        self.addr_cmd.batch()
+        self.assertFalse(self.parent._as_root_batch.called)
+
     def test_flush(self):
         self.addr_cmd.flush()
         self._assert_sudo([], ('flush', 'tap0'))
@@ -821,6 +877,102 @@ class TestIpNetnsCommand(TestIPCmdBase):
                 root_helper='sudo', check_exit_code=True)
 
 
+NETLINK_SAMPLE = {
+    netlink_lib.LINKS: [
+        {'index': 1, 'name': 'lo', 'link_type': 'loopback',
+         'address': '00:00:00:00:00:00', 'broadcast': '00:00:00:00:00:00',
+         'mtu': 65536, 'qdisc': 'noqueue', 'qlen': None, 'state': 'UNKNOWN',
+         'alias': None},
+        {'index': 2, 'name': 'qr-1', 'link_type': 'ether',
+         'address': 'cc:dd:ee:ff:ab:cd', 'broadcast': 'ff:ff:ff:ff:ff:ff',
+         'mtu': 1500, 'qdisc': 'mq', 'qlen': 1000, 'state': 'UP',
+         'alias': 'openvswitch'}],
+    netlink_lib.ADDRESSES: [
+        {'index': 1, 'cidr': '127.0.0.1/8', 'broadcast': '127.255.255.255',
+         'scope': 'host', 'ip_version': 4, 'dynamic': False, 'label': 'lo'},
+        {'index': 2, 'cidr': '172.16.77.240/24',
+         'broadcast': '172.16.77.255', 'scope': 'global', 'ip_version': 4,
+         'dynamic': False, 'label': 'qr-1'},
+        {'index': 2, 'cidr': 'fe80::dfcc:aaff:feb9:76ce/64',
+         'broadcast': '::', 'scope': 'link', 'ip_version': 6,
+         'dynamic': False, 'label': ''}],
+    netlink_lib.ROUTES: [
+        {'index': 2, 'dst': 'default', 'gateway': '10.0.0.1', 'oif': 1,
+         'ip_version': 4, 'table': 254, 'scope': 'global', 'metric': None},
+        {'dst': '10.0.0.0/24', 'gateway': None, 'oif': 2, 'ip_version': 4,
+         'table': 254, 'scope': 'link', 'metric': None},
+        {'dst': 'default', 'gateway': '10.0.0.1', 'oif': 2, 'ip_version': 4,
+         'table': 254, 'scope': 'global', 'metric': 100}],
+}
+
+
+class TestIpLibNetlinkBackend(base.BaseTestCase):
+    def setUp(self):
+        super(TestIpLibNetlinkBackend, self).setUp()
+        cfg.CONF.register_opts(ip_lib.OPTS)
+        self.config(ip_lib_backend=ip_lib.NETLINK_BACKEND)
+        self.dump = mock.patch.object(netlink_lib, 'dump').start()
+        self.dump.side_effect = lambda tables, namespace, root_helper: dict(
+            (table, NETLINK_SAMPLE[table]) for table in tables)
+        self.execute = mock.patch.object(ip_lib.SubProcessBase,
+                                         '_execute').start()
+        self.device = ip_lib.IPDevice('qr-1', 'sudo', 'ns')
+
+    def test_get_devices(self):
+        retval = ip_lib.IPWrapper('sudo', 'ns').get_devices(
+            exclude_loopback=True)
+        self.assertEqual([ip_lib.IPDevice('qr-1', namespace='ns')], retval)
+        self.dump.assert_called_once_with((netlink_lib.LINKS,),
+                                          namespace='ns', root_helper='sudo')
+        self.assertFalse(self.execute.called)
+
+    def test_get_addresses(self):
+        retval = ip_lib.IPWrapper('sudo', 'ns').get_addresses()
+        self.assertEqual(['127.0.0.1/8'], [a['cidr'] for a in retval['lo']])
+        self.assertEqual(['172.16.77.240/24', 'fe80::dfcc:aaff:feb9:76ce/64'],
+                         [a['cidr'] for a in retval['qr-1']])
+        self.assertEqual(1, self.dump.call_count)
+
+    def test_link_attributes(self):
+        self.assertEqual({'mtu': 1500,
+                          'qlen': 1000,
+                          'state': 'UP',
+                          'qdisc': 'mq',
+                          'brd': 'ff:ff:ff:ff:ff:ff',
+                          'link/ether': 'cc:dd:ee:ff:ab:cd',
+                          'alias': 'openvswitch'},
+                         self.device.link.attributes)
+        self.assertFalse(self.execute.called)
+
+    def test_addr_list(self):
+        self.assertEqual([dict(cidr='172.16.77.240/24',
+                               broadcast='172.16.77.255',
+                               scope='global',
+                               ip_version=4,
+                               dynamic=False)],
+                         self.device.addr.list(scope='global'))
+        self.assertEqual(['fe80::dfcc:aaff:feb9:76ce/64'],
+                         [a['cidr'] for a in
+                          self.device.addr.list(to='fe80::/64')])
+        self.assertFalse(self.execute.called)
+
+    def test_addr_list_with_filters_runs_ip(self):
+        self.execute.return_value = ''
+        self.device.addr.list(filters=['permanent'])
+        self.assertTrue(self.execute.called)
+
+    def test_get_gateway(self):
+        self.assertEqual(dict(gateway='10.0.0.1', metric=100),
+                         self.device.route.get_gateway())
+        self.assertIsNone(self.device.route.get_gateway(scope='link'))
+        self.assertFalse(self.execute.called)
+
+    def test_device_exists(self):
+        self.assertTrue(ip_lib.device_exists('qr-1', 'sudo', 'ns'))
+        self.assertFalse(ip_lib.device_exists('qr-2', 'sudo', 'ns'))
+        self.assertFalse(self.execute.called)
+
+
 class TestDeviceExists(base.BaseTestCase):
     def test_device_exists(self):
         with mock.patch.object(ip_lib.IPDevice, '_execute') as _execute:
@@ -17,6 +17,7 @@ import contextlib
 
 import mock
 from oslo.config import cfg
+from oslo import messaging
 from testtools import matchers
 import webob.exc
 
@@ -382,6 +383,62 @@ class SGServerRpcCallBackMixinTestCase(test_sg.SecurityGroupDBTestCase):
                 self._delete('ports', port_id1)
                 self._delete('ports', port_id2)
 
+    def test_security_group_info_for_devices_ipv4_source_group(self):
+
+        with self.network() as n:
+            with contextlib.nested(self.subnet(n),
+                                   self.security_group(),
+                                   self.security_group()) as (subnet_v4,
+                                                              sg1,
+                                                              sg2):
+                sg1_id = sg1['security_group']['id']
+                sg2_id = sg2['security_group']['id']
+                rule1 = self._build_security_group_rule(
+                    sg1_id,
+                    'ingress', const.PROTO_NAME_TCP, '24',
+                    '25', remote_group_id=sg2['security_group']['id'])
+                rules = {
+                    'security_group_rules': [rule1['security_group_rule']]}
+                res = self._create_security_group_rule(self.fmt, rules)
+                self.deserialize(self.fmt, res)
+                self.assertEqual(res.status_int, webob.exc.HTTPCreated.code)
+
+                res1 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg1_id,
+                                     sg2_id])
+                ports_rest1 = self.deserialize(self.fmt, res1)
+                port_id1 = ports_rest1['port']['id']
+                self.rpc.devices = {port_id1: ports_rest1['port']}
+                devices = [port_id1, 'no_exist_device']
+
+                res2 = self._create_port(
+                    self.fmt, n['network']['id'],
+                    security_groups=[sg2_id])
+                ports_rest2 = self.deserialize(self.fmt, res2)
+                port_id2 = ports_rest2['port']['id']
+                ctx = context.get_admin_context()
+                info = self.rpc.security_group_info_for_devices(
+                    ctx, devices=devices)
+                port_rpc = info['devices'][port_id1]
+                expected_rule = {'direction': u'ingress',
+                                 'protocol': const.PROTO_NAME_TCP,
+                                 'ethertype': const.IPv4,
+                                 'port_range_max': 25, 'port_range_min': 24,
+                                 'remote_group_id': sg2_id,
+                                 'security_group_id': sg1_id}
+                self.assertIn(expected_rule,
+                              port_rpc['security_group_rules'])
+                self.assertEqual([sg2_id],
+                                 port_rpc['security_group_source_groups'])
+                self.assertEqual(
+                    ['10.0.0.2', '10.0.0.3'],
+                    sorted(info['sg_member_ips'][sg2_id][const.IPv4]))
+                self.assertEqual([],
+                                 info['sg_member_ips'][sg2_id][const.IPv6])
+                self._delete('ports', port_id1)
+                self._delete('ports', port_id2)
+
     def test_security_group_rules_for_devices_ipv6_ingress(self):
         fake_prefix = FAKE_PREFIX[const.IPv6]
         fake_gateway = FAKE_IP[const.IPv6]
@@ -962,6 +1019,76 @@ class SecurityGroupAgentRpcTestCase(base.BaseTestCase):
         self.agent.refresh_firewall([])
         self.firewall.assert_has_calls([])
 
+    def _enable_ipset(self):
+        cfg.CONF.set_override('enable_ipset', True, group='SECURITYGROUP')
+        self.agent.plugin_rpc.security_group_info_for_devices.return_value = {
+            'devices': {'fake_device': dict(self.fake_device)},
+            'sg_member_ips': {'fake_sgid2': {'IPv4': ['10.0.0.1'],
+                                             'IPv6': []}}}
+
+    def test_prepare_devices_filter_with_ipset(self):
+        self._enable_ipset()
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+        self.firewall.assert_has_calls(
+            [mock.call.update_security_group_members(
+                'fake_sgid2', {'IPv4': ['10.0.0.1'], 'IPv6': []}),
+             mock.call.defer_apply(),
+             mock.call.prepare_port_filter(self.fake_device)])
+
+    def test_refresh_firewall_with_ipset_skips_unchanged_devices(self):
+        self._enable_ipset()
+        self.agent.refresh_firewall()
+        self.firewall.update_security_group_members.assert_called_once_with(
+            'fake_sgid2', {'IPv4': ['10.0.0.1'], 'IPv6': []})
+        self.assertFalse(self.firewall.update_port_filter.called)
+
+    def _test_ipset_falls_back_to_rules(self, exc_type, supported):
+        self._enable_ipset()
+        rpc = self.agent.plugin_rpc
+        rpc.security_group_info_for_devices.side_effect = (
+            messaging.RemoteError(exc_type))
+        rpc.security_group_rules_for_devices.return_value = {
+            'fake_device': self.fake_device}
+        self.agent.prepare_devices_filter(['fake_device'])
+        rpc.security_group_rules_for_devices.assert_called_once_with(
+            None, ['fake_device'])
+        self.assertFalse(self.firewall.update_security_group_members.called)
+        self.firewall.prepare_port_filter.assert_called_once_with(
+            self.fake_device)
+        self.assertEqual(supported, self.agent.sg_info_supported)
+
+    def test_ipset_falls_back_to_rules_for_old_server(self):
+        self._test_ipset_falls_back_to_rules('UnsupportedVersion', False)
+
+    def test_ipset_falls_back_to_rules_on_error(self):
+        self._test_ipset_falls_back_to_rules('RuntimeError', True)
+
+    def test_ipset_not_used_once_unsupported(self):
+        self._enable_ipset()
+        self.agent.sg_info_supported = False
+        self.agent.prepare_devices_filter(['fake_device'])
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_info_for_devices.called)
+
+    def test_refresh_firewall_without_ports(self):
+        self.firewall.ports = None
+        self.agent.refresh_firewall()
+        self.assertFalse(
+            self.agent.plugin_rpc.security_group_rules_for_devices.called)
+
+    def test_remove_devices_filter_without_ports(self):
+        self.firewall.ports = None
+        self.agent.remove_devices_filter(['fake_device'])
+        self.assertFalse(self.firewall.remove_port_filter.called)
+
+    def test_security_groups_rule_updated_without_ports(self):
+        self.firewall.ports = None
+        self.agent.refresh_firewall = mock.Mock()
+        self.agent.security_groups_rule_updated(['fake_sgid1'])
+        self.assertFalse(self.agent.refresh_firewall.called)
+
 
 class SecurityGroupAgentRpcWithDeferredRefreshTestCase(
     SecurityGroupAgentRpcTestCase):
@@ -1187,6 +1314,17 @@ class SecurityGroupServerRpcApiTestCase(base.BaseTestCase):
              version=sg_rpc.SG_RPC_VERSION,
              topic='fake_topic')])
 
+    def test_security_group_info_for_devices(self):
+        self.rpc.security_group_info_for_devices(None, ['fake_device'])
+        self.rpc.call.assert_has_calls(
+            [mock.call(None,
+             {'args':
+                 {'devices': ['fake_device']},
+              'method': 'security_group_info_for_devices',
+              'namespace': None},
+             version=sg_rpc.SG_INFO_RPC_VERSION,
+             topic='fake_topic')])
+
 
 class FakeSGNotifierAPI(n_rpc.RpcProxy,
                         sg_rpc.SecurityGroupAgentRpcApiMixin):